@@ -24,6 +24,14 @@ canvas_type_str_lookup = {
     CANVAS_MEDIA_VIEWER_ARCHIVE_DELETE : 'archive/delete filter'
 }
 
+CACHE_EVICTION_POLICY_LRU = 0
+CACHE_EVICTION_POLICY_W_TINYLFU = 1
+
+cache_eviction_policy_str_lookup = {
+    CACHE_EVICTION_POLICY_LRU : 'least recently used',
+    CACHE_EVICTION_POLICY_W_TINYLFU : 'W-TinyLFU (frequency-aware)'
+}
+
 # Hue is generally 200, Sat and Lum changes based on need
 COLOUR_LIGHT_SELECTED = QG.QColor( 235, 248, 255 )
 COLOUR_SELECTED = QG.QColor( 217, 242, 255 )
@@ -368,6 +376,26 @@ SYSTEM_SORT_TYPES = {
     SORT_FILES_BY_HASH
 }
 
+# sorts that give every file a stable key, so a search can be walked through a page at a time
+PAGEABLE_SYSTEM_SORT_TYPES = {
+    SORT_FILES_BY_HEIGHT,
+    SORT_FILES_BY_WIDTH,
+    SORT_FILES_BY_RATIO,
+    SORT_FILES_BY_NUM_PIXELS,
+    SORT_FILES_BY_DURATION,
+    SORT_FILES_BY_FRAMERATE,
+    SORT_FILES_BY_NUM_FRAMES,
+    SORT_FILES_BY_FILESIZE,
+    SORT_FILES_BY_APPROX_BITRATE,
+    SORT_FILES_BY_MEDIA_VIEWS,
+    SORT_FILES_BY_MEDIA_VIEWTIME,
+    SORT_FILES_BY_IMPORT_TIME,
+    SORT_FILES_BY_FILE_MODIFIED_TIMESTAMP,
+    SORT_FILES_BY_LAST_VIEWED_TIME,
+    SORT_FILES_BY_ARCHIVED_TIMESTAMP,
+    SORT_FILES_BY_HASH
+}
+
 system_sort_type_submetatype_string_lookup = {
     SORT_FILES_BY_NUM_COLLECTION_FILES : 'collections',
     SORT_FILES_BY_HEIGHT : 'dimensions',
@@ -16,6 +16,7 @@ from qtpy import QtGui as QG
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusController
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusSerialisable
@@ -859,6 +860,8 @@ class Controller( HydrusController.HydrusController ):
                 HG.profile_start_time = now
                 HG.profile_slow_count = 0
                 HG.profile_fast_count = 0
+                HG.db_temp_tables_created = 0
+                HG.db_temp_tables_reused = 0
                 
             
             
@@ -873,10 +876,39 @@ class Controller( HydrusController.HydrusController ):
             with HG.profile_counter_lock:
                 
                 ( slow, fast ) = ( HG.profile_slow_count, HG.profile_fast_count )
+                ( temp_tables_created, temp_tables_reused ) = ( HG.db_temp_tables_created, HG.db_temp_tables_reused )
                 
             
             HydrusData.ShowText( 'Profiling done: {} slow jobs, {} fast jobs'.format( HydrusData.ToHumanInt( slow ), HydrusData.ToHumanInt( fast ) ) )
             
+            summary = 'temp integer tables: {} created, {} reused'.format( HydrusData.ToHumanInt( temp_tables_created ), HydrusData.ToHumanInt( temp_tables_reused ) )
+            
+            HydrusData.ShowText( summary )
+            
+            self.PrintProfile( summary )
+            
+        
+    
+    def FlipSlowQueryMode( self ):
+        
+        if not HG.slow_query_mode:
+            
+            HydrusDBBase.ClearQueryStats()
+            
+            HG.slow_query_mode = True
+            
+            HydrusData.ShowText( 'Slow query mode on! Statements slower than {}ms will be logged, with their query plans, in "{} slow queries.log" in your db directory.'.format( HydrusData.ToHumanInt( HG.db_slow_query_min_time_ms ), self._name ) )
+            
+        else:
+            
+            HG.slow_query_mode = False
+            
+            all_stats = HydrusDBBase.GetQueryStats()
+            
+            num_slow = sum( ( stats[ 'num_slow' ] for stats in all_stats ) )
+            
+            HydrusData.ShowText( 'Slow query mode done: {} different statements recorded, {} slow runs logged.'.format( HydrusData.ToHumanInt( len( all_stats ) ), HydrusData.ToHumanInt( num_slow ) ) )
+            
         
     
     def GetClipboardImage( self ):
@@ -145,13 +145,19 @@ class DatabaseMaintenanceManager( object ):
                         
                         still_work_to_do = HG.client_controller.WriteSynchronous( 'do_deferred_table_delete_work', time_to_stop )
                         
+                        if not still_work_to_do and not HydrusTime.TimeHasPassedFloat( time_to_stop ):
+                            
+                            # with the deletes done, fill any wildcard tag search caches that are waiting after an update or an sqlite change
+                            still_work_to_do = HG.client_controller.WriteSynchronous( 'maintain_tag_search_wildcard_caches', time_to_stop )
+                            
+                        
                     except Exception as e:
                         
                         self._serious_error_encountered = True
                         
                         HydrusData.PrintException( e )
                         
-                        message = 'There was an unexpected problem during deferred table delete database maintenance work! This maintenance system will not run again this boot. A full traceback of this error should be written to the log.'
+                        message = 'There was an unexpected problem during deferred table delete or wildcard tag search cache database maintenance work! This maintenance system will not run again this boot. A full traceback of this error should be written to the log.'
                         message += os.linesep * 2
                         message += str( e )
                         
@@ -24,6 +24,8 @@ from hydrus.core.files.images import HydrusImageOpening
 from hydrus.core.networking import HydrusNetworking
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientFilesMaintenanceWorkers
+from hydrus.client import ClientFilesPacked
 from hydrus.client import ClientFilesPhysical
 from hydrus.client import ClientImageHandling
 from hydrus.client import ClientPaths
@@ -367,6 +369,8 @@ class ClientFilesManager( object ):
         self._bad_error_occurred = False
         self._missing_subfolders = set()
         
+        self._thumbnail_pack_manager = ClientFilesPacked.ThumbnailPackManager()
+        
         self._Reinit()
         
         self._controller.sub( self, 'Reinit', 'new_ideal_client_files_locations' )
@@ -417,18 +421,39 @@ class ClientFilesManager( object ):
         
         dest_path = self._GenerateExpectedThumbnailPath( hash )
         
+        thumbnail_pack = self._GetThumbnailPack( hash )
+        
+        use_packed_thumbnail_store = self._controller.new_options.GetBoolean( 'use_packed_thumbnail_store' )
+        
         if HG.file_report_mode:
             
-            HydrusData.ShowText( 'Adding thumbnail: ' + str( ( len( thumbnail_bytes ), dest_path ) ) )
+            HydrusData.ShowText( 'Adding thumbnail: ' + str( ( len( thumbnail_bytes ), dest_path, 'packed' if use_packed_thumbnail_store else 'loose' ) ) )
             
         
         try:
             
-            HydrusPaths.TryToGiveFileNicePermissionBits( dest_path )
-            
-            with open( dest_path, 'wb' ) as f:
+            if use_packed_thumbnail_store:
+                
+                thumbnail_pack.Add( hash, thumbnail_bytes )
+                
+                if os.path.exists( dest_path ):
+                    
+                    ClientPaths.DeletePath( dest_path, always_delete_fully = True )
+                    
+                
+            else:
+                
+                HydrusPaths.TryToGiveFileNicePermissionBits( dest_path )
+                
+                with open( dest_path, 'wb' ) as f:
+                    
+                    f.write( thumbnail_bytes )
+                    
                 
-                f.write( thumbnail_bytes )
+                if thumbnail_pack.HasThumbnail( hash ):
+                    
+                    thumbnail_pack.Delete( hash )
+                    
                 
             
         except Exception as e:
@@ -601,15 +626,10 @@ class ClientFilesManager( object ):
         
         hash = media.GetHash()
         mime = media.GetMime()
-        ( width, height ) = media.GetResolution()
         duration = media.GetDurationMS()
         num_frames = media.GetNumFrames()
         
-        bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
-        thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
-        thumbnail_dpr_percent = HG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
-        
-        target_resolution = HydrusImageHandling.GetThumbnailResolution( ( width, height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
+        target_resolution = self.GetThumbnailTargetResolution( media )
         
         percentage_in = self._controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
         
@@ -625,6 +645,11 @@ class ClientFilesManager( object ):
         return thumbnail_bytes
         
     
+    def _GetAllThumbnailSubfolders( self ) -> typing.List[ ClientFilesPhysical.FilesStorageSubfolder ]:
+        
+        return [ subfolder for subfolder in self._GetAllSubfolders() if not subfolder.IsForFiles() ]
+        
+    
     def _GetCurrentSubfolderBaseLocations( self, only_files = False ):
         
         known_base_locations = set()
@@ -966,6 +991,13 @@ class ClientFilesManager( object ):
         return self._GetPossibleSubfoldersForFile( hash, prefix_type )[0]
         
     
+    def _GetThumbnailPack( self, hash: bytes ) -> ClientFilesPacked.ThumbnailPack:
+        
+        subfolder = self._GetSubfolderForFile( hash, 't' )
+        
+        return self._thumbnail_pack_manager.GetPack( subfolder.path )
+        
+    
     def _HandleCriticalDriveError( self ):
         
         self._controller.new_options.SetBoolean( 'pause_import_folders_sync', True )
@@ -1012,6 +1044,11 @@ class ClientFilesManager( object ):
                     
                     for filename in filenames:
                         
+                        if ClientFilesPacked.IsPackFilename( filename ):
+                            
+                            continue
+                            
+                        
                         yield os.path.join( files_dir, filename )
                         
                     
@@ -1019,6 +1056,23 @@ class ClientFilesManager( object ):
             
         
     
+    def _LocklessThumbnailExists( self, hash ) -> bool:
+        
+        if self._GetThumbnailPack( hash ).HasThumbnail( hash ):
+            
+            return True
+            
+        
+        path = self._GenerateExpectedThumbnailPath( hash )
+        
+        if HG.file_report_mode:
+            
+            HydrusData.ShowText( 'Thumbnail path test: ' + path )
+            
+        
+        return os.path.exists( path )
+        
+    
     def _LookForFilePath( self, hash ):
         
         for potential_mime in HC.ALLOWED_MIMES:
@@ -1044,10 +1098,33 @@ class ClientFilesManager( object ):
         raise HydrusExceptions.FileMissingException( 'File for ' + hash.hex() + ' not found!' )
         
     
+    def _ReadThumbnailBytes( self, hash ) -> typing.Optional[ bytes ]:
+        
+        thumbnail_bytes = self._GetThumbnailPack( hash ).GetThumbnailBytes( hash )
+        
+        if thumbnail_bytes is None:
+            
+            path = self._GenerateExpectedThumbnailPath( hash )
+            
+            if os.path.exists( path ):
+                
+                with open( path, 'rb' ) as f:
+                    
+                    thumbnail_bytes = f.read()
+                    
+                
+            
+        
+        return thumbnail_bytes
+        
+    
     def _Reinit( self ):
         
         self._ReinitSubfolders()
         
+        # subfolders may have moved, so let's reload any packs from wherever they are now
+        self._thumbnail_pack_manager.Clear()
+        
         if HG.client_controller.IsFirstStart():
             
             try:
@@ -1245,6 +1322,82 @@ class ClientFilesManager( object ):
             
         
     
+    def BenchmarkThumbnailReads( self, num_thumbnails = 1000, batch_size = 128 ):
+        
+        # one sample is read one thumbnail at a time, like the old waterfall, and a different sample is read in waterfall-sized batches, so the OS disk cache does not help the second go
+        
+        with self._rwlock.read:
+            
+            all_hashes = []
+            
+            for subfolder in self._GetAllThumbnailSubfolders():
+                
+                all_hashes.extend( self._thumbnail_pack_manager.GetPack( subfolder.path ).GetHashes() )
+                
+                if subfolder.PathExists():
+                    
+                    for filename in os.listdir( subfolder.path ):
+                        
+                        try:
+                            
+                            all_hashes.append( bytes.fromhex( filename[:64] ) )
+                            
+                        except ValueError:
+                            
+                            continue
+                            
+                        
+                    
+                
+            
+        
+        all_hashes = list( set( all_hashes ) )
+        
+        random.shuffle( all_hashes )
+        
+        num_thumbnails = min( num_thumbnails, len( all_hashes ) // 2 )
+        
+        # the waterfall goes in hash order
+        single_hashes = sorted( all_hashes[ : num_thumbnails ] )
+        batch_hashes = sorted( all_hashes[ num_thumbnails : num_thumbnails * 2 ] )
+        
+        results = []
+        
+        single_num_bytes = 0
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        for hash in single_hashes:
+            
+            with self._rwlock.read:
+                
+                thumbnail_bytes = self._ReadThumbnailBytes( hash )
+                
+            
+            if thumbnail_bytes is not None:
+                
+                single_num_bytes += len( thumbnail_bytes )
+                
+            
+        
+        results.append( ( 'one at a time', len( single_hashes ), single_num_bytes, HydrusTime.GetNowPrecise() - time_started ) )
+        
+        batch_num_bytes = 0
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        for block_of_hashes in HydrusLists.SplitListIntoChunks( batch_hashes, batch_size ):
+            
+            hashes_to_thumbnail_bytes = self.GetThumbnailBytesBatch( block_of_hashes )
+            
+            batch_num_bytes += sum( ( len( thumbnail_bytes ) for thumbnail_bytes in hashes_to_thumbnail_bytes.values() ) )
+            
+        
+        results.append( ( 'batches of {}'.format( HydrusData.ToHumanInt( batch_size ) ), len( batch_hashes ), batch_num_bytes, HydrusTime.GetNowPrecise() - time_started ) )
+        
+        return results
+        
+    
     def ChangeFileExt( self, hash, old_mime, mime ):
         
         if old_mime == mime:
@@ -1376,6 +1529,30 @@ class ClientFilesManager( object ):
                     
                 
             
+            orphan_packed_thumbnails = []
+            
+            for subfolder in self._GetAllThumbnailSubfolders():
+                
+                thumbnail_pack = self._thumbnail_pack_manager.GetPack( subfolder.path )
+                
+                for hash in thumbnail_pack.GetHashes():
+                    
+                    ( i_paused, should_quit ) = job_status.WaitIfNeeded()
+                    
+                    if should_quit:
+                        
+                        return
+                        
+                    
+                    is_an_orphan = HG.client_controller.Read( 'is_an_orphan', 'thumbnail', hash )
+                    
+                    if is_an_orphan:
+                        
+                        orphan_packed_thumbnails.append( ( thumbnail_pack, hash ) )
+                        
+                    
+                
+            
             time.sleep( 2 )
             
             if move_location is None and len( orphan_paths ) > 0:
@@ -1432,13 +1609,39 @@ class ClientFilesManager( object ):
                     
                 
             
-            if len( orphan_paths ) == 0 and len( orphan_thumbnails ) == 0:
+            if len( orphan_packed_thumbnails ) > 0:
+                
+                job_status.SetStatusText( 'found ' + HydrusData.ToHumanInt( len( orphan_packed_thumbnails ) ) + ' orphan packed thumbnails, now deleting' )
+                
+                touched_thumbnail_packs = set()
+                
+                for ( thumbnail_pack, hash ) in orphan_packed_thumbnails:
+                    
+                    HydrusData.Print( 'Deleting the orphan packed thumbnail ' + hash.hex() )
+                    
+                    thumbnail_pack.Delete( hash )
+                    
+                    touched_thumbnail_packs.add( thumbnail_pack )
+                    
+                
+                for thumbnail_pack in touched_thumbnail_packs:
+                    
+                    if thumbnail_pack.WantsCompaction():
+                        
+                        thumbnail_pack.Compact()
+                        
+                    
+                
+            
+            num_orphan_thumbnails = len( orphan_thumbnails ) + len( orphan_packed_thumbnails )
+            
+            if len( orphan_paths ) == 0 and num_orphan_thumbnails == 0:
                 
                 final_text = 'no orphans found!'
                 
             else:
                 
-                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( len( orphan_thumbnails ) ) + ' orphan thumbnails cleared!'
+                final_text = HydrusData.ToHumanInt( len( orphan_paths ) ) + ' orphan files and ' + HydrusData.ToHumanInt( num_orphan_thumbnails ) + ' orphan thumbnails cleared!'
                 
             
             job_status.SetStatusText( final_text )
@@ -1543,6 +1746,15 @@ class ClientFilesManager( object ):
                         num_thumbnails_deleted += 1
                         
                     
+                    thumbnail_pack = self._GetThumbnailPack( thumbnail_hash )
+                    
+                    if thumbnail_pack.HasThumbnail( thumbnail_hash ):
+                        
+                        thumbnail_pack.Delete( thumbnail_hash )
+                        
+                        num_thumbnails_deleted += 1
+                        
+                    
                 
                 self._controller.WriteSynchronous( 'clear_deferred_physical_delete', file_hash = file_hash, thumbnail_hash = thumbnail_hash )
                 
@@ -1618,29 +1830,96 @@ class ClientFilesManager( object ):
         return self._missing_subfolders
         
     
-    def GetThumbnailPath( self, media ):
+    def GetThumbnailBytes( self, media ) -> bytes:
         
         hash = media.GetHash()
         mime = media.GetMime()
         
         if HG.file_report_mode:
             
-            HydrusData.ShowText( 'Thumbnail path request: ' + str( ( hash, mime ) ) )
+            HydrusData.ShowText( 'Thumbnail request: ' + str( ( hash, mime ) ) )
             
         
         with self._rwlock.read:
             
-            path = self._GenerateExpectedThumbnailPath( hash )
-            
-            thumb_missing = not os.path.exists( path )
+            thumbnail_bytes = self._ReadThumbnailBytes( hash )
             
         
-        if thumb_missing:
+        if thumbnail_bytes is None:
             
             self.RegenerateThumbnail( media )
             
+            with self._rwlock.read:
+                
+                thumbnail_bytes = self._ReadThumbnailBytes( hash )
+                
+            
+            if thumbnail_bytes is None:
+                
+                raise HydrusExceptions.FileMissingException( 'The thumbnail for file ' + hash.hex() + ' was missing and could not be regenerated!' )
+                
+            
         
-        return path
+        return thumbnail_bytes
+        
+    
+    def GetThumbnailBytesBatch( self, hashes: typing.Collection[ bytes ] ) -> typing.Dict[ bytes, bytes ]:
+        
+        # for the thumbnail waterfall. packed thumbnails in the same subfolder come out of one read. anything missing is just not in the result, so no regen here
+        
+        hashes_to_thumbnail_bytes = {}
+        
+        with self._rwlock.read:
+            
+            directories_to_hashes = collections.defaultdict( list )
+            
+            for hash in hashes:
+                
+                directories_to_hashes[ self._GetSubfolderForFile( hash, 't' ).path ].append( hash )
+                
+            
+            for ( directory, directory_hashes ) in directories_to_hashes.items():
+                
+                thumbnail_pack = self._thumbnail_pack_manager.GetPack( directory )
+                
+                hashes_to_thumbnail_bytes.update( thumbnail_pack.GetThumbnailBytesBatch( directory_hashes ) )
+                
+                for hash in directory_hashes:
+                    
+                    if hash in hashes_to_thumbnail_bytes:
+                        
+                        continue
+                        
+                    
+                    path = self._GenerateExpectedThumbnailPath( hash )
+                    
+                    try:
+                        
+                        with open( path, 'rb' ) as f:
+                            
+                            hashes_to_thumbnail_bytes[ hash ] = f.read()
+                            
+                        
+                    except OSError:
+                        
+                        continue
+                        
+                    
+                
+            
+        
+        return hashes_to_thumbnail_bytes
+        
+    
+    def GetThumbnailTargetResolution( self, media ):
+        
+        ( width, height ) = media.GetResolution()
+        
+        bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
+        thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
+        thumbnail_dpr_percent = self._controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
+        
+        return HydrusImageHandling.GetThumbnailResolution( ( width, height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
         
     
     def LocklessHasFile( self, hash, mime ):
@@ -1657,14 +1936,127 @@ class ClientFilesManager( object ):
     
     def LocklessHasThumbnail( self, hash ):
         
-        path = self._GenerateExpectedThumbnailPath( hash )
+        return self._LocklessThumbnailExists( hash )
         
-        if HG.file_report_mode:
+    
+    def MigrateThumbnailStorage( self, use_packed_thumbnail_store: bool ):
+        
+        # new thumbnails go to the new place straight away, and the read path checks packs and loose files both, so it is fine to cancel this halfway
+        
+        self._controller.new_options.SetBoolean( 'use_packed_thumbnail_store', use_packed_thumbnail_store )
+        
+        self._controller.WriteSynchronous( 'serialisable', self._controller.new_options )
+        
+        job_status = ClientThreading.JobStatus( cancellable = True )
+        
+        job_status.SetStatusTitle( 'packing thumbnails' if use_packed_thumbnail_store else 'unpacking thumbnails' )
+        
+        self._controller.pub( 'message', job_status )
+        
+        num_moved = 0
+        
+        try:
             
-            HydrusData.ShowText( 'Thumbnail path test: ' + path )
+            with self._rwlock.read:
+                
+                subfolders = self._GetAllThumbnailSubfolders()
+                
+            
+            for ( i, subfolder ) in enumerate( subfolders ):
+                
+                ( i_paused, should_quit ) = job_status.WaitIfNeeded()
+                
+                if should_quit:
+                    
+                    return
+                    
+                
+                job_status.SetStatusText( '{}: {} thumbnails moved so far'.format( HydrusData.ConvertValueRangeToPrettyString( i + 1, len( subfolders ) ), HydrusData.ToHumanInt( num_moved ) ) )
+                job_status.SetVariable( 'popup_gauge_1', ( i + 1, len( subfolders ) ) )
+                
+                with self._rwlock.write:
+                    
+                    if not subfolder.PathExists():
+                        
+                        continue
+                        
+                    
+                    thumbnail_pack = self._thumbnail_pack_manager.GetPack( subfolder.path )
+                    
+                    if use_packed_thumbnail_store:
+                        
+                        # hash order, so a page of thumbnails tends to sit together in the pack
+                        filenames = sorted( ( filename for filename in os.listdir( subfolder.path ) if not ClientFilesPacked.IsPackFilename( filename ) ) )
+                        
+                        for filename in filenames:
+                            
+                            try:
+                                
+                                hash = bytes.fromhex( filename[:64] )
+                                
+                            except ValueError:
+                                
+                                # clear orphans can deal with this
+                                continue
+                                
+                            
+                            path = subfolder.GetFilePath( filename )
+                            
+                            with open( path, 'rb' ) as f:
+                                
+                                thumbnail_bytes = f.read()
+                                
+                            
+                            if len( thumbnail_bytes ) > 0:
+                                
+                                thumbnail_pack.Add( hash, thumbnail_bytes )
+                                
+                            
+                            ClientPaths.DeletePath( path, always_delete_fully = True )
+                            
+                            num_moved += 1
+                            
+                        
+                        if thumbnail_pack.WantsCompaction():
+                            
+                            thumbnail_pack.Compact()
+                            
+                        
+                    else:
+                        
+                        hashes = sorted( thumbnail_pack.GetHashes() )
+                        
+                        for block_of_hashes in HydrusLists.SplitListIntoChunks( hashes, 256 ):
+                            
+                            hashes_to_thumbnail_bytes = thumbnail_pack.GetThumbnailBytesBatch( block_of_hashes )
+                            
+                            for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+                                
+                                path = subfolder.GetFilePath( f'{hash.hex()}.thumbnail' )
+                                
+                                with open( path, 'wb' ) as f:
+                                    
+                                    f.write( thumbnail_bytes )
+                                    
+                                
+                                num_moved += 1
+                                
+                            
+                        
+                        thumbnail_pack.DeletePackFiles()
+                        
+                    
+                
+            
+        finally:
+            
+            job_status.DeleteVariable( 'popup_gauge_1' )
+            job_status.SetStatusText( 'done! {} thumbnails moved'.format( HydrusData.ToHumanInt( num_moved ) ) )
+            
+            HydrusData.Print( job_status.ToString() )
+            
+            job_status.Finish()
             
-        
-        return os.path.exists( path )
         
     
     def Rebalance( self, job_status ):
@@ -1724,7 +2116,7 @@ class ClientFilesManager( object ):
             
         
     
-    def RegenerateThumbnail( self, media ):
+    def RegenerateThumbnail( self, media, thumbnail_bytes = None ):
         
         hash = media.GetHash()
         mime = media.GetMime()
@@ -1734,16 +2126,19 @@ class ClientFilesManager( object ):
             return
             
         
-        with self._rwlock.read:
-            
-            file_path = self._GenerateExpectedFilePath( hash, mime )
+        if thumbnail_bytes is None:
             
-            if not os.path.exists( file_path ):
+            with self._rwlock.read:
                 
-                raise HydrusExceptions.FileMissingException( 'The thumbnail for file ' + hash.hex() + ' could not be regenerated from the original file because the original file is missing! This event could indicate hard drive corruption. Please check everything is ok.')
+                file_path = self._GenerateExpectedFilePath( hash, mime )
+                
+                if not os.path.exists( file_path ):
+                    
+                    raise HydrusExceptions.FileMissingException( 'The thumbnail for file ' + hash.hex() + ' could not be regenerated from the original file because the original file is missing! This event could indicate hard drive corruption. Please check everything is ok.')
+                    
+                
+                thumbnail_bytes = self._GenerateThumbnailBytes( file_path, media )
                 
-            
-            thumbnail_bytes = self._GenerateThumbnailBytes( file_path, media )
             
         
         with self._rwlock.write:
@@ -1767,26 +2162,20 @@ class ClientFilesManager( object ):
                 return
                 
             
-            ( media_width, media_height ) = media.GetResolution()
-            
-            path = self._GenerateExpectedThumbnailPath( hash )
+            thumbnail_bytes = self._ReadThumbnailBytes( hash )
             
-            if not os.path.exists( path ):
+            if thumbnail_bytes is None:
                 
                 raise Exception()
                 
             
-            thumbnail_mime = HydrusFileHandling.GetThumbnailMime( path )
+            thumbnail_mime = HydrusFileHandling.GetThumbnailMimeFromBytes( thumbnail_bytes )
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( path, thumbnail_mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, thumbnail_mime )
             
             ( current_width, current_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
             
-            bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
-            thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
-            thumbnail_dpr_percent = HG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
-            
-            ( expected_width, expected_height ) = HydrusImageHandling.GetThumbnailResolution( (media_width, media_height), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
+            ( expected_width, expected_height ) = self.GetThumbnailTargetResolution( media )
             
             if current_width != expected_width or current_height != expected_height:
                 
@@ -1980,6 +2369,10 @@ class FilesMaintenanceManager( object ):
         
         self._ReInitialiseWorkRules()
         
+        self._worker_pool = ClientFilesMaintenanceWorkers.FileMaintenanceWorkerPool()
+        
+        self._worker_pool.SetNumWorkers( self._controller.new_options.GetInteger( 'file_maintenance_num_worker_processes' ) )
+        
         self._maintenance_lock = threading.Lock()
         self._lock = threading.Lock()
         
@@ -2327,6 +2720,133 @@ class FilesMaintenanceManager( object ):
             
         
     
+    def _GetWorkerCall( self, media_result, job_type, hashes_to_thumbnail_bytes ):
+        
+        # returns the CPU-heavy part of this job as ( func, args ) for a worker process, or None if this one has to be done the normal way
+        
+        hash = media_result.GetHash()
+        mime = media_result.GetMime()
+        
+        client_files_manager = self._controller.client_files_manager
+        
+        force_pil = self._controller.new_options.GetBoolean( 'load_images_with_pil' )
+        
+        if job_type in ( REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL, REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL ):
+            
+            if mime not in ClientFilesMaintenanceWorkers.MIMES_WORKERS_CAN_LOAD or not self._CanRegenThumbForMediaResult( media_result ):
+                
+                return None
+                
+            
+            path = client_files_manager.GetFilePath( hash, mime )
+            
+            target_resolution = client_files_manager.GetThumbnailTargetResolution( media_result )
+            duration = media_result.GetDurationMS()
+            num_frames = media_result.GetNumFrames()
+            percentage_in = self._controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
+            
+            if job_type == REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL:
+                
+                return ( ClientFilesMaintenanceWorkers.GenerateThumbnailBytes, ( path, target_resolution, mime, duration, num_frames, percentage_in ) )
+                
+            else:
+                
+                thumbnail_bytes = hashes_to_thumbnail_bytes.get( hash, None )
+                
+                return ( ClientFilesMaintenanceWorkers.GenerateThumbnailBytesIfWrongSize, ( thumbnail_bytes, path, target_resolution, mime, duration, num_frames, percentage_in, force_pil ) )
+                
+            
+        elif job_type == REGENERATE_FILE_DATA_JOB_PIXEL_HASH:
+            
+            if mime not in HC.FILES_THAT_CAN_HAVE_PIXEL_HASH or mime not in ClientFilesMaintenanceWorkers.MIMES_WORKERS_CAN_LOAD or media_result.GetDurationMS() is not None:
+                
+                return None
+                
+            
+            path = client_files_manager.GetFilePath( hash, mime )
+            
+            return ( ClientFilesMaintenanceWorkers.GetPixelHash, ( path, mime ) )
+            
+        elif job_type == REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA:
+            
+            if mime not in HC.FILES_THAT_HAVE_PERCEPTUAL_HASH or mime not in ClientFilesMaintenanceWorkers.MIMES_WORKERS_CAN_LOAD:
+                
+                return None
+                
+            
+            path = client_files_manager.GetFilePath( hash, mime )
+            
+            return ( ClientFilesMaintenanceWorkers.GetPerceptualHashes, ( path, mime, force_pil ) )
+            
+        elif job_type == REGENERATE_FILE_DATA_JOB_BLURHASH:
+            
+            if mime not in HC.MIMES_WITH_THUMBNAILS or hash not in hashes_to_thumbnail_bytes:
+                
+                return None
+                
+            
+            return ( ClientFilesMaintenanceWorkers.GetBlurhash, ( hashes_to_thumbnail_bytes[ hash ], force_pil ) )
+            
+        
+        return None
+        
+    
+    def _GetWorkerCalls( self, media_results_to_job_types ):
+        
+        worker_calls = []
+        
+        # metadata and integrity jobs run first and can change or remove the file, so anything after them has to wait for the normal way
+        index_of_metadata_job = ALL_REGEN_JOBS_IN_RUN_ORDER.index( REGENERATE_FILE_DATA_JOB_FILE_METADATA )
+        
+        jobs_that_change_the_file = set( ALL_REGEN_JOBS_IN_RUN_ORDER[ : index_of_metadata_job + 1 ] )
+        
+        jobs_that_change_the_thumbnail = { REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL, REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL }
+        
+        thumbnail_hashes = { media_result.GetHash() for ( media_result, job_types ) in media_results_to_job_types.items() if REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL in job_types or REGENERATE_FILE_DATA_JOB_BLURHASH in job_types }
+        
+        hashes_to_thumbnail_bytes = {}
+        
+        if len( thumbnail_hashes ) > 0:
+            
+            hashes_to_thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytesBatch( thumbnail_hashes )
+            
+        
+        for ( media_result, job_types ) in media_results_to_job_types.items():
+            
+            if not jobs_that_change_the_file.isdisjoint( job_types ):
+                
+                continue
+                
+            
+            for job_type in job_types:
+                
+                if job_type == REGENERATE_FILE_DATA_JOB_BLURHASH and not jobs_that_change_the_thumbnail.isdisjoint( job_types ):
+                    
+                    continue
+                    
+                
+                try:
+                    
+                    worker_call = self._GetWorkerCall( media_result, job_type, hashes_to_thumbnail_bytes )
+                    
+                except HydrusExceptions.FileMissingException:
+                    
+                    # the normal way will deal with this
+                    continue
+                    
+                
+                if worker_call is not None:
+                    
+                    ( func, args ) = worker_call
+                    
+                    worker_calls.append( ( media_result.GetHash(), job_type, func, args ) )
+                    
+                
+            
+        
+        return worker_calls
+        
+    
     def _HasEXIF( self, media_result ):
         
         hash = media_result.GetHash()
@@ -2556,7 +3076,7 @@ class FilesMaintenanceManager( object ):
             
         
     
-    def _RegenFileThumbnailForce( self, media_result ):
+    def _RegenFileThumbnailForce( self, media_result, future = None ):
         
         good_to_go = self._CanRegenThumbForMediaResult( media_result )
         
@@ -2567,7 +3087,14 @@ class FilesMaintenanceManager( object ):
         
         try:
             
-            return self._controller.client_files_manager.RegenerateThumbnail( media_result )
+            thumbnail_bytes = None
+            
+            if future is not None:
+                
+                thumbnail_bytes = self._worker_pool.GetResult( future )
+                
+            
+            return self._controller.client_files_manager.RegenerateThumbnail( media_result, thumbnail_bytes = thumbnail_bytes )
             
         except HydrusExceptions.FileMissingException:
             
@@ -2575,7 +3102,7 @@ class FilesMaintenanceManager( object ):
             
         
     
-    def _RegenFileThumbnailRefit( self, media_result ):
+    def _RegenFileThumbnailRefit( self, media_result, future = None ):
         
         good_to_go = self._CanRegenThumbForMediaResult( media_result )
         
@@ -2586,6 +3113,20 @@ class FilesMaintenanceManager( object ):
         
         try:
             
+            if future is not None:
+                
+                thumbnail_bytes = self._worker_pool.GetResult( future )
+                
+                if thumbnail_bytes is None:
+                    
+                    return False
+                    
+                
+                self._controller.client_files_manager.RegenerateThumbnail( media_result, thumbnail_bytes = thumbnail_bytes )
+                
+                return True
+                
+            
             was_regenerated = self._controller.client_files_manager.RegenerateThumbnailIfWrongSize( media_result )
             
             return was_regenerated
@@ -2596,7 +3137,7 @@ class FilesMaintenanceManager( object ):
             
         
     
-    def _RegenPixelHash( self, media_result ):
+    def _RegenPixelHash( self, media_result, future = None ):
         
         hash = media_result.GetHash()
         mime = media_result.GetMime()
@@ -2613,6 +3154,11 @@ class FilesMaintenanceManager( object ):
             return None
             
         
+        if future is not None:
+            
+            return self._worker_pool.GetResult( future )
+            
+        
         try:
             
             path = self._controller.client_files_manager.GetFilePath( hash, mime )
@@ -2635,16 +3181,21 @@ class FilesMaintenanceManager( object ):
             return None
             
         
-    def _RegenBlurhash( self, media ):
+    def _RegenBlurhash( self, media, future = None ):
         
         if media.GetMime() not in HC.MIMES_WITH_THUMBNAILS:
             
             return None
             
         
+        if future is not None:
+            
+            return self._worker_pool.GetResult( future )
+            
+        
         try:
             
-            thumbnail_path = self._controller.client_files_manager.GetThumbnailPath( media )
+            thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( media )
             
         except HydrusExceptions.FileMissingException as e:
             
@@ -2653,9 +3204,9 @@ class FilesMaintenanceManager( object ):
         
         try:
             
-            thumbnail_mime = HydrusFileHandling.GetThumbnailMime( thumbnail_path )
+            thumbnail_mime = HydrusFileHandling.GetThumbnailMimeFromBytes( thumbnail_bytes )
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( thumbnail_path, thumbnail_mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, thumbnail_mime )
             
             return HydrusBlurhash.GetBlurhashFromNumPy( numpy_image )
             
@@ -2666,7 +3217,7 @@ class FilesMaintenanceManager( object ):
         
     
     
-    def _RegenSimilarFilesMetadata( self, media_result ):
+    def _RegenSimilarFilesMetadata( self, media_result, future = None ):
         
         hash = media_result.GetHash()
         mime = media_result.GetMime()
@@ -2678,6 +3229,11 @@ class FilesMaintenanceManager( object ):
             return None
             
         
+        if future is not None:
+            
+            return self._worker_pool.GetResult( future )
+            
+        
         try:
             
             path = self._controller.client_files_manager.GetFilePath( hash, mime )
@@ -2718,8 +3274,32 @@ class FilesMaintenanceManager( object ):
         
         cleared_jobs = []
         
+        # the CPU-heavy parts of some jobs can go off to worker processes. we keep a few ahead of where we are in the loop, and the loop picks up the results, so all the db and file writes still happen here
+        
+        worker_calls = collections.deque()
+        worker_futures = {}
+        
+        def top_up_worker_futures():
+            
+            max_num_in_flight = self._worker_pool.GetNumWorkers() * 2
+            
+            while len( worker_calls ) > 0 and len( worker_futures ) < max_num_in_flight:
+                
+                ( hash, job_type, func, args ) = worker_calls.popleft()
+                
+                worker_futures[ ( hash, job_type ) ] = self._worker_pool.Submit( func, *args )
+                
+            
+        
         try:
             
+            if self._worker_pool.IsActive():
+                
+                worker_calls.extend( self._GetWorkerCalls( media_results_to_job_types ) )
+                
+                top_up_worker_futures()
+                
+            
             big_pauser = HydrusThreading.BigJobPauser( wait_time = 0.8 )
             
             last_time_jobs_were_cleared = HydrusTime.GetNow()
@@ -2737,6 +3317,13 @@ class FilesMaintenanceManager( object ):
                 
                 for job_type in job_types:
                     
+                    future = worker_futures.pop( ( hash, job_type ), None )
+                    
+                    if future is not None:
+                        
+                        top_up_worker_futures()
+                        
+                    
                     if HG.file_report_mode:
                         
                         HydrusData.ShowText( 'file maintenance: {} for {}'.format( regen_file_enum_to_str_lookup[ job_type ], hash.hex() ) )
@@ -2786,15 +3373,15 @@ class FilesMaintenanceManager( object ):
                             
                         elif job_type == REGENERATE_FILE_DATA_JOB_PIXEL_HASH:
                             
-                            additional_data = self._RegenPixelHash( media_result )
+                            additional_data = self._RegenPixelHash( media_result, future = future )
                             
                         elif job_type == REGENERATE_FILE_DATA_JOB_FORCE_THUMBNAIL:
                             
-                            additional_data = self._RegenFileThumbnailForce( media_result )
+                            additional_data = self._RegenFileThumbnailForce( media_result, future = future )
                             
                         elif job_type == REGENERATE_FILE_DATA_JOB_REFIT_THUMBNAIL:
                             
-                            was_regenerated = self._RegenFileThumbnailRefit( media_result )
+                            was_regenerated = self._RegenFileThumbnailRefit( media_result, future = future )
                             
                             additional_data = was_regenerated
                             
@@ -2822,7 +3409,7 @@ class FilesMaintenanceManager( object ):
                             
                         elif job_type == REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA:
                             
-                            additional_data = self._RegenSimilarFilesMetadata( media_result )
+                            additional_data = self._RegenSimilarFilesMetadata( media_result, future = future )
                             
                         elif job_type == REGENERATE_FILE_DATA_JOB_FIX_PERMISSIONS:
                             
@@ -2830,7 +3417,7 @@ class FilesMaintenanceManager( object ):
                             
                         elif job_type == REGENERATE_FILE_DATA_JOB_BLURHASH:
                             
-                            additional_data = self._RegenBlurhash( media_result )
+                            additional_data = self._RegenBlurhash( media_result, future = future )
                             
                         elif job_type in (
                             REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_PRESENCE_REMOVE_RECORD,
@@ -2929,6 +3516,11 @@ class FilesMaintenanceManager( object ):
             
         finally:
             
+            for future in worker_futures.values():
+                
+                future.cancel()
+                
+            
             if len( cleared_jobs ) > 0:
                 
                 self._controller.Write( 'file_maintenance_clear_jobs', cleared_jobs )
@@ -3136,7 +3728,10 @@ class FilesMaintenanceManager( object ):
                             
                             media_results_to_job_types = { hashes_to_media_results[ hash ] : job_types for ( hash, job_types ) in hashes_to_job_types.items() }
                             
-                            for ( media_result, job_types ) in media_results_to_job_types.items():
+                            # with worker processes, we do one file per worker at a time. the throttle is checked before each block and charged for every job, so it still holds over time
+                            block_size = max( 1, self._worker_pool.GetNumWorkers() )
+                            
+                            for block_of_media_results_to_job_types in HydrusLists.SplitListIntoChunks( list( media_results_to_job_types.items() ), block_size ):
                                 
                                 wait_on_maintenance()
                                 
@@ -3147,7 +3742,7 @@ class FilesMaintenanceManager( object ):
                                 
                                 with self._lock:
                                     
-                                    self._RunJob( { media_result : job_types }, job_status )
+                                    self._RunJob( dict( block_of_media_results_to_job_types ), job_status )
                                     
                                 
                             
@@ -3188,6 +3783,8 @@ class FilesMaintenanceManager( object ):
     
     def NotifyNewOptions( self ):
         
+        self._worker_pool.SetNumWorkers( self._controller.new_options.GetInteger( 'file_maintenance_num_worker_processes' ) )
+        
         with self._lock:
             
             self._ReInitialiseWorkRules()
@@ -3281,6 +3878,8 @@ class FilesMaintenanceManager( object ):
         
         self._shutdown = True
         
+        self._worker_pool.Shutdown()
+        
         self._wake_background_event.set()
         
     
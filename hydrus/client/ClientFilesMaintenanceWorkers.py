@@ -0,0 +1,205 @@
+import concurrent.futures
+import multiprocessing
+import threading
+import typing
+
+from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
+from hydrus.core.files import HydrusFileHandling
+from hydrus.core.files.images import HydrusBlurhash
+from hydrus.core.files.images import HydrusImageHandling
+
+from hydrus.client import ClientImageHandling
+
+# the CPU-heavy half of some file maintenance jobs, done in worker processes so we can use more than one core
+# everything here has to be a plain top-level function of plain picklable arguments, and must not touch the controller, which does not exist in a worker
+# the main side does all the file lookups beforehand and all the db and file writes afterwards
+# the import pipeline uses the same pool for its analysis stage
+
+# a worker has no Qt app to render a pdf or svg, and may not have the user's ffmpeg, so we only send it stuff PIL, OpenCV, or our own pure python can load
+MIMES_WORKERS_CAN_LOAD = set( HC.IMAGES ).union( HC.VIEWABLE_IMAGE_PROJECT_FILES )
+
+def GenerateThumbnailBytes( path, target_resolution, mime, duration, num_frames, percentage_in ):
+    
+    try:
+        
+        return HydrusFileHandling.GenerateThumbnailBytes( path, target_resolution, mime, duration, num_frames, percentage_in = percentage_in )
+        
+    except Exception as e:
+        
+        raise HydrusExceptions.FileMissingException( 'The thumbnail could not be regenerated from the original file: {}'.format( e ) )
+        
+    
+
+def GenerateThumbnailBytesIfWrongSize( thumbnail_bytes, path, target_resolution, mime, duration, num_frames, percentage_in, force_pil ):
+    
+    if thumbnail_bytes is not None:
+        
+        try:
+            
+            thumbnail_mime = HydrusFileHandling.GetThumbnailMimeFromBytes( thumbnail_bytes )
+            
+            numpy_image = HydrusImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, thumbnail_mime, force_pil = force_pil )
+            
+            if HydrusImageHandling.GetResolutionNumPy( numpy_image ) == tuple( target_resolution ):
+                
+                return None
+                
+            
+        except:
+            
+            pass
+            
+        
+    
+    return GenerateThumbnailBytes( path, target_resolution, mime, duration, num_frames, percentage_in )
+    
+
+def GetBlurhash( thumbnail_bytes, force_pil ):
+    
+    try:
+        
+        thumbnail_mime = HydrusFileHandling.GetThumbnailMimeFromBytes( thumbnail_bytes )
+        
+        numpy_image = HydrusImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, thumbnail_mime, force_pil = force_pil )
+        
+        return HydrusBlurhash.GetBlurhashFromNumPy( numpy_image )
+        
+    except:
+        
+        return None
+        
+    
+
+def GetPerceptualHashes( path, mime, force_pil ):
+    
+    try:
+        
+        numpy_image = HydrusImageHandling.GenerateNumPyImage( path, mime, force_pil = force_pil )
+        
+        return ClientImageHandling.GenerateShapePerceptualHashesNumPy( numpy_image )
+        
+    except:
+        
+        return set()
+        
+    
+
+def GetPixelHash( path, mime ):
+    
+    try:
+        
+        return HydrusImageHandling.GetImagePixelHash( path, mime )
+        
+    except:
+        
+        return None
+        
+    
+
+class FileMaintenanceWorkerPool( object ):
+    
+    def __init__( self ):
+        
+        self._num_workers = 0
+        self._executor = None
+        
+        self._lock = threading.Lock()
+        
+    
+    def _ShutdownExecutor( self ):
+        
+        if self._executor is not None:
+            
+            self._executor.shutdown( wait = False, cancel_futures = True )
+            
+            self._executor = None
+            
+        
+    
+    def GetNumWorkers( self ) -> int:
+        
+        with self._lock:
+            
+            return self._num_workers
+            
+        
+    
+    def GetResult( self, future: concurrent.futures.Future ):
+        
+        try:
+            
+            return future.result()
+            
+        except concurrent.futures.BrokenExecutor:
+            
+            # a worker died, probably a decoder crashing on a bad file. we'll get a fresh pool next time
+            
+            self.Reset()
+            
+            raise HydrusExceptions.DamagedOrUnusualFileException( 'A file maintenance worker process died while working on this file! It may be damaged or in an unusual format.' )
+            
+        
+    
+    def IsActive( self ) -> bool:
+        
+        with self._lock:
+            
+            return self._num_workers > 0
+            
+        
+    
+    def Reset( self ):
+        
+        with self._lock:
+            
+            self._ShutdownExecutor()
+            
+        
+    
+    def SetNumWorkers( self, num_workers: int ):
+        
+        with self._lock:
+            
+            if num_workers != self._num_workers:
+                
+                self._ShutdownExecutor()
+                
+                self._num_workers = num_workers
+                
+            
+        
+    
+    def Shutdown( self ):
+        
+        with self._lock:
+            
+            self._ShutdownExecutor()
+            
+            self._num_workers = 0
+            
+        
+    
+    def Submit( self, func: typing.Callable, *args ) -> concurrent.futures.Future:
+        
+        with self._lock:
+            
+            if self._num_workers == 0:
+                
+                raise Exception( 'The file maintenance worker pool is not active!' )
+                
+            
+            if self._executor is None:
+                
+                # spawn, not fork--forking a process with Qt and a bunch of threads holding locks is asking for trouble
+                
+                self._executor = concurrent.futures.ProcessPoolExecutor( max_workers = self._num_workers, mp_context = multiprocessing.get_context( 'spawn' ) )
+                
+                HydrusData.Print( 'Started {} file worker processes.'.format( HydrusData.ToHumanInt( self._num_workers ) ) )
+                
+            
+            return self._executor.submit( func, *args )
+            
+        
+    
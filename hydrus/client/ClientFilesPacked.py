@@ -0,0 +1,525 @@
+import os
+import struct
+import threading
+import typing
+
+from hydrus.core import HydrusData
+from hydrus.core import HydrusPaths
+
+# an optional alternative to one-file-per-thumbnail. each thumbnail subfolder gets an append-only pack file and an offset index beside it
+# a record in the pack is [ hash, length, thumbnail bytes ]. a record with zero length is a tombstone, i.e. a delete
+# the index is [ hash, offset of the thumbnail bytes, length ] for every record, so we can load it in one read. it can be rebuilt from the pack if it falls behind
+# a compaction swaps in a new pack and index one after the other, so a crash between the two can leave them mismatched. we check the pack's own record headers against the index on load and on read, and rebuild the index from the pack if they disagree
+
+PACK_FILENAME = 'thumbnails.pack'
+PACK_INDEX_FILENAME = 'thumbnails.pack.index'
+
+PACK_FILENAMES = { PACK_FILENAME, PACK_INDEX_FILENAME }
+
+PACK_RECORD_HEADER = struct.Struct( '>32sI' )
+PACK_INDEX_RECORD = struct.Struct( '>32sQI' )
+
+# when reading a batch, we'll read straight through gaps smaller than this rather than seek
+MAX_READ_GAP = 256 * 1024
+
+class ThumbnailPack( object ):
+    
+    def __init__( self, directory: str ):
+        
+        self._directory = directory
+        
+        self._pack_path = os.path.join( self._directory, PACK_FILENAME )
+        self._index_path = os.path.join( self._directory, PACK_INDEX_FILENAME )
+        
+        self._hashes_to_locations = None
+        self._pack_size = 0
+        self._num_dead_bytes = 0
+        
+        self._lock = threading.Lock()
+        
+    
+    def _AppendRecord( self, hash: bytes, thumbnail_bytes: bytes ):
+        
+        self._InitialiseIndex()
+        
+        HydrusPaths.MakeSureDirectoryExists( self._directory )
+        
+        offset = self._pack_size + PACK_RECORD_HEADER.size
+        length = len( thumbnail_bytes )
+        
+        with open( self._pack_path, 'ab' ) as f:
+            
+            f.write( PACK_RECORD_HEADER.pack( hash, length ) )
+            f.write( thumbnail_bytes )
+            
+        
+        with open( self._index_path, 'ab' ) as f:
+            
+            f.write( PACK_INDEX_RECORD.pack( hash, offset, length ) )
+            
+        
+        self._pack_size = offset + length
+        
+        self._IndexRecord( hash, offset, length )
+        
+    
+    def _DeletePackFiles( self ):
+        
+        for path in ( self._pack_path, self._index_path ):
+            
+            if os.path.exists( path ):
+                
+                os.remove( path )
+                
+            
+        
+        self._hashes_to_locations = None
+        
+    
+    def _HeaderMatches( self, header_bytes: bytes, hash: bytes, length: int ) -> bool:
+        
+        return len( header_bytes ) == PACK_RECORD_HEADER.size and PACK_RECORD_HEADER.unpack( header_bytes ) == ( hash, length )
+        
+    
+    def _IndexRecord( self, hash: bytes, offset: int, length: int ):
+        
+        if hash in self._hashes_to_locations:
+            
+            ( old_offset, old_length ) = self._hashes_to_locations[ hash ]
+            
+            self._num_dead_bytes += PACK_RECORD_HEADER.size + old_length
+            
+        
+        if length == 0:
+            
+            self._num_dead_bytes += PACK_RECORD_HEADER.size
+            
+            if hash in self._hashes_to_locations:
+                
+                del self._hashes_to_locations[ hash ]
+                
+            
+        else:
+            
+            self._hashes_to_locations[ hash ] = ( offset, length )
+            
+        
+    
+    def _InitialiseIndex( self ):
+        
+        if self._hashes_to_locations is not None:
+            
+            return
+            
+        
+        self._hashes_to_locations = {}
+        self._pack_size = 0
+        self._num_dead_bytes = 0
+        
+        if not os.path.exists( self._pack_path ):
+            
+            return
+            
+        
+        actual_pack_size = os.path.getsize( self._pack_path )
+        
+        num_good_index_bytes = 0
+        
+        if os.path.exists( self._index_path ):
+            
+            with open( self._index_path, 'rb' ) as f:
+                
+                index_bytes = f.read()
+                
+            
+            num_whole_index_bytes = len( index_bytes ) - ( len( index_bytes ) % PACK_INDEX_RECORD.size )
+            
+            index_matches_pack = True
+            
+            with open( self._pack_path, 'rb' ) as pack_f:
+                
+                for ( hash, offset, length ) in PACK_INDEX_RECORD.iter_unpack( index_bytes[ : num_whole_index_bytes ] ):
+                    
+                    if offset + length > actual_pack_size:
+                        
+                        break
+                        
+                    
+                    pack_f.seek( offset - PACK_RECORD_HEADER.size )
+                    
+                    if not self._HeaderMatches( pack_f.read( PACK_RECORD_HEADER.size ), hash, length ):
+                        
+                        index_matches_pack = False
+                        
+                        break
+                        
+                    
+                    self._IndexRecord( hash, offset, length )
+                    
+                    self._pack_size = offset + length
+                    
+                    num_good_index_bytes += PACK_INDEX_RECORD.size
+                    
+                
+            
+            if not index_matches_pack:
+                
+                HydrusData.Print( 'Thumbnail pack "{}" did not match its index, so the index is being rebuilt from the pack.'.format( self._pack_path ) )
+                
+                self._hashes_to_locations = {}
+                self._pack_size = 0
+                self._num_dead_bytes = 0
+                
+                num_good_index_bytes = 0
+                
+            
+            if num_good_index_bytes < len( index_bytes ):
+                
+                with open( self._index_path, 'r+b' ) as f:
+                    
+                    f.truncate( num_good_index_bytes )
+                    
+                
+            
+        
+        if self._pack_size < actual_pack_size:
+            
+            # the index fell behind, probably a crash mid-write, so let's catch up from the pack itself
+            
+            self._RecoverIndexFromPack( actual_pack_size )
+            
+        
+    
+    def _ReadRecords( self, hashes: typing.Collection[ bytes ] ):
+        
+        # returns the thumbnail bytes of every record whose header agreed with the index, and whether they all did
+        
+        locations = sorted( ( self._hashes_to_locations[ hash ] + ( hash, ) for hash in hashes if hash in self._hashes_to_locations ) )
+        
+        if len( locations ) == 0:
+            
+            return ( {}, True )
+            
+        
+        # group the wanted records into runs we can read in one go
+        
+        runs = []
+        
+        current_run = [ locations[0] ]
+        
+        for location in locations[1:]:
+            
+            ( previous_offset, previous_length, previous_hash ) = current_run[-1]
+            ( offset, length, hash ) = location
+            
+            if offset - ( previous_offset + previous_length ) <= MAX_READ_GAP:
+                
+                current_run.append( location )
+                
+            else:
+                
+                runs.append( current_run )
+                
+                current_run = [ location ]
+                
+            
+        
+        runs.append( current_run )
+        
+        hashes_to_thumbnail_bytes = {}
+        all_records_ok = True
+        
+        with open( self._pack_path, 'rb' ) as f:
+            
+            for run in runs:
+                
+                ( first_offset, first_length, first_hash ) = run[0]
+                ( last_offset, last_length, last_hash ) = run[-1]
+                
+                # we start at the first header, so we can check every record is what the index says
+                
+                run_start = first_offset - PACK_RECORD_HEADER.size
+                
+                f.seek( run_start )
+                
+                run_bytes = f.read( last_offset + last_length - run_start )
+                
+                for ( offset, length, hash ) in run:
+                    
+                    header_start = offset - PACK_RECORD_HEADER.size - run_start
+                    
+                    if not self._HeaderMatches( run_bytes[ header_start : header_start + PACK_RECORD_HEADER.size ], hash, length ):
+                        
+                        all_records_ok = False
+                        
+                        continue
+                        
+                    
+                    hashes_to_thumbnail_bytes[ hash ] = run_bytes[ offset - run_start : offset - run_start + length ]
+                    
+                
+            
+        
+        return ( hashes_to_thumbnail_bytes, all_records_ok )
+        
+    
+    def _RebuildIndexFromPack( self ):
+        
+        with open( self._index_path, 'wb' ) as f:
+            
+            pass
+            
+        
+        self._hashes_to_locations = None
+        
+        self._InitialiseIndex()
+        
+    
+    def _RecoverIndexFromPack( self, actual_pack_size: int ):
+        
+        new_index_records = []
+        
+        with open( self._pack_path, 'rb' ) as f:
+            
+            f.seek( self._pack_size )
+            
+            while True:
+                
+                header_bytes = f.read( PACK_RECORD_HEADER.size )
+                
+                if len( header_bytes ) < PACK_RECORD_HEADER.size:
+                    
+                    break
+                    
+                
+                ( hash, length ) = PACK_RECORD_HEADER.unpack( header_bytes )
+                
+                offset = self._pack_size + PACK_RECORD_HEADER.size
+                
+                if offset + length > actual_pack_size:
+                    
+                    break
+                    
+                
+                f.seek( length, os.SEEK_CUR )
+                
+                self._IndexRecord( hash, offset, length )
+                
+                self._pack_size = offset + length
+                
+                new_index_records.append( PACK_INDEX_RECORD.pack( hash, offset, length ) )
+                
+            
+        
+        if self._pack_size < actual_pack_size:
+            
+            HydrusData.Print( 'Thumbnail pack "{}" had {} of truncated data at the end, which is being cut off.'.format( self._pack_path, HydrusData.ToHumanBytes( actual_pack_size - self._pack_size ) ) )
+            
+            with open( self._pack_path, 'r+b' ) as f:
+                
+                f.truncate( self._pack_size )
+                
+            
+        
+        with open( self._index_path, 'ab' ) as f:
+            
+            f.write( b''.join( new_index_records ) )
+            
+        
+    
+    def Add( self, hash: bytes, thumbnail_bytes: bytes ):
+        
+        if len( thumbnail_bytes ) == 0:
+            
+            raise Exception( 'Cannot add an empty thumbnail to a thumbnail pack!' )
+            
+        
+        with self._lock:
+            
+            self._AppendRecord( hash, thumbnail_bytes )
+            
+        
+    
+    def Compact( self ):
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            if len( self._hashes_to_locations ) == 0:
+                
+                self._DeletePackFiles()
+                
+                return
+                
+            
+            temp_pack_path = self._pack_path + '.compacting'
+            temp_index_path = self._index_path + '.compacting'
+            
+            new_hashes_to_locations = {}
+            new_pack_size = 0
+            
+            with open( self._pack_path, 'rb' ) as source, open( temp_pack_path, 'wb' ) as dest_pack, open( temp_index_path, 'wb' ) as dest_index:
+                
+                # hash order, so a waterfall (which also goes in hash order) reads straight through
+                
+                for ( hash, ( offset, length ) ) in sorted( self._hashes_to_locations.items() ):
+                    
+                    source.seek( offset )
+                    
+                    thumbnail_bytes = source.read( length )
+                    
+                    new_offset = new_pack_size + PACK_RECORD_HEADER.size
+                    
+                    dest_pack.write( PACK_RECORD_HEADER.pack( hash, length ) )
+                    dest_pack.write( thumbnail_bytes )
+                    
+                    dest_index.write( PACK_INDEX_RECORD.pack( hash, new_offset, length ) )
+                    
+                    new_hashes_to_locations[ hash ] = ( new_offset, length )
+                    new_pack_size = new_offset + length
+                    
+                
+            
+            os.replace( temp_pack_path, self._pack_path )
+            os.replace( temp_index_path, self._index_path )
+            
+            self._hashes_to_locations = new_hashes_to_locations
+            self._pack_size = new_pack_size
+            self._num_dead_bytes = 0
+            
+        
+    
+    def Delete( self, hash: bytes ):
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            if hash in self._hashes_to_locations:
+                
+                self._AppendRecord( hash, b'' )
+                
+            
+        
+    
+    def DeletePackFiles( self ):
+        
+        with self._lock:
+            
+            self._DeletePackFiles()
+            
+        
+    
+    def GetHashes( self ) -> typing.Set[ bytes ]:
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            return set( self._hashes_to_locations.keys() )
+            
+        
+    
+    def GetNumDeadBytes( self ) -> int:
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            return self._num_dead_bytes
+            
+        
+    
+    def GetSize( self ) -> int:
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            return self._pack_size
+            
+        
+    
+    def GetThumbnailBytes( self, hash: bytes ) -> typing.Optional[ bytes ]:
+        
+        return self.GetThumbnailBytesBatch( ( hash, ) ).get( hash, None )
+        
+    
+    def GetThumbnailBytesBatch( self, hashes: typing.Collection[ bytes ] ) -> typing.Dict[ bytes, bytes ]:
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            ( hashes_to_thumbnail_bytes, all_records_ok ) = self._ReadRecords( hashes )
+            
+            if not all_records_ok:
+                
+                HydrusData.Print( 'Thumbnail pack "{}" had records that did not match its index, so the index is being rebuilt from the pack.'.format( self._pack_path ) )
+                
+                self._RebuildIndexFromPack()
+                
+                ( hashes_to_thumbnail_bytes, all_records_ok ) = self._ReadRecords( hashes )
+                
+            
+            return hashes_to_thumbnail_bytes
+            
+        
+    
+    def HasThumbnail( self, hash: bytes ) -> bool:
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            return hash in self._hashes_to_locations
+            
+        
+    
+    def WantsCompaction( self ) -> bool:
+        
+        with self._lock:
+            
+            self._InitialiseIndex()
+            
+            return self._num_dead_bytes > 0 and self._num_dead_bytes > self._pack_size * 0.25
+            
+        
+    
+
+class ThumbnailPackManager( object ):
+    
+    def __init__( self ):
+        
+        self._directories_to_packs = {}
+        
+        self._lock = threading.Lock()
+        
+    
+    def Clear( self ):
+        
+        with self._lock:
+            
+            self._directories_to_packs = {}
+            
+        
+    
+    def GetPack( self, directory: str ) -> ThumbnailPack:
+        
+        with self._lock:
+            
+            if directory not in self._directories_to_packs:
+                
+                self._directories_to_packs[ directory ] = ThumbnailPack( directory )
+                
+            
+            return self._directories_to_packs[ directory ]
+            
+        
+    
+
+def IsPackFilename( filename: str ) -> bool:
+    
+    return filename in PACK_FILENAMES or filename.endswith( '.compacting' )
+    
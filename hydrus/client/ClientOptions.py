@@ -149,9 +149,12 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'booleans' ][ 'use_system_ffmpeg' ] = False
         
+        self._dictionary[ 'booleans' ][ 'use_packed_thumbnail_store' ] = False
+        
         self._dictionary[ 'booleans' ][ 'elide_page_tab_names' ] = True
         
         self._dictionary[ 'booleans' ][ 'maintain_similar_files_duplicate_pairs_during_idle' ] = False
+        self._dictionary[ 'booleans' ][ 'similar_files_use_in_memory_index' ] = False
         
         self._dictionary[ 'booleans' ][ 'show_namespaces' ] = True
         self._dictionary[ 'booleans' ][ 'show_number_namespaces' ] = True
@@ -186,6 +189,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'booleans' ][ 'tag_display_maintenance_during_active' ] = True
         
         self._dictionary[ 'booleans' ][ 'save_page_sort_on_change' ] = False
+        self._dictionary[ 'booleans' ][ 'keep_pages_sorted_on_content_updates' ] = False
+        self._dictionary[ 'booleans' ][ 'keep_pages_collected_on_content_updates' ] = False
         self._dictionary[ 'booleans' ][ 'force_hide_page_signal_on_new_page' ] = False
         
         self._dictionary[ 'booleans' ][ 'pause_export_folders_sync' ] = False
@@ -478,6 +483,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'image_cache_size' ] = 1024 * 1024 * 384
         self._dictionary[ 'integers' ][ 'image_tile_cache_size' ] = 1024 * 1024 * 256
         
+        self._dictionary[ 'integers' ][ 'data_cache_eviction_policy' ] = CC.CACHE_EVICTION_POLICY_LRU
+        
         self._dictionary[ 'integers' ][ 'thumbnail_cache_timeout' ] = 86400
         self._dictionary[ 'integers' ][ 'image_cache_timeout' ] = 600
         self._dictionary[ 'integers' ][ 'image_tile_cache_timeout' ] = 300
@@ -500,6 +507,10 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         self._dictionary[ 'integers' ][ 'file_maintenance_active_throttle_files' ] = 1
         self._dictionary[ 'integers' ][ 'file_maintenance_active_throttle_time_delta' ] = 20
         
+        self._dictionary[ 'integers' ][ 'file_maintenance_num_worker_processes' ] = 0
+        
+        self._dictionary[ 'integers' ][ 'file_import_num_worker_processes' ] = 0
+        
         self._dictionary[ 'integers' ][ 'subscription_network_error_delay' ] = 12 * 3600
         self._dictionary[ 'integers' ][ 'subscription_other_error_delay' ] = 36 * 3600
         self._dictionary[ 'integers' ][ 'downloader_network_error_delay' ] = 90 * 60
@@ -569,6 +580,8 @@ class ClientOptions( HydrusSerialisable.SerialisableBase ):
         
         self._dictionary[ 'noneable_integers' ][ 'forced_search_limit' ] = None
         
+        self._dictionary[ 'noneable_integers' ][ 'thumbnail_bitmap_disk_cache_size' ] = None
+        
         self._dictionary[ 'noneable_integers' ][ 'num_recent_tags' ] = 20
         
         self._dictionary[ 'noneable_integers' ][ 'duplicate_background_switch_intensity_a' ] = 0
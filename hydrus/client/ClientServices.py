@@ -1,3 +1,5 @@
+import collections
+import concurrent.futures
 import hashlib
 import json
 import os
@@ -35,6 +37,13 @@ from hydrus.client.networking import ClientNetworkingJobs
 SHORT_DELAY_PERIOD = 50000
 ACCOUNT_SYNC_PERIOD = 250000
 
+# how many mappings updates we need in one sync before we bulk load them and rebuild the caches after, rather than keep the caches in step row by row
+BULK_LOAD_MIN_NUM_UPDATES_FIRST_SYNC = 10
+BULK_LOAD_MIN_NUM_UPDATES = 200
+
+# how many update files we read and decode ahead of the one the db is working on
+UPDATE_PREFETCH_NUM = 2
+
 def GenerateDefaultServiceDictionary( service_type ):
     
     dictionary = HydrusSerialisable.SerialisableDictionary()
@@ -188,6 +197,30 @@ def GenerateService( service_key, service_type, name, dictionary = None ):
     
     return cl( service_key, service_type, name, dictionary )
     
+def LoadRepositoryUpdate( update_hash, mime ):
+    
+    # this runs in a prefetch worker, so no db work in here. the caller sorts out any trouble
+    
+    time_started = HydrusTime.GetNowPrecise()
+    
+    update_path = HG.client_controller.client_files_manager.GetFilePath( update_hash, mime )
+    
+    with open( update_path, 'rb' ) as f:
+        
+        update_network_bytes = f.read()
+        
+    
+    try:
+        
+        update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
+        
+    except Exception as e:
+        
+        raise HydrusExceptions.SerialisationException( 'Could not decode update {}: {}'.format( update_hash.hex(), e ) )
+        
+    
+    return ( update, HydrusTime.GetNowPrecise() - time_started )
+    
 class Service( object ):
     
     def __init__( self, service_key, service_type, name, dictionary = None ):
@@ -1597,6 +1630,62 @@ class ServiceRestricted( ServiceRemote ):
             
         
     
+class RepositoryUpdatePrefetcher( object ):
+    
+    def __init__( self, update_hashes, mime ):
+        
+        self._update_hashes = collections.deque( update_hashes )
+        self._mime = mime
+        
+        self._futures = collections.deque()
+        
+        self._executor = concurrent.futures.ThreadPoolExecutor( max_workers = UPDATE_PREFETCH_NUM, thread_name_prefix = 'repository update decode' )
+        
+        self._shutdown = False
+        
+        self._TopUp()
+        
+    
+    def _TopUp( self ):
+        
+        while len( self._futures ) < UPDATE_PREFETCH_NUM and len( self._update_hashes ) > 0:
+            
+            update_hash = self._update_hashes.popleft()
+            
+            self._futures.append( self._executor.submit( LoadRepositoryUpdate, update_hash, self._mime ) )
+            
+        
+    
+    def GetNext( self ):
+        
+        if self._shutdown:
+            
+            raise HydrusExceptions.ShutdownException( 'The repository update prefetcher was shut down!' )
+            
+        
+        future = self._futures.popleft()
+        
+        # keep the workers busy on the next ones while the db works on this one
+        self._TopUp()
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        ( update, decode_time ) = future.result()
+        
+        wait_time = HydrusTime.GetNowPrecise() - time_started
+        
+        return ( update, decode_time, wait_time )
+        
+    
+    def Shutdown( self ):
+        
+        self._shutdown = True
+        
+        self._update_hashes.clear()
+        
+        self._executor.shutdown( wait = False, cancel_futures = True )
+        
+    
 class ServiceRepository( ServiceRestricted ):
     
     def __init__( self, service_key, service_type, name, dictionary = None ):
@@ -1729,6 +1818,18 @@ class ServiceRepository( ServiceRestricted ):
         HydrusData.Print( summary )
         
     
+    def _LogFinalUpdateTimes( self, total_decode_time, total_wait_time, total_db_time, row_name ):
+        
+        if total_decode_time + total_db_time == 0:
+            
+            return
+            
+        
+        summary = '{} {} updates: decode took {}, db waited {} for it, db work took {}'.format( self._name, row_name, HydrusTime.TimeDeltaToPrettyTimeDelta( total_decode_time ), HydrusTime.TimeDeltaToPrettyTimeDelta( total_wait_time ), HydrusTime.TimeDeltaToPrettyTimeDelta( total_db_time ) )
+        
+        HydrusData.Print( summary )
+        
+    
     def _ReportOngoingRowSpeed( self, job_status, rows_done, total_rows, precise_timestamp, rows_done_in_last_packet, row_name ):
         
         it_took = HydrusTime.GetNowPrecise() - precise_timestamp
@@ -1746,6 +1847,66 @@ class ServiceRepository( ServiceRestricted ):
             
         
     
+    def _ReportUpdateTimes( self, row_name, decode_time, wait_time, db_time ):
+        
+        # if the db spends a lot of time waiting, decode is the bottleneck and more prefetch will help
+        
+        if HG.profile_mode:
+            
+            summary = '{} {} update: decode took {}, db waited {} for it, db work took {}'.format( self._name, row_name, HydrusTime.TimeDeltaToPrettyTimeDelta( decode_time ), HydrusTime.TimeDeltaToPrettyTimeDelta( wait_time ), HydrusTime.TimeDeltaToPrettyTimeDelta( db_time ) )
+            
+            HG.client_controller.PrintProfile( summary )
+            
+        
+    
+    def _ShouldBulkLoad( self, this_is_first_content_work, content_hashes_and_content_types ):
+        
+        num_mappings_updates = len( [ 1 for ( content_hash, content_types ) in content_hashes_and_content_types if HC.CONTENT_TYPE_MAPPINGS in content_types ] )
+        
+        if this_is_first_content_work:
+            
+            return num_mappings_updates >= BULK_LOAD_MIN_NUM_UPDATES_FIRST_SYNC
+            
+        else:
+            
+            return num_mappings_updates >= BULK_LOAD_MIN_NUM_UPDATES
+            
+        
+    
+    def _SyncBulkLoadFinish( self, job_status, maintenance_mode, stop_time ):
+        
+        # if there are more updates on the way, they should go through the bulk path too, so we only rebuild when we are properly caught up
+        
+        if self._metadata.UpdateDue( from_client = True ):
+            
+            return
+            
+        
+        if len( HG.client_controller.Read( 'missing_repository_update_hashes', self._service_key ) ) > 0:
+            
+            return
+            
+        
+        job_status.SetStatusText( 'rebuilding tag caches' )
+        
+        # one cache per job, so we can stop in between and carry on next time
+        
+        while True:
+            
+            all_done = HG.client_controller.WriteSynchronous( 'repository_bulk_load_finish', self._service_key )
+            
+            if all_done:
+                
+                return
+                
+            
+            if HG.client_controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time ) or job_status.IsCancelled():
+                
+                return
+                
+            
+        
+    
     def _SyncDownloadMetadata( self ):
         
         with self._lock:
@@ -1779,7 +1940,8 @@ class ServiceRepository( ServiceRestricted ):
             
             try:
                 
-                response = self.Request( HC.GET, 'metadata', { 'since' : next_update_index } )
+                # we can read binary updates, so we ask for them. older servers ignore this and always send json
+                response = self.Request( HC.GET, 'metadata', { 'since' : next_update_index, 'update_format' : HydrusNetwork.UPDATE_FORMAT_BINARY } )
                 
                 metadata_slice = response[ 'metadata_slice' ]
                 
@@ -2020,8 +2182,18 @@ class ServiceRepository( ServiceRestricted ):
             
             ( this_is_first_definitions_work, definition_hashes_and_content_types, this_is_first_content_work, content_hashes_and_content_types ) = HG.client_controller.Read( 'repository_update_hashes_to_process', self._service_key, content_types_to_process )
             
+            is_bulk_loading = HG.client_controller.Read( 'repository_is_bulk_loading', self._service_key )
+            
             if len( definition_hashes_and_content_types ) == 0 and len( content_hashes_and_content_types ) == 0:
                 
+                if is_bulk_loading:
+                    
+                    # all the updates we have are in, but the caches are not rebuilt yet
+                    HG.client_controller.pub( 'message', job_status )
+                    
+                    self._SyncBulkLoadFinish( job_status, maintenance_mode, stop_time )
+                    
+                
                 return # no work to do
                 
             
@@ -2029,6 +2201,13 @@ class ServiceRepository( ServiceRestricted ):
                 
                 content_hashes_and_content_types = self._metadata.SortContentHashesAndContentTypes( content_hashes_and_content_types )
                 
+                if not is_bulk_loading and self._ShouldBulkLoad( this_is_first_content_work, content_hashes_and_content_types ):
+                    
+                    HG.client_controller.WriteSynchronous( 'repository_bulk_load_begin', self._service_key )
+                    
+                    is_bulk_loading = True
+                    
+                
             
             HydrusData.Print( title )
             
@@ -2046,6 +2225,12 @@ class ServiceRepository( ServiceRestricted ):
             
             definition_start_time = HydrusTime.GetNowPrecise()
             
+            total_definition_decode_time = 0.0
+            total_definition_wait_time = 0.0
+            total_definition_db_time = 0.0
+            
+            definition_prefetcher = RepositoryUpdatePrefetcher( [ definition_hash for ( definition_hash, content_types ) in definition_hashes_and_content_types ], HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+            
             try:
                 
                 for ( definition_hash, content_types ) in definition_hashes_and_content_types:
@@ -2063,7 +2248,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( definition_hash, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+                        ( definition_update, decode_time, wait_time ) = definition_prefetcher.GetNext()
                         
                     except HydrusExceptions.FileMissingException:
                         
@@ -2072,16 +2257,7 @@ class ServiceRepository( ServiceRestricted ):
                         raise Exception( 'An unusual error has occured during repository processing: a definition update file ({}) was missing. Your repository should be paused, and all update files have been scheduled for a presence check. I recommend you run _database->maintenance->clear/fix orphan file records_ too. Please then permit file maintenance under _database->file maintenance->manage scheduled jobs_ to finish its new work, which should fix this, before unpausing your repository.'.format( definition_hash.hex() ) )
                         
                     
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        definition_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
+                    except HydrusExceptions.SerialisationException:
                         
                         HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD )
                         
@@ -2097,6 +2273,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     rows_in_this_update = definition_update.GetNumRows()
                     rows_done_in_this_update = 0
+                    db_time = 0.0
                     
                     iterator_dict = {}
                     
@@ -2129,6 +2306,8 @@ class ServiceRepository( ServiceRestricted ):
                         
                         time_it_took = HydrusTime.GetNowPrecise() - start_time
                         
+                        db_time += time_it_took
+                        
                         rows_done_in_this_update += num_rows_done
                         total_definition_rows_completed += num_rows_done
                         
@@ -2153,6 +2332,12 @@ class ServiceRepository( ServiceRestricted ):
                         self._ReportOngoingRowSpeed( job_status, rows_done_in_this_update, rows_in_this_update, this_work_start_time, num_rows_done, 'definitions' )
                         
                     
+                    self._ReportUpdateTimes( 'definitions', decode_time, wait_time, db_time )
+                    
+                    total_definition_decode_time += decode_time
+                    total_definition_wait_time += wait_time
+                    total_definition_db_time += db_time
+                    
                     num_updates_done += 1
                     
                 
@@ -2165,7 +2350,10 @@ class ServiceRepository( ServiceRestricted ):
                 
             finally:
                 
+                definition_prefetcher.Shutdown()
+                
                 self._LogFinalRowSpeed( definition_start_time, total_definition_rows_completed, 'definitions' )
+                self._LogFinalUpdateTimes( total_definition_decode_time, total_definition_wait_time, total_definition_db_time, 'definitions' )
                 
             
             if HG.client_controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time ) or job_status.IsCancelled():
@@ -2175,6 +2363,12 @@ class ServiceRepository( ServiceRestricted ):
             
             content_start_time = HydrusTime.GetNowPrecise()
             
+            total_content_decode_time = 0.0
+            total_content_wait_time = 0.0
+            total_content_db_time = 0.0
+            
+            content_prefetcher = RepositoryUpdatePrefetcher( [ content_hash for ( content_hash, content_types ) in content_hashes_and_content_types ], HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+            
             try:
                 
                 for ( content_hash, content_types ) in content_hashes_and_content_types:
@@ -2192,7 +2386,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     try:
                         
-                        update_path = HG.client_controller.client_files_manager.GetFilePath( content_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+                        ( content_update, decode_time, wait_time ) = content_prefetcher.GetNext()
                         
                     except HydrusExceptions.FileMissingException:
                         
@@ -2201,16 +2395,7 @@ class ServiceRepository( ServiceRestricted ):
                         raise Exception( 'An unusual error has occured during repository processing: a content update file ({}) was missing. Your repository should be paused, and all update files have been scheduled for a presence check. I recommend you run _database->maintenance->clear/fix orphan file records_ too. Please then permit file maintenance under _database->file maintenance->manage scheduled jobs_ to finish its new work, which should fix this, before unpausing your repository.'.format( content_hash.hex() ) )
                         
                     
-                    with open( update_path, 'rb' ) as f:
-                        
-                        update_network_bytes = f.read()
-                        
-                    
-                    try:
-                        
-                        content_update = HydrusSerialisable.CreateFromNetworkBytes( update_network_bytes )
-                        
-                    except:
+                    except HydrusExceptions.SerialisationException:
                         
                         HG.client_controller.WriteSynchronous( 'schedule_repository_update_file_maintenance', self._service_key, ClientFiles.REGENERATE_FILE_DATA_JOB_FILE_INTEGRITY_DATA_REMOVE_RECORD )
                         
@@ -2226,6 +2411,7 @@ class ServiceRepository( ServiceRestricted ):
                     
                     rows_in_this_update = content_update.GetNumRows( content_types )
                     rows_done_in_this_update = 0
+                    db_time = 0.0
                     
                     iterator_dict = {}
                     
@@ -2279,6 +2465,8 @@ class ServiceRepository( ServiceRestricted ):
                         
                         time_it_took = HydrusTime.GetNowPrecise() - start_time
                         
+                        db_time += time_it_took
+                        
                         rows_done_in_this_update += num_rows_done
                         total_content_rows_completed += num_rows_done
                         
@@ -2303,6 +2491,12 @@ class ServiceRepository( ServiceRestricted ):
                         self._ReportOngoingRowSpeed( job_status, rows_done_in_this_update, rows_in_this_update, this_work_start_time, num_rows_done, 'content rows' )
                         
                     
+                    self._ReportUpdateTimes( 'content', decode_time, wait_time, db_time )
+                    
+                    total_content_decode_time += decode_time
+                    total_content_wait_time += wait_time
+                    total_content_db_time += db_time
+                    
                     num_updates_done += 1
                     
                 
@@ -2313,9 +2507,17 @@ class ServiceRepository( ServiceRestricted ):
                     did_content_analyze = True
                     
                 
+                if is_bulk_loading:
+                    
+                    self._SyncBulkLoadFinish( job_status, maintenance_mode, stop_time )
+                    
+                
             finally:
                 
+                content_prefetcher.Shutdown()
+                
                 self._LogFinalRowSpeed( content_start_time, total_content_rows_completed, 'content rows' )
+                self._LogFinalUpdateTimes( total_content_decode_time, total_content_wait_time, total_content_db_time, 'content' )
                 
             
         except HydrusExceptions.ShutdownException:
@@ -2506,6 +2708,15 @@ class ServiceRepository( ServiceRestricted ):
             
         
     
+    def GetUpdateFormat( self ) -> int:
+        
+        with self._lock:
+            
+            # older servers do not send this, and they only ever made json updates
+            return self._service_options.get( 'update_format', HydrusNetwork.UPDATE_FORMAT_JSON )
+            
+        
+    
     def GetUpdateHashes( self ):
         
         with self._lock:
@@ -21,6 +21,7 @@ from hydrus.client import ClientParsing
 from hydrus.client import ClientRendering
 from hydrus.client import ClientThreading
 from hydrus.client.caches import ClientCachesBase
+from hydrus.client.caches import ClientCachesDisk
 
 class LocalBooruCache( object ):
     
@@ -287,8 +288,9 @@ class ImageRendererCache( object ):
         
         cache_size = self._controller.new_options.GetInteger( 'image_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'image_cache_timeout' )
+        eviction_policy_type = self._controller.new_options.GetInteger( 'data_cache_eviction_policy' )
         
-        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image cache', cache_size, timeout = cache_timeout )
+        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image cache', cache_size, timeout = cache_timeout, eviction_policy_type = eviction_policy_type )
         
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         
@@ -338,8 +340,10 @@ class ImageRendererCache( object ):
         
         cache_size = self._controller.new_options.GetInteger( 'image_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'image_cache_timeout' )
+        eviction_policy_type = self._controller.new_options.GetInteger( 'data_cache_eviction_policy' )
         
         self._data_cache.SetCacheSizeAndTimeout( cache_size, cache_timeout )
+        self._data_cache.SetEvictionPolicyType( eviction_policy_type )
         
     
     def PrefetchImageRenderer( self, media ):
@@ -364,8 +368,9 @@ class ImageTileCache( object ):
         
         cache_size = self._controller.new_options.GetInteger( 'image_tile_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'image_tile_cache_timeout' )
+        eviction_policy_type = self._controller.new_options.GetInteger( 'data_cache_eviction_policy' )
         
-        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image tile cache', cache_size, timeout = cache_timeout )
+        self._data_cache = ClientCachesBase.DataCache( self._controller, 'image tile cache', cache_size, timeout = cache_timeout, eviction_policy_type = eviction_policy_type )
         
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         self._controller.sub( self, 'Clear', 'clear_image_tile_cache' )
@@ -412,8 +417,10 @@ class ImageTileCache( object ):
         
         cache_size = self._controller.new_options.GetInteger( 'image_tile_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'image_tile_cache_timeout' )
+        eviction_policy_type = self._controller.new_options.GetInteger( 'data_cache_eviction_policy' )
         
         self._data_cache.SetCacheSizeAndTimeout( cache_size, cache_timeout )
+        self._data_cache.SetEvictionPolicyType( eviction_policy_type )
         
     
 class ThumbnailCache( object ):
@@ -424,8 +431,9 @@ class ThumbnailCache( object ):
         
         cache_size = self._controller.new_options.GetInteger( 'thumbnail_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
+        eviction_policy_type = self._controller.new_options.GetInteger( 'data_cache_eviction_policy' )
         
-        self._data_cache = ClientCachesBase.DataCache( self._controller, 'thumbnail cache', cache_size, timeout = cache_timeout )
+        self._data_cache = ClientCachesBase.DataCache( self._controller, 'thumbnail cache', cache_size, timeout = cache_timeout, eviction_policy_type = eviction_policy_type )
         
         self._magic_mime_thumbnail_ease_score_lookup = {}
         
@@ -449,6 +457,8 @@ class ThumbnailCache( object ):
         
         self._special_thumbs = {}
         
+        self._bitmap_disk_cache = None
+        
         self.Clear()
         
         self._controller.CallToThreadLongRunning( self.MainLoop )
@@ -458,6 +468,28 @@ class ThumbnailCache( object ):
         self._controller.sub( self, 'NotifyNewOptions', 'notify_new_options' )
         
     
+    def _AddToBitmapDiskCache( self, hash, expected_resolution, numpy_image ):
+        
+        bitmap_disk_cache = self._bitmap_disk_cache
+        
+        if bitmap_disk_cache is None:
+            
+            return
+            
+        
+        ( height, width, depth ) = numpy_image.shape
+        
+        try:
+            
+            bitmap_disk_cache.AddBitmap( hash, expected_resolution, ( width, height ), depth, numpy_image.tobytes() )
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not write to the thumbnail bitmap disk cache:' )
+            HydrusData.PrintException( e, do_wait = False )
+            
+        
+    
     def _GetBestRecoveryThumbnailHydrusBitmap( self, display_media ):
         
         if self._allow_blurhash_fallback:
@@ -492,7 +524,49 @@ class ThumbnailCache( object ):
         return self._special_thumbs[ 'hydrus' ]
         
     
-    def _GetThumbnailHydrusBitmap( self, display_media ):
+    def _GetExpectedThumbnailResolution( self, display_media ):
+        
+        ( media_width, media_height ) = display_media.GetResolution()
+        
+        bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
+        thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
+        thumbnail_dpr_percent = HG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
+        
+        return HydrusImageHandling.GetThumbnailResolution( ( media_width, media_height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
+        
+    
+    def _GetThumbnailHydrusBitmapFromBitmapDiskCache( self, hash, expected_resolution ):
+        
+        bitmap_disk_cache = self._bitmap_disk_cache
+        
+        if bitmap_disk_cache is None:
+            
+            return None
+            
+        
+        try:
+            
+            result = bitmap_disk_cache.GetBitmap( hash, expected_resolution )
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not read from the thumbnail bitmap disk cache:' )
+            HydrusData.PrintException( e, do_wait = False )
+            
+            return None
+            
+        
+        if result is None:
+            
+            return None
+            
+        
+        ( resolution, depth, data ) = result
+        
+        return ClientRendering.HydrusBitmap( data, resolution, depth )
+        
+    
+    def _GetThumbnailHydrusBitmap( self, display_media, thumbnail_bytes = None ):
         
         if HG.blurhash_mode:
             
@@ -503,29 +577,41 @@ class ThumbnailCache( object ):
         
         locations_manager = display_media.GetLocationsManager()
         
-        try:
+        expected_resolution = self._GetExpectedThumbnailResolution( display_media )
+        
+        hydrus_bitmap = self._GetThumbnailHydrusBitmapFromBitmapDiskCache( hash, expected_resolution )
+        
+        if hydrus_bitmap is not None:
             
-            thumbnail_path = self._controller.client_files_manager.GetThumbnailPath( display_media )
+            return hydrus_bitmap
             
-        except HydrusExceptions.FileMissingException as e:
+        
+        if thumbnail_bytes is None:
             
-            if locations_manager.IsLocal():
+            try:
                 
-                summary = 'Unable to get thumbnail for file {}.'.format( hash.hex() )
+                thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
                 
-                self._HandleThumbnailException( hash, e, summary )
+            except HydrusExceptions.FileMissingException as e:
+                
+                if locations_manager.IsLocal():
+                    
+                    summary = 'Unable to get thumbnail for file {}.'.format( hash.hex() )
+                    
+                    self._HandleThumbnailException( hash, e, summary )
+                    
+                
+                return self._GetBestRecoveryThumbnailHydrusBitmap( display_media )
                 
-            
-            return self._GetBestRecoveryThumbnailHydrusBitmap( display_media )
             
         
         thumbnail_mime = HC.IMAGE_JPEG
         
         try:
             
-            thumbnail_mime = HydrusFileHandling.GetThumbnailMime( thumbnail_path )
+            thumbnail_mime = HydrusFileHandling.GetThumbnailMimeFromBytes( thumbnail_bytes )
             
-            numpy_image = ClientImageHandling.GenerateNumPyImage( thumbnail_path, thumbnail_mime )
+            numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, thumbnail_mime )
             
         except Exception as e:
             
@@ -545,7 +631,9 @@ class ThumbnailCache( object ):
             
             try:
                 
-                numpy_image = ClientImageHandling.GenerateNumPyImage( thumbnail_path, thumbnail_mime )
+                thumbnail_bytes = self._controller.client_files_manager.GetThumbnailBytes( display_media )
+                
+                numpy_image = ClientImageHandling.GenerateNumPyImageFromBytes( thumbnail_bytes, thumbnail_mime )
                 
             except Exception as e:
                 
@@ -559,13 +647,7 @@ class ThumbnailCache( object ):
         
         ( current_width, current_height ) = HydrusImageHandling.GetResolutionNumPy( numpy_image )
         
-        ( media_width, media_height ) = display_media.GetResolution()
-        
-        bounding_dimensions = self._controller.options[ 'thumbnail_dimensions' ]
-        thumbnail_scale_type = self._controller.new_options.GetInteger( 'thumbnail_scale_type' )
-        thumbnail_dpr_percent = HG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
-        
-        ( expected_width, expected_height ) = HydrusImageHandling.GetThumbnailResolution( ( media_width, media_height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
+        ( expected_width, expected_height ) = expected_resolution
         
         exactly_as_expected = current_width == expected_width and current_height == expected_height
         
@@ -607,6 +689,12 @@ class ThumbnailCache( object ):
                     HydrusData.ShowText( 'Thumbnail {} wrong size ({}x{} instead of {}x{}), only scaling due to no local source.'.format( hash.hex(), current_width, current_height, expected_width, expected_height ) )
                     
                 
+                self._AddToBitmapDiskCache( hash, expected_resolution, numpy_image )
+                
+            
+        else:
+            
+            self._AddToBitmapDiskCache( hash, expected_resolution, numpy_image )
             
         
         hydrus_bitmap = ClientRendering.GenerateHydrusBitmapFromNumPyImage( numpy_image )
@@ -689,6 +777,110 @@ class ThumbnailCache( object ):
             
         
     
+    def _InitialiseBitmapDiskCache( self ):
+        
+        num_bytes = self._controller.new_options.GetNoneableInteger( 'thumbnail_bitmap_disk_cache_size' )
+        
+        # a slot has to fit the biggest thumb we will make, which is the bounding box at our dpr, RGBA
+        
+        ( bounding_width, bounding_height ) = self._controller.options[ 'thumbnail_dimensions' ]
+        thumbnail_dpr_percent = self._controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
+        
+        max_bitmap_size = int( bounding_width * thumbnail_dpr_percent / 100 ) * int( bounding_height * thumbnail_dpr_percent / 100 ) * 4
+        
+        if self._bitmap_disk_cache is not None:
+            
+            if num_bytes is not None and self._bitmap_disk_cache.GetMaxBitmapSize() == max_bitmap_size and self._bitmap_disk_cache.GetNumBytes() == num_bytes:
+                
+                return
+                
+            
+            self._bitmap_disk_cache.Close()
+            
+            self._bitmap_disk_cache = None
+            
+        
+        path = os.path.join( self._controller.db_dir, 'client_thumbnail_bitmaps.cache' )
+        
+        if num_bytes is None:
+            
+            if os.path.exists( path ):
+                
+                try:
+                    
+                    os.remove( path )
+                    
+                except Exception as e:
+                    
+                    HydrusData.Print( 'Could not delete the old thumbnail bitmap disk cache:' )
+                    HydrusData.PrintException( e, do_wait = False )
+                    
+                
+            
+            return
+            
+        
+        try:
+            
+            self._bitmap_disk_cache = ClientCachesDisk.ThumbnailBitmapDiskCache( path, max_bitmap_size, num_bytes )
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not start the thumbnail bitmap disk cache:' )
+            HydrusData.PrintException( e, do_wait = False )
+            
+        
+    
+    def _PrefetchThumbnailBytes( self, medias ):
+        
+        hashes = set()
+        
+        for media in medias:
+            
+            display_media = media.GetDisplayMedia()
+            
+            if display_media is None or display_media.GetMime() not in HC.MIMES_WITH_THUMBNAILS or not self._ShouldBeAbleToProvideThumb( display_media ):
+                
+                continue
+                
+            
+            hash = display_media.GetHash()
+            
+            if self._data_cache.HasData( hash ):
+                
+                continue
+                
+            
+            bitmap_disk_cache = self._bitmap_disk_cache
+            
+            if bitmap_disk_cache is not None and bitmap_disk_cache.HasBitmap( hash, self._GetExpectedThumbnailResolution( display_media ) ):
+                
+                continue
+                
+            
+            hashes.add( hash )
+            
+        
+        if len( hashes ) == 0 or HG.blurhash_mode:
+            
+            return {}
+            
+        
+        try:
+            
+            return self._controller.client_files_manager.GetThumbnailBytesBatch( hashes )
+            
+        except Exception as e:
+            
+            # we'll fall back to the one-by-one path, which has proper error handling
+            
+            HydrusData.Print( 'Could not batch-read thumbnails, so they will be read one by one:' )
+            HydrusData.PrintException( e, do_wait = False )
+            
+            return {}
+            
+        
+    
     def _RecalcQueues( self ):
         
         # here we sort by the hash since this is both breddy random and more likely to access faster on a well defragged hard drive!
@@ -788,6 +980,9 @@ class ThumbnailCache( object ):
             
             self._data_cache.Clear()
             
+            # thumbnail size may have changed, which changes the slot size
+            self._InitialiseBitmapDiskCache()
+            
             self._special_thumbs = {}
             
             names = [ 'hydrus', 'pdf', 'psd', 'clip', 'sai', 'krita', 'xcf', 'svg', 'audio', 'video', 'zip', 'epub', 'djvu' ]
@@ -833,6 +1028,11 @@ class ThumbnailCache( object ):
                 self._data_cache.DeleteData( hash )
                 
             
+            if self._bitmap_disk_cache is not None:
+                
+                self._bitmap_disk_cache.InvalidateHashes( hashes )
+                
+            
         
     
     def WaitUntilFree( self ):
@@ -853,7 +1053,7 @@ class ThumbnailCache( object ):
             
         
     
-    def GetThumbnail( self, media ):
+    def GetThumbnail( self, media, thumbnail_bytes = None ):
         
         display_media = media.GetDisplayMedia()
         
@@ -881,7 +1081,7 @@ class ThumbnailCache( object ):
                     
                     try:
                         
-                        hydrus_bitmap = self._GetThumbnailHydrusBitmap( display_media )
+                        hydrus_bitmap = self._GetThumbnailHydrusBitmap( display_media, thumbnail_bytes = thumbnail_bytes )
                         
                     except:
                         
@@ -951,8 +1151,15 @@ class ThumbnailCache( object ):
         
         cache_size = self._controller.new_options.GetInteger( 'thumbnail_cache_size' )
         cache_timeout = self._controller.new_options.GetInteger( 'thumbnail_cache_timeout' )
+        eviction_policy_type = self._controller.new_options.GetInteger( 'data_cache_eviction_policy' )
         
         self._data_cache.SetCacheSizeAndTimeout( cache_size, cache_timeout )
+        self._data_cache.SetEvictionPolicyType( eviction_policy_type )
+        
+        with self._lock:
+            
+            self._InitialiseBitmapDiskCache()
+            
         
         allow_blurhash_fallback = self._controller.new_options.GetBoolean( 'allow_blurhash_fallback' )
         
@@ -999,38 +1206,65 @@ class ThumbnailCache( object ):
             
             page_keys_to_rendered_medias = collections.defaultdict( list )
             
-            num_done = 0
             max_at_once = 16
             
-            while not HydrusTime.TimeHasPassedPrecise( stop_time ) and num_done <= max_at_once:
+            # we grab a batch up front so the file manager can get all their thumbnail bytes in one go. with packed thumbnails, that is often one read
+            
+            with self._lock:
                 
-                with self._lock:
-                    
-                    if len( self._waterfall_queue ) == 0:
-                        
-                        break
-                        
+                results = []
+                
+                while len( self._waterfall_queue ) > 0 and len( results ) < max_at_once:
                     
                     result = self._waterfall_queue.pop()
                     
-                    if len( self._waterfall_queue ) == 0:
+                    self._waterfall_queue_quick.discard( result )
+                    
+                    results.append( result )
+                    
+                
+            
+            hashes_to_thumbnail_bytes = self._PrefetchThumbnailBytes( [ media for ( page_key, media ) in results ] )
+            
+            for ( i, result ) in enumerate( results ):
+                
+                if HydrusTime.TimeHasPassedPrecise( stop_time ):
+                    
+                    # out of time for this frame, so put the rest back for next time
+                    
+                    with self._lock:
                         
-                        self._waterfall_queue_empty_event.set()
+                        for unrendered_result in reversed( results[ i : ] ):
+                            
+                            if unrendered_result not in self._waterfall_queue_quick:
+                                
+                                self._waterfall_queue_quick.add( unrendered_result )
+                                self._waterfall_queue.append( unrendered_result )
+                                
+                            
                         
                     
-                    self._waterfall_queue_quick.discard( result )
+                    break
                     
                 
                 ( page_key, media ) = result
                 
-                if media.GetDisplayMedia() is not None:
+                display_media = media.GetDisplayMedia()
+                
+                if display_media is not None:
                     
-                    self.GetThumbnail( media )
+                    self.GetThumbnail( media, thumbnail_bytes = hashes_to_thumbnail_bytes.get( display_media.GetHash(), None ) )
                     
                     page_keys_to_rendered_medias[ page_key ].append( media )
                     
                 
-                num_done += 1
+            
+            with self._lock:
+                
+                if len( self._waterfall_queue ) == 0:
+                    
+                    self._waterfall_queue_empty_event.set()
+                    
                 
             
             if len( page_keys_to_rendered_medias ) > 0:
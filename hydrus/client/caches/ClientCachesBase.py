@@ -1,11 +1,16 @@
 import collections
 import threading
 import typing
+import weakref
+
+import numpy
 
 from hydrus.core import HydrusData
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTime
 
+from hydrus.client import ClientConstants as CC
+
 class CacheableObject( object ):
     
     def GetEstimatedMemoryFootprint( self ) -> int:
@@ -14,60 +19,587 @@ class CacheableObject( object ):
         
     
 
+class FrequencySketch( object ):
+    
+    # a count-min sketch of 4-bit counters. it estimates how often a key has been requested recently, with everything halved every so often so old popularity fades
+    
+    DEPTH = 4
+    MAX_COUNT = 15
+    MULTIPLIERS = ( 0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F, 0x165667B19E3779F9, 0xD6E8FEB86659FD93 )
+    
+    def __init__( self, width = 1024 ):
+        
+        self._InitialiseTable( width )
+        
+    
+    def _GetIndices( self, key ):
+        
+        h = hash( key ) & 0xFFFFFFFFFFFFFFFF
+        
+        return [ ( ( ( h * multiplier ) & 0xFFFFFFFFFFFFFFFF ) >> 32 ) & self._mask for multiplier in self.MULTIPLIERS ]
+        
+    
+    def _InitialiseTable( self, width ):
+        
+        self._width = 1
+        
+        while self._width < width:
+            
+            self._width *= 2
+            
+        
+        self._mask = self._width - 1
+        
+        self._table = numpy.zeros( ( self.DEPTH, self._width ), dtype = numpy.uint8 )
+        
+        self._sample_size = 10 * self._width
+        self._num_increments = 0
+        
+    
+    def _Reset( self ):
+        
+        self._table >>= 1
+        
+        self._num_increments //= 2
+        
+    
+    def EnsureWidth( self, width ):
+        
+        # we lose our history here, but it only happens as the cache grows past each power of two
+        
+        if width > self._width:
+            
+            self._InitialiseTable( width )
+            
+        
+    
+    def GetFrequency( self, key ) -> int:
+        
+        indices = self._GetIndices( key )
+        
+        return int( min( self._table[ row, index ] for ( row, index ) in enumerate( indices ) ) )
+        
+    
+    def Increment( self, key ):
+        
+        indices = self._GetIndices( key )
+        
+        incremented = False
+        
+        for ( row, index ) in enumerate( indices ):
+            
+            if self._table[ row, index ] < self.MAX_COUNT:
+                
+                self._table[ row, index ] += 1
+                
+                incremented = True
+                
+            
+        
+        if incremented:
+            
+            self._num_increments += 1
+            
+            if self._num_increments >= self._sample_size:
+                
+                self._Reset()
+                
+            
+        
+    
+
+class CacheEvictionPolicy( object ):
+    
+    # the cache tells us what it adds, touches and removes, and we tell it what to throw out next
+    
+    def __init__( self ):
+        
+        self._cache_size = 0
+        
+    
+    def Add( self, key, size: int ):
+        
+        raise NotImplementedError()
+        
+    
+    def Clear( self ):
+        
+        raise NotImplementedError()
+        
+    
+    def GetVictim( self ):
+        
+        raise NotImplementedError()
+        
+    
+    def Hit( self, key ):
+        
+        raise NotImplementedError()
+        
+    
+    def Remove( self, key ):
+        
+        raise NotImplementedError()
+        
+    
+    def Resize( self, key, size: int ):
+        
+        pass
+        
+    
+    def SetCacheSize( self, cache_size: int ):
+        
+        self._cache_size = cache_size
+        
+    
+
+class CacheEvictionPolicyLRU( CacheEvictionPolicy ):
+    
+    def __init__( self ):
+        
+        CacheEvictionPolicy.__init__( self )
+        
+        self._keys_lru = collections.OrderedDict()
+        
+    
+    def Add( self, key, size: int ):
+        
+        self._keys_lru[ key ] = size
+        
+        self._keys_lru.move_to_end( key )
+        
+    
+    def Clear( self ):
+        
+        self._keys_lru = collections.OrderedDict()
+        
+    
+    def GetVictim( self ):
+        
+        if len( self._keys_lru ) == 0:
+            
+            return None
+            
+        
+        return next( iter( self._keys_lru ) )
+        
+    
+    def Hit( self, key ):
+        
+        if key in self._keys_lru:
+            
+            self._keys_lru.move_to_end( key )
+            
+        
+    
+    def Remove( self, key ):
+        
+        if key in self._keys_lru:
+            
+            del self._keys_lru[ key ]
+            
+        
+    
+
+class CacheEvictionPolicyWTinyLFU( CacheEvictionPolicy ):
+    
+    # a small lru 'window' takes all new entries, and a segmented lru 'main' area holds the established stuff
+    # when the window overflows, its oldest entries become candidates for main. if the cache is over budget, a candidate only gets in if it has been requested more often than everything main would throw out to fit it, put together
+    # this stops a burst of one-off big entries from flushing a load of small popular ones
+    
+    WINDOW_PERCENTAGE = 1
+    PROTECTED_PERCENTAGE = 80
+    
+    def __init__( self ):
+        
+        CacheEvictionPolicy.__init__( self )
+        
+        self._sketch = FrequencySketch()
+        
+        self._window = collections.OrderedDict()
+        self._probation = collections.OrderedDict()
+        self._protected = collections.OrderedDict()
+        
+        self._candidates = collections.OrderedDict()
+        
+        self._window_size = 0
+        self._probation_size = 0
+        self._protected_size = 0
+        
+    
+    def _GetWindowLimit( self ):
+        
+        return self._cache_size * self.WINDOW_PERCENTAGE / 100
+        
+    
+    def _GetProtectedLimit( self ):
+        
+        return ( self._cache_size - self._GetWindowLimit() ) * self.PROTECTED_PERCENTAGE / 100
+        
+    
+    def _DemoteProtected( self ):
+        
+        # we always keep at least one entry in protected, so a single big popular entry is not bounced around
+        
+        while self._protected_size > self._GetProtectedLimit() and len( self._protected ) > 1:
+            
+            ( key, size ) = self._protected.popitem( last = False )
+            
+            self._protected_size -= size
+            
+            self._probation[ key ] = size
+            
+            self._probation_size += size
+            
+        
+    
+    def _IterateMainEntries( self ):
+        
+        # in the order main would throw them out
+        
+        for ( key, size ) in self._probation.items():
+            
+            if key not in self._candidates:
+                
+                yield ( key, size )
+                
+            
+        
+        yield from self._protected.items()
+        
+    
+    def Add( self, key, size: int ):
+        
+        self.Remove( key )
+        
+        self._sketch.EnsureWidth( 4 * ( len( self._window ) + len( self._probation ) + len( self._protected ) ) )
+        
+        self._sketch.Increment( key )
+        
+        self._window[ key ] = size
+        
+        self._window_size += size
+        
+        # something bigger than the whole window goes straight through to face main, so a cold giant cannot push out the hot stuff just by being new
+        
+        self._candidates = collections.OrderedDict()
+        
+        while self._window_size > self._GetWindowLimit() and len( self._window ) > 0:
+            
+            ( candidate_key, candidate_size ) = self._window.popitem( last = False )
+            
+            self._window_size -= candidate_size
+            
+            self._probation[ candidate_key ] = candidate_size
+            self._candidates[ candidate_key ] = candidate_size
+            
+            self._probation_size += candidate_size
+            
+        
+    
+    def Clear( self ):
+        
+        self._window = collections.OrderedDict()
+        self._probation = collections.OrderedDict()
+        self._protected = collections.OrderedDict()
+        
+        self._candidates = collections.OrderedDict()
+        
+        self._window_size = 0
+        self._probation_size = 0
+        self._protected_size = 0
+        
+    
+    def GetVictim( self ):
+        
+        if len( self._candidates ) > 0:
+            
+            # the newest candidate is the one that pushed us over, so it faces the door first
+            
+            ( candidate_key, candidate_size ) = next( reversed( self._candidates.items() ) )
+            
+            # to let the candidate in, main has to give up as much as the candidate takes, or as much as we are over budget, if that is less
+            # the candidate has to be requested more often than all those victims put together, so one big cold entry cannot displace a pile of small hot ones
+            
+            num_bytes_over = self._window_size + self._probation_size + self._protected_size - self._cache_size
+            
+            num_bytes_to_free = min( num_bytes_over, candidate_size )
+            
+            first_victim_key = None
+            victims_frequency = 0
+            num_bytes_freed = 0
+            
+            for ( key, size ) in self._IterateMainEntries():
+                
+                if first_victim_key is None:
+                    
+                    first_victim_key = key
+                    
+                
+                victims_frequency += self._sketch.GetFrequency( key )
+                num_bytes_freed += size
+                
+                if num_bytes_freed >= num_bytes_to_free:
+                    
+                    break
+                    
+                
+            
+            if first_victim_key is not None and num_bytes_freed >= num_bytes_to_free and self._sketch.GetFrequency( candidate_key ) > victims_frequency:
+                
+                return first_victim_key
+                
+            
+            return candidate_key
+            
+        
+        for keys in ( self._probation, self._protected, self._window ):
+            
+            if len( keys ) > 0:
+                
+                return next( iter( keys ) )
+                
+            
+        
+        return None
+        
+    
+    def Hit( self, key ):
+        
+        self._sketch.Increment( key )
+        
+        if key in self._window:
+            
+            self._window.move_to_end( key )
+            
+        elif key in self._probation:
+            
+            size = self._probation[ key ]
+            
+            del self._probation[ key ]
+            
+            self._probation_size -= size
+            
+            if key in self._candidates:
+                
+                del self._candidates[ key ]
+                
+            
+            self._protected[ key ] = size
+            
+            self._protected_size += size
+            
+            self._DemoteProtected()
+            
+        elif key in self._protected:
+            
+            self._protected.move_to_end( key )
+            
+        
+    
+    def Remove( self, key ):
+        
+        if key in self._window:
+            
+            self._window_size -= self._window[ key ]
+            
+            del self._window[ key ]
+            
+        elif key in self._probation:
+            
+            self._probation_size -= self._probation[ key ]
+            
+            del self._probation[ key ]
+            
+            if key in self._candidates:
+                
+                del self._candidates[ key ]
+                
+            
+        elif key in self._protected:
+            
+            self._protected_size -= self._protected[ key ]
+            
+            del self._protected[ key ]
+            
+        
+    
+    def Resize( self, key, size: int ):
+        
+        if key in self._window:
+            
+            self._window_size += size - self._window[ key ]
+            
+            self._window[ key ] = size
+            
+        elif key in self._probation:
+            
+            self._probation_size += size - self._probation[ key ]
+            
+            self._probation[ key ] = size
+            
+            if key in self._candidates:
+                
+                self._candidates[ key ] = size
+                
+            
+        elif key in self._protected:
+            
+            self._protected_size += size - self._protected[ key ]
+            
+            self._protected[ key ] = size
+            
+        
+    
+    def SetCacheSize( self, cache_size: int ):
+        
+        CacheEvictionPolicy.SetCacheSize( self, cache_size )
+        
+        self._DemoteProtected()
+        
+    
+
+def GenerateCacheEvictionPolicy( eviction_policy_type: int ) -> CacheEvictionPolicy:
+    
+    if eviction_policy_type == CC.CACHE_EVICTION_POLICY_W_TINYLFU:
+        
+        return CacheEvictionPolicyWTinyLFU()
+        
+    else:
+        
+        return CacheEvictionPolicyLRU()
+        
+    
+
+data_caches = weakref.WeakSet()
+data_caches_lock = threading.Lock()
+
+def GetAllDataCacheStats() -> typing.List[ dict ]:
+    
+    with data_caches_lock:
+        
+        caches = list( data_caches )
+        
+    
+    all_stats = [ cache.GetStats() for cache in caches ]
+    
+    all_stats.sort( key = lambda stats: stats[ 'name' ] )
+    
+    return all_stats
+    
+
 class DataCache( object ):
     
-    def __init__( self, controller, name, cache_size, timeout = 1200 ):
+    def __init__( self, controller, name, cache_size, timeout = 1200, eviction_policy_type = CC.CACHE_EVICTION_POLICY_LRU ):
         
         self._controller = controller
         self._name = name
         self._cache_size = cache_size
         self._timeout = timeout
         
+        self._eviction_policy_type = eviction_policy_type
+        self._eviction_policy = GenerateCacheEvictionPolicy( self._eviction_policy_type )
+        self._eviction_policy.SetCacheSize( self._cache_size )
+        
         self._keys_to_data = {}
         self._keys_fifo = collections.OrderedDict()
+        self._keys_to_added_times = {}
         
         self._total_estimated_memory_footprint = 0
         
+        self._ResetStats()
+        
         self._lock = threading.Lock()
         
         self._controller.sub( self, 'MaintainCache', 'memory_maintenance_pulse' )
         
+        with data_caches_lock:
+            
+            data_caches.add( self )
+            
+        
     
-    def _Delete( self, key ):
+    def _Delete( self, key, reason = 'removed' ):
         
         if key not in self._keys_to_data:
             
             return
             
-
+        
         ( data, size_estimate ) = self._keys_to_data[ key ]
         
         del self._keys_to_data[ key ]
         
+        if key in self._keys_fifo:
+            
+            del self._keys_fifo[ key ]
+            
+        
+        self._eviction_policy.Remove( key )
+        
         self._total_estimated_memory_footprint -= size_estimate
         
+        added_time = self._keys_to_added_times.pop( key, None )
+        
+        if added_time is not None:
+            
+            self._num_removed_entries += 1
+            self._total_removed_entry_lifetime += HydrusTime.GetNowFloat() - added_time
+            
+        
+        if reason == 'evicted':
+            
+            self._num_evictions += 1
+            self._bytes_evicted += size_estimate
+            
+        elif reason == 'timed out':
+            
+            self._num_timeouts += 1
+            
+        
         if HG.cache_report_mode:
             
-            HydrusData.ShowText( 'Cache "{}" removing "{}", size "{}". Current size {}.'.format( self._name, key, HydrusData.ToHumanBytes( size_estimate ), HydrusData.ConvertValueRangeToBytes( self._total_estimated_memory_footprint, self._cache_size ) ) )
+            HydrusData.ShowText( 'Cache "{}" {} "{}", size "{}". Current size {}.'.format( self._name, reason, key, HydrusData.ToHumanBytes( size_estimate ), HydrusData.ConvertValueRangeToBytes( self._total_estimated_memory_footprint, self._cache_size ) ) )
             
         
     
-    def _DeleteItem( self ):
-        
-        ( deletee_key, last_access_time ) = self._keys_fifo.popitem( last = False )
+    def _EvictToFit( self ):
         
-        self._Delete( deletee_key )
+        while self._total_estimated_memory_footprint > self._cache_size and len( self._keys_to_data ) > 0:
+            
+            deletee_key = self._eviction_policy.GetVictim()
+            
+            if deletee_key is None or deletee_key not in self._keys_to_data:
+                
+                # policy and cache have fallen out of sync, which should not happen, but let's not spin forever
+                
+                self._eviction_policy.Clear()
+                
+                for ( key, ( data, size_estimate ) ) in self._keys_to_data.items():
+                    
+                    self._eviction_policy.Add( key, size_estimate )
+                    
+                
+                deletee_key = next( iter( self._keys_to_data ) )
+                
+            
+            self._Delete( deletee_key, reason = 'evicted' )
+            
         
     
     def _GetData( self, key ) -> CacheableObject:
         
         if key not in self._keys_to_data:
             
+            self._num_misses += 1
+            
             raise Exception( 'Cache error! Looking for {}, but it was missing.'.format( key ) )
             
         
+        self._num_hits += 1
+        
         self._TouchKey( key )
-
+        
         ( data, size_estimate ) = self._keys_to_data[ key ]
         
         new_estimate = data.GetEstimatedMemoryFootprint()
@@ -78,10 +610,24 @@ class DataCache( object ):
             
             self._keys_to_data[ key ] = ( data, new_estimate )
             
+            self._eviction_policy.Resize( key, new_estimate )
+            
         
         return data
         
     
+    def _ResetStats( self ):
+        
+        self._num_hits = 0
+        self._num_misses = 0
+        self._num_additions = 0
+        self._num_evictions = 0
+        self._num_timeouts = 0
+        self._bytes_evicted = 0
+        self._num_removed_entries = 0
+        self._total_removed_entry_lifetime = 0.0
+        
+    
     def _TouchKey( self, key ):
         
         # have to delete first, rather than overwriting, so the ordereddict updates its internal order
@@ -92,6 +638,8 @@ class DataCache( object ):
         
         self._keys_fifo[ key ] = HydrusTime.GetNow()
         
+        self._eviction_policy.Hit( key )
+        
     
     def Clear( self ):
         
@@ -99,6 +647,9 @@ class DataCache( object ):
             
             self._keys_to_data = {}
             self._keys_fifo = collections.OrderedDict()
+            self._keys_to_added_times = {}
+            
+            self._eviction_policy.Clear()
             
             self._total_estimated_memory_footprint = 0
             
@@ -110,18 +661,17 @@ class DataCache( object ):
             
             if key not in self._keys_to_data:
                 
-                while self._total_estimated_memory_footprint > self._cache_size:
-                    
-                    self._DeleteItem()
-                    
-                
                 size_estimate = data.GetEstimatedMemoryFootprint()
                 
                 self._keys_to_data[ key ] = ( data, size_estimate )
+                self._keys_fifo[ key ] = HydrusTime.GetNow()
+                self._keys_to_added_times[ key ] = HydrusTime.GetNowFloat()
                 
                 self._total_estimated_memory_footprint += size_estimate
                 
-                self._TouchKey( key )
+                self._num_additions += 1
+                
+                self._eviction_policy.Add( key, size_estimate )
                 
                 if HG.cache_report_mode:
                     
@@ -135,6 +685,10 @@ class DataCache( object ):
                     )
                     
                 
+                # we evict after adding, so the policy can weigh the newcomer against what is already here
+                
+                self._EvictToFit()
+                
             
         
     
@@ -164,11 +718,18 @@ class DataCache( object ):
                 
             else:
                 
+                self._num_misses += 1
+                
                 return None
                 
             
         
     
+    def GetName( self ) -> str:
+        
+        return self._name
+        
+    
     def GetSizeLimit( self ) -> int:
         
         with self._lock:
@@ -177,6 +738,35 @@ class DataCache( object ):
             
         
     
+    def GetStats( self ) -> dict:
+        
+        with self._lock:
+            
+            num_requests = self._num_hits + self._num_misses
+            
+            hit_rate = self._num_hits / num_requests if num_requests > 0 else None
+            
+            mean_entry_lifetime = self._total_removed_entry_lifetime / self._num_removed_entries if self._num_removed_entries > 0 else None
+            
+            return {
+                'name' : self._name,
+                'eviction_policy' : CC.cache_eviction_policy_str_lookup[ self._eviction_policy_type ],
+                'size_limit' : self._cache_size,
+                'timeout' : self._timeout,
+                'current_size' : self._total_estimated_memory_footprint,
+                'num_entries' : len( self._keys_to_data ),
+                'hits' : self._num_hits,
+                'misses' : self._num_misses,
+                'hit_rate' : hit_rate,
+                'additions' : self._num_additions,
+                'evictions' : self._num_evictions,
+                'timeouts' : self._num_timeouts,
+                'bytes_evicted' : self._bytes_evicted,
+                'mean_entry_lifetime' : mean_entry_lifetime
+            }
+            
+        
+    
     def HasData( self, key ) -> bool:
         
         with self._lock:
@@ -189,10 +779,7 @@ class DataCache( object ):
         
         with self._lock:
             
-            while self._total_estimated_memory_footprint > self._cache_size:
-                
-                self._DeleteItem()
-                
+            self._EvictToFit()
             
             while True:
                 
@@ -206,7 +793,14 @@ class DataCache( object ):
                     
                     if HydrusTime.TimeHasPassed( last_access_time + self._timeout ):
                         
-                        self._DeleteItem()
+                        if key in self._keys_to_data:
+                            
+                            self._Delete( key, reason = 'timed out' )
+                            
+                        else:
+                            
+                            del self._keys_fifo[ key ]
+                            
                         
                     else:
                         
@@ -217,6 +811,14 @@ class DataCache( object ):
             
         
     
+    def ResetStats( self ):
+        
+        with self._lock:
+            
+            self._ResetStats()
+            
+        
+    
     def SetCacheSizeAndTimeout( self, cache_size, timeout ) -> None:
         
         with self._lock:
@@ -224,15 +826,47 @@ class DataCache( object ):
             self._cache_size = cache_size
             self._timeout = timeout
             
+            self._eviction_policy.SetCacheSize( self._cache_size )
+            
         
         self.MaintainCache()
         
     
+    def SetEvictionPolicyType( self, eviction_policy_type: int ) -> None:
+        
+        with self._lock:
+            
+            if eviction_policy_type == self._eviction_policy_type:
+                
+                return
+                
+            
+            self._eviction_policy_type = eviction_policy_type
+            self._eviction_policy = GenerateCacheEvictionPolicy( self._eviction_policy_type )
+            self._eviction_policy.SetCacheSize( self._cache_size )
+            
+            # oldest first, so the new policy starts with roughly the right recency order
+            
+            for key in self._keys_fifo.keys():
+                
+                if key in self._keys_to_data:
+                    
+                    ( data, size_estimate ) = self._keys_to_data[ key ]
+                    
+                    self._eviction_policy.Add( key, size_estimate )
+                    
+                
+            
+        
+    
     def TouchKey( self, key ):
         
         with self._lock:
             
-            self._TouchKey( key )
+            if key in self._keys_to_data:
+                
+                self._TouchKey( key )
+                
             
         
     
@@ -0,0 +1,351 @@
+import collections
+import mmap
+import os
+import struct
+import threading
+import typing
+import zlib
+
+from hydrus.core import HydrusData
+
+# a second tier behind the in-memory thumbnail cache. it holds already-decoded, already-resized thumbnail bitmaps in a memory-mapped file of fixed-size slots, so a cold page load can skip decode and resize
+# the file starts with [ magic, slot size, num slots ]. each slot is [ hash, key width, key height, width, height, depth, crc32, sequence ] and then the raw bitmap
+# the key dimensions are what we wanted, and width/height are what we actually stored, which can differ for a rotated thumb
+# sequence is zero for an empty slot, and otherwise goes up with every write, so on load we can figure out where the ring got to
+
+FILE_MAGIC = b'HYDTHMB1'
+
+FILE_HEADER = struct.Struct( '>8sII' )
+SLOT_HEADER = struct.Struct( '>32sHHHHBxxxIQ' )
+
+class ThumbnailBitmapDiskCache( object ):
+    
+    def __init__( self, path: str, max_bitmap_size: int, num_bytes: int ):
+        
+        self._path = path
+        self._max_bitmap_size = max_bitmap_size
+        self._num_bytes = num_bytes
+        
+        self._slot_size = SLOT_HEADER.size + self._max_bitmap_size
+        self._num_slots = max( 0, ( num_bytes - FILE_HEADER.size ) // self._slot_size )
+        
+        self._file = None
+        self._mmap = None
+        
+        self._keys_to_slots = {}
+        self._slots_to_keys = {}
+        self._hashes_to_keys = collections.defaultdict( set )
+        
+        self._next_slot = 0
+        self._next_sequence = 1
+        
+        self._lock = threading.Lock()
+        
+        if self._num_slots > 0:
+            
+            self._InitialiseFile()
+            
+        
+    
+    def _ClearSlot( self, slot: int ):
+        
+        if slot in self._slots_to_keys:
+            
+            key = self._slots_to_keys[ slot ]
+            
+            del self._slots_to_keys[ slot ]
+            del self._keys_to_slots[ key ]
+            
+            ( hash, key_width, key_height ) = key
+            
+            self._hashes_to_keys[ hash ].discard( key )
+            
+            if len( self._hashes_to_keys[ hash ] ) == 0:
+                
+                del self._hashes_to_keys[ hash ]
+                
+            
+        
+        offset = self._GetSlotOffset( slot )
+        
+        self._mmap[ offset : offset + SLOT_HEADER.size ] = bytes( SLOT_HEADER.size )
+        
+    
+    def _GetSlotOffset( self, slot: int ) -> int:
+        
+        return FILE_HEADER.size + slot * self._slot_size
+        
+    
+    def _InitialiseFile( self ):
+        
+        file_size = FILE_HEADER.size + self._num_slots * self._slot_size
+        
+        file_header = FILE_HEADER.pack( FILE_MAGIC, self._slot_size, self._num_slots )
+        
+        existing_file_is_good = False
+        
+        if os.path.exists( self._path ) and os.path.getsize( self._path ) == file_size:
+            
+            with open( self._path, 'rb' ) as f:
+                
+                existing_file_is_good = f.read( FILE_HEADER.size ) == file_header
+                
+            
+        
+        if not existing_file_is_good:
+            
+            # different thumbnail size or cache size, so the old slots are no good. starting again is simplest
+            
+            with open( self._path, 'wb' ) as f:
+                
+                f.write( file_header )
+                
+                f.truncate( file_size )
+                
+            
+        
+        self._file = open( self._path, 'r+b' )
+        
+        self._mmap = mmap.mmap( self._file.fileno(), file_size )
+        
+        if existing_file_is_good:
+            
+            self._LoadIndex()
+            
+        
+    
+    def _LoadIndex( self ):
+        
+        last_slot = None
+        last_sequence = 0
+        
+        for slot in range( self._num_slots ):
+            
+            offset = self._GetSlotOffset( slot )
+            
+            ( hash, key_width, key_height, width, height, depth, crc, sequence ) = SLOT_HEADER.unpack_from( self._mmap, offset )
+            
+            if sequence == 0:
+                
+                continue
+                
+            
+            key = ( hash, key_width, key_height )
+            
+            if key in self._keys_to_slots:
+                
+                # should not happen, but if it does, we'll keep whichever is newer
+                
+                existing_slot = self._keys_to_slots[ key ]
+                
+                existing_sequence = SLOT_HEADER.unpack_from( self._mmap, self._GetSlotOffset( existing_slot ) )[-1]
+                
+                if existing_sequence > sequence:
+                    
+                    self._ClearSlot( slot )
+                    
+                    continue
+                    
+                
+                self._ClearSlot( existing_slot )
+                
+            
+            self._keys_to_slots[ key ] = slot
+            self._slots_to_keys[ slot ] = key
+            self._hashes_to_keys[ hash ].add( key )
+            
+            if sequence > last_sequence:
+                
+                last_slot = slot
+                last_sequence = sequence
+                
+            
+        
+        if last_slot is not None:
+            
+            self._next_slot = ( last_slot + 1 ) % self._num_slots
+            self._next_sequence = last_sequence + 1
+            
+        
+    
+    def AddBitmap( self, hash: bytes, key_resolution: typing.Tuple[ int, int ], resolution: typing.Tuple[ int, int ], depth: int, data: bytes ):
+        
+        if len( data ) > self._max_bitmap_size:
+            
+            return
+            
+        
+        ( key_width, key_height ) = key_resolution
+        ( width, height ) = resolution
+        
+        key = ( hash, key_width, key_height )
+        
+        with self._lock:
+            
+            if self._mmap is None:
+                
+                return
+                
+            
+            if key in self._keys_to_slots:
+                
+                self._ClearSlot( self._keys_to_slots[ key ] )
+                
+            
+            slot = self._next_slot
+            
+            self._next_slot = ( self._next_slot + 1 ) % self._num_slots
+            
+            self._ClearSlot( slot )
+            
+            offset = self._GetSlotOffset( slot )
+            
+            data_offset = offset + SLOT_HEADER.size
+            
+            # payload first, header last, so a half-written slot reads as empty or fails its crc
+            
+            self._mmap[ data_offset : data_offset + len( data ) ] = data
+            
+            self._mmap[ offset : offset + SLOT_HEADER.size ] = SLOT_HEADER.pack( hash, key_width, key_height, width, height, depth, zlib.crc32( data ), self._next_sequence )
+            
+            self._next_sequence += 1
+            
+            self._keys_to_slots[ key ] = slot
+            self._slots_to_keys[ slot ] = key
+            self._hashes_to_keys[ hash ].add( key )
+            
+        
+    
+    def Clear( self ):
+        
+        with self._lock:
+            
+            if self._mmap is None:
+                
+                return
+                
+            
+            for slot in list( self._slots_to_keys.keys() ):
+                
+                self._ClearSlot( slot )
+                
+            
+        
+    
+    def Close( self ):
+        
+        with self._lock:
+            
+            if self._mmap is not None:
+                
+                self._mmap.close()
+                
+                self._mmap = None
+                
+            
+            if self._file is not None:
+                
+                self._file.close()
+                
+                self._file = None
+                
+            
+            self._keys_to_slots = {}
+            self._slots_to_keys = {}
+            self._hashes_to_keys = collections.defaultdict( set )
+            
+        
+    
+    def GetBitmap( self, hash: bytes, key_resolution: typing.Tuple[ int, int ] ) -> typing.Optional[ typing.Tuple[ typing.Tuple[ int, int ], int, bytes ] ]:
+        
+        ( key_width, key_height ) = key_resolution
+        
+        key = ( hash, key_width, key_height )
+        
+        with self._lock:
+            
+            if key not in self._keys_to_slots:
+                
+                return None
+                
+            
+            slot = self._keys_to_slots[ key ]
+            
+            offset = self._GetSlotOffset( slot )
+            
+            ( stored_hash, stored_key_width, stored_key_height, width, height, depth, crc, sequence ) = SLOT_HEADER.unpack_from( self._mmap, offset )
+            
+            data_offset = offset + SLOT_HEADER.size
+            
+            num_bytes = min( width * height * depth, self._max_bitmap_size )
+            
+            data = self._mmap[ data_offset : data_offset + num_bytes ]
+            
+            if ( stored_hash, stored_key_width, stored_key_height ) != key or len( data ) != width * height * depth or zlib.crc32( data ) != crc:
+                
+                HydrusData.Print( 'A slot in the thumbnail bitmap disk cache was corrupt, so it is being discarded.' )
+                
+                self._ClearSlot( slot )
+                
+                return None
+                
+            
+            return ( ( width, height ), depth, data )
+            
+        
+    
+    def GetMaxBitmapSize( self ) -> int:
+        
+        return self._max_bitmap_size
+        
+    
+    def GetNumBytes( self ) -> int:
+        
+        return self._num_bytes
+        
+    
+    def GetNumEntries( self ) -> int:
+        
+        with self._lock:
+            
+            return len( self._keys_to_slots )
+            
+        
+    
+    def GetNumSlots( self ) -> int:
+        
+        return self._num_slots
+        
+    
+    def HasBitmap( self, hash: bytes, key_resolution: typing.Tuple[ int, int ] ) -> bool:
+        
+        ( key_width, key_height ) = key_resolution
+        
+        with self._lock:
+            
+            return ( hash, key_width, key_height ) in self._keys_to_slots
+            
+        
+    
+    def InvalidateHashes( self, hashes: typing.Collection[ bytes ] ):
+        
+        with self._lock:
+            
+            if self._mmap is None:
+                
+                return
+                
+            
+            for hash in hashes:
+                
+                if hash in self._hashes_to_keys:
+                    
+                    for key in list( self._hashes_to_keys[ hash ] ):
+                        
+                        self._ClearSlot( self._keys_to_slots[ key ] )
+                        
+                    
+                
+            
+        
+    
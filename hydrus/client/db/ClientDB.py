@@ -224,6 +224,8 @@ class JobDatabaseClient( HydrusData.JobDatabase ):
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'service_info', 'system_predicates', 'missing_thumbnail_hashes' ]
+    READ_POOL_ACTIONS = { 'autocomplete_predicates', 'file_hashes', 'file_query_ids', 'file_query_ids_page' }
+    BACKGROUND_ACTIONS = { 'analyze', 'clear_deferred_physical_delete', 'cull_file_viewing_statistics', 'deferred_delete_data', 'deferred_physical_delete', 'do_deferred_table_delete_work', 'file_maintenance_clear_jobs', 'file_maintenance_get_jobs', 'import_update', 'maintain_hashed_serialisables', 'maintain_similar_files_search_for_potential_duplicates', 'maintain_similar_files_tree', 'maintain_tag_search_wildcard_caches', 'process_repository_content', 'process_repository_definitions', 'repository_bulk_load_begin', 'repository_bulk_load_finish', 'repository_update_hashes_to_process', 'sync_tag_display_maintenance', 'vacuum' }
     
     def __init__( self, controller, db_dir, db_name ):
         
@@ -539,14 +541,23 @@ class DB( HydrusDB.HydrusDB ):
         
         ( sibling_rows_to_add, sibling_rows_to_remove, parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows ) = self.modules_tag_display.GetApplicationStatus( service_id )
         
+        num_siblings_to_sync = len( sibling_rows_to_add ) + len( sibling_rows_to_remove )
+        num_parents_to_sync = len( parent_rows_to_add ) + len( parent_rows_to_remove )
+        
         status = {
-            'num_siblings_to_sync' : len( sibling_rows_to_add ) + len( sibling_rows_to_remove ),
-            'num_parents_to_sync' : len( parent_rows_to_add ) + len( parent_rows_to_remove ),
+            'num_siblings_to_sync' : num_siblings_to_sync,
+            'num_parents_to_sync' : num_parents_to_sync,
             'num_actual_rows' : num_actual_rows,
             'num_ideal_rows' : num_ideal_rows,
+            'sync_time_estimate' : self.modules_tag_display.GetSyncTimeEstimate( service_id, num_siblings_to_sync + num_parents_to_sync ),
             'waiting_on_tag_repos' : []
         }
         
+        if self.modules_mappings_storage.IsBulkLoadRegenerating( service_id ):
+            
+            status[ 'waiting_on_tag_repos' ].append( 'waiting on {} to rebuild its tag caches'.format( self.modules_services.GetService( service_id ).GetName() ) )
+            
+        
         for ( applicable_service_ids, content_type ) in [
             ( self.modules_tag_parents.GetApplicableServiceIds( service_id ), HC.CONTENT_TYPE_TAG_PARENTS ),
             ( self.modules_tag_siblings.GetApplicableServiceIds( service_id ), HC.CONTENT_TYPE_TAG_SIBLINGS )
@@ -571,6 +582,184 @@ class DB( HydrusDB.HydrusDB ):
     
     def _CacheTagDisplaySync( self, service_key: bytes, work_time = 0.5 ):
         
+        # when there is a big backlog, like after a large sibling update from a repository, moving one row at a time can take days
+        # so past a certain size, we sync in batches instead
+        
+        TAG_DISPLAY_SYNC_BULK_MIN_NUM_ROWS = 100
+        
+        time_started = HydrusTime.GetNowFloat()
+        
+        tag_service_id = self.modules_services.GetServiceId( service_key )
+        
+        # we fetch this once. the row syncs below take their rows out of these same sets as they go
+        
+        application_status = self.modules_tag_display.GetApplicationStatus( tag_service_id )
+        
+        ( sibling_rows_to_add, sibling_rows_to_remove, parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows ) = application_status
+        
+        num_rows_to_sync = len( sibling_rows_to_add ) + len( sibling_rows_to_remove ) + len( parent_rows_to_add ) + len( parent_rows_to_remove )
+        
+        if num_rows_to_sync >= TAG_DISPLAY_SYNC_BULK_MIN_NUM_ROWS:
+            
+            all_tag_ids_altered = self._CacheTagDisplaySyncBulk( tag_service_id, work_time, application_status )
+            
+        else:
+            
+            all_tag_ids_altered = self._CacheTagDisplaySyncIncremental( tag_service_id, work_time, application_status )
+            
+        
+        if len( all_tag_ids_altered ) > 0:
+            
+            self._regen_tags_managers_tag_ids.update( all_tag_ids_altered )
+            
+            self._CacheTagsSyncTags( tag_service_id, all_tag_ids_altered )
+            
+            self._cursor_transaction_wrapper.pub_after_job( 'notify_new_tag_display_sync_status', service_key )
+            
+        
+        num_rows_still_to_sync = len( sibling_rows_to_add ) + len( sibling_rows_to_remove ) + len( parent_rows_to_add ) + len( parent_rows_to_remove )
+        
+        self.modules_tag_display.NotifySyncWorkDone( tag_service_id, max( 0, num_rows_to_sync - num_rows_still_to_sync ), HydrusTime.GetNowFloat() - time_started )
+        
+        still_needs_work = num_rows_still_to_sync > 0
+        
+        return still_needs_work
+        
+    
+    def _CacheTagDisplaySyncBulk( self, tag_service_id, work_time, application_status ):
+        
+        # rather than picking and weighing one row at a time, we move a whole batch of rows into actual at once
+        # we get every affected tag's implications before and after in one go and then update the display caches with set queries
+        # removes still go first. any set of removes, and then any set of adds, leaves actual valid
+        
+        BULK_SYNC_MIN_BATCH_SIZE = 100
+        BULK_SYNC_MAX_BATCH_SIZE = 20000
+        
+        time_started = HydrusTime.GetNowFloat()
+        
+        ( cache_ideal_tag_siblings_lookup_table_name, cache_actual_tag_siblings_lookup_table_name ) = ClientDBTagSiblings.GenerateTagSiblingsLookupCacheTableNames( tag_service_id )
+        ( cache_ideal_tag_parents_lookup_table_name, cache_actual_tag_parents_lookup_table_name ) = ClientDBTagParents.GenerateTagParentsLookupCacheTableNames( tag_service_id )
+        
+        file_service_ids = self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_MAPPING_CACHES )
+        
+        all_tag_ids_altered = set()
+        
+        ( sibling_rows_to_add, sibling_rows_to_remove, parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows ) = application_status
+        
+        while not HydrusTime.TimeHasPassedFloat( time_started + work_time ):
+            
+            # size the batch to fit the work time, going by how fast recent batches were
+            
+            rows_per_work_second = self.modules_tag_display.GetSyncRowsPerWorkSecond( tag_service_id )
+            
+            if rows_per_work_second is None:
+                
+                batch_size = BULK_SYNC_MIN_BATCH_SIZE
+                
+            else:
+                
+                batch_size = max( BULK_SYNC_MIN_BATCH_SIZE, min( int( rows_per_work_second * work_time ), BULK_SYNC_MAX_BATCH_SIZE ) )
+                
+            
+            removing = len( sibling_rows_to_remove ) + len( parent_rows_to_remove ) > 0
+            
+            if removing:
+                
+                sibling_rows = HydrusData.SampleSetByGettingFirst( sibling_rows_to_remove, batch_size )
+                parent_rows = HydrusData.SampleSetByGettingFirst( parent_rows_to_remove, batch_size - len( sibling_rows ) )
+                
+            else:
+                
+                sibling_rows = HydrusData.SampleSetByGettingFirst( sibling_rows_to_add, batch_size )
+                parent_rows = HydrusData.SampleSetByGettingFirst( parent_rows_to_add, batch_size - len( sibling_rows ) )
+                
+            
+            if len( sibling_rows ) + len( parent_rows ) == 0:
+                
+                break
+                
+            
+            touched_tag_ids = set( itertools.chain.from_iterable( sibling_rows ) )
+            touched_tag_ids.update( itertools.chain.from_iterable( parent_rows ) )
+            
+            # this is the same neighbourhood the incremental sync looks at, for the whole batch
+            # removes only shrink actual, and we only add once actual is inside ideal, so the current actual and the ideal between them cover every tag whose implications can change
+            
+            possibly_affected_tag_ids = set( touched_tag_ids )
+            
+            for display_type in ( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, ClientTags.TAG_DISPLAY_DISPLAY_IDEAL ):
+                
+                possibly_affected_tag_ids.update( itertools.chain.from_iterable( self.modules_tag_display.GetTagsToImplies( display_type, tag_service_id, touched_tag_ids ).values() ) )
+                possibly_affected_tag_ids.update( itertools.chain.from_iterable( self.modules_tag_display.GetTagsToImpliedBy( display_type, tag_service_id, touched_tag_ids ).values() ) )
+                
+            
+            previous_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
+            
+            if removing:
+                
+                self._ExecuteMany( 'DELETE FROM {} WHERE bad_tag_id = ? AND ideal_tag_id = ?;'.format( cache_actual_tag_siblings_lookup_table_name ), sibling_rows )
+                self._ExecuteMany( 'DELETE FROM {} WHERE child_tag_id = ? AND ancestor_tag_id = ?;'.format( cache_actual_tag_parents_lookup_table_name ), parent_rows )
+                
+                for row in sibling_rows:
+                    
+                    self.modules_tag_siblings.NotifySiblingDeleteRowSynced( tag_service_id, row )
+                    
+                
+                for row in parent_rows:
+                    
+                    self.modules_tag_parents.NotifyParentDeleteRowSynced( tag_service_id, row )
+                    
+                
+            else:
+                
+                self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( bad_tag_id, ideal_tag_id ) VALUES ( ?, ? );'.format( cache_actual_tag_siblings_lookup_table_name ), sibling_rows )
+                self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( child_tag_id, ancestor_tag_id ) VALUES ( ?, ? );'.format( cache_actual_tag_parents_lookup_table_name ), parent_rows )
+                
+                for row in sibling_rows:
+                    
+                    self.modules_tag_siblings.NotifySiblingAddRowSynced( tag_service_id, row )
+                    
+                
+                for row in parent_rows:
+                    
+                    self.modules_tag_parents.NotifyParentAddRowSynced( tag_service_id, row )
+                    
+                
+            
+            after_tag_ids_to_implied_by = self.modules_tag_display.GetTagsToImpliedBy( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, tag_service_id, possibly_affected_tag_ids )
+            
+            tag_ids_to_implication_changes = {}
+            
+            for tag_id in possibly_affected_tag_ids:
+                
+                previous_implied_by = previous_tag_ids_to_implied_by[ tag_id ]
+                after_implied_by = after_tag_ids_to_implied_by[ tag_id ]
+                
+                if previous_implied_by != after_implied_by:
+                    
+                    tag_ids_to_implication_changes[ tag_id ] = ( previous_implied_by, after_implied_by )
+                    
+                    all_tag_ids_altered.add( tag_id )
+                    all_tag_ids_altered.update( previous_implied_by.symmetric_difference( after_implied_by ) )
+                    
+                
+            
+            if len( tag_ids_to_implication_changes ) > 0:
+                
+                for file_service_id in file_service_ids:
+                    
+                    self.modules_mappings_cache_specific_display.SyncImplications( file_service_id, tag_service_id, tag_ids_to_implication_changes )
+                    
+                
+                self.modules_mappings_cache_combined_files_display.SyncImplications( tag_service_id, tag_ids_to_implication_changes )
+                
+            
+        
+        return all_tag_ids_altered
+        
+    
+    def _CacheTagDisplaySyncIncremental( self, tag_service_id, work_time, application_status ):
+        
         # ok, this is the big maintenance lad
         # basically, we fetch what is in actual, what should be in ideal, and migrate
         # the important change here as compared to the old system is that if you have a bunch of parents like 'character name' -> 'female', which might be a 10k-to-1 relationship, adding a new link to the chain does need much work
@@ -578,11 +767,9 @@ class DB( HydrusDB.HydrusDB ):
         
         time_started = HydrusTime.GetNowFloat()
         
-        tag_service_id = self.modules_services.GetServiceId( service_key )
-        
         all_tag_ids_altered = set()
         
-        ( sibling_rows_to_add, sibling_rows_to_remove, parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows ) = self.modules_tag_display.GetApplicationStatus( tag_service_id )
+        ( sibling_rows_to_add, sibling_rows_to_remove, parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows ) = application_status
         
         while len( sibling_rows_to_add ) + len( sibling_rows_to_remove ) + len( parent_rows_to_add ) + len( parent_rows_to_remove ) > 0 and not HydrusTime.TimeHasPassedFloat( time_started + work_time ):
             
@@ -944,18 +1131,7 @@ class DB( HydrusDB.HydrusDB ):
             ( sibling_rows_to_add, sibling_rows_to_remove, parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows ) = self.modules_tag_display.GetApplicationStatus( tag_service_id )
             
         
-        if len( all_tag_ids_altered ) > 0:
-            
-            self._regen_tags_managers_tag_ids.update( all_tag_ids_altered )
-            
-            self._CacheTagsSyncTags( tag_service_id, all_tag_ids_altered )
-            
-            self._cursor_transaction_wrapper.pub_after_job( 'notify_new_tag_display_sync_status', service_key )
-            
-        
-        still_needs_work = len( sibling_rows_to_add ) + len( sibling_rows_to_remove ) + len( parent_rows_to_add ) + len( parent_rows_to_remove ) > 0
-        
-        return still_needs_work
+        return all_tag_ids_altered
         
     
     def _CacheTagsPopulate( self, file_service_id, tag_service_id, status_hook = None ):
@@ -3260,6 +3436,193 @@ class DB( HydrusDB.HydrusDB ):
         return file_info_managers
         
     
+    def _GetFileMetadataColumns( self, hash_ids: typing.Sequence[ int ], field_names: typing.Collection[ str ], tag_fields: typing.Collection[ typing.Tuple[ bytes, int, int ] ] ):
+        
+        # a cheap alternative to media results for when the caller wants a few bits of metadata for a lot of files
+        # files that already have a media result read from that, and for everything else we only hit the tables we need, without making any managers
+        # tag fields are ( tag_service_key, tag_display_type, status )
+        # we return columns, i.e. field_name -> a list of values in the same order as hash_ids
+        
+        fields_to_hash_ids_to_values = collections.defaultdict( dict )
+        tag_fields_to_hash_ids_to_tags = collections.defaultdict( dict )
+        
+        ( cached_media_results, missing_hash_ids ) = self._weakref_media_result_cache.GetMediaResultsAndMissing( hash_ids )
+        
+        for media_result in cached_media_results:
+            
+            hash_id = media_result.GetHashId()
+            
+            file_info_manager = media_result.GetFileInfoManager()
+            locations_manager = media_result.GetLocationsManager()
+            tags_manager = media_result.GetTagsManager()
+            
+            for field_name in field_names:
+                
+                if field_name == 'file_id':
+                    
+                    value = hash_id
+                    
+                elif field_name == 'is_inbox':
+                    
+                    value = locations_manager.inbox
+                    
+                elif field_name == 'known_urls':
+                    
+                    value = locations_manager.GetURLs()
+                    
+                else:
+                    
+                    value = getattr( file_info_manager, field_name )
+                    
+                
+                fields_to_hash_ids_to_values[ field_name ][ hash_id ] = value
+                
+            
+            for tag_field in tag_fields:
+                
+                ( tag_service_key, tag_display_type, status ) = tag_field
+                
+                tag_fields_to_hash_ids_to_tags[ tag_field ][ hash_id ] = tags_manager.GetStatusesToTags( tag_service_key, tag_display_type )[ status ]
+                
+            
+        
+        if len( missing_hash_ids ) > 0:
+            
+            with self._MakeTemporaryIntegerTable( missing_hash_ids, 'hash_id' ) as temp_table_name:
+                
+                if 'file_id' in field_names:
+                    
+                    fields_to_hash_ids_to_values[ 'file_id' ].update( { hash_id : hash_id for hash_id in missing_hash_ids } )
+                    
+                
+                if 'hash' in field_names:
+                    
+                    fields_to_hash_ids_to_values[ 'hash' ].update( self.modules_hashes_local_cache.GetHashIdsToHashes( hash_ids = missing_hash_ids ) )
+                    
+                
+                files_info_field_names = [ field_name for field_name in field_names if field_name in ( 'size', 'mime', 'width', 'height', 'duration', 'num_frames', 'has_audio', 'num_words' ) ]
+                
+                if len( files_info_field_names ) > 0:
+                    
+                    # temp hashes to metadata
+                    for row in self._Execute( 'SELECT hash_id, {} FROM {} CROSS JOIN files_info USING ( hash_id );'.format( ', '.join( files_info_field_names ), temp_table_name ) ):
+                        
+                        hash_id = row[0]
+                        
+                        for ( field_name, value ) in zip( files_info_field_names, row[1:] ):
+                            
+                            fields_to_hash_ids_to_values[ field_name ][ hash_id ] = value
+                            
+                        
+                    
+                    if 'mime' in field_names:
+                        
+                        fields_to_hash_ids_to_values[ 'mime' ].update( self.modules_files_metadata_basic.GetHashIdsToForcedFiletypes( temp_table_name ) )
+                        
+                    
+                
+                if 'blurhash' in field_names:
+                    
+                    fields_to_hash_ids_to_values[ 'blurhash' ].update( self.modules_files_metadata_basic.GetHashIdsToBlurhashes( temp_table_name ) )
+                    
+                
+                if 'pixel_hash' in field_names:
+                    
+                    fields_to_hash_ids_to_values[ 'pixel_hash' ].update( self.modules_similar_files.GetHashIdsToPixelHashes( temp_table_name ) )
+                    
+                
+                if 'is_inbox' in field_names:
+                    
+                    fields_to_hash_ids_to_values[ 'is_inbox' ].update( { hash_id : hash_id in self.modules_files_inbox.inbox_hash_ids for hash_id in missing_hash_ids } )
+                    
+                
+                if 'known_urls' in field_names:
+                    
+                    fields_to_hash_ids_to_values[ 'known_urls' ].update( self.modules_url_map.GetHashIdsToURLs( hash_ids_table_name = temp_table_name ) )
+                    
+                
+                if len( tag_fields ) > 0:
+                    
+                    tag_service_ids_to_tag_service_keys = { self.modules_services.GetServiceId( tag_service_key ) : tag_service_key for ( tag_service_key, tag_display_type, status ) in tag_fields }
+                    
+                    common_file_service_ids_to_hash_ids = self.modules_files_storage.GroupHashIdsByTagCachedFileServiceId( missing_hash_ids, temp_table_name )
+                    
+                    storage_tag_data = []
+                    display_tag_data = []
+                    
+                    for ( common_file_service_id, batch_of_hash_ids ) in common_file_service_ids_to_hash_ids.items():
+                        
+                        # only the tag services we were asked about, which is usually the big saving over a full media result
+                        
+                        with self._MakeTemporaryIntegerTable( batch_of_hash_ids, 'hash_id' ) as temp_batch_hash_ids_table_name:
+                            
+                            ( batch_of_storage_tag_data, batch_of_display_tag_data ) = self._GetForceRefreshTagsManagersWithTableHashIdsTagData( common_file_service_id, list( tag_service_ids_to_tag_service_keys.keys() ), temp_batch_hash_ids_table_name )
+                            
+                        
+                        storage_tag_data.extend( batch_of_storage_tag_data )
+                        display_tag_data.extend( batch_of_display_tag_data )
+                        
+                    
+                    seen_tag_ids = { tag_id for ( hash_id, ( tag_service_id, status, tag_id ) ) in storage_tag_data }
+                    seen_tag_ids.update( ( tag_id for ( hash_id, ( tag_service_id, status, tag_id ) ) in display_tag_data ) )
+                    
+                    tag_ids_to_tags = self.modules_tags_local_cache.GetTagIdsToTags( tag_ids = seen_tag_ids )
+                    
+                    for ( tag_display_type, tag_data ) in ( ( ClientTags.TAG_DISPLAY_STORAGE, storage_tag_data ), ( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, display_tag_data ) ):
+                        
+                        for ( hash_id, ( tag_service_id, status, tag_id ) ) in tag_data:
+                            
+                            tag_field = ( tag_service_ids_to_tag_service_keys[ tag_service_id ], tag_display_type, status )
+                            
+                            if tag_field in tag_fields:
+                                
+                                hash_ids_to_tags = tag_fields_to_hash_ids_to_tags[ tag_field ]
+                                
+                                if hash_id not in hash_ids_to_tags:
+                                    
+                                    hash_ids_to_tags[ hash_id ] = set()
+                                    
+                                
+                                hash_ids_to_tags[ hash_id ].add( tag_ids_to_tags[ tag_id ] )
+                                
+                            
+                        
+                    
+                
+            
+        
+        columns = {}
+        
+        for field_name in field_names:
+            
+            hash_ids_to_values = fields_to_hash_ids_to_values[ field_name ]
+            
+            if field_name == 'known_urls':
+                
+                columns[ field_name ] = [ list( hash_ids_to_values.get( hash_id, [] ) ) for hash_id in hash_ids ]
+                
+            elif field_name == 'is_inbox':
+                
+                columns[ field_name ] = [ hash_ids_to_values.get( hash_id, False ) for hash_id in hash_ids ]
+                
+            else:
+                
+                columns[ field_name ] = [ hash_ids_to_values.get( hash_id, None ) for hash_id in hash_ids ]
+                
+            
+        
+        tag_columns = {}
+        
+        for tag_field in tag_fields:
+            
+            hash_ids_to_tags = tag_fields_to_hash_ids_to_tags[ tag_field ]
+            
+            tag_columns[ tag_field ] = [ list( hash_ids_to_tags.get( hash_id, [] ) ) for hash_id in hash_ids ]
+            
+        
+        return ( columns, tag_columns )
+        
+    
     def _GetFileSystemPredicates( self, file_search_context: ClientSearch.FileSearchContext, force_system_everything = False ):
         
         location_context = file_search_context.GetLocationContext()
@@ -5010,6 +5373,13 @@ class DB( HydrusDB.HydrusDB ):
         return file_import_status
         
     
+    def _ImportFiles( self, file_import_jobs: typing.Collection[ ClientImportFiles.FileImportJob ] ):
+        
+        # the import pipeline's commit stage. one db job for the whole batch, not one round trip per file
+        
+        return [ self._ImportFile( file_import_job ) for file_import_job in file_import_jobs ]
+        
+    
     def _ImportUpdate( self, update_network_bytes, update_hash, mime ):
         
         try:
@@ -5607,6 +5977,11 @@ class DB( HydrusDB.HydrusDB ):
             
         
     
+    def _NotifyJobRolledBack( self ):
+        
+        self.modules_similar_files.NotifyJobRolledBack()
+        
+    
     def _PerceptualHashesResetSearchFromHashes( self, hashes ):
         
         hash_ids = self.modules_hashes_local_cache.GetHashIds( hashes )
@@ -5621,50 +5996,73 @@ class DB( HydrusDB.HydrusDB ):
         num_done = 0
         still_work_to_do = True
         
-        group_of_hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ?;', ( search_distance, ) ).fetchmany( 10 ) )
-        
-        while len( group_of_hash_ids ) > 0:
+        # files are searched in blocks, which share their tree walk and lookups. the blocks grow until each takes about a quarter of our work time
+        block_size = 16
         
-            text = 'searching potential duplicates: {}'.format( HydrusData.ToHumanInt( num_done ) )
-            
-            HG.client_controller.frame_splash_status.SetSubtext( text )
+        while True:
             
-            for ( i, hash_id ) in enumerate( group_of_hash_ids ):
+            if work_time_float is not None and HydrusTime.TimeHasPassedFloat( time_started_float + work_time_float ):
                 
-                if work_time_float is not None and HydrusTime.TimeHasPassedFloat( time_started_float + work_time_float ):
-                    
-                    return ( still_work_to_do, num_done )
-                    
+                return ( still_work_to_do, num_done )
                 
-                if job_status is not None:
-                    
-                    ( i_paused, should_stop ) = job_status.WaitIfNeeded()
-                    
-                    if should_stop:
-                        
-                        return ( still_work_to_do, num_done )
-                        
-                    
+            
+            if job_status is not None:
                 
-                should_stop = HG.client_controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time )
+                ( i_paused, should_stop ) = job_status.WaitIfNeeded()
                 
                 if should_stop:
                     
                     return ( still_work_to_do, num_done )
                     
                 
+            
+            should_stop = HG.client_controller.ShouldStopThisWork( maintenance_mode, stop_time = stop_time )
+            
+            if should_stop:
+                
+                return ( still_work_to_do, num_done )
+                
+            
+            group_of_hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ?;', ( search_distance, ) ).fetchmany( block_size ) )
+            
+            if len( group_of_hash_ids ) == 0:
+                
+                break
+                
+            
+            text = 'searching potential duplicates: {}'.format( HydrusData.ToHumanInt( num_done ) )
+            
+            HG.client_controller.frame_splash_status.SetSubtext( text )
+            
+            block_started = HydrusTime.GetNowPrecise()
+            
+            hash_ids_to_similar_hash_ids_and_distances = self.modules_similar_files.SearchFiles( group_of_hash_ids, search_distance )
+            
+            for ( hash_id, similar_hash_ids_and_distances ) in hash_ids_to_similar_hash_ids_and_distances.items():
+                
                 media_id = self.modules_files_duplicates.GetMediaId( hash_id )
                 
-                potential_duplicate_media_ids_and_distances = [ ( self.modules_files_duplicates.GetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in self.modules_similar_files.SearchFile( hash_id, search_distance ) if duplicate_hash_id != hash_id ]
+                potential_duplicate_media_ids_and_distances = [ ( self.modules_files_duplicates.GetMediaId( duplicate_hash_id ), distance ) for ( duplicate_hash_id, distance ) in similar_hash_ids_and_distances if duplicate_hash_id != hash_id ]
                 
                 self.modules_files_duplicates.AddPotentialDuplicates( media_id, potential_duplicate_media_ids_and_distances )
                 
-                self._Execute( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( search_distance, hash_id ) )
+            
+            self._ExecuteMany( 'UPDATE shape_search_cache SET searched_distance = ? WHERE hash_id = ?;', ( ( search_distance, hash_id ) for hash_id in group_of_hash_ids ) )
+            
+            num_done += len( group_of_hash_ids )
+            
+            time_per_file = max( ( HydrusTime.GetNowPrecise() - block_started ) / len( group_of_hash_ids ), 0.00001 )
+            
+            if work_time_float is None:
+                
+                ideal_block_size = block_size * 2
                 
-                num_done += 1
+            else:
+                
+                ideal_block_size = int( ( work_time_float / 4 ) / time_per_file )
                 
             
-            group_of_hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM shape_search_cache WHERE searched_distance IS NULL or searched_distance < ?;', ( search_distance, ) ).fetchmany( 10 ) )
+            block_size = max( 16, min( ideal_block_size, 4096 ) )
             
         
         still_work_to_do = False
@@ -6427,6 +6825,7 @@ class DB( HydrusDB.HydrusDB ):
         
         FILES_INITIAL_CHUNK_SIZE = 20
         MAPPINGS_INITIAL_CHUNK_SIZE = 50
+        MAPPINGS_BULK_LOAD_INITIAL_CHUNK_SIZE = 5000
         PAIR_ROWS_INITIAL_CHUNK_SIZE = 100
         
         service_id = self.modules_services.GetServiceId( service_key )
@@ -6502,31 +6901,53 @@ class DB( HydrusDB.HydrusDB ):
         
         if HC.CONTENT_TYPE_MAPPINGS in content_types_to_process:
             
+            # a bulk load writes straight to storage and leaves the caches until it is finished
+            # once the caches have started rebuilding, any new rows go the normal way so the rebuilt caches stay right
+            bulk_loading = self.modules_mappings_storage.IsBulkLoading( service_id ) and not self.modules_mappings_storage.IsBulkLoadRegenerating( service_id )
+            
+            if bulk_loading:
+                
+                mappings_initial_chunk_size = MAPPINGS_BULK_LOAD_INITIAL_CHUNK_SIZE
+                
+            else:
+                
+                mappings_initial_chunk_size = MAPPINGS_INITIAL_CHUNK_SIZE
+                
+            
             if 'new_mappings' in content_iterator_dict:
                 
                 i = content_iterator_dict[ 'new_mappings' ]
                 
-                for chunk in HydrusLists.SplitMappingIteratorIntoAutothrottledChunks( i, MAPPINGS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
+                for chunk in HydrusLists.SplitMappingIteratorIntoAutothrottledChunks( i, mappings_initial_chunk_size, precise_time_to_stop ):
                     
-                    mappings_ids = []
-                    
-                    num_rows = 0
-                    
-                    # yo, I can save time if I merge these ids so we only have one round of normalisation
-                    
-                    for ( service_tag_id, service_hash_ids ) in chunk:
+                    if bulk_loading:
                         
-                        tag_id = self.modules_repositories.NormaliseServiceTagId( service_id, service_tag_id )
-                        hash_ids = self.modules_repositories.NormaliseServiceHashIds( service_id, service_hash_ids )
+                        mappings_rows = self.modules_repositories.NormaliseServiceMappings( service_id, chunk )
                         
-                        mappings_ids.append( ( tag_id, hash_ids ) )
+                        self.modules_mappings_storage.BulkLoadAddMappings( service_id, mappings_rows )
                         
-                        num_rows += len( service_hash_ids )
+                        num_rows_processed += len( mappings_rows )
+                        
+                    else:
+                        
+                        mappings_ids = []
+                        
+                        num_rows = 0
+                        
+                        for ( service_tag_id, service_hash_ids ) in chunk:
+                            
+                            tag_id = self.modules_repositories.NormaliseServiceTagId( service_id, service_tag_id )
+                            hash_ids = self.modules_repositories.NormaliseServiceHashIds( service_id, service_hash_ids )
+                            
+                            mappings_ids.append( ( tag_id, hash_ids ) )
+                            
+                            num_rows += len( service_hash_ids )
+                            
+                        
+                        self._UpdateMappings( service_id, mappings_ids = mappings_ids )
+                        
+                        num_rows_processed += num_rows
                         
-                    
-                    self._UpdateMappings( service_id, mappings_ids = mappings_ids )
-                    
-                    num_rows_processed += num_rows
                     
                     if HydrusTime.TimeHasPassedPrecise( precise_time_to_stop ) or job_status.IsCancelled():
                         
@@ -6543,25 +6964,36 @@ class DB( HydrusDB.HydrusDB ):
                 
                 i = content_iterator_dict[ 'deleted_mappings' ]
                 
-                for chunk in HydrusLists.SplitMappingIteratorIntoAutothrottledChunks( i, MAPPINGS_INITIAL_CHUNK_SIZE, precise_time_to_stop ):
+                for chunk in HydrusLists.SplitMappingIteratorIntoAutothrottledChunks( i, mappings_initial_chunk_size, precise_time_to_stop ):
                     
-                    deleted_mappings_ids = []
-                    
-                    num_rows = 0
-                    
-                    for ( service_tag_id, service_hash_ids ) in chunk:
+                    if bulk_loading:
                         
-                        tag_id = self.modules_repositories.NormaliseServiceTagId( service_id, service_tag_id )
-                        hash_ids = self.modules_repositories.NormaliseServiceHashIds( service_id, service_hash_ids )
+                        mappings_rows = self.modules_repositories.NormaliseServiceMappings( service_id, chunk )
                         
-                        deleted_mappings_ids.append( ( tag_id, hash_ids ) )
+                        self.modules_mappings_storage.BulkLoadDeleteMappings( service_id, mappings_rows )
                         
-                        num_rows += len( service_hash_ids )
+                        num_rows_processed += len( mappings_rows )
+                        
+                    else:
+                        
+                        deleted_mappings_ids = []
+                        
+                        num_rows = 0
+                        
+                        for ( service_tag_id, service_hash_ids ) in chunk:
+                            
+                            tag_id = self.modules_repositories.NormaliseServiceTagId( service_id, service_tag_id )
+                            hash_ids = self.modules_repositories.NormaliseServiceHashIds( service_id, service_hash_ids )
+                            
+                            deleted_mappings_ids.append( ( tag_id, hash_ids ) )
+                            
+                            num_rows += len( service_hash_ids )
+                            
+                        
+                        self._UpdateMappings( service_id, deleted_mappings_ids = deleted_mappings_ids )
+                        
+                        num_rows_processed += num_rows
                         
-                    
-                    self._UpdateMappings( service_id, deleted_mappings_ids = deleted_mappings_ids )
-                    
-                    num_rows_processed += num_rows
                     
                     if HydrusTime.TimeHasPassedPrecise( precise_time_to_stop ) or job_status.IsCancelled():
                         
@@ -6770,9 +7202,11 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'file_history': result = self._GetFileHistory( *args, **kwargs )
         elif action == 'file_info_managers': result = self._GetFileInfoManagersFromHashes( *args, **kwargs )
         elif action == 'file_info_managers_from_ids': result = self._GetFileInfoManagers( *args, **kwargs )
+        elif action == 'file_metadata_columns': result = self._GetFileMetadataColumns( *args, **kwargs )
         elif action == 'file_maintenance_get_job_counts': result = self.modules_files_maintenance_queue.GetJobCounts( *args, **kwargs )
         elif action == 'file_maintenance_get_jobs': result = self.modules_files_maintenance_queue.GetJobs( *args, **kwargs )
         elif action == 'file_query_ids': result = self.modules_files_query.GetHashIdsFromQuery( *args, **kwargs )
+        elif action == 'file_query_ids_page': result = self.modules_files_query.GetHashIdsPageFromQuery( *args, **kwargs )
         elif action == 'file_relationships_for_api': result = self.modules_files_duplicates.GetFileRelationshipsForAPI( *args, **kwargs )
         elif action == 'file_system_predicates': result = self._GetFileSystemPredicates( *args, **kwargs )
         elif action == 'filter_existing_tags': result = self.modules_mappings_counts_update.FilterExistingTags( *args, **kwargs )
@@ -6781,6 +7215,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'gui_session': result = self.modules_serialisable.GetGUISession( *args, **kwargs )
         elif action == 'hash_ids_to_hashes': result = self.modules_hashes_local_cache.GetHashIdsToHashes( *args, **kwargs )
         elif action == 'hash_status': result = self.modules_files_metadata_rich.GetHashStatus( *args, **kwargs )
+        elif action == 'hash_statuses': result = self.modules_files_metadata_rich.GetHashStatuses( *args, **kwargs )
         elif action == 'have_hashed_serialised_objects': result = self.modules_serialisable.HaveHashedJSONDumps( *args, **kwargs )
         elif action == 'ideal_client_files_locations': result = self.modules_files_physical_storage.GetIdealClientFilesLocations( *args, **kwargs )
         elif action == 'inbox_hashes': result = self._FilterInboxHashes( *args, **kwargs )
@@ -6805,6 +7240,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'random_potential_duplicate_hashes': result = self._DuplicatesGetRandomPotentialDuplicateHashes( *args, **kwargs )
         elif action == 'recent_tags': result = self.modules_recent_tags.GetRecentTags( *args, **kwargs )
         elif action == 'repository_progress': result = self.modules_repositories.GetRepositoryProgress( *args, **kwargs )
+        elif action == 'repository_is_bulk_loading': result = self._RepositoryIsBulkLoading( *args, **kwargs )
         elif action == 'repository_update_hashes_to_process': result = self.modules_repositories.GetRepositoryUpdateHashesICanProcess( *args, **kwargs )
         elif action == 'serialisable': result = self.modules_serialisable.GetJSONDump( *args, **kwargs )
         elif action == 'serialisable_simple': result = self.modules_serialisable.GetJSONSimple( *args, **kwargs )
@@ -6816,6 +7252,7 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'service_info': result = self._GetServiceInfo( *args, **kwargs )
         elif action == 'service_id': result = self.modules_services.GetServiceId( *args, **kwargs )
         elif action == 'services': result = self.modules_services.GetServices( *args, **kwargs )
+        elif action == 'similar_files_benchmark': result = self.modules_similar_files.BenchmarkSearch( *args, **kwargs )
         elif action == 'similar_files_maintenance_status': result = self.modules_similar_files.GetMaintenanceStatus( *args, **kwargs )
         elif action == 'related_tags': result = self._GetRelatedTags( *args, **kwargs )
         elif action == 'tag_display_application': result = self.modules_tag_display.GetApplication( *args, **kwargs )
@@ -6829,12 +7266,32 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'trash_hashes': result = self._GetTrashHashes( *args, **kwargs )
         elif action == 'potential_duplicates_count': result = self._DuplicatesGetPotentialDuplicatesCount( *args, **kwargs )
         elif action == 'url_statuses': result = self.modules_files_metadata_rich.GetURLStatuses( *args, **kwargs )
+        elif action == 'url_statuses_bulk': result = self.modules_files_metadata_rich.GetURLStatusesBulk( *args, **kwargs )
         elif action == 'vacuum_data': result = self.modules_db_maintenance.GetVacuumData( *args, **kwargs )
         else: raise Exception( 'db received an unknown read command: ' + action )
         
         return result
         
     
+    def _ReadPoolShouldTakeJob( self, action, *args, **kwargs ):
+        
+        if action in ( 'file_query_ids', 'file_query_ids_page' ):
+            
+            file_search_context = args[0] if len( args ) > 0 else kwargs[ 'file_search_context' ]
+            
+            system_predicates = file_search_context.GetSystemPredicates()
+            
+            if system_predicates.HasSimilarToData() or system_predicates.HasSimilarToFiles():
+                
+                # the similar files index is big and lives on the main connection, so we do not want every reader building its own
+                
+                return False
+                
+            
+        
+        return HydrusDB.HydrusDB._ReadPoolShouldTakeJob( self, action, *args, **kwargs )
+        
+    
     def _RecoverFromMissingDefinitions( self, content_type ):
         
         # this is not finished, but basics are there
@@ -8066,6 +8523,89 @@ class DB( HydrusDB.HydrusDB ):
         self._controller.BlockingSafeShowMessage( message )
         
     
+    def _RepositoryBulkLoadBegin( self, service_key: bytes ):
+        
+        service_id = self.modules_services.GetServiceId( service_key )
+        
+        self.modules_mappings_storage.BulkLoadBegin( service_id )
+        
+    
+    def _RepositoryBulkLoadFinish( self, service_key: bytes ) -> bool:
+        
+        # we rebuild this tag service's caches one file service at a time, one job each, and remember which are done
+        # returns True when there is nothing left to do
+        
+        service_id = self.modules_services.GetServiceId( service_key )
+        
+        if not self.modules_mappings_storage.IsBulkLoading( service_id ):
+            
+            return True
+            
+        
+        regenerated_file_service_ids = self.modules_mappings_storage.BulkLoadGetRegeneratedFileServiceIds( service_id )
+        
+        if len( regenerated_file_service_ids ) == 0:
+            
+            # the display caches are copied straight from storage, so the display sync has to start again from scratch
+            # it waits until we are done here
+            self.modules_tag_siblings.ClearActual( service_id )
+            self.modules_tag_parents.ClearActual( service_id )
+            
+        
+        file_service_ids = list( self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_MAPPING_CACHES ) )
+        tag_cache_file_service_ids = self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES )
+        
+        file_service_ids.append( self.modules_services.combined_file_service_id )
+        
+        for file_service_id in file_service_ids:
+            
+            if file_service_id in regenerated_file_service_ids:
+                
+                continue
+                
+            
+            if file_service_id == self.modules_services.combined_file_service_id:
+                
+                self.modules_tag_search.Drop( file_service_id, service_id )
+                self.modules_tag_search.Generate( file_service_id, service_id )
+                
+                self.modules_mappings_cache_combined_files_storage.Drop( service_id )
+                self.modules_mappings_cache_combined_files_storage.Generate( service_id )
+                
+            else:
+                
+                if file_service_id in tag_cache_file_service_ids:
+                    
+                    self.modules_tag_search.Drop( file_service_id, service_id )
+                    self.modules_tag_search.Generate( file_service_id, service_id )
+                    
+                
+                self.modules_mappings_cache_specific_storage.Drop( file_service_id, service_id )
+                self.modules_mappings_cache_specific_storage.Generate( file_service_id, service_id )
+                
+            
+            self.modules_mappings_storage.BulkLoadNotifyRegenerated( service_id, file_service_id )
+            
+            return False
+            
+        
+        self._DeleteServiceInfo( service_key = service_key, types_to_delete = ( HC.SERVICE_INFO_NUM_FILE_HASHES, HC.SERVICE_INFO_NUM_MAPPINGS, HC.SERVICE_INFO_NUM_DELETED_MAPPINGS, HC.SERVICE_INFO_NUM_TAGS ) )
+        
+        self.modules_mappings_storage.BulkLoadEnd( service_id )
+        
+        self._cursor_transaction_wrapper.pub_after_job( 'notify_new_tag_display_application' )
+        self._cursor_transaction_wrapper.pub_after_job( 'notify_new_force_refresh_tags_data' )
+        
+        return True
+        
+    
+    def _RepositoryIsBulkLoading( self, service_key: bytes ) -> bool:
+        
+        service_id = self.modules_services.GetServiceId( service_key )
+        
+        return self.modules_mappings_storage.IsBulkLoading( service_id )
+        
+    
     def _ResetRepository( self, service ):
         
         ( service_key, service_type, name, dictionary ) = service.ToTuple()
@@ -10086,6 +10626,46 @@ class DB( HydrusDB.HydrusDB ):
                 
             
         
+        if version == 557:
+            
+            if not self._TableExists( 'mappings_bulk_load_services' ):
+                
+                self._Execute( 'CREATE TABLE IF NOT EXISTS main.mappings_bulk_load_services ( service_id INTEGER PRIMARY KEY );' )
+                
+            
+            if not self._TableExists( 'mappings_bulk_load_regenerated_caches' ):
+                
+                self._Execute( 'CREATE TABLE IF NOT EXISTS main.mappings_bulk_load_regenerated_caches ( service_id INTEGER, file_service_id INTEGER, PRIMARY KEY ( service_id, file_service_id ) );' )
+                
+            
+            try:
+                
+                self._Execute( 'CREATE TABLE IF NOT EXISTS main.tag_search_wildcard_cache_status ( file_service_id INTEGER, tag_service_id INTEGER, reversed_populated_to_subtag_id INTEGER, trigram_populated_to_subtag_id INTEGER, PRIMARY KEY ( file_service_id, tag_service_id ) );' )
+                
+                tag_service_ids = self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
+                
+                file_service_ids = list( self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES ) )
+                file_service_ids.append( self.modules_services.combined_file_service_id )
+                
+                for ( file_service_id, tag_service_id ) in itertools.product( file_service_ids, tag_service_ids ):
+                    
+                    # just the empty tables here. filling them can take a long time on a big client, so database maintenance does it in the background
+                    
+                    self.modules_tag_search.Generate( file_service_id, tag_service_id )
+                    
+                    self.modules_tag_search.ResetWildcardCaches( file_service_id, tag_service_id )
+                    
+                
+            except Exception as e:
+                
+                HydrusData.PrintException( e )
+                
+                message = 'Trying to create the new wildcard tag search caches failed! Please let hydrus dev know! You can try to fill them yourself under _database->regenerate->tag text search cache (searchable subtag maps)_.'
+                
+                self.pub_initial_message( message )
+                
+            
+        
         self._controller.frame_splash_status.SetTitleText( 'updated db to v{}'.format( HydrusData.ToHumanInt( version + 1 ) ) )
         
         self._Execute( 'UPDATE version SET version = ?;', ( version + 1, ) )
@@ -10588,11 +11168,13 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'force_filetype': self._ForceFiletypes( *args, **kwargs )
         elif action == 'ideal_client_files_locations': self.modules_files_physical_storage.SetIdealClientFilesLocations( *args, **kwargs )
         elif action == 'import_file': result = self._ImportFile( *args, **kwargs )
+        elif action == 'import_files': result = self._ImportFiles( *args, **kwargs )
         elif action == 'import_update': self._ImportUpdate( *args, **kwargs )
         elif action == 'local_booru_share': self.modules_serialisable.SetYAMLDump( ClientDBSerialisable.YAML_DUMP_ID_LOCAL_BOORU, *args, **kwargs )
         elif action == 'maintain_hashed_serialisables': result = self.modules_serialisable.MaintainHashedStorage( *args, **kwargs )
         elif action == 'maintain_similar_files_search_for_potential_duplicates': result = self._PerceptualHashesSearchForPotentialDuplicates( *args, **kwargs )
         elif action == 'maintain_similar_files_tree': self.modules_similar_files.MaintainTree( *args, **kwargs )
+        elif action == 'maintain_tag_search_wildcard_caches': result = self.modules_tag_search.MaintainWildcardCaches( *args, **kwargs )
         elif action == 'migration_clear_job': self._MigrationClearJob( *args, **kwargs )
         elif action == 'migration_start_mappings_job': self._MigrationStartMappingsJob( *args, **kwargs )
         elif action == 'migration_start_pairs_job': self._MigrationStartPairsJob( *args, **kwargs )
@@ -10615,6 +11197,8 @@ class DB( HydrusDB.HydrusDB ):
         elif action == 'repopulate_mappings_from_cache': self._RepopulateMappingsFromCache( *args, **kwargs )
         elif action == 'repopulate_tag_cache_missing_subtags': self._RepopulateTagCacheMissingSubtags( *args, **kwargs )
         elif action == 'repopulate_tag_display_mappings_cache': self._RepopulateTagDisplayMappingsCache( *args, **kwargs )
+        elif action == 'repository_bulk_load_begin': self._RepositoryBulkLoadBegin( *args, **kwargs )
+        elif action == 'repository_bulk_load_finish': result = self._RepositoryBulkLoadFinish( *args, **kwargs )
         elif action == 'relocate_client_files': self.modules_files_physical_storage.RelocateClientFiles( *args, **kwargs )
         elif action == 'remove_alternates_member': self.modules_files_duplicates.RemoveAlternateMemberFromHashes( *args, **kwargs )
         elif action == 'remove_duplicates_member': self.modules_files_duplicates.RemoveMediaIdMemberFromHashes( *args, **kwargs )
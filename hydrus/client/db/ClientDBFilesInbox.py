@@ -67,6 +67,8 @@ class ClientDBFilesInbox( ClientDBModule.ClientDBModule ):
             
             self.inbox_hash_ids.difference_update( archiveable_hash_ids )
             
+            self._NotifyCachesChanged()
+            
             now = HydrusTime.GetNow()
             
             self.modules_files_metadata_timestamps.SetSimpleTimestamps( HC.TIMESTAMP_TYPE_ARCHIVED, [ ( hash_id, now ) for hash_id in archiveable_hash_ids ] )
@@ -110,6 +112,8 @@ class ClientDBFilesInbox( ClientDBModule.ClientDBModule ):
             
             self.inbox_hash_ids.update( inboxable_hash_ids )
             
+            self._NotifyCachesChanged()
+            
             self.modules_files_metadata_timestamps.ClearArchivedTimestamps( inboxable_hash_ids )
             
             service_ids_to_counts = self.modules_files_storage.GetServiceIdCounts( inboxable_hash_ids )
@@ -121,3 +125,10 @@ class ClientDBFilesInbox( ClientDBModule.ClientDBModule ):
             
         
     
+    def ResetCaches( self ):
+        
+        self.inbox_hash_ids = set()
+        
+        self._InitCaches()
+        
+    
@@ -113,6 +113,11 @@ class ClientDBFilesMetadataBasic( ClientDBModule.ClientDBModule ):
         return dict( self._Execute( 'SELECT hash_id, forced_mime FROM {} CROSS JOIN files_info_forced_filetypes USING ( hash_id );'.format( hash_ids_table_name ) ) )
         
     
+    def GetHashIdsToMimes( self, hash_ids_table_name: str ) -> typing.Dict[ int, int ]:
+        
+        return dict( self._Execute( 'SELECT hash_id, mime FROM {} CROSS JOIN files_info USING ( hash_id );'.format( hash_ids_table_name ) ) )
+        
+    
     def GetHasICCProfile( self, hash_id: int ):
         
         result = self._Execute( 'SELECT hash_id FROM has_icc_profile WHERE hash_id = ?;', ( hash_id, ) ).fetchone()
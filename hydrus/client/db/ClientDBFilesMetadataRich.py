@@ -68,54 +68,102 @@ class ClientDBFilesMetadataRich( ClientDBModule.ClientDBModule ):
     
     def GetHashIdStatus( self, hash_id, prefix = '' ) -> ClientImportFiles.FileImportStatus:
         
+        return self.GetHashIdsToStatuses( ( hash_id, ), prefix = prefix )[ hash_id ]
+        
+    
+    def GetHashIdsToStatuses( self, hash_ids: typing.Collection[ int ], prefix = '' ) -> typing.Dict[ int, ClientImportFiles.FileImportStatus ]:
+        
         if prefix != '':
             
             prefix += ': '
             
         
-        hash = self.modules_hashes_local_cache.GetHash( hash_id )
+        if len( hash_ids ) == 0:
+            
+            return {}
+            
+        
+        hash_ids_to_hashes = self.modules_hashes_local_cache.GetHashIdsToHashes( hash_ids = hash_ids )
         
-        ( is_deleted, timestamp, file_deletion_reason ) = self.modules_files_storage.GetDeletionStatus( self.modules_services.combined_local_file_service_id, hash_id )
+        combined_local_current_files_table_name = ClientDBFilesStorage.GenerateFilesTableName( self.modules_services.combined_local_file_service_id, HC.CONTENT_STATUS_CURRENT )
+        combined_local_deleted_files_table_name = ClientDBFilesStorage.GenerateFilesTableName( self.modules_services.combined_local_file_service_id, HC.CONTENT_STATUS_DELETED )
+        trash_current_files_table_name = ClientDBFilesStorage.GenerateFilesTableName( self.modules_services.trash_service_id, HC.CONTENT_STATUS_CURRENT )
         
-        if is_deleted:
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
             
-            if timestamp is None:
-                
-                note = 'Deleted from the client before delete times were tracked ({}).'.format( file_deletion_reason )
-                
-            else:
-                
-                note = 'Deleted from the client {} ({}), which was {} before this check.'.format( HydrusTime.TimestampToPrettyTime( timestamp ), file_deletion_reason, HydrusTime.BaseTimestampToPrettyTimeDelta( timestamp ) )
-                
+            # everything we need for every file in one pass over the temp table
+            # can have a deletion reason here and just be in trash, so we fetch it whatever the end result
+            
+            query = 'SELECT hash_id, deleted_files.hash_id IS NOT NULL, deleted_files.timestamp, trash_files.timestamp, imported_files.timestamp, mime, text FROM {} LEFT OUTER JOIN {} AS deleted_files USING ( hash_id ) LEFT OUTER JOIN {} AS trash_files USING ( hash_id ) LEFT OUTER JOIN {} AS imported_files USING ( hash_id ) LEFT OUTER JOIN files_info USING ( hash_id ) LEFT OUTER JOIN local_file_deletion_reasons USING ( hash_id ) LEFT OUTER JOIN texts ON ( reason_id = text_id );'.format(
+                temp_hash_ids_table_name,
+                combined_local_deleted_files_table_name,
+                trash_current_files_table_name,
+                combined_local_current_files_table_name
+            )
             
-            return ClientImportFiles.FileImportStatus( CC.STATUS_DELETED, hash, note = prefix + note )
+            rows = self._Execute( query ).fetchall()
             
         
-        result = self.modules_files_storage.GetImportedTimestamp( self.modules_services.trash_service_id, hash_id )
+        hash_ids_to_statuses = {}
         
-        if result is not None:
+        for ( hash_id, is_deleted, deleted_timestamp, trash_timestamp, imported_timestamp, mime, file_deletion_reason ) in rows:
             
-            timestamp = result
+            hash = hash_ids_to_hashes[ hash_id ]
             
-            note = 'Currently in trash ({}). Sent there at {}, which was {} before this check.'.format( file_deletion_reason, HydrusTime.TimestampToPrettyTime( timestamp ), HydrusTime.BaseTimestampToPrettyTimeDelta( timestamp, just_now_threshold = 0 ) )
+            if file_deletion_reason is None:
+                
+                file_deletion_reason = 'Unknown deletion reason.'
+                
             
-            return ClientImportFiles.FileImportStatus( CC.STATUS_DELETED, hash, note = prefix + note )
+            if is_deleted:
+                
+                timestamp = deleted_timestamp
+                
+                if timestamp is None:
+                    
+                    note = 'Deleted from the client before delete times were tracked ({}).'.format( file_deletion_reason )
+                    
+                else:
+                    
+                    note = 'Deleted from the client {} ({}), which was {} before this check.'.format( HydrusTime.TimestampToPrettyTime( timestamp ), file_deletion_reason, HydrusTime.BaseTimestampToPrettyTimeDelta( timestamp ) )
+                    
+                
+                hash_ids_to_statuses[ hash_id ] = ClientImportFiles.FileImportStatus( CC.STATUS_DELETED, hash, note = prefix + note )
+                
+                continue
+                
             
-        
-        result = self.modules_files_storage.GetImportedTimestamp( self.modules_services.combined_local_file_service_id, hash_id )
-        
-        if result is not None:
+            timestamp = trash_timestamp
             
-            timestamp = result
+            if timestamp is not None:
+                
+                note = 'Currently in trash ({}). Sent there at {}, which was {} before this check.'.format( file_deletion_reason, HydrusTime.TimestampToPrettyTime( timestamp ), HydrusTime.BaseTimestampToPrettyTimeDelta( timestamp, just_now_threshold = 0 ) )
+                
+                hash_ids_to_statuses[ hash_id ] = ClientImportFiles.FileImportStatus( CC.STATUS_DELETED, hash, note = prefix + note )
+                
+                continue
+                
             
-            mime = self.modules_files_metadata_basic.GetMime( hash_id )
+            timestamp = imported_timestamp
             
-            note = 'Imported at {}, which was {} before this check.'.format( HydrusTime.TimestampToPrettyTime( timestamp ), HydrusTime.BaseTimestampToPrettyTimeDelta( timestamp, just_now_threshold = 0 ) )
+            if timestamp is not None:
+                
+                if mime is None:
+                    
+                    raise HydrusExceptions.DataMissing( 'Did not have mime information for that file!' )
+                    
+                
+                note = 'Imported at {}, which was {} before this check.'.format( HydrusTime.TimestampToPrettyTime( timestamp ), HydrusTime.BaseTimestampToPrettyTimeDelta( timestamp, just_now_threshold = 0 ) )
+                
+                hash_ids_to_statuses[ hash_id ] = ClientImportFiles.FileImportStatus( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, hash, mime = mime, note = prefix + note )
+                
+                continue
+                
             
-            return ClientImportFiles.FileImportStatus( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, hash, mime = mime, note = prefix + note )
+            hash_ids_to_statuses[ hash_id ] = ClientImportFiles.FileImportStatus( CC.STATUS_UNKNOWN, hash )
             
         
-        return ClientImportFiles.FileImportStatus( CC.STATUS_UNKNOWN, hash )
+        return hash_ids_to_statuses
         
     
     def GetHashStatus( self, hash_type, hash, prefix = None ) -> ClientImportFiles.FileImportStatus:
@@ -153,6 +201,43 @@ class ClientDBFilesMetadataRich( ClientDBModule.ClientDBModule ):
         return self.GetHashIdStatus( hash_id, prefix = prefix )
         
     
+    def GetHashStatuses( self, hash_type, hashes, prefix = None ) -> typing.List[ ClientImportFiles.FileImportStatus ]:
+        
+        # GetHashStatus for a whole list in one go. results are in the same order as the hashes
+        
+        if prefix is None:
+            
+            prefix = hash_type + ' recognised'
+            
+        
+        if hash_type == 'sha256':
+            
+            hashes_to_hash_ids = { hash : hash_id for ( hash_id, hash ) in self.modules_hashes_local_cache.GetHashIdsToHashes( hashes = hashes, create_new_hash_ids = False ).items() }
+            
+        else:
+            
+            hashes_to_hash_ids = self.modules_hashes.GetExtraHashesToHashIds( hash_type, hashes )
+            
+        
+        hash_ids_to_statuses = self.GetHashIdsToStatuses( set( hashes_to_hash_ids.values() ), prefix = prefix )
+        
+        statuses = []
+        
+        for hash in hashes:
+            
+            if hash in hashes_to_hash_ids:
+                
+                statuses.append( hash_ids_to_statuses[ hashes_to_hash_ids[ hash ] ] )
+                
+            else:
+                
+                statuses.append( ClientImportFiles.FileImportStatus.STATICGetUnknownStatus() )
+                
+            
+        
+        return statuses
+        
+    
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> typing.List[ typing.Tuple[ str, str ] ]:
         
         return []
@@ -183,3 +268,75 @@ class ClientDBFilesMetadataRich( ClientDBModule.ClientDBModule ):
         return results
         
     
+    def GetURLStatusesBulk( self, urls ) -> typing.Dict[ str, typing.List[ ClientImportFiles.FileImportStatus ] ]:
+        
+        # GetURLStatuses for a whole list in one go
+        
+        urls_to_search_urls = { url : ClientNetworkingFunctions.GetSearchURLs( url ) for url in urls }
+        
+        all_search_urls = set()
+        
+        for search_urls in urls_to_search_urls.values():
+            
+            all_search_urls.update( search_urls )
+            
+        
+        search_urls_to_hash_ids = self.modules_url_map.GetURLsToHashIds( all_search_urls )
+        
+        urls_to_hash_ids = {}
+        
+        for ( url, search_urls ) in urls_to_search_urls.items():
+            
+            hash_ids = set()
+            
+            for search_url in search_urls:
+                
+                hash_ids.update( search_urls_to_hash_ids[ search_url ] )
+                
+            
+            urls_to_hash_ids[ url ] = hash_ids
+            
+        
+        all_hash_ids = set()
+        
+        for hash_ids in urls_to_hash_ids.values():
+            
+            all_hash_ids.update( hash_ids )
+            
+        
+        try:
+            
+            hash_ids_to_statuses = self.GetHashIdsToStatuses( all_hash_ids, prefix = 'url recognised' )
+            
+        except Exception as e:
+            
+            HydrusData.Print( 'Could not get the statuses of a batch of URLs, so they will be looked up one by one:' )
+            HydrusData.PrintException( e, do_wait = False )
+            
+            # one bad file should only cost its own URLs their statuses, like it did before we did these in bulk
+            
+            urls_to_statuses = {}
+            
+            for ( url, hash_ids ) in urls_to_hash_ids.items():
+                
+                try:
+                    
+                    url_hash_ids_to_statuses = self.GetHashIdsToStatuses( hash_ids, prefix = 'url recognised' )
+                    
+                    urls_to_statuses[ url ] = [ url_hash_ids_to_statuses[ hash_id ] for hash_id in hash_ids ]
+                    
+                except Exception as e:
+                    
+                    HydrusData.Print( 'Could not get the statuses of URL "{}":'.format( url ) )
+                    HydrusData.PrintException( e, do_wait = False )
+                    
+                    urls_to_statuses[ url ] = []
+                    
+                
+            
+            return urls_to_statuses
+            
+        
+        return { url : [ hash_ids_to_statuses[ hash_id ] for hash_id in hash_ids ] for ( url, hash_ids ) in urls_to_hash_ids.items() }
+        
+    
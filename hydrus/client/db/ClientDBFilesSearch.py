@@ -1,3 +1,4 @@
+import heapq
 import random
 import sqlite3
 import typing
@@ -31,6 +32,25 @@ from hydrus.client.media import ClientMedia
 from hydrus.client.metadata import ClientTags
 from hydrus.client.search import ClientSearch
 
+# system sorts we can do with one query on the files' metadata and a key on the rows
+SIMPLE_SYSTEM_SORT_TYPES = {
+    CC.SORT_FILES_BY_IMPORT_TIME,
+    CC.SORT_FILES_BY_FILESIZE,
+    CC.SORT_FILES_BY_DURATION,
+    CC.SORT_FILES_BY_FRAMERATE,
+    CC.SORT_FILES_BY_NUM_FRAMES,
+    CC.SORT_FILES_BY_WIDTH,
+    CC.SORT_FILES_BY_HEIGHT,
+    CC.SORT_FILES_BY_RATIO,
+    CC.SORT_FILES_BY_NUM_PIXELS,
+    CC.SORT_FILES_BY_MEDIA_VIEWS,
+    CC.SORT_FILES_BY_MEDIA_VIEWTIME,
+    CC.SORT_FILES_BY_APPROX_BITRATE,
+    CC.SORT_FILES_BY_FILE_MODIFIED_TIMESTAMP,
+    CC.SORT_FILES_BY_LAST_VIEWED_TIME,
+    CC.SORT_FILES_BY_ARCHIVED_TIMESTAMP
+}
+
 def intersection_update_qhi( query_hash_ids: typing.Optional[ typing.Set[ int ] ], some_hash_ids: typing.Collection[ int ], force_create_new_set = False ) -> typing.Set[ int ]:
     
     if query_hash_ids is None:
@@ -1256,6 +1276,358 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         return ( query_hash_ids, have_cross_referenced_file_locations )
         
     
+    def _GetHashIdsPageFromSimpleSortQuery( self, query: str, temp_hash_ids_table_name: str, key, sql_sort_column: str, reverse: bool, limit: typing.Optional[ int ], after ):
+        
+        # the cursor goes in the WHERE, so sqlite hands us just this page and we never load the sort keys of everything else
+        # the python keys treat null as -1, so we order on the same here
+        
+        sort_value = 'IFNULL( {}, -1 )'.format( sql_sort_column )
+        
+        query = query.rstrip( ';' ).format( temp_table = temp_hash_ids_table_name )
+        
+        # we fetch one more than we want, to know if there is a next page
+        
+        def get_sql_limit( num_wanted ):
+            
+            return -1 if num_wanted is None else num_wanted + 1
+            
+        
+        if after is None:
+            
+            ( after_sort_key, after_hash_id ) = ( -1, None )
+            
+        else:
+            
+            ( after_sort_key, after_hash_id ) = after
+            
+        
+        page = []
+        
+        if after_sort_key is not None:
+            
+            if after_hash_id is None:
+                
+                cursor_predicate = '1 = 1'
+                cursor_params = ()
+                
+            else:
+                
+                # import time keys carry the hash_id along, but the column is just the timestamp
+                
+                if isinstance( after_sort_key, ( tuple, list ) ):
+                    
+                    after_sort_value = after_sort_key[0]
+                    
+                else:
+                    
+                    after_sort_value = after_sort_key
+                    
+                
+                if reverse:
+                    
+                    cursor_predicate = '( {} < ? OR ( {} = ? AND hash_id > ? ) )'.format( sort_value, sort_value )
+                    cursor_params = ( after_sort_value, after_sort_value, after_hash_id )
+                    
+                else:
+                    
+                    cursor_predicate = '( {}, hash_id ) > ( ?, ? )'.format( sort_value )
+                    cursor_params = ( after_sort_value, after_hash_id )
+                    
+                
+            
+            where_or_and = 'AND' if ' WHERE ' in query else 'WHERE'
+            direction = 'DESC' if reverse else 'ASC'
+            
+            page_query = '{} {} {} ORDER BY {} {}, hash_id ASC LIMIT ?;'.format( query, where_or_and, cursor_predicate, sort_value, direction )
+            
+            page = [ ( row[0], key( row ) ) for row in self._Execute( page_query, cursor_params + ( get_sql_limit( limit ), ) ) ]
+            
+        
+        if limit is None or len( page ) <= limit:
+            
+            # files with no row at all go at the end in hash_id order
+            
+            num_wanted = None if limit is None else limit - len( page )
+            
+            if after_sort_key is None:
+                
+                keyless_predicate = 'hash_id > ?'
+                keyless_params = ( after_hash_id, )
+                
+            else:
+                
+                keyless_predicate = '1 = 1'
+                keyless_params = ()
+                
+            
+            keyless_query = 'SELECT hash_id FROM {} WHERE hash_id NOT IN ( SELECT hash_id FROM ( {} ) ) AND {} ORDER BY hash_id ASC LIMIT ?;'.format( temp_hash_ids_table_name, query, keyless_predicate )
+            
+            page.extend( ( ( hash_id, None ) for ( hash_id, ) in self._Execute( keyless_query, keyless_params + ( get_sql_limit( num_wanted ), ) ) ) )
+            
+        
+        if limit is not None and len( page ) > limit:
+            
+            page = page[ : limit ]
+            
+            ( last_hash_id, last_sort_key ) = page[-1]
+            
+            next_after = ( last_sort_key, last_hash_id )
+            
+        else:
+            
+            next_after = None
+            
+        
+        return ( [ hash_id for ( hash_id, sort_key ) in page ], next_after )
+        
+    
+    def _GetSimpleSortQueryAndKey( self, location_context: ClientLocation.LocationContext, sort_data: int ):
+        
+        # for a simple column sort, sqlite can do the ORDER BY and LIMIT itself and only hand us the top rows
+        # the secondary hash_id order is the same as what our stable python sort does with rows that come out of the temp table in hash_id order
+        sql_sort_column = None
+        sql_sort_hash_id_follows_order = False
+        
+        if sort_data == CC.SORT_FILES_BY_IMPORT_TIME:
+            
+            if location_context.IsOneDomain() and location_context.IncludesCurrent():
+                
+                file_service_key = list( location_context.current_service_keys )[0]
+                
+            else:
+                
+                file_service_key = CC.COMBINED_LOCAL_FILE_SERVICE_KEY
+                
+            
+            file_service_id = self.modules_services.GetServiceId( file_service_key )
+            
+            current_files_table_name = ClientDBFilesStorage.GenerateFilesTableName( file_service_id, HC.CONTENT_STATUS_CURRENT )
+            
+            query = 'SELECT hash_id, timestamp FROM {temp_table} CROSS JOIN {current_files_table} USING ( hash_id );'.format( temp_table = '{temp_table}', current_files_table = current_files_table_name )
+            
+            sql_sort_column = 'timestamp'
+            sql_sort_hash_id_follows_order = True
+            
+        elif sort_data == CC.SORT_FILES_BY_FILESIZE:
+            
+            query = 'SELECT hash_id, size FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+            sql_sort_column = 'size'
+            
+        elif sort_data == CC.SORT_FILES_BY_DURATION:
+            
+            query = 'SELECT hash_id, duration FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+            sql_sort_column = 'duration'
+            
+        elif sort_data == CC.SORT_FILES_BY_FRAMERATE:
+            
+            query = 'SELECT hash_id, num_frames, duration FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+        elif sort_data == CC.SORT_FILES_BY_NUM_FRAMES:
+            
+            query = 'SELECT hash_id, num_frames FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+            sql_sort_column = 'num_frames'
+            
+        elif sort_data == CC.SORT_FILES_BY_WIDTH:
+            
+            query = 'SELECT hash_id, width FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+            sql_sort_column = 'width'
+            
+        elif sort_data == CC.SORT_FILES_BY_HEIGHT:
+            
+            query = 'SELECT hash_id, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+            sql_sort_column = 'height'
+            
+        elif sort_data == CC.SORT_FILES_BY_RATIO:
+            
+            query = 'SELECT hash_id, width, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+        elif sort_data == CC.SORT_FILES_BY_NUM_PIXELS:
+            
+            query = 'SELECT hash_id, width, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+        elif sort_data == CC.SORT_FILES_BY_MEDIA_VIEWS:
+            
+            query = 'SELECT hash_id, views FROM {temp_table} CROSS JOIN file_viewing_stats USING ( hash_id ) WHERE canvas_type = {canvas_type};'.format( temp_table = '{temp_table}', canvas_type = CC.CANVAS_MEDIA_VIEWER )
+            
+            sql_sort_column = 'views'
+            
+        elif sort_data == CC.SORT_FILES_BY_MEDIA_VIEWTIME:
+            
+            query = 'SELECT hash_id, viewtime FROM {temp_table} CROSS JOIN file_viewing_stats USING ( hash_id ) WHERE canvas_type = {canvas_type};'.format( temp_table = '{temp_table}', canvas_type = CC.CANVAS_MEDIA_VIEWER )
+            
+            sql_sort_column = 'viewtime'
+            
+        elif sort_data == CC.SORT_FILES_BY_APPROX_BITRATE:
+            
+            query = 'SELECT hash_id, duration, num_frames, size, width, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
+            
+        elif sort_data == CC.SORT_FILES_BY_FILE_MODIFIED_TIMESTAMP:
+            
+            q1 = 'SELECT hash_id, file_modified_timestamp FROM {temp_table} CROSS JOIN file_modified_timestamps USING ( hash_id )'
+            q2 = 'SELECT hash_id, file_modified_timestamp FROM {temp_table} CROSS JOIN file_domain_modified_timestamps USING ( hash_id )'
+            
+            query = 'SELECT hash_id, MIN( file_modified_timestamp ) FROM ( {} UNION {} ) GROUP BY hash_id;'.format( q1, q2 )
+            
+        elif sort_data == CC.SORT_FILES_BY_LAST_VIEWED_TIME:
+            
+            query = 'SELECT hash_id, last_viewed_timestamp FROM {temp_table} CROSS JOIN file_viewing_stats USING ( hash_id ) WHERE canvas_type = {canvas_type};'.format( temp_table = '{temp_table}', canvas_type = CC.CANVAS_MEDIA_VIEWER )
+            
+            sql_sort_column = 'last_viewed_timestamp'
+            
+        elif sort_data == CC.SORT_FILES_BY_ARCHIVED_TIMESTAMP:
+            
+            query = 'SELECT hash_id, archived_timestamp FROM {temp_table} CROSS JOIN archive_timestamps USING ( hash_id );'
+            
+            sql_sort_column = 'archived_timestamp'
+            
+        
+        if sort_data == CC.SORT_FILES_BY_IMPORT_TIME:
+            
+            def deal_with_none( x ):
+                
+                if x is None: return -1
+                else: return x
+                
+            
+            def key( row ):
+                
+                hash_id = row[0]
+                timestamp = row[1]
+                
+                # hash_id to differentiate files imported in the same second
+                
+                return ( deal_with_none( timestamp ), hash_id )
+                
+            
+        elif sort_data == CC.SORT_FILES_BY_RATIO:
+            
+            def key( row ):
+                
+                width = row[1]
+                height = row[2]
+                
+                if width is None or height is None:
+                    
+                    return -1
+                    
+                else:
+                    
+                    return width / height
+                    
+                
+            
+        elif sort_data == CC.SORT_FILES_BY_FRAMERATE:
+            
+            def key( row ):
+                
+                num_frames = row[1]
+                duration = row[2]
+                
+                if num_frames is None or duration is None or num_frames == 0 or duration == 0:
+                    
+                    return -1
+                    
+                else:
+                    
+                    return num_frames / duration
+                    
+                
+            
+        elif sort_data == CC.SORT_FILES_BY_NUM_PIXELS:
+            
+            def key( row ):
+                
+                width = row[1]
+                height = row[2]
+                
+                if width is None or height is None or width == 0 or height == 0:
+                    
+                    return -1
+                    
+                else:
+                    
+                    return width * height
+                    
+                
+            
+        elif sort_data == CC.SORT_FILES_BY_APPROX_BITRATE:
+            
+            def key( row ):
+                
+                duration = row[1]
+                num_frames = row[2]
+                size = row[3]
+                width = row[4]
+                height = row[5]
+                
+                if duration is None or duration == 0:
+                    
+                    if size is None or size == 0:
+                        
+                        duration_bitrate = -1
+                        frame_bitrate = -1
+                        
+                    else:
+                        
+                        duration_bitrate = 0
+                        
+                        if width is None or height is None:
+                            
+                            frame_bitrate = 0
+                            
+                        else:
+                            
+                            if size is None or size == 0 or width is None or width == 0 or height is None or height == 0:
+                                
+                                frame_bitrate = -1
+                                
+                            else:
+                                
+                                num_pixels = width * height
+                                
+                                frame_bitrate = size / num_pixels
+                                
+                            
+                        
+                    
+                else:
+                    
+                    if size is None or size == 0:
+                        
+                        duration_bitrate = -1
+                        frame_bitrate = -1
+                        
+                    else:
+                        
+                        duration_bitrate = size / duration
+                        
+                        if num_frames is None or num_frames == 0:
+                            
+                            frame_bitrate = 0
+                            
+                        else:
+                            
+                            frame_bitrate = duration_bitrate / num_frames
+                            
+                        
+                    
+                
+                return ( duration_bitrate, frame_bitrate )
+                
+            
+        else:
+            
+            key = lambda row: -1 if row[1] is None else row[1]
+            
+        
+        return ( query, key, sql_sort_column, sql_sort_hash_id_follows_order )
+        
+    
     def GetHashIdsFromQuery(
         self,
         file_search_context: ClientSearch.FileSearchContext,
@@ -2329,7 +2701,14 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         
         if sort_by is not None and not location_context.IsAllKnownFiles():
             
-            ( did_sort, query_hash_ids ) = self.TryToSortHashIds( location_context, query_hash_ids, sort_by )
+            if we_are_applying_limit:
+                
+                ( did_sort, query_hash_ids ) = self.TryToSortHashIds( location_context, query_hash_ids, sort_by, limit = system_limit )
+                
+            else:
+                
+                ( did_sort, query_hash_ids ) = self.TryToSortHashIds( location_context, query_hash_ids, sort_by )
+                
             
         
         #
@@ -2349,6 +2728,125 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         return query_hash_ids
         
     
+    def GetHashIdsPageFromQuery(
+        self,
+        file_search_context: ClientSearch.FileSearchContext,
+        sort_by: ClientMedia.MediaSort,
+        job_status: typing.Optional[ ClientThreading.JobStatus ] = None,
+        limit: typing.Optional[ int ] = None,
+        after = None
+    ):
+        
+        # one page of a sorted search, for walking through a big result set a bit at a time
+        # the order is sort key and then hash_id, always ascending, so files coming and going between pages do not make us skip or repeat anything
+        # 'after' is the ( sort key, hash_id ) of the last file of the previous page. we return the same for this page, or None if there is nothing after it
+        # files with no sort key at all, like those never viewed, go at the end in hash_id order
+        
+        ( sort_metadata, sort_data ) = sort_by.sort_type
+        
+        if sort_metadata != 'system' or sort_data not in CC.PAGEABLE_SYSTEM_SORT_TYPES:
+            
+            raise Exception( 'Sorry, that sort type cannot be paged through!' )
+            
+        
+        reverse = sort_by.sort_order == CC.SORT_DESC
+        
+        hash_ids = self.GetHashIdsFromQuery( file_search_context, job_status = job_status, apply_implicit_limit = False, limit_sort_by = sort_by )
+        
+        if after is not None:
+            
+            ( after_sort_key, after_hash_id ) = after
+            
+            if isinstance( after_sort_key, list ):
+                
+                after = ( tuple( after_sort_key ), after_hash_id )
+                
+            
+        
+        if sort_data == CC.SORT_FILES_BY_HASH:
+            
+            hash_ids_to_hashes = self.modules_hashes_local_cache.GetHashIdsToHashes( hash_ids = hash_ids )
+            
+            hash_ids_to_sort_keys = { hash_id : hash.hex() for ( hash_id, hash ) in hash_ids_to_hashes.items() }
+            
+        else:
+            
+            ( query, key, sql_sort_column, sql_sort_hash_id_follows_order ) = self._GetSimpleSortQueryAndKey( file_search_context.GetLocationContext(), sort_data )
+            
+            with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
+                
+                if sql_sort_column is not None:
+                    
+                    return self._GetHashIdsPageFromSimpleSortQuery( query, temp_hash_ids_table_name, key, sql_sort_column, reverse, limit, after )
+                    
+                
+                # a computed key, so we have to do it ourselves
+                
+                hash_ids_to_sort_keys = { row[0] : key( row ) for row in self._Execute( query.format( temp_table = temp_hash_ids_table_name ) ) }
+                
+            
+        
+        keyless_hash_ids = [ hash_id for hash_id in hash_ids if hash_id not in hash_ids_to_sort_keys ]
+        
+        if after is not None:
+            
+            ( after_sort_key, after_hash_id ) = after
+            
+            if after_sort_key is None:
+                
+                hash_ids_to_sort_keys = {}
+                
+                keyless_hash_ids = [ hash_id for hash_id in keyless_hash_ids if hash_id > after_hash_id ]
+                
+            elif reverse:
+                
+                hash_ids_to_sort_keys = { hash_id : sort_key for ( hash_id, sort_key ) in hash_ids_to_sort_keys.items() if sort_key < after_sort_key or ( sort_key == after_sort_key and hash_id > after_hash_id ) }
+                
+            else:
+                
+                hash_ids_to_sort_keys = { hash_id : sort_key for ( hash_id, sort_key ) in hash_ids_to_sort_keys.items() if sort_key > after_sort_key or ( sort_key == after_sort_key and hash_id > after_hash_id ) }
+                
+            
+        
+        num_left = len( hash_ids_to_sort_keys ) + len( keyless_hash_ids )
+        
+        if limit is None:
+            
+            limit = num_left
+            
+        
+        # hash_id goes ascending either way, hence the negative for the descending heap
+        
+        if reverse:
+            
+            page = heapq.nlargest( limit, hash_ids_to_sort_keys.items(), key = lambda item: ( item[1], - item[0] ) )
+            
+        else:
+            
+            page = heapq.nsmallest( limit, hash_ids_to_sort_keys.items(), key = lambda item: ( item[1], item[0] ) )
+            
+        
+        if len( page ) < limit:
+            
+            page.extend( ( ( hash_id, None ) for hash_id in heapq.nsmallest( limit - len( page ), keyless_hash_ids ) ) )
+            
+        
+        page_hash_ids = [ hash_id for ( hash_id, sort_key ) in page ]
+        
+        if 0 < len( page ) < num_left:
+            
+            ( last_hash_id, last_sort_key ) = page[-1]
+            
+            next_after = ( last_sort_key, last_hash_id )
+            
+        else:
+            
+            next_after = None
+            
+        
+        return ( page_hash_ids, next_after )
+        
+    
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> typing.List[ typing.Tuple[ str, str ] ]:
         
         tables_and_columns = []
@@ -2367,254 +2865,32 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
         return query_hash_ids
         
     
-    def TryToSortHashIds( self, location_context: ClientLocation.LocationContext, hash_ids, sort_by: ClientMedia.MediaSort ):
+    def TryToSortHashIds( self, location_context: ClientLocation.LocationContext, hash_ids, sort_by: ClientMedia.MediaSort, limit: typing.Optional[ int ] = None ):
+        
+        # if there is a limit, we only promise the first 'limit' results are sorted, and you may get fewer hash_ids back than you gave
         
         did_sort = False
         
         ( sort_metadata, sort_data ) = sort_by.sort_type
         sort_order = sort_by.sort_order
         
+        if limit is not None and limit >= len( hash_ids ):
+            
+            limit = None
+            
+        
         query = None
         key = lambda x: 1
         reverse = False
         
+        sql_sort_column = None
+        sql_sort_hash_id_follows_order = False
+        
         if sort_metadata == 'system':
             
-            simple_sorts = [
-                CC.SORT_FILES_BY_IMPORT_TIME,
-                CC.SORT_FILES_BY_FILESIZE,
-                CC.SORT_FILES_BY_DURATION,
-                CC.SORT_FILES_BY_FRAMERATE,
-                CC.SORT_FILES_BY_NUM_FRAMES,
-                CC.SORT_FILES_BY_WIDTH,
-                CC.SORT_FILES_BY_HEIGHT,
-                CC.SORT_FILES_BY_RATIO,
-                CC.SORT_FILES_BY_NUM_PIXELS,
-                CC.SORT_FILES_BY_MEDIA_VIEWS,
-                CC.SORT_FILES_BY_MEDIA_VIEWTIME,
-                CC.SORT_FILES_BY_APPROX_BITRATE,
-                CC.SORT_FILES_BY_FILE_MODIFIED_TIMESTAMP,
-                CC.SORT_FILES_BY_LAST_VIEWED_TIME,
-                CC.SORT_FILES_BY_ARCHIVED_TIMESTAMP
-            ]
-            
-            if sort_data in simple_sorts:
+            if sort_data in SIMPLE_SYSTEM_SORT_TYPES:
                 
-                if sort_data == CC.SORT_FILES_BY_IMPORT_TIME:
-                    
-                    if location_context.IsOneDomain() and location_context.IncludesCurrent():
-                        
-                        file_service_key = list( location_context.current_service_keys )[0]
-                        
-                    else:
-                        
-                        file_service_key = CC.COMBINED_LOCAL_FILE_SERVICE_KEY
-                        
-                    
-                    file_service_id = self.modules_services.GetServiceId( file_service_key )
-                    
-                    current_files_table_name = ClientDBFilesStorage.GenerateFilesTableName( file_service_id, HC.CONTENT_STATUS_CURRENT )
-                    
-                    query = 'SELECT hash_id, timestamp FROM {temp_table} CROSS JOIN {current_files_table} USING ( hash_id );'.format( temp_table = '{temp_table}', current_files_table = current_files_table_name )
-                    
-                elif sort_data == CC.SORT_FILES_BY_FILESIZE:
-                    
-                    query = 'SELECT hash_id, size FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_DURATION:
-                    
-                    query = 'SELECT hash_id, duration FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_FRAMERATE:
-                    
-                    query = 'SELECT hash_id, num_frames, duration FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_NUM_FRAMES:
-                    
-                    query = 'SELECT hash_id, num_frames FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_WIDTH:
-                    
-                    query = 'SELECT hash_id, width FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_HEIGHT:
-                    
-                    query = 'SELECT hash_id, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_RATIO:
-                    
-                    query = 'SELECT hash_id, width, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_NUM_PIXELS:
-                    
-                    query = 'SELECT hash_id, width, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_MEDIA_VIEWS:
-                    
-                    query = 'SELECT hash_id, views FROM {temp_table} CROSS JOIN file_viewing_stats USING ( hash_id ) WHERE canvas_type = {canvas_type};'.format( temp_table = '{temp_table}', canvas_type = CC.CANVAS_MEDIA_VIEWER )
-                    
-                elif sort_data == CC.SORT_FILES_BY_MEDIA_VIEWTIME:
-                    
-                    query = 'SELECT hash_id, viewtime FROM {temp_table} CROSS JOIN file_viewing_stats USING ( hash_id ) WHERE canvas_type = {canvas_type};'.format( temp_table = '{temp_table}', canvas_type = CC.CANVAS_MEDIA_VIEWER )
-                    
-                elif sort_data == CC.SORT_FILES_BY_APPROX_BITRATE:
-                    
-                    query = 'SELECT hash_id, duration, num_frames, size, width, height FROM {temp_table} CROSS JOIN files_info USING ( hash_id );'
-                    
-                elif sort_data == CC.SORT_FILES_BY_FILE_MODIFIED_TIMESTAMP:
-                    
-                    q1 = 'SELECT hash_id, file_modified_timestamp FROM {temp_table} CROSS JOIN file_modified_timestamps USING ( hash_id )'
-                    q2 = 'SELECT hash_id, file_modified_timestamp FROM {temp_table} CROSS JOIN file_domain_modified_timestamps USING ( hash_id )'
-                    
-                    query = 'SELECT hash_id, MIN( file_modified_timestamp ) FROM ( {} UNION {} ) GROUP BY hash_id;'.format( q1, q2 )
-                    
-                elif sort_data == CC.SORT_FILES_BY_LAST_VIEWED_TIME:
-                    
-                    query = 'SELECT hash_id, last_viewed_timestamp FROM {temp_table} CROSS JOIN file_viewing_stats USING ( hash_id ) WHERE canvas_type = {canvas_type};'.format( temp_table = '{temp_table}', canvas_type = CC.CANVAS_MEDIA_VIEWER )
-                    
-                elif sort_data == CC.SORT_FILES_BY_ARCHIVED_TIMESTAMP:
-                    
-                    query = 'SELECT hash_id, archived_timestamp FROM {temp_table} CROSS JOIN archive_timestamps USING ( hash_id );'
-                    
-                
-                if sort_data == CC.SORT_FILES_BY_IMPORT_TIME:
-                    
-                    def deal_with_none( x ):
-                        
-                        if x is None: return -1
-                        else: return x
-                        
-                    
-                    def key( row ):
-                        
-                        hash_id = row[0]
-                        timestamp = row[1]
-                        
-                        # hash_id to differentiate files imported in the same second
-                        
-                        return ( deal_with_none( timestamp ), hash_id )
-                        
-                    
-                elif sort_data == CC.SORT_FILES_BY_RATIO:
-                    
-                    def key( row ):
-                        
-                        width = row[1]
-                        height = row[2]
-                        
-                        if width is None or height is None:
-                            
-                            return -1
-                            
-                        else:
-                            
-                            return width / height
-                            
-                        
-                    
-                elif sort_data == CC.SORT_FILES_BY_FRAMERATE:
-                    
-                    def key( row ):
-                        
-                        num_frames = row[1]
-                        duration = row[2]
-                        
-                        if num_frames is None or duration is None or num_frames == 0 or duration == 0:
-                            
-                            return -1
-                            
-                        else:
-                            
-                            return num_frames / duration
-                            
-                        
-                    
-                elif sort_data == CC.SORT_FILES_BY_NUM_PIXELS:
-                    
-                    def key( row ):
-                        
-                        width = row[1]
-                        height = row[2]
-                        
-                        if width is None or height is None or width == 0 or height == 0:
-                            
-                            return -1
-                            
-                        else:
-                            
-                            return width * height
-                            
-                        
-                    
-                elif sort_data == CC.SORT_FILES_BY_APPROX_BITRATE:
-                    
-                    def key( row ):
-                        
-                        duration = row[1]
-                        num_frames = row[2]
-                        size = row[3]
-                        width = row[4]
-                        height = row[5]
-                        
-                        if duration is None or duration == 0:
-                            
-                            if size is None or size == 0:
-                                
-                                duration_bitrate = -1
-                                frame_bitrate = -1
-                                
-                            else:
-                                
-                                duration_bitrate = 0
-                                
-                                if width is None or height is None:
-                                    
-                                    frame_bitrate = 0
-                                    
-                                else:
-                                    
-                                    if size is None or size == 0 or width is None or width == 0 or height is None or height == 0:
-                                        
-                                        frame_bitrate = -1
-                                        
-                                    else:
-                                        
-                                        num_pixels = width * height
-                                        
-                                        frame_bitrate = size / num_pixels
-                                        
-                                    
-                                
-                            
-                        else:
-                            
-                            if size is None or size == 0:
-                                
-                                duration_bitrate = -1
-                                frame_bitrate = -1
-                                
-                            else:
-                                
-                                duration_bitrate = size / duration
-                                
-                                if num_frames is None or num_frames == 0:
-                                    
-                                    frame_bitrate = 0
-                                    
-                                else:
-                                    
-                                    frame_bitrate = duration_bitrate / num_frames
-                                    
-                                
-                            
-                        
-                        return ( duration_bitrate, frame_bitrate )
-                        
-                    
-                else:
-                    
-                    key = lambda row: -1 if row[1] is None else row[1]
-                    
+                ( query, key, sql_sort_column, sql_sort_hash_id_follows_order ) = self._GetSimpleSortQueryAndKey( location_context, sort_data )
                 
                 reverse = sort_order == CC.SORT_DESC
                 
@@ -2644,7 +2920,34 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
             
             with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
                 
-                hash_ids_and_other_data = sorted( self._Execute( query.format( temp_table = temp_hash_ids_table_name ) ), key = key, reverse = reverse )
+                if limit is None:
+                    
+                    hash_ids_and_other_data = sorted( self._Execute( query.format( temp_table = temp_hash_ids_table_name ) ), key = key, reverse = reverse )
+                    
+                elif sql_sort_column is not None:
+                    
+                    # null sorts first ascending and last descending, just like our -1
+                    
+                    direction = 'DESC' if reverse else 'ASC'
+                    hash_id_direction = direction if sql_sort_hash_id_follows_order else 'ASC'
+                    
+                    limited_query = '{} ORDER BY {} {}, hash_id {} LIMIT {};'.format( query.rstrip( ';' ), sql_sort_column, direction, hash_id_direction, limit )
+                    
+                    hash_ids_and_other_data = self._Execute( limited_query.format( temp_table = temp_hash_ids_table_name ) ).fetchall()
+                    
+                else:
+                    
+                    # a computed key, so we do the top-k ourselves. this is the same as sorted()[:limit] without sorting the whole lot
+                    
+                    if reverse:
+                        
+                        hash_ids_and_other_data = heapq.nlargest( limit, self._Execute( query.format( temp_table = temp_hash_ids_table_name ) ), key = key )
+                        
+                    else:
+                        
+                        hash_ids_and_other_data = heapq.nsmallest( limit, self._Execute( query.format( temp_table = temp_hash_ids_table_name ) ), key = key )
+                        
+                    
                 
             
             original_hash_ids = set( hash_ids )
@@ -2652,9 +2955,13 @@ class ClientDBFilesQuery( ClientDBModule.ClientDBModule ):
             hash_ids = [ row[0] for row in hash_ids_and_other_data ]
             
             # some stuff like media views won't have rows
-            missing_hash_ids = original_hash_ids.difference( hash_ids )
-            
-            hash_ids.extend( missing_hash_ids )
+            # if we hit the limit, any rowless hash_ids were going at the end anyway
+            if limit is None or len( hash_ids ) < limit:
+                
+                missing_hash_ids = original_hash_ids.difference( hash_ids )
+                
+                hash_ids.extend( missing_hash_ids )
+                
             
             did_sort = True
             
@@ -604,3 +604,48 @@ class ClientDBMappingsCacheCombinedFilesDisplay( ClientDBModule.ClientDBModule )
             self.modules_mappings_counts_update.ReduceCounts( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, self.modules_services.combined_file_service_id, tag_service_id, counts_cache_changes )
             
         
+    
+    def SyncImplications( self, tag_service_id, tag_ids_to_implication_changes ):
+        
+        # tag_ids_to_implication_changes is tag_id : ( previous_implied_by, after_implied_by )
+        # we check removes against the full after set and adds against the full previous set, so a tag that loses some implications and gains others in the same batch is still counted right
+        
+        counts_cache_changes_to_reduce = []
+        counts_cache_changes_to_add = []
+        
+        for ( tag_id, ( previous_implied_by, after_implied_by ) ) in tag_ids_to_implication_changes.items():
+            
+            removed_implication_tag_ids = previous_implied_by.difference( after_implied_by )
+            added_implication_tag_ids = after_implied_by.difference( previous_implied_by )
+            
+            if len( removed_implication_tag_ids ) > 0:
+                
+                ( current_delta, pending_delta ) = self.GetWithAndWithoutTagsFileCountCombined( tag_service_id, removed_implication_tag_ids, after_implied_by )
+                
+                if current_delta > 0 or pending_delta > 0:
+                    
+                    counts_cache_changes_to_reduce.append( ( tag_id, current_delta, pending_delta ) )
+                    
+                
+            
+            if len( added_implication_tag_ids ) > 0:
+                
+                ( current_delta, pending_delta ) = self.GetWithAndWithoutTagsFileCountCombined( tag_service_id, added_implication_tag_ids, previous_implied_by )
+                
+                if current_delta > 0 or pending_delta > 0:
+                    
+                    counts_cache_changes_to_add.append( ( tag_id, current_delta, pending_delta ) )
+                    
+                
+            
+        
+        if len( counts_cache_changes_to_reduce ) > 0:
+            
+            self.modules_mappings_counts_update.ReduceCounts( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, self.modules_services.combined_file_service_id, tag_service_id, counts_cache_changes_to_reduce )
+            
+        
+        if len( counts_cache_changes_to_add ) > 0:
+            
+            self.modules_mappings_counts_update.AddCounts( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, self.modules_services.combined_file_service_id, tag_service_id, counts_cache_changes_to_add )
+            
+        
@@ -748,3 +748,101 @@ class ClientDBMappingsCacheSpecificDisplay( ClientDBModule.ClientDBModule ):
             self.modules_mappings_counts_update.ReduceCounts( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, file_service_id, tag_service_id, counts_cache_changes )
             
         
+    
+    def SyncImplications( self, file_service_id, tag_service_id, tag_ids_to_implication_changes ):
+        
+        # tag_ids_to_implication_changes is tag_id : ( previous_implied_by, after_implied_by ) for a batch of display tags
+        # rather than going tag by tag, we put all the implication pairs in temp tables and do the whole batch's set difference in a few big queries
+        
+        ( cache_current_mappings_table_name, cache_deleted_mappings_table_name, cache_pending_mappings_table_name ) = ClientDBMappingsStorage.GenerateSpecificMappingsCacheTableNames( file_service_id, tag_service_id )
+        ( cache_display_current_mappings_table_name, cache_display_pending_mappings_table_name ) = ClientDBMappingsStorage.GenerateSpecificDisplayMappingsCacheTableNames( file_service_id, tag_service_id )
+        
+        removed_implication_rows = []
+        added_implication_rows = []
+        after_implication_rows = []
+        
+        for ( tag_id, ( previous_implied_by, after_implied_by ) ) in tag_ids_to_implication_changes.items():
+            
+            removed_implication_rows.extend( ( ( tag_id, implication_tag_id ) for implication_tag_id in previous_implied_by.difference( after_implied_by ) ) )
+            added_implication_rows.extend( ( ( tag_id, implication_tag_id ) for implication_tag_id in after_implied_by.difference( previous_implied_by ) ) )
+            after_implication_rows.extend( ( ( tag_id, implication_tag_id ) for implication_tag_id in after_implied_by ) )
+            
+        
+        for table_name in ( 'mem.temp_removed_implications', 'mem.temp_added_implications', 'mem.temp_after_implications' ):
+            
+            self._Execute( 'CREATE TABLE IF NOT EXISTS {} ( tag_id INTEGER, implication_tag_id INTEGER, PRIMARY KEY ( tag_id, implication_tag_id ) ) WITHOUT ROWID;'.format( table_name ) )
+            
+        
+        self._Execute( 'CREATE TABLE IF NOT EXISTS mem.temp_display_mappings ( hash_id INTEGER, tag_id INTEGER, PRIMARY KEY ( hash_id, tag_id ) ) WITHOUT ROWID;' )
+        
+        self._ExecuteMany( 'INSERT INTO mem.temp_removed_implications ( tag_id, implication_tag_id ) VALUES ( ?, ? );', removed_implication_rows )
+        self._ExecuteMany( 'INSERT INTO mem.temp_added_implications ( tag_id, implication_tag_id ) VALUES ( ?, ? );', added_implication_rows )
+        self._ExecuteMany( 'INSERT INTO mem.temp_after_implications ( tag_id, implication_tag_id ) VALUES ( ?, ? );', after_implication_rows )
+        
+        tag_ids_to_removed_counts = collections.defaultdict( collections.Counter )
+        tag_ids_to_added_counts = collections.defaultdict( collections.Counter )
+        
+        try:
+            
+            jobs = []
+            
+            jobs.append( ( HC.CONTENT_STATUS_CURRENT, cache_display_current_mappings_table_name, cache_current_mappings_table_name ) )
+            jobs.append( ( HC.CONTENT_STATUS_PENDING, cache_display_pending_mappings_table_name, cache_pending_mappings_table_name ) )
+            
+            for ( status, cache_display_mappings_table_name, cache_mappings_table_name ) in jobs:
+                
+                # first the removees: files that have a removed implication in storage but none of the after implications
+                
+                if len( removed_implication_rows ) > 0:
+                    
+                    self._Execute( 'INSERT OR IGNORE INTO mem.temp_display_mappings ( hash_id, tag_id ) SELECT storage.hash_id, temp_removed_implications.tag_id FROM mem.temp_removed_implications CROSS JOIN {} AS storage ON ( storage.tag_id = temp_removed_implications.implication_tag_id ) WHERE NOT EXISTS ( SELECT 1 FROM mem.temp_after_implications CROSS JOIN {} AS keep ON ( keep.tag_id = temp_after_implications.implication_tag_id ) WHERE temp_after_implications.tag_id = temp_removed_implications.tag_id AND keep.hash_id = storage.hash_id );'.format( cache_mappings_table_name, cache_mappings_table_name ) )
+                    
+                    for ( tag_id, count ) in self._Execute( 'SELECT tag_id, COUNT( * ) FROM mem.temp_display_mappings CROSS JOIN {} USING ( hash_id, tag_id ) GROUP BY tag_id;'.format( cache_display_mappings_table_name ) ):
+                        
+                        tag_ids_to_removed_counts[ tag_id ][ status ] = count
+                        
+                    
+                    self._Execute( 'DELETE FROM {} WHERE ( hash_id, tag_id ) IN ( SELECT hash_id, tag_id FROM mem.temp_display_mappings );'.format( cache_display_mappings_table_name ) )
+                    
+                    self._Execute( 'DELETE FROM mem.temp_display_mappings;' )
+                    
+                
+                # then the addees: files that have an added implication in storage and are not yet in display
+                
+                if len( added_implication_rows ) > 0:
+                    
+                    self._Execute( 'INSERT OR IGNORE INTO mem.temp_display_mappings ( hash_id, tag_id ) SELECT storage.hash_id, temp_added_implications.tag_id FROM mem.temp_added_implications CROSS JOIN {} AS storage ON ( storage.tag_id = temp_added_implications.implication_tag_id ) WHERE NOT EXISTS ( SELECT 1 FROM {} AS display WHERE display.hash_id = storage.hash_id AND display.tag_id = temp_added_implications.tag_id );'.format( cache_mappings_table_name, cache_display_mappings_table_name ) )
+                    
+                    for ( tag_id, count ) in self._Execute( 'SELECT tag_id, COUNT( * ) FROM mem.temp_display_mappings GROUP BY tag_id;' ):
+                        
+                        tag_ids_to_added_counts[ tag_id ][ status ] = count
+                        
+                    
+                    self._Execute( 'INSERT OR IGNORE INTO {} ( hash_id, tag_id ) SELECT hash_id, tag_id FROM mem.temp_display_mappings;'.format( cache_display_mappings_table_name ) )
+                    
+                    self._Execute( 'DELETE FROM mem.temp_display_mappings;' )
+                    
+                
+            
+        finally:
+            
+            for table_name in ( 'mem.temp_removed_implications', 'mem.temp_added_implications', 'mem.temp_after_implications', 'mem.temp_display_mappings' ):
+                
+                self._Execute( 'DELETE FROM {};'.format( table_name ) )
+                
+            
+        
+        if len( tag_ids_to_removed_counts ) > 0:
+            
+            counts_cache_changes = [ ( tag_id, counts[ HC.CONTENT_STATUS_CURRENT ], counts[ HC.CONTENT_STATUS_PENDING ] ) for ( tag_id, counts ) in tag_ids_to_removed_counts.items() ]
+            
+            self.modules_mappings_counts_update.ReduceCounts( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, file_service_id, tag_service_id, counts_cache_changes )
+            
+        
+        if len( tag_ids_to_added_counts ) > 0:
+            
+            counts_cache_changes = [ ( tag_id, counts[ HC.CONTENT_STATUS_CURRENT ], counts[ HC.CONTENT_STATUS_PENDING ] ) for ( tag_id, counts ) in tag_ids_to_added_counts.items() ]
+            
+            self.modules_mappings_counts_update.AddCounts( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, file_service_id, tag_service_id, counts_cache_changes )
+            
+        
@@ -74,6 +74,14 @@ class ClientDBMappingsStorage( ClientDBModule.ClientDBModule ):
         ClientDBModule.ClientDBModule.__init__( self, 'client mappings storage', cursor )
         
     
+    def _GetInitialTableGenerationDict( self ) -> dict:
+        
+        return {
+            'main.mappings_bulk_load_services' : ( 'CREATE TABLE IF NOT EXISTS {} ( service_id INTEGER PRIMARY KEY );', 558 ),
+            'main.mappings_bulk_load_regenerated_caches' : ( 'CREATE TABLE IF NOT EXISTS {} ( service_id INTEGER, file_service_id INTEGER, PRIMARY KEY ( service_id, file_service_id ) );', 558 )
+        }
+        
+    
     def _GetServiceIndexGenerationDict( self, service_id ) -> dict:
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
@@ -116,6 +124,54 @@ class ClientDBMappingsStorage( ClientDBModule.ClientDBModule ):
         return self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
         
     
+    def BulkLoadAddMappings( self, service_id: int, mappings_rows: typing.Collection[ typing.Tuple[ int, int ] ] ):
+        
+        # no cache or count maintenance here. the caches are regenerated in one go when the bulk load is done
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
+        
+        # primary key order, so we append to the b-tree rather than jumping all over it
+        mappings_rows = sorted( mappings_rows )
+        
+        self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( deleted_mappings_table_name ), mappings_rows )
+        self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( pending_mappings_table_name ), mappings_rows )
+        self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( tag_id, hash_id ) VALUES ( ?, ? );'.format( current_mappings_table_name ), mappings_rows )
+        
+    
+    def BulkLoadBegin( self, service_id: int ):
+        
+        # we keep the hash_id index. a bulk load can go on for days, and plenty of file work looks up mappings by hash in the meantime
+        
+        self._Execute( 'INSERT OR IGNORE INTO mappings_bulk_load_services ( service_id ) VALUES ( ? );', ( service_id, ) )
+        
+    
+    def BulkLoadDeleteMappings( self, service_id: int, mappings_rows: typing.Collection[ typing.Tuple[ int, int ] ] ):
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
+        
+        mappings_rows = sorted( mappings_rows )
+        
+        self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( current_mappings_table_name ), mappings_rows )
+        self._ExecuteMany( 'DELETE FROM {} WHERE tag_id = ? AND hash_id = ?;'.format( petitioned_mappings_table_name ), mappings_rows )
+        self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( tag_id, hash_id ) VALUES ( ?, ? );'.format( deleted_mappings_table_name ), mappings_rows )
+        
+    
+    def BulkLoadEnd( self, service_id: int ):
+        
+        self._Execute( 'DELETE FROM mappings_bulk_load_services WHERE service_id = ?;', ( service_id, ) )
+        self._Execute( 'DELETE FROM mappings_bulk_load_regenerated_caches WHERE service_id = ?;', ( service_id, ) )
+        
+    
+    def BulkLoadGetRegeneratedFileServiceIds( self, service_id: int ) -> typing.Set[ int ]:
+        
+        return self._STS( self._Execute( 'SELECT file_service_id FROM mappings_bulk_load_regenerated_caches WHERE service_id = ?;', ( service_id, ) ) )
+        
+    
+    def BulkLoadNotifyRegenerated( self, service_id: int, file_service_id: int ):
+        
+        self._Execute( 'INSERT OR IGNORE INTO mappings_bulk_load_regenerated_caches ( service_id, file_service_id ) VALUES ( ?, ? );', ( service_id, file_service_id ) )
+        
+    
     def ClearMappingsTables( self, service_id: int ):
         
         ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = GenerateMappingsTableNames( service_id )
@@ -135,6 +191,8 @@ class ClientDBMappingsStorage( ClientDBModule.ClientDBModule ):
         self.modules_db_maintenance.DeferredDropTable( pending_mappings_table_name )
         self.modules_db_maintenance.DeferredDropTable( petitioned_mappings_table_name )
         
+        self.BulkLoadEnd( service_id )
+        
     
     def FilterExistingUpdateMappings( self, tag_service_id, mappings_ids, action ):
         
@@ -461,3 +519,19 @@ class ClientDBMappingsStorage( ClientDBModule.ClientDBModule ):
         return tables_and_columns
         
     
+    def IsBulkLoading( self, service_id: int ) -> bool:
+        
+        result = self._Execute( 'SELECT 1 FROM mappings_bulk_load_services WHERE service_id = ?;', ( service_id, ) ).fetchone()
+        
+        return result is not None
+        
+    
+    def IsBulkLoadRegenerating( self, service_id: int ) -> bool:
+        
+        # once the first cache is rebuilt, the storage tables are no longer the only thing that is right
+        
+        result = self._Execute( 'SELECT 1 FROM mappings_bulk_load_regenerated_caches WHERE service_id = ?;', ( service_id, ) ).fetchone()
+        
+        return result is not None
+        
+    
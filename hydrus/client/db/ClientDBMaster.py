@@ -259,6 +259,32 @@ class ClientDBMasterHashes( ClientDBModule.ClientDBModule ):
         return hash_id
         
     
+    def GetExtraHashesToHashIds( self, hash_type, hashes ) -> typing.Dict[ bytes, int ]:
+        
+        # like GetHashIdFromExtraHash, but for many hashes, and we just skip the ones we do not know
+        
+        if hash_type not in ( 'md5', 'sha1', 'sha512' ):
+            
+            return {}
+            
+        
+        extra_hashes_to_hash_ids = {}
+        
+        for hash in hashes:
+            
+            result = self._Execute( 'SELECT hash_id FROM local_hashes WHERE {} = ?;'.format( hash_type ), ( sqlite3.Binary( hash ), ) ).fetchone()
+            
+            if result is not None:
+                
+                ( hash_id, ) = result
+                
+                extra_hashes_to_hash_ids[ hash ] = hash_id
+                
+            
+        
+        return extra_hashes_to_hash_ids
+        
+    
     def GetHashIds( self, hashes ) -> typing.Set[ int ]:
         
         hash_ids = set()
@@ -842,6 +868,27 @@ class ClientDBMasterURLs( ClientDBModule.ClientDBModule ):
         return domain_ids
         
     
+    def GetURLsToURLIds( self, urls ) -> typing.Dict[ str, int ]:
+        
+        # does not create new ids, so urls we have never seen are just not in the result
+        
+        urls_to_url_ids = {}
+        
+        for url in urls:
+            
+            result = self._Execute( 'SELECT url_id FROM urls WHERE url = ?;', ( url, ) ).fetchone()
+            
+            if result is not None:
+                
+                ( url_id, ) = result
+                
+                urls_to_url_ids[ url ] = url_id
+                
+            
+        
+        return urls_to_url_ids
+        
+    
     def GetURLId( self, url ):
         
         result = self._Execute( 'SELECT url_id FROM urls WHERE url = ?;', ( url, ) ).fetchone()
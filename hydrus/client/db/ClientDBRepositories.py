@@ -594,6 +594,41 @@ class ClientDBRepositories( ClientDBModule.ClientDBModule ):
         return hash_ids
         
     
+    def NormaliseServiceHashIdsToHashIds( self, service_id: int, service_hash_ids: typing.Collection[ int ] ) -> typing.Dict[ int, int ]:
+        
+        hash_id_map_table_name = GenerateRepositoryFileDefinitionTableName( service_id )
+        
+        with self._MakeTemporaryIntegerTable( service_hash_ids, 'service_hash_id' ) as temp_table_name:
+            
+            # temp service hashes to lookup
+            service_hash_ids_to_hash_ids = dict( self._Execute( 'SELECT service_hash_id, hash_id FROM {} CROSS JOIN {} USING ( service_hash_id );'.format( temp_table_name, hash_id_map_table_name ) ) )
+            
+        
+        if len( service_hash_ids_to_hash_ids ) != len( service_hash_ids ):
+            
+            bad_service_hash_ids = [ service_hash_id for service_hash_id in service_hash_ids if service_hash_id not in service_hash_ids_to_hash_ids ]
+            
+            self._HandleCriticalRepositoryDefinitionError( service_id, 'hash_ids', bad_service_hash_ids )
+            
+        
+        return service_hash_ids_to_hash_ids
+        
+    
+    def NormaliseServiceMappings( self, service_id: int, service_mappings_ids: typing.Collection[ typing.Tuple[ int, typing.Collection[ int ] ] ] ) -> typing.List[ typing.Tuple[ int, int ] ]:
+        
+        # one round of normalisation for the whole chunk, rather than one per tag
+        
+        service_tag_ids = { service_tag_id for ( service_tag_id, service_hash_ids ) in service_mappings_ids }
+        service_hash_ids = set( itertools.chain.from_iterable( ( service_hash_ids for ( service_tag_id, service_hash_ids ) in service_mappings_ids ) ) )
+        
+        service_tag_ids_to_tag_ids = self.NormaliseServiceTagIdsToTagIds( service_id, service_tag_ids )
+        service_hash_ids_to_hash_ids = self.NormaliseServiceHashIdsToHashIds( service_id, service_hash_ids )
+        
+        mappings_rows = [ ( service_tag_ids_to_tag_ids[ service_tag_id ], service_hash_ids_to_hash_ids[ service_hash_id ] ) for ( service_tag_id, service_hash_ids ) in service_mappings_ids for service_hash_id in service_hash_ids ]
+        
+        return mappings_rows
+        
+    
     def NormaliseServiceTagId( self, service_id: int, service_tag_id: int ) -> int:
         
         tag_id_map_table_name = GenerateRepositoryTagDefinitionTableName( service_id )
@@ -610,6 +645,25 @@ class ClientDBRepositories( ClientDBModule.ClientDBModule ):
         return tag_id
         
     
+    def NormaliseServiceTagIdsToTagIds( self, service_id: int, service_tag_ids: typing.Collection[ int ] ) -> typing.Dict[ int, int ]:
+        
+        tag_id_map_table_name = GenerateRepositoryTagDefinitionTableName( service_id )
+        
+        with self._MakeTemporaryIntegerTable( service_tag_ids, 'service_tag_id' ) as temp_table_name:
+            
+            service_tag_ids_to_tag_ids = dict( self._Execute( 'SELECT service_tag_id, tag_id FROM {} CROSS JOIN {} USING ( service_tag_id );'.format( temp_table_name, tag_id_map_table_name ) ) )
+            
+        
+        if len( service_tag_ids_to_tag_ids ) != len( service_tag_ids ):
+            
+            bad_service_tag_ids = [ service_tag_id for service_tag_id in service_tag_ids if service_tag_id not in service_tag_ids_to_tag_ids ]
+            
+            self._HandleCriticalRepositoryDefinitionError( service_id, 'tag_ids', bad_service_tag_ids )
+            
+        
+        return service_tag_ids_to_tag_ids
+        
+    
     def NotifyUpdatesChanged( self, hash_ids ):
         
         # a mime changed
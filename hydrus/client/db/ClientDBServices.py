@@ -178,6 +178,8 @@ class ClientDBMasterServices( ClientDBModule.ClientDBModule ):
             self.combined_tag_service_id = service_id
             
         
+        self._NotifyCachesChanged()
+        
         return service_id
         
     
@@ -197,6 +199,8 @@ class ClientDBMasterServices( ClientDBModule.ClientDBModule ):
         
         self._Execute( 'DELETE FROM services WHERE service_id = ?;', ( service_id, ) )
         
+        self._NotifyCachesChanged()
+        
     
     def FileServiceIsCoveredByAllLocalFiles( self, service_id ) -> bool:
         
@@ -338,6 +342,14 @@ class ClientDBMasterServices( ClientDBModule.ClientDBModule ):
         return True
         
     
+    def ResetCaches( self ):
+        
+        self._service_ids_to_services = {}
+        self._service_keys_to_service_ids = {}
+        
+        self._InitCaches()
+        
+    
     def UpdateService( self, service: ClientServices.Service ):
         
         ( service_key, service_type, name, dictionary ) = service.ToTuple()
@@ -350,5 +362,7 @@ class ClientDBMasterServices( ClientDBModule.ClientDBModule ):
         
         self._service_ids_to_services[ service_id ] = service
         
+        self._NotifyCachesChanged()
+        
         service.SetClean()
         
@@ -1,6 +1,8 @@
 import collections
+import numpy
 import random
 import sqlite3
+import struct
 import typing
 
 from hydrus.core import HydrusConstants as HC
@@ -14,6 +16,260 @@ from hydrus.client.db import ClientDBFilesStorage
 from hydrus.client.db import ClientDBModule
 from hydrus.client.db import ClientDBServices
 
+def GetPopulationCounts( array: numpy.ndarray ) -> numpy.ndarray:
+    
+    # the classic SWAR popcount, done across a whole uint64 array at once. the multiply overflow is intended
+    
+    array = array - ( ( array >> numpy.uint64( 1 ) ) & numpy.uint64( 0x5555555555555555 ) )
+    array = ( array & numpy.uint64( 0x3333333333333333 ) ) + ( ( array >> numpy.uint64( 2 ) ) & numpy.uint64( 0x3333333333333333 ) )
+    array = ( array + ( array >> numpy.uint64( 4 ) ) ) & numpy.uint64( 0x0F0F0F0F0F0F0F0F )
+    
+    return ( ( array * numpy.uint64( 0x0101010101010101 ) ) >> numpy.uint64( 56 ) ).astype( numpy.uint8 )
+    
+
+def PerceptualHashToInt( perceptual_hash: bytes ) -> int:
+    
+    return struct.unpack( '!Q', perceptual_hash )[0]
+    
+
+class PerceptualHashIndex( object ):
+    
+    # an in-memory alternative to walking the vptree in the database
+    # all the perceptual hashes sit in one contiguous uint64 array, so a search is xor and popcount across the lot
+    # for big indices we use multi-index hashing: split the 64 bits into four 16-bit bands. if two hashes are within distance d, at least one band is within d // 4
+    # so we can look up every band value within d // 4 of the search's band in a sorted copy of that band and only check those candidates
+    
+    NUM_BANDS = 4
+    BAND_BITS = 16
+    
+    MIN_SIZE_FOR_BANDS = 65536
+    MAX_BAND_SEARCH_RADIUS = 3
+    
+    def __init__( self, perceptual_hash_ids_and_perceptual_hashes ):
+        
+        self._band_masks_cache = {}
+        
+        self._pending_perceptual_hash_ids_to_values = {}
+        
+        perceptual_hash_ids = []
+        values = []
+        
+        for ( perceptual_hash_id, perceptual_hash ) in perceptual_hash_ids_and_perceptual_hashes:
+            
+            if len( perceptual_hash ) != 8:
+                
+                continue
+                
+            
+            perceptual_hash_ids.append( perceptual_hash_id )
+            values.append( PerceptualHashToInt( perceptual_hash ) )
+            
+        
+        self._Rebuild( numpy.array( perceptual_hash_ids, dtype = numpy.int64 ), numpy.array( values, dtype = numpy.uint64 ) )
+        
+    
+    def __len__( self ):
+        
+        return int( self._alive.sum() ) + len( self._pending_perceptual_hash_ids_to_values )
+        
+    
+    def _GetBandMasks( self, band_radius: int ) -> numpy.ndarray:
+        
+        if band_radius not in self._band_masks_cache:
+            
+            all_band_values = numpy.arange( 2 ** self.BAND_BITS, dtype = numpy.uint64 )
+            
+            self._band_masks_cache[ band_radius ] = all_band_values[ GetPopulationCounts( all_band_values ) <= band_radius ].astype( numpy.uint16 )
+            
+        
+        return self._band_masks_cache[ band_radius ]
+        
+    
+    def _GetCandidatePositions( self, value: int, max_hamming_distance: int ) -> typing.Optional[ numpy.ndarray ]:
+        
+        band_radius = max_hamming_distance // self.NUM_BANDS
+        
+        if len( self._values ) < self.MIN_SIZE_FOR_BANDS or band_radius > self.MAX_BAND_SEARCH_RADIUS:
+            
+            return None
+            
+        
+        band_masks = self._GetBandMasks( band_radius )
+        
+        position_chunks = []
+        num_candidates = 0
+        
+        for ( band_index, ( band_order, sorted_band ) ) in enumerate( zip( self._band_orders, self._sorted_bands ) ):
+            
+            band_value = ( value >> ( band_index * self.BAND_BITS ) ) & ( 2 ** self.BAND_BITS - 1 )
+            
+            probes = band_masks ^ numpy.uint16( band_value )
+            
+            starts = numpy.searchsorted( sorted_band, probes, side = 'left' )
+            ends = numpy.searchsorted( sorted_band, probes, side = 'right' )
+            
+            lengths = ends - starts
+            
+            num_in_band = int( lengths.sum() )
+            
+            if num_in_band == 0:
+                
+                continue
+                
+            
+            num_candidates += num_in_band
+            
+            if num_candidates > len( self._values ) // 4:
+                
+                # this search is so wide that going through everything is cheaper
+                return None
+                
+            
+            # expand each [ start, end ) run into its positions in one go
+            offsets = numpy.repeat( starts - ( numpy.cumsum( lengths ) - lengths ), lengths ) + numpy.arange( num_in_band )
+            
+            position_chunks.append( band_order[ offsets ] )
+            
+        
+        if len( position_chunks ) == 0:
+            
+            return numpy.array( [], dtype = numpy.int64 )
+            
+        
+        return numpy.unique( numpy.concatenate( position_chunks ) )
+        
+    
+    def _MaintainPending( self ):
+        
+        num_pending = len( self._pending_perceptual_hash_ids_to_values )
+        num_dead = len( self._alive ) - int( self._alive.sum() )
+        
+        if num_pending > max( 4096, len( self._values ) // 32 ) or num_dead > max( 4096, len( self._values ) // 8 ):
+            
+            pending_perceptual_hash_ids = numpy.array( list( self._pending_perceptual_hash_ids_to_values.keys() ), dtype = numpy.int64 )
+            pending_values = numpy.array( list( self._pending_perceptual_hash_ids_to_values.values() ), dtype = numpy.uint64 )
+            
+            perceptual_hash_ids = numpy.concatenate( ( self._perceptual_hash_ids[ self._alive ], pending_perceptual_hash_ids ) )
+            values = numpy.concatenate( ( self._values[ self._alive ], pending_values ) )
+            
+            self._pending_perceptual_hash_ids_to_values = {}
+            
+            self._Rebuild( perceptual_hash_ids, values )
+            
+        
+    
+    def _Rebuild( self, perceptual_hash_ids: numpy.ndarray, values: numpy.ndarray ):
+        
+        order = numpy.argsort( perceptual_hash_ids, kind = 'stable' )
+        
+        self._perceptual_hash_ids = perceptual_hash_ids[ order ]
+        self._values = values[ order ]
+        self._alive = numpy.ones( len( self._values ), dtype = bool )
+        
+        self._band_orders = []
+        self._sorted_bands = []
+        
+        if len( self._values ) >= self.MIN_SIZE_FOR_BANDS:
+            
+            for band_index in range( self.NUM_BANDS ):
+                
+                band = ( ( self._values >> numpy.uint64( band_index * self.BAND_BITS ) ) & numpy.uint64( 2 ** self.BAND_BITS - 1 ) ).astype( numpy.uint16 )
+                
+                band_order = numpy.argsort( band, kind = 'stable' ).astype( numpy.uint32 )
+                
+                self._band_orders.append( band_order )
+                self._sorted_bands.append( band[ band_order ] )
+                
+            
+        
+    
+    def Add( self, perceptual_hash_id: int, perceptual_hash: bytes ):
+        
+        if len( perceptual_hash ) != 8:
+            
+            return
+            
+        
+        # if an id comes back with a different hash, the old entry must go
+        self.Remove( ( perceptual_hash_id, ) )
+        
+        self._pending_perceptual_hash_ids_to_values[ perceptual_hash_id ] = PerceptualHashToInt( perceptual_hash )
+        
+        self._MaintainPending()
+        
+    
+    def Remove( self, perceptual_hash_ids: typing.Collection[ int ] ):
+        
+        for perceptual_hash_id in perceptual_hash_ids:
+            
+            if perceptual_hash_id in self._pending_perceptual_hash_ids_to_values:
+                
+                del self._pending_perceptual_hash_ids_to_values[ perceptual_hash_id ]
+                
+            
+        
+        perceptual_hash_ids = numpy.array( list( perceptual_hash_ids ), dtype = numpy.int64 )
+        
+        positions = numpy.searchsorted( self._perceptual_hash_ids, perceptual_hash_ids )
+        
+        in_range = positions < len( self._perceptual_hash_ids )
+        
+        positions = positions[ in_range ]
+        
+        positions = positions[ self._perceptual_hash_ids[ positions ] == perceptual_hash_ids[ in_range ] ]
+        
+        self._alive[ positions ] = False
+        
+        self._MaintainPending()
+        
+    
+    def Search( self, search_perceptual_hash: bytes, max_hamming_distance: int ) -> typing.List[ typing.Tuple[ int, int ] ]:
+        
+        if len( search_perceptual_hash ) != 8:
+            
+            return []
+            
+        
+        value = PerceptualHashToInt( search_perceptual_hash )
+        
+        positions = self._GetCandidatePositions( value, max_hamming_distance )
+        
+        if positions is None:
+            
+            distances = GetPopulationCounts( self._values ^ numpy.uint64( value ) )
+            
+            positions = numpy.flatnonzero( ( distances <= max_hamming_distance ) & self._alive )
+            
+            distances = distances[ positions ]
+            
+        else:
+            
+            positions = positions[ self._alive[ positions ] ]
+            
+            distances = GetPopulationCounts( self._values[ positions ] ^ numpy.uint64( value ) )
+            
+            within_distance = distances <= max_hamming_distance
+            
+            positions = positions[ within_distance ]
+            distances = distances[ within_distance ]
+            
+        
+        results = list( zip( self._perceptual_hash_ids[ positions ].tolist(), distances.tolist() ) )
+        
+        for ( perceptual_hash_id, pending_value ) in self._pending_perceptual_hash_ids_to_values.items():
+            
+            distance = bin( pending_value ^ value ).count( '1' )
+            
+            if distance <= max_hamming_distance:
+                
+                results.append( ( perceptual_hash_id, distance ) )
+                
+            
+        
+        return results
+        
+    
+
 class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
     
     def __init__( self, cursor: sqlite3.Cursor, modules_services: ClientDBServices.ClientDBMasterServices, modules_files_storage: ClientDBFilesStorage.ClientDBFilesStorage ):
@@ -27,6 +283,8 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         self._non_vp_treed_perceptual_hash_ids = set()
         self._root_node_perceptual_hash_id = None
         
+        self._perceptual_hash_index = None
+        
     
     def _AddLeaf( self, perceptual_hash_id, perceptual_hash ):
         
@@ -249,6 +507,23 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         }
         
     
+    def _GetPerceptualHashIndex( self ) -> typing.Optional[ PerceptualHashIndex ]:
+        
+        if not HG.client_controller.new_options.GetBoolean( 'similar_files_use_in_memory_index' ):
+            
+            self._perceptual_hash_index = None
+            
+            return None
+            
+        
+        if self._perceptual_hash_index is None:
+            
+            self._perceptual_hash_index = PerceptualHashIndex( self._Execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ) )
+            
+        
+        return self._perceptual_hash_index
+        
+    
     def _GetPerceptualHashes( self, perceptual_hash_ids: typing.Collection[ int ] ) -> typing.Set[ bytes ]:
         
         with self._MakeTemporaryIntegerTable( perceptual_hash_ids, 'phash_id' ) as temp_table_name:
@@ -276,6 +551,11 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             self._AddLeaf( perceptual_hash_id, perceptual_hash )
             
+            if self._perceptual_hash_index is not None:
+                
+                self._perceptual_hash_index.Add( perceptual_hash_id, perceptual_hash )
+                
+            
         else:
             
             ( perceptual_hash_id, ) = result
@@ -443,6 +723,11 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         
         self._ExecuteMany( 'DELETE FROM shape_perceptual_hashes WHERE phash_id = ?;', ( ( p_id, ) for p_id in orphan_perceptual_hash_ids ) )
         
+        if self._perceptual_hash_index is not None:
+            
+            self._perceptual_hash_index.Remove( orphan_perceptual_hash_ids )
+            
+        
         useful_nodes = [ row for row in unbalanced_nodes if row[0] in useful_perceptual_hash_ids ]
         
         useful_population = len( useful_nodes )
@@ -511,6 +796,10 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
                 
             
         
+        # every tree or perceptual hash change comes through here
+        
+        self._NotifyCachesChanged()
+        
     
     def _RepairRepopulateTables( self, repopulate_table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
         
@@ -520,6 +809,140 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
         
     
+    def _SearchPerceptualHashesBatch( self, search_perceptual_hashes: typing.Collection[ bytes ], search_radius: int ) -> typing.Dict[ bytes, typing.Dict[ int, int ] ]:
+        
+        perceptual_hash_index = self._GetPerceptualHashIndex()
+        
+        if perceptual_hash_index is None:
+            
+            return self._SearchPerceptualHashesVPTree( search_perceptual_hashes, search_radius )
+            
+        else:
+            
+            return { search_perceptual_hash : dict( perceptual_hash_index.Search( search_perceptual_hash, search_radius ) ) for search_perceptual_hash in search_perceptual_hashes }
+            
+        
+    
+    def _SearchPerceptualHashesVPTree( self, search_perceptual_hashes: typing.Collection[ bytes ], search_radius: int ) -> typing.Dict[ bytes, typing.Dict[ int, int ] ]:
+        
+        search_perceptual_hashes = list( set( search_perceptual_hashes ) )
+        
+        search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances = { search_perceptual_hash : {} for search_perceptual_hash in search_perceptual_hashes }
+        
+        if len( search_perceptual_hashes ) == 0:
+            
+            return search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances
+            
+        
+        if self._root_node_perceptual_hash_id is None:
+            
+            top_node_result = self._Execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
+            
+            if top_node_result is None:
+                
+                return search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances
+                
+            
+            ( self._root_node_perceptual_hash_id, ) = top_node_result
+            
+        
+        num_cycles = 0
+        total_nodes_searched = 0
+        
+        # we walk the tree one level at a time for all the searches together, so each level's nodes are fetched once, however many searches want them
+        
+        next_potentials = [ ( search_perceptual_hash, self._root_node_perceptual_hash_id ) for search_perceptual_hash in search_perceptual_hashes ]
+        
+        while len( next_potentials ) > 0:
+            
+            current_potentials = next_potentials
+            next_potentials = []
+            
+            num_cycles += 1
+            total_nodes_searched += len( current_potentials )
+            
+            # this is no longer an iterable inside the main node SELECT because it was causing crashes on linux!!
+            # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching perceptual_hashes it presumably was still hanging on to
+            # the crash was in sqlite code, again presumably on subsequent fetch
+            # adding a fake delay in seemed to fix it also. guess it was some memory maintenance buffer/bytes thing
+            # anyway, we now just get the whole lot of results first and then work on the whole lot
+            # UPDATE: we moved to a cache finally, so the iteration danger is less worrying, but leaving the above up anyway
+            
+            self._TryToPopulatePerceptualHashToVPTreeNodeCache( { node_perceptual_hash_id for ( search_perceptual_hash, node_perceptual_hash_id ) in current_potentials } )
+            
+            for ( search_perceptual_hash, node_perceptual_hash_id ) in current_potentials:
+                
+                if node_perceptual_hash_id not in self._perceptual_hash_id_to_vp_tree_node_cache:
+                    
+                    # something crazy happened, probably a broken tree branch, move on
+                    continue
+                    
+                
+                ( node_perceptual_hash, node_radius, inner_perceptual_hash_id, outer_perceptual_hash_id ) = self._perceptual_hash_id_to_vp_tree_node_cache[ node_perceptual_hash_id ]
+                
+                # first check the node itself--is it similar?
+                
+                node_hamming_distance = HydrusData.Get64BitHammingDistance( search_perceptual_hash, node_perceptual_hash )
+                
+                if node_hamming_distance <= search_radius:
+                    
+                    similar_perceptual_hash_ids_to_distances = search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances[ search_perceptual_hash ]
+                    
+                    if node_perceptual_hash_id in similar_perceptual_hash_ids_to_distances:
+                        
+                        current_distance = similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ]
+                        
+                        similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ] = min( node_hamming_distance, current_distance )
+                        
+                    else:
+                        
+                        similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ] = node_hamming_distance
+                        
+                    
+                
+                # now how about its children--where should we search next?
+                
+                if node_radius is not None:
+                    
+                    # we have two spheres--node and search--their centers separated by node_hamming_distance
+                    # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
+                    # there are four possibles:
+                    # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
+                    # (----N---(-)-S--)      intersects with both
+                    # (----N-(--S-)-)        intersects with both
+                    # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
+                    
+                    if inner_perceptual_hash_id is not None:
+                        
+                        spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
+                        
+                        if not spheres_disjoint: # i.e. they intersect at some point
+                            
+                            next_potentials.append( ( search_perceptual_hash, inner_perceptual_hash_id ) )
+                            
+                        
+                    
+                    if outer_perceptual_hash_id is not None:
+                        
+                        search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
+                        
+                        if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
+                            
+                            next_potentials.append( ( search_perceptual_hash, outer_perceptual_hash_id ) )
+                            
+                        
+                    
+                
+            
+        
+        if HG.db_report_mode:
+            
+            HydrusData.ShowText( 'Similar file search for {} perceptual hashes touched {} nodes over {} cycles.'.format( HydrusData.ToHumanInt( len( search_perceptual_hashes ) ), HydrusData.ToHumanInt( total_nodes_searched ), HydrusData.ToHumanInt( num_cycles ) ) )
+            
+        
+        return search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances
+        
+    
     def _TryToPopulatePerceptualHashToVPTreeNodeCache( self, perceptual_hash_ids: typing.Collection[ int ] ):
         
         if len( self._perceptual_hash_id_to_vp_tree_node_cache ) > 1000000:
@@ -589,6 +1012,74 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         return perceptual_hash_ids
         
     
+    def BenchmarkSearch( self, num_searches = 100, max_hamming_distances = ( 0, 4, 8, 12 ) ):
+        
+        search_perceptual_hashes = self._STL( self._Execute( 'SELECT phash FROM shape_perceptual_hashes ORDER BY RANDOM() LIMIT ?;', ( num_searches, ) ) )
+        search_hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM shape_search_cache ORDER BY RANDOM() LIMIT ?;', ( num_searches, ) ) )
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        perceptual_hash_index = PerceptualHashIndex( self._Execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ) )
+        
+        index_build_time = HydrusTime.GetNowPrecise() - time_started
+        
+        rows = []
+        
+        for max_hamming_distance in max_hamming_distances:
+            
+            num_tree_results = 0
+            num_index_results = 0
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+            for search_perceptual_hash in search_perceptual_hashes:
+                
+                num_tree_results += len( self._SearchPerceptualHashesVPTree( ( search_perceptual_hash, ), max_hamming_distance )[ search_perceptual_hash ] )
+                
+            
+            tree_time = HydrusTime.GetNowPrecise() - time_started
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+            num_batched_tree_results = sum( ( len( similar_perceptual_hash_ids_to_distances ) for similar_perceptual_hash_ids_to_distances in self._SearchPerceptualHashesVPTree( search_perceptual_hashes, max_hamming_distance ).values() ) )
+            
+            batched_tree_time = HydrusTime.GetNowPrecise() - time_started
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+            for search_perceptual_hash in search_perceptual_hashes:
+                
+                num_index_results += len( perceptual_hash_index.Search( search_perceptual_hash, max_hamming_distance ) )
+                
+            
+            index_time = HydrusTime.GetNowPrecise() - time_started
+            
+            # and the whole file search, as potential duplicate maintenance does it, one file at a time and then in one block
+            # this goes through the in-memory index if the user has it on
+            # the tree node cache is emptied before each so neither gets the other's warm cache
+            
+            self._perceptual_hash_id_to_vp_tree_node_cache = {}
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+            num_file_results = sum( ( len( self.SearchFile( hash_id, max_hamming_distance ) ) for hash_id in search_hash_ids ) )
+            
+            file_time = HydrusTime.GetNowPrecise() - time_started
+            
+            self._perceptual_hash_id_to_vp_tree_node_cache = {}
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+            num_batched_file_results = sum( ( len( similar_hash_ids_and_distances ) for similar_hash_ids_and_distances in self.SearchFiles( search_hash_ids, max_hamming_distance ).values() ) )
+            
+            batched_file_time = HydrusTime.GetNowPrecise() - time_started
+            
+            rows.append( ( max_hamming_distance, tree_time, num_tree_results, batched_tree_time, num_batched_tree_results, index_time, num_index_results, file_time, num_file_results, batched_file_time, num_batched_file_results ) )
+            
+        
+        return ( len( perceptual_hash_index ), len( search_perceptual_hashes ), index_build_time, rows )
+        
+    
     def ClearPixelHash( self, hash_id: int ):
         
         self._Execute( 'DELETE FROM pixel_hash_map WHERE hash_id = ?;', ( hash_id, ) )
@@ -737,6 +1228,13 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
         return False
         
     
+    def NotifyJobRolledBack( self ):
+        
+        # a failed job may have added or removed perceptual hash rows we then mirrored here. sqlite will hand those rowids out again, so we reload from the db next time
+        
+        self.ResetCaches()
+        
+    
     def RegenerateTree( self ):
         
         job_status = ClientThreading.JobStatus()
@@ -761,6 +1259,8 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             self._non_vp_treed_perceptual_hash_ids = set()
             self._root_node_perceptual_hash_id = None
             
+            self._NotifyCachesChanged()
+            
             all_nodes = self._Execute( 'SELECT phash_id, phash FROM shape_perceptual_hashes;' ).fetchall()
             
             job_status.SetStatusText( HydrusData.ToHumanInt( len( all_nodes ) ) + ' leaves found, now regenerating' )
@@ -780,6 +1280,15 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
         
     
+    def ResetCaches( self ):
+        
+        self._perceptual_hash_id_to_vp_tree_node_cache = {}
+        self._non_vp_treed_perceptual_hash_ids = set()
+        self._root_node_perceptual_hash_id = None
+        
+        self._perceptual_hash_index = None
+        
+    
     def ResetSearch( self, hash_ids ):
         
         self._ExecuteMany( 'UPDATE shape_search_cache SET searched_distance = NULL WHERE hash_id = ?;', ( ( hash_id, ) for hash_id in hash_ids ) )
@@ -787,33 +1296,107 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
     
     def SearchFile( self, hash_id: int, max_hamming_distance: int ) -> typing.List:
         
-        similar_hash_ids_and_distances = [ ( hash_id, 0 ) ]
+        return self.SearchFiles( ( hash_id, ), max_hamming_distance )[ hash_id ]
+        
+    
+    def SearchFiles( self, hash_ids: typing.Collection[ int ], max_hamming_distance: int ) -> typing.Dict[ int, typing.List[ typing.Tuple[ int, int ] ] ]:
         
-        pixel_hash_id = self._GetPixelHashId( hash_id )
+        # one pass for a whole block of files: each lookup is one join over all of them, and the perceptual hash search is shared
         
-        if pixel_hash_id is not None:
+        if len( hash_ids ) == 0:
             
-            similar_hash_ids_and_distances.extend( self.SearchPixelHashes( ( pixel_hash_id, ) ) )
+            return {}
+            
+        
+        with self._MakeTemporaryIntegerTable( hash_ids, 'hash_id' ) as temp_hash_ids_table_name:
+            
+            hash_ids_to_pixel_hash_ids = dict( self._Execute( f'SELECT hash_id, pixel_hash_id FROM {temp_hash_ids_table_name} CROSS JOIN pixel_hash_map USING ( hash_id );' ) )
+            
+            hash_ids_to_perceptual_hash_ids_and_perceptual_hashes = HydrusData.BuildKeyToListDict( ( ( hash_id, ( perceptual_hash_id, perceptual_hash ) ) for ( hash_id, perceptual_hash_id, perceptual_hash ) in self._Execute( f'SELECT hash_id, phash_id, phash FROM {temp_hash_ids_table_name} CROSS JOIN shape_perceptual_hash_map USING ( hash_id ) CROSS JOIN shape_perceptual_hashes USING ( phash_id );' ) ) )
+            
+        
+        pixel_hash_ids_to_hash_ids = {}
+        
+        if len( hash_ids_to_pixel_hash_ids ) > 0:
+            
+            with self._MakeTemporaryIntegerTable( set( hash_ids_to_pixel_hash_ids.values() ), 'pixel_hash_id' ) as temp_pixel_hash_ids_table_name:
+                
+                pixel_hash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._Execute( f'SELECT pixel_hash_id, hash_id FROM {temp_pixel_hash_ids_table_name} CROSS JOIN pixel_hash_map USING ( pixel_hash_id );' ) )
+                
             
         
         if max_hamming_distance == 0:
             
-            exact_match_hash_ids = self._STL( self._Execute( 'SELECT hash_id FROM shape_perceptual_hash_map WHERE phash_id IN ( SELECT phash_id FROM shape_perceptual_hash_map WHERE hash_id = ? );', ( hash_id, ) ) )
+            search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances = {}
             
-            similar_hash_ids_and_distances.extend( [ ( exact_match_hash_id, 0 ) for exact_match_hash_id in exact_match_hash_ids ] )
+            for perceptual_hash_ids_and_perceptual_hashes in hash_ids_to_perceptual_hash_ids_and_perceptual_hashes.values():
+                
+                for ( perceptual_hash_id, perceptual_hash ) in perceptual_hash_ids_and_perceptual_hashes:
+                    
+                    search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances[ perceptual_hash ] = { perceptual_hash_id : 0 }
+                    
+                
             
         else:
             
-            perceptual_hash_ids = self._GetPerceptualHashIdsFromHashId( hash_id )
+            search_perceptual_hashes = { perceptual_hash for perceptual_hash_ids_and_perceptual_hashes in hash_ids_to_perceptual_hash_ids_and_perceptual_hashes.values() for ( perceptual_hash_id, perceptual_hash ) in perceptual_hash_ids_and_perceptual_hashes }
+            
+            search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances = self._SearchPerceptualHashesBatch( search_perceptual_hashes, max_hamming_distance )
             
-            perceptual_hashes = self._GetPerceptualHashes( perceptual_hash_ids )
+        
+        all_similar_perceptual_hash_ids = set()
+        
+        for similar_perceptual_hash_ids_to_distances in search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances.values():
             
-            similar_hash_ids_and_distances.extend( self.SearchPerceptualHashes( perceptual_hashes, max_hamming_distance ) )
+            all_similar_perceptual_hash_ids.update( similar_perceptual_hash_ids_to_distances.keys() )
             
         
-        similar_hash_ids_and_distances = HydrusData.DedupeList( similar_hash_ids_and_distances )
+        similar_perceptual_hash_ids_to_hash_ids = {}
         
-        return similar_hash_ids_and_distances
+        if len( all_similar_perceptual_hash_ids ) > 0:
+            
+            with self._MakeTemporaryIntegerTable( all_similar_perceptual_hash_ids, 'phash_id' ) as temp_perceptual_hash_ids_table_name:
+                
+                # temp perceptual_hashes to hash map
+                similar_perceptual_hash_ids_to_hash_ids = HydrusData.BuildKeyToListDict( self._Execute( f'SELECT phash_id, hash_id FROM {temp_perceptual_hash_ids_table_name} CROSS JOIN shape_perceptual_hash_map USING ( phash_id );' ) )
+                
+            
+        
+        hash_ids_to_similar_hash_ids_and_distances = {}
+        
+        for hash_id in hash_ids:
+            
+            similar_hash_ids_and_distances = [ ( hash_id, 0 ) ]
+            
+            if hash_id in hash_ids_to_pixel_hash_ids:
+                
+                similar_hash_ids_and_distances.extend( ( ( pixel_dupe_hash_id, 0 ) for pixel_dupe_hash_id in pixel_hash_ids_to_hash_ids.get( hash_ids_to_pixel_hash_ids[ hash_id ], [] ) ) )
+                
+            
+            # files can have multiple perceptual_hashes, and perceptual_hashes can refer to multiple files, so let's make sure we are setting the smallest distance we found
+            
+            similar_hash_ids_to_distances = {}
+            
+            for ( perceptual_hash_id, perceptual_hash ) in hash_ids_to_perceptual_hash_ids_and_perceptual_hashes.get( hash_id, [] ):
+                
+                for ( similar_perceptual_hash_id, distance ) in search_perceptual_hashes_to_similar_perceptual_hash_ids_to_distances[ perceptual_hash ].items():
+                    
+                    for similar_hash_id in similar_perceptual_hash_ids_to_hash_ids.get( similar_perceptual_hash_id, [] ):
+                        
+                        if similar_hash_id not in similar_hash_ids_to_distances or distance < similar_hash_ids_to_distances[ similar_hash_id ]:
+                            
+                            similar_hash_ids_to_distances[ similar_hash_id ] = distance
+                            
+                        
+                    
+                
+            
+            similar_hash_ids_and_distances.extend( similar_hash_ids_to_distances.items() )
+            
+            hash_ids_to_similar_hash_ids_and_distances[ hash_id ] = HydrusData.DedupeList( similar_hash_ids_and_distances )
+            
+        
+        return hash_ids_to_similar_hash_ids_and_distances
         
     
     def SearchPixelHashes( self, search_pixel_hash_ids: typing.Collection[ int ] ):
@@ -869,113 +1452,19 @@ class ClientDBSimilarFiles( ClientDBModule.ClientDBModule ):
             
             search_radius = max_hamming_distance
             
-            if self._root_node_perceptual_hash_id is None:
-                
-                top_node_result = self._Execute( 'SELECT phash_id FROM shape_vptree WHERE parent_id IS NULL;' ).fetchone()
-                
-                if top_node_result is None:
-                    
-                    return similar_hash_ids_and_distances
-                    
-                
-                ( self._root_node_perceptual_hash_id, ) = top_node_result
-                
-            
             similar_perceptual_hash_ids_to_distances = {}
             
-            num_cycles = 0
-            total_nodes_searched = 0
-            
-            for search_perceptual_hash in search_perceptual_hashes:
+            for search_similar_perceptual_hash_ids_to_distances in self._SearchPerceptualHashesBatch( search_perceptual_hashes, search_radius ).values():
                 
-                next_potentials = [ self._root_node_perceptual_hash_id ]
-                
-                while len( next_potentials ) > 0:
-                    
-                    current_potentials = next_potentials
-                    next_potentials = []
-                    
-                    num_cycles += 1
-                    total_nodes_searched += len( current_potentials )
+                for ( perceptual_hash_id, distance ) in search_similar_perceptual_hash_ids_to_distances.items():
                     
-                    # this is no longer an iterable inside the main node SELECT because it was causing crashes on linux!!
-                    # after investigation, it seemed to be SQLite having a problem with part of Get64BitHammingDistance touching perceptual_hashes it presumably was still hanging on to
-                    # the crash was in sqlite code, again presumably on subsequent fetch
-                    # adding a fake delay in seemed to fix it also. guess it was some memory maintenance buffer/bytes thing
-                    # anyway, we now just get the whole lot of results first and then work on the whole lot
-                    # UPDATE: we moved to a cache finally, so the iteration danger is less worrying, but leaving the above up anyway
-                    
-                    self._TryToPopulatePerceptualHashToVPTreeNodeCache( current_potentials )
-                    
-                    for node_perceptual_hash_id in current_potentials:
-                        
-                        if node_perceptual_hash_id not in self._perceptual_hash_id_to_vp_tree_node_cache:
-                            
-                            # something crazy happened, probably a broken tree branch, move on
-                            continue
-                            
-                        
-                        ( node_perceptual_hash, node_radius, inner_perceptual_hash_id, outer_perceptual_hash_id ) = self._perceptual_hash_id_to_vp_tree_node_cache[ node_perceptual_hash_id ]
-                        
-                        # first check the node itself--is it similar?
-                        
-                        node_hamming_distance = HydrusData.Get64BitHammingDistance( search_perceptual_hash, node_perceptual_hash )
+                    if perceptual_hash_id not in similar_perceptual_hash_ids_to_distances or distance < similar_perceptual_hash_ids_to_distances[ perceptual_hash_id ]:
                         
-                        if node_hamming_distance <= search_radius:
-                            
-                            if node_perceptual_hash_id in similar_perceptual_hash_ids_to_distances:
-                                
-                                current_distance = similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ]
-                                
-                                similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ] = min( node_hamming_distance, current_distance )
-                                
-                            else:
-                                
-                                similar_perceptual_hash_ids_to_distances[ node_perceptual_hash_id ] = node_hamming_distance
-                                
-                            
-                        
-                        # now how about its children--where should we search next?
-                        
-                        if node_radius is not None:
-                            
-                            # we have two spheres--node and search--their centers separated by node_hamming_distance
-                            # we want to search inside/outside the node_sphere if the search_sphere intersects with those spaces
-                            # there are four possibles:
-                            # (----N----)-(--S--)    intersects with outer only - distance between N and S > their radii
-                            # (----N---(-)-S--)      intersects with both
-                            # (----N-(--S-)-)        intersects with both
-                            # (---(-N-S--)-)         intersects with inner only - distance between N and S + radius_S does not exceed radius_N
-                            
-                            if inner_perceptual_hash_id is not None:
-                                
-                                spheres_disjoint = node_hamming_distance > ( node_radius + search_radius )
-                                
-                                if not spheres_disjoint: # i.e. they intersect at some point
-                                    
-                                    next_potentials.append( inner_perceptual_hash_id )
-                                    
-                                
-                            
-                            if outer_perceptual_hash_id is not None:
-                                
-                                search_sphere_subset_of_node_sphere = ( node_hamming_distance + search_radius ) <= node_radius
-                                
-                                if not search_sphere_subset_of_node_sphere: # i.e. search sphere intersects with non-node sphere space at some point
-                                    
-                                    next_potentials.append( outer_perceptual_hash_id )
-                                    
-                                
-                            
+                        similar_perceptual_hash_ids_to_distances[ perceptual_hash_id ] = distance
                         
                     
                 
             
-            if HG.db_report_mode:
-                
-                HydrusData.ShowText( 'Similar file search touched {} nodes over {} cycles.'.format( HydrusData.ToHumanInt( total_nodes_searched ), HydrusData.ToHumanInt( num_cycles ) ) )
-                
-            
             # so, now we have perceptual_hash_ids and distances. let's map that to actual files.
             # files can have multiple perceptual_hashes, and perceptual_hashes can refer to multiple files, so let's make sure we are setting the smallest distance we found
             
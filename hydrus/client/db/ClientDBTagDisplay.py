@@ -21,6 +21,9 @@ from hydrus.client.db import ClientDBTagSiblings
 from hydrus.client.metadata import ClientTags
 from hydrus.client.search import ClientSearch
 
+# how far back we look at sync work when sizing batches and estimating time left
+SYNC_WORK_HISTORY_PERIOD = 600
+
 class ClientDBTagDisplay( ClientDBModule.ClientDBModule ):
     
     def __init__(
@@ -41,9 +44,23 @@ class ClientDBTagDisplay( ClientDBModule.ClientDBModule ):
         self.modules_tag_parents = modules_tag_parents
         self.modules_tag_siblings = modules_tag_siblings
         
+        self._service_ids_to_sync_work_history = collections.defaultdict( collections.deque )
+        
         ClientDBModule.ClientDBModule.__init__( self, 'client tag display', cursor )
         
     
+    def _GetSyncWorkHistory( self, service_id ):
+        
+        sync_work_history = self._service_ids_to_sync_work_history[ service_id ]
+        
+        while len( sync_work_history ) > 0 and HydrusTime.TimeHasPassedFloat( sync_work_history[0][0] + SYNC_WORK_HISTORY_PERIOD ):
+            
+            sync_work_history.popleft()
+            
+        
+        return sync_work_history
+        
+    
     def FilterChained( self, display_type, tag_service_id, tag_ids ) -> typing.Set[ int ]:
         
         # we are not passing ideal_tag_ids here, but that's ok, we are testing sibling chains in one second
@@ -448,6 +465,51 @@ class ClientDBTagDisplay( ClientDBModule.ClientDBModule ):
         return tags_to_service_keys_to_siblings_and_parents
         
     
+    def GetSyncRowsPerWorkSecond( self, service_id ) -> typing.Optional[ float ]:
+        
+        sync_work_history = self._GetSyncWorkHistory( service_id )
+        
+        total_num_rows = sum( ( num_rows for ( time_finished, num_rows, time_took ) in sync_work_history ) )
+        total_time_took = sum( ( time_took for ( time_finished, num_rows, time_took ) in sync_work_history ) )
+        
+        if total_num_rows == 0 or total_time_took <= 0:
+            
+            return None
+            
+        
+        return total_num_rows / total_time_took
+        
+    
+    def GetSyncTimeEstimate( self, service_id, num_rows_to_sync ) -> typing.Optional[ float ]:
+        
+        # this is against the clock, not just work time, so it includes the breaks the maintenance manager takes between jobs
+        
+        if num_rows_to_sync == 0:
+            
+            return 0.0
+            
+        
+        sync_work_history = self._GetSyncWorkHistory( service_id )
+        
+        if len( sync_work_history ) == 0:
+            
+            return None
+            
+        
+        total_num_rows = sum( ( num_rows for ( time_finished, num_rows, time_took ) in sync_work_history ) )
+        
+        ( first_time_finished, first_num_rows, first_time_took ) = sync_work_history[0]
+        
+        time_spent = HydrusTime.GetNowFloat() - ( first_time_finished - first_time_took )
+        
+        if total_num_rows == 0 or time_spent <= 0:
+            
+            return None
+            
+        
+        return num_rows_to_sync * time_spent / total_num_rows
+        
+    
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> typing.List[ typing.Tuple[ str, str ] ]:
         
         return []
@@ -632,6 +694,13 @@ class ClientDBTagDisplay( ClientDBModule.ClientDBModule ):
         self.modules_tag_parents.RegenChains( interested_tag_service_ids, tag_ids_that_changed )
         
     
+    def NotifySyncWorkDone( self, service_id, num_rows, time_took ):
+        
+        self._service_ids_to_sync_work_history[ service_id ].append( ( HydrusTime.GetNowFloat(), num_rows, time_took ) )
+        
+        self._GetSyncWorkHistory( service_id )
+        
+    
     def RegenerateTagSiblingsAndParentsCache( self, only_these_service_ids = None ):
         
         if only_these_service_ids is None:
@@ -132,6 +132,8 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
                 self._service_ids_to_applicable_service_ids = None
                 self._service_ids_to_interested_service_ids = None
                 
+                self._NotifyCachesChanged()
+                
                 self.Regen( ( service_id, ) )
                 
                 cursor_transaction_wrapper.CommitAndBegin()
@@ -157,6 +159,8 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
             
             del self._service_ids_to_display_application_status[ service_id ]
             
+            self._NotifyCachesChanged()
+            
         
     
     def DeleteTagParents( self, service_id, pairs ):
@@ -182,6 +186,8 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
         self._service_ids_to_applicable_service_ids = None
         self._service_ids_to_interested_service_ids = None
         
+        self._NotifyCachesChanged()
+        
     
     def FilterChained( self, display_type, tag_service_id, ideal_tag_ids ):
         
@@ -240,6 +246,8 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
         self._service_ids_to_applicable_service_ids = None
         self._service_ids_to_interested_service_ids = None
         
+        self._NotifyCachesChanged()
+        
         self.Regen( ( tag_service_id, ) )
         
     
@@ -675,6 +683,8 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
             
             self._service_ids_to_display_application_status[ tag_service_id ] = ( parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows )
             
+            self._NotifyCachesChanged()
+            
         
     
     def NotifyParentDeleteRowSynced( self, tag_service_id, row ):
@@ -689,6 +699,8 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
             
             self._service_ids_to_display_application_status[ tag_service_id ] = ( parent_rows_to_add, parent_rows_to_remove, num_actual_rows, num_ideal_rows )
             
+            self._NotifyCachesChanged()
+            
         
     
     def PendTagParents( self, service_id, triples ):
@@ -761,6 +773,8 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
                 
                 del self._service_ids_to_display_application_status[ tag_service_id ]
                 
+                self._NotifyCachesChanged()
+                
             
         
     
@@ -832,9 +846,19 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
                 
                 del self._service_ids_to_display_application_status[ tag_service_id ]
                 
+                self._NotifyCachesChanged()
+                
             
         
     
+    def ResetCaches( self ):
+        
+        self._service_ids_to_display_application_status = {}
+        
+        self._service_ids_to_applicable_service_ids = None
+        self._service_ids_to_interested_service_ids = None
+        
+    
     def SetApplication( self, service_keys_to_applicable_service_keys ):
         
         if self._service_ids_to_applicable_service_ids is None:
@@ -885,6 +909,8 @@ class ClientDBTagParents( ClientDBModule.ClientDBModule ):
         self._service_ids_to_applicable_service_ids = None
         self._service_ids_to_interested_service_ids = None
         
+        self._NotifyCachesChanged()
+        
         return service_ids_to_sync
         
     
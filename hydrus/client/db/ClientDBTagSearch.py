@@ -1,4 +1,5 @@
 import collections
+import itertools
 import sqlite3
 import time
 import typing
@@ -28,6 +29,14 @@ from hydrus.client.search import ClientSearch
 MIN_CACHED_INTEGER = - ( 2 ** 63 )
 MAX_CACHED_INTEGER = ( 2 ** 63 ) - 1
 
+# how many subtags we copy into a wildcard cache in one go when populating it in the background
+WILDCARD_CACHE_POPULATION_BLOCK_SIZE = 1000
+
+# the fts5 trigram tokenizer can only use its index for a LIKE that has a run of at least this many literal characters
+MIN_TRIGRAM_LITERAL_LENGTH = 3
+
+sqlite_supports_trigram_index = None
+
 def CanCacheInteger( num ):
     
     return MIN_CACHED_INTEGER <= num <= MAX_CACHED_INTEGER
@@ -58,6 +67,15 @@ def GenerateCombinedFilesSubtagsFTS4TableName( tag_service_id ):
     return subtags_fts4_table_name
     
 
+def GenerateCombinedFilesSubtagsReversedFTS4TableName( tag_service_id ):
+    
+    name = 'combined_files_subtags_reversed_fts4_cache'
+    
+    subtags_reversed_fts4_table_name = 'external_caches.{}_{}'.format( name, tag_service_id )
+    
+    return subtags_reversed_fts4_table_name
+    
+
 def GenerateCombinedFilesSubtagsSearchableMapTableName( tag_service_id ):
     
     name = 'combined_files_subtags_searchable_map_cache'
@@ -67,6 +85,15 @@ def GenerateCombinedFilesSubtagsSearchableMapTableName( tag_service_id ):
     return subtags_searchable_map_table_name
     
 
+def GenerateCombinedFilesSubtagsTrigramTableName( tag_service_id ):
+    
+    name = 'combined_files_subtags_trigram_cache'
+    
+    subtags_trigram_table_name = 'external_caches.{}_{}'.format( name, tag_service_id )
+    
+    return subtags_trigram_table_name
+    
+
 def GenerateCombinedFilesTagsTableName( tag_service_id ):
     
     name = 'combined_files_tags_cache'
@@ -107,6 +134,17 @@ def GenerateSpecificSubtagsFTS4TableName( file_service_id, tag_service_id ):
     return subtags_fts4_table_name
     
 
+def GenerateSpecificSubtagsReversedFTS4TableName( file_service_id, tag_service_id ):
+    
+    name = 'specific_subtags_reversed_fts4_cache'
+    
+    suffix = '{}_{}'.format( file_service_id, tag_service_id )
+    
+    subtags_reversed_fts4_table_name = 'external_caches.{}_{}'.format( name, suffix )
+    
+    return subtags_reversed_fts4_table_name
+    
+
 def GenerateSpecificSubtagsSearchableMapTableName( file_service_id, tag_service_id ):
     
     name = 'specific_subtags_searchable_map_cache'
@@ -118,6 +156,17 @@ def GenerateSpecificSubtagsSearchableMapTableName( file_service_id, tag_service_
     return subtags_searchable_map_table_name
     
 
+def GenerateSpecificSubtagsTrigramTableName( file_service_id, tag_service_id ):
+    
+    name = 'specific_subtags_trigram_cache'
+    
+    suffix = '{}_{}'.format( file_service_id, tag_service_id )
+    
+    subtags_trigram_table_name = 'external_caches.{}_{}'.format( name, suffix )
+    
+    return subtags_trigram_table_name
+    
+
 def GenerateSpecificTagsTableName( file_service_id, tag_service_id ):
     
     name = 'specific_tags_cache'
@@ -149,6 +198,43 @@ def WildcardHasFTS4SearchableCharacters( wildcard: str ):
     return False
     
 
+def GetLongestWildcardLiteralLength( wildcard: str ):
+    
+    return max( ( len( literal ) for literal in wildcard.split( '*' ) ) )
+    
+
+def SQLiteSupportsTrigramIndex():
+    
+    global sqlite_supports_trigram_index
+    
+    if sqlite_supports_trigram_index is None:
+        
+        # the trigram tokenizer arrived in 3.34, and some builds don't have fts5 at all, so we just try it
+        
+        try:
+            
+            db = sqlite3.connect( ':memory:' )
+            
+            try:
+                
+                db.execute( 'CREATE VIRTUAL TABLE trigram_test USING fts5( subtag, tokenize = "trigram" );' )
+                
+            finally:
+                
+                db.close()
+                
+            
+            sqlite_supports_trigram_index = True
+            
+        except sqlite3.Error:
+            
+            sqlite_supports_trigram_index = False
+            
+        
+    
+    return sqlite_supports_trigram_index
+    
+
 class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
     
     CAN_REPOPULATE_ALL_MISSING_DATA = True
@@ -162,10 +248,65 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         self.modules_tag_siblings = modules_tag_siblings
         self.modules_mappings_counts = modules_mappings_counts
         
+        self._trigram_index_ok = SQLiteSupportsTrigramIndex()
+        
         ClientDBModule.ClientDBModule.__init__( self, 'client tag search', cursor )
         
         self._missing_tag_search_service_pairs = set()
         
+        self._service_ids_to_wildcard_cache_status = {}
+        
+        self._InitCaches()
+        
+    
+    def _AddReversedSubtags( self, file_service_id, tag_service_id, subtag_ids_and_searchable_subtags ):
+        
+        subtags_reversed_fts4_table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+        
+        self._ExecuteMany( 'INSERT OR IGNORE INTO {} ( docid, subtag ) VALUES ( ?, ? );'.format( subtags_reversed_fts4_table_name ), ( ( subtag_id, searchable_subtag[::-1] ) for ( subtag_id, searchable_subtag ) in subtag_ids_and_searchable_subtags ) )
+        
+    
+    def _AddTrigramSubtags( self, file_service_id, tag_service_id, subtag_ids_and_searchable_subtags ):
+        
+        subtags_trigram_table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+        
+        # fts5 has no INSERT OR IGNORE
+        self._ExecuteMany( 'INSERT INTO {} ( rowid, subtag ) SELECT ?, ? WHERE NOT EXISTS ( SELECT 1 FROM {} WHERE rowid = ? );'.format( subtags_trigram_table_name, subtags_trigram_table_name ), ( ( subtag_id, searchable_subtag, subtag_id ) for ( subtag_id, searchable_subtag ) in subtag_ids_and_searchable_subtags ) )
+        
+    
+    def _AddWildcardSubtags( self, file_service_id, tag_service_id, subtag_ids_and_searchable_subtags ):
+        
+        self._AddReversedSubtags( file_service_id, tag_service_id, subtag_ids_and_searchable_subtags )
+        
+        if self._TrigramCacheIsWriteable( file_service_id, tag_service_id ):
+            
+            self._AddTrigramSubtags( file_service_id, tag_service_id, subtag_ids_and_searchable_subtags )
+            
+        
+    
+    def _ClearWildcardSubtags( self, file_service_id, tag_service_id ):
+        
+        subtags_reversed_fts4_table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+        
+        self._Execute( 'DELETE FROM {};'.format( subtags_reversed_fts4_table_name ) )
+        
+        if self._trigram_index_ok:
+            
+            subtags_trigram_table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+            
+            # the trigram cache may not exist yet if this db has been running on an sqlite that cannot do it
+            self._CreateTable( 'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5( subtag, tokenize = "trigram" );', subtags_trigram_table_name )
+            
+            self._Execute( 'DELETE FROM {};'.format( subtags_trigram_table_name ) )
+            
+        
+    
+    def _GetInitialTableGenerationDict( self ) -> dict:
+        
+        return {
+            'main.tag_search_wildcard_cache_status' : ( 'CREATE TABLE IF NOT EXISTS {} ( file_service_id INTEGER, tag_service_id INTEGER, reversed_populated_to_subtag_id INTEGER, trigram_populated_to_subtag_id INTEGER, PRIMARY KEY ( file_service_id, tag_service_id ) );', 558 )
+        }
+        
     
     def _GetServiceIndexGenerationDictSingle( self, file_service_id, tag_service_id ) -> dict:
         
@@ -218,13 +359,18 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         subtags_searchable_map_table_name = self.GetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
         integer_subtags_table_name = self.GetIntegerSubtagsTableName( file_service_id, tag_service_id )
         
+        subtags_reversed_fts4_table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+        
         table_dict = {
             tags_table_name : ( 'CREATE TABLE IF NOT EXISTS {} ( tag_id INTEGER PRIMARY KEY, namespace_id INTEGER, subtag_id INTEGER );', 465 ),
             subtags_fts4_table_name : ( 'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts4( subtag );', 465 ),
             subtags_searchable_map_table_name : ( 'CREATE TABLE IF NOT EXISTS {} ( subtag_id INTEGER PRIMARY KEY, searchable_subtag_id INTEGER );', 465 ),
-            integer_subtags_table_name : ( 'CREATE TABLE IF NOT EXISTS {} ( subtag_id INTEGER PRIMARY KEY, integer_subtag INTEGER );', 465 )
+            integer_subtags_table_name : ( 'CREATE TABLE IF NOT EXISTS {} ( subtag_id INTEGER PRIMARY KEY, integer_subtag INTEGER );', 465 ),
+            subtags_reversed_fts4_table_name : ( 'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts4( subtag );', 558 )
         }
         
+        # the trigram cache is not in here, since whether we can have it depends on the sqlite we booted with. it is made and filled as the wildcard cache status says
+        
         return table_dict
         
     
@@ -247,11 +393,180 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         return table_dict
         
     
+    def _GetSubtagIdsFromWildcardQuery( self, file_service_id: int, tag_service_id: int, subtag_wildcard ):
+        
+        subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
+        
+        wildcard_has_fts4_searchable_characters = WildcardHasFTS4SearchableCharacters( subtag_wildcard )
+        
+        if subtag_wildcard == '*':
+            
+            # hellmode, but shouldn't be called normally
+            query = 'SELECT docid FROM {};'.format( subtags_fts4_table_name )
+            query_args = ()
+            
+        elif ClientSearch.IsComplexWildcard( subtag_wildcard ) or not wildcard_has_fts4_searchable_characters:
+            
+            # FTS4 does not support complex wildcards, so instead we'll search our raw subtags
+            # however, since we want to search 'searchable' text, we use the 'searchable subtags map' to cross between real and searchable
+            
+            like_param = ConvertWildcardToSQLiteLikeParameter( subtag_wildcard )
+            
+            if subtag_wildcard.startswith( '*' ) or not wildcard_has_fts4_searchable_characters:
+                
+                # we store every subtag reversed in a second fts4 cache, so '*amus' is a prefix search for 'suma*' there
+                # and if sqlite can do fts5 trigrams, '*amu*' and friends can use that index
+                # the reversed prefix is usually the tighter search, so we prefer it unless it is very short
+                
+                reversed_prefix = subtag_wildcard[::-1].split( '*' )[0]
+                
+                # these caches are filled in the background after an update or an sqlite change, so we only use them once they are complete
+                
+                ( reversed_populated_to_subtag_id, trigram_populated_to_subtag_id ) = self._GetWildcardCacheStatus( file_service_id, tag_service_id )
+                
+                can_use_reversed = reversed_populated_to_subtag_id is None and not subtag_wildcard.endswith( '*' ) and WildcardHasFTS4SearchableCharacters( reversed_prefix )
+                can_use_trigram = self._trigram_index_ok and trigram_populated_to_subtag_id is None and GetLongestWildcardLiteralLength( subtag_wildcard ) >= MIN_TRIGRAM_LITERAL_LENGTH
+                
+                if can_use_reversed and ( len( reversed_prefix ) >= MIN_TRIGRAM_LITERAL_LENGTH or not can_use_trigram ):
+                    
+                    subtags_reversed_fts4_table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+                    
+                    reversed_prefix_fts4_wildcard_param = '"{}*"'.format( reversed_prefix )
+                    reversed_like_param = ConvertWildcardToSQLiteLikeParameter( subtag_wildcard[::-1] )
+                    
+                    query = 'SELECT docid FROM {} WHERE subtag MATCH ? AND subtag LIKE ?;'.format( subtags_reversed_fts4_table_name )
+                    query_args = ( reversed_prefix_fts4_wildcard_param, reversed_like_param )
+                    
+                elif can_use_trigram:
+                    
+                    subtags_trigram_table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+                    
+                    query = 'SELECT rowid FROM {} WHERE subtag LIKE ?;'.format( subtags_trigram_table_name )
+                    query_args = ( like_param, )
+                    
+                else:
+                    
+                    # this is a SCAN, but there we go
+                    
+                    query = 'SELECT docid FROM {} WHERE subtag LIKE ?;'.format( subtags_fts4_table_name )
+                    query_args = ( like_param, )
+                    
+                
+            else:
+                
+                # we have an optimisation here--rather than searching all subtags for bl*ah, let's search all the bl* subtags for bl*ah!
+                
+                prefix_fts4_wildcard = subtag_wildcard.split( '*' )[0]
+                
+                prefix_fts4_wildcard_param = '"{}*"'.format( prefix_fts4_wildcard )
+                
+                query = 'SELECT docid FROM {} WHERE subtag MATCH ? AND subtag LIKE ?;'.format( subtags_fts4_table_name )
+                query_args = ( prefix_fts4_wildcard_param, like_param )
+                
+            
+        else:
+            
+            # we want the " " wrapping our search text to keep whitespace words connected and in order
+            # "samus ar*" should not match "around samus"
+            
+            # simple 'sam*' style subtag, so we can search fts4 no prob
+            
+            subtags_fts4_param = '"{}"'.format( subtag_wildcard )
+            
+            query = 'SELECT docid FROM {} WHERE subtag MATCH ?;'.format( subtags_fts4_table_name )
+            query_args = ( subtags_fts4_param, )
+            
+        
+        return ( query, query_args )
+        
+    
     def _GetServiceIdsWeGenerateDynamicTablesFor( self ):
         
         return self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES )
         
     
+    def _GetWildcardCacheStatus( self, file_service_id, tag_service_id ):
+        
+        # None means populated and in sync, a subtag_id means populated up to and including that subtag_id, and 0 means it needs to be cleared and populated from scratch
+        
+        return self._service_ids_to_wildcard_cache_status.get( ( file_service_id, tag_service_id ), ( 0, 0 ) )
+        
+    
+    def _InitCaches( self ):
+        
+        if self._Execute( 'SELECT 1 FROM sqlite_master WHERE name = ?;', ( 'tag_search_wildcard_cache_status', ) ).fetchone() is not None:
+            
+            self._service_ids_to_wildcard_cache_status = { ( file_service_id, tag_service_id ) : ( reversed_populated_to_subtag_id, trigram_populated_to_subtag_id ) for ( file_service_id, tag_service_id, reversed_populated_to_subtag_id, trigram_populated_to_subtag_id ) in self._Execute( 'SELECT file_service_id, tag_service_id, reversed_populated_to_subtag_id, trigram_populated_to_subtag_id FROM tag_search_wildcard_cache_status;' ) }
+            
+        
+    
+    def _PopulateWildcardCacheChunk( self, file_service_id, tag_service_id, trigram: bool ):
+        
+        ( reversed_populated_to_subtag_id, trigram_populated_to_subtag_id ) = self._GetWildcardCacheStatus( file_service_id, tag_service_id )
+        
+        if trigram:
+            
+            populated_to_subtag_id = trigram_populated_to_subtag_id
+            
+            table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+            
+        else:
+            
+            populated_to_subtag_id = reversed_populated_to_subtag_id
+            
+            table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+            
+        
+        if populated_to_subtag_id is None:
+            
+            return
+            
+        
+        if populated_to_subtag_id == 0:
+            
+            # starting from scratch, so whatever is in there may be stale
+            
+            if trigram:
+                
+                self._CreateTable( 'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5( subtag, tokenize = "trigram" );', table_name )
+                
+            
+            self._Execute( 'DELETE FROM {};'.format( table_name ) )
+            
+        
+        subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
+        
+        # the fts4 table already holds the searchable subtag, and new tags are added to the wildcard caches as they come in, so we just walk the docids
+        subtag_ids_and_searchable_subtags = self._Execute( 'SELECT docid, subtag FROM {} WHERE docid > ? ORDER BY docid LIMIT ?;'.format( subtags_fts4_table_name ), ( populated_to_subtag_id, WILDCARD_CACHE_POPULATION_BLOCK_SIZE ) ).fetchall()
+        
+        if len( subtag_ids_and_searchable_subtags ) == 0:
+            
+            populated_to_subtag_id = None
+            
+        else:
+            
+            if trigram:
+                
+                self._AddTrigramSubtags( file_service_id, tag_service_id, subtag_ids_and_searchable_subtags )
+                
+            else:
+                
+                self._AddReversedSubtags( file_service_id, tag_service_id, subtag_ids_and_searchable_subtags )
+                
+            
+            ( populated_to_subtag_id, searchable_subtag ) = subtag_ids_and_searchable_subtags[-1]
+            
+        
+        if trigram:
+            
+            self._SetWildcardCacheStatus( file_service_id, tag_service_id, reversed_populated_to_subtag_id, populated_to_subtag_id )
+            
+        else:
+            
+            self._SetWildcardCacheStatus( file_service_id, tag_service_id, populated_to_subtag_id, trigram_populated_to_subtag_id )
+            
+        
+    
     def _RepairRepopulateTables( self, table_names, cursor_transaction_wrapper: HydrusDBBase.DBCursorTransactionWrapper ):
         
         file_service_ids = list( self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES ) )
@@ -275,6 +590,36 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
         
     
+    def _SetWildcardCacheStatus( self, file_service_id, tag_service_id, reversed_populated_to_subtag_id, trigram_populated_to_subtag_id ):
+        
+        self._Execute( 'REPLACE INTO tag_search_wildcard_cache_status ( file_service_id, tag_service_id, reversed_populated_to_subtag_id, trigram_populated_to_subtag_id ) VALUES ( ?, ?, ?, ? );', ( file_service_id, tag_service_id, reversed_populated_to_subtag_id, trigram_populated_to_subtag_id ) )
+        
+        self._service_ids_to_wildcard_cache_status[ ( file_service_id, tag_service_id ) ] = ( reversed_populated_to_subtag_id, trigram_populated_to_subtag_id )
+        
+        self._NotifyCachesChanged()
+        
+    
+    def _TrigramCacheIsWriteable( self, file_service_id, tag_service_id ):
+        
+        ( reversed_populated_to_subtag_id, trigram_populated_to_subtag_id ) = self._GetWildcardCacheStatus( file_service_id, tag_service_id )
+        
+        if self._trigram_index_ok:
+            
+            # if it is waiting to be rebuilt from scratch, it may not exist yet and it is going to be cleared anyway
+            return trigram_populated_to_subtag_id != 0
+            
+        else:
+            
+            # we can't keep it in sync with this sqlite, so it'll have to be rebuilt next time we boot with one that can
+            if trigram_populated_to_subtag_id != 0:
+                
+                self._SetWildcardCacheStatus( file_service_id, tag_service_id, reversed_populated_to_subtag_id, 0 )
+                
+            
+            return False
+            
+        
+    
     def AddTags( self, file_service_id, tag_service_id, tag_ids ):
         
         if len( tag_ids ) == 0:
@@ -312,10 +657,14 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                 subtags_searchable_map_table_name = self.GetSubtagsSearchableMapTableName( file_service_id, tag_service_id )
                 integer_subtags_table_name = self.GetIntegerSubtagsTableName( file_service_id, tag_service_id )
                 
+                subtag_ids_and_searchable_subtags = []
+                
                 for ( subtag_id, subtag ) in subtag_ids_and_subtags:
                     
                     searchable_subtag = ClientSearch.ConvertSubtagToSearchable( subtag )
                     
+                    subtag_ids_and_searchable_subtags.append( ( subtag_id, searchable_subtag ) )
+                    
                     if searchable_subtag != subtag:
                         
                         searchable_subtag_id = self.modules_tags.GetSubtagId( searchable_subtag )
@@ -345,9 +694,10 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                         
                     
                 
+                self._AddWildcardSubtags( file_service_id, tag_service_id, subtag_ids_and_searchable_subtags )
+                
             
         
-    
     def DeleteTags( self, file_service_id, tag_service_id, tag_ids ):
         
         if len( tag_ids ) == 0:
@@ -412,6 +762,17 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                 self._ExecuteMany( 'DELETE FROM {} WHERE subtag_id = ?;'.format( subtags_searchable_map_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
                 self._ExecuteMany( 'DELETE FROM {} WHERE subtag_id = ?;'.format( integer_subtags_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
                 
+                subtags_reversed_fts4_table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+                
+                self._ExecuteMany( 'DELETE FROM {} WHERE docid = ?;'.format( subtags_reversed_fts4_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
+                
+                if self._TrigramCacheIsWriteable( file_service_id, tag_service_id ):
+                    
+                    subtags_trigram_table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+                    
+                    self._ExecuteMany( 'DELETE FROM {} WHERE rowid = ?;'.format( subtags_trigram_table_name ), ( ( subtag_id, ) for subtag_id in deletee_subtag_ids ) )
+                    
+                
             
         
     
@@ -433,6 +794,24 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         
         self.modules_db_maintenance.DeferredDropTable( integer_subtags_table_name )
         
+        subtags_reversed_fts4_table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+        
+        self.modules_db_maintenance.DeferredDropTable( subtags_reversed_fts4_table_name )
+        
+        # we drop this even if our sqlite can't do trigrams any more
+        subtags_trigram_table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+        
+        self.modules_db_maintenance.DeferredDropTable( subtags_trigram_table_name )
+        
+        self._Execute( 'DELETE FROM tag_search_wildcard_cache_status WHERE file_service_id = ? AND tag_service_id = ?;', ( file_service_id, tag_service_id ) )
+        
+        if ( file_service_id, tag_service_id ) in self._service_ids_to_wildcard_cache_status:
+            
+            del self._service_ids_to_wildcard_cache_status[ ( file_service_id, tag_service_id ) ]
+            
+            self._NotifyCachesChanged()
+            
+        
     
     def FilterExistingTagIds( self, file_service_id, tag_service_id, tag_ids_table_name ):
         
@@ -457,6 +836,21 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             self._CreateIndex( table_name, columns, unique = unique )
             
         
+        # everything is empty, so the wildcard caches are in sync from the start. if we can't do trigrams, that one waits until we can
+        
+        if self._trigram_index_ok:
+            
+            subtags_trigram_table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+            
+            self._CreateTable( 'CREATE VIRTUAL TABLE IF NOT EXISTS {} USING fts5( subtag, tokenize = "trigram" );', subtags_trigram_table_name )
+            
+            self._SetWildcardCacheStatus( file_service_id, tag_service_id, None, None )
+            
+        else:
+            
+            self._SetWildcardCacheStatus( file_service_id, tag_service_id, None, 0 )
+            
+        
     
     def GetAllTagIds( self, leaf: ClientDBServices.FileSearchContextLeaf, job_status = None ):
         
@@ -841,57 +1235,7 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
             if '*' in subtag_wildcard:
                 
-                subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, search_tag_service_id )
-                
-                wildcard_has_fts4_searchable_characters = WildcardHasFTS4SearchableCharacters( subtag_wildcard )
-                
-                if subtag_wildcard == '*':
-                    
-                    # hellmode, but shouldn't be called normally
-                    query = 'SELECT docid FROM {};'.format( subtags_fts4_table_name )
-                    query_args = ()
-                    
-                elif ClientSearch.IsComplexWildcard( subtag_wildcard ) or not wildcard_has_fts4_searchable_characters:
-                    
-                    # FTS4 does not support complex wildcards, so instead we'll search our raw subtags
-                    # however, since we want to search 'searchable' text, we use the 'searchable subtags map' to cross between real and searchable
-                    
-                    like_param = ConvertWildcardToSQLiteLikeParameter( subtag_wildcard )
-                    
-                    if subtag_wildcard.startswith( '*' ) or not wildcard_has_fts4_searchable_characters:
-                        
-                        # this is a SCAN, but there we go
-                        # a potential optimisation here, in future, is to store fts4 of subtags reversed, then for '*amus', we can just search that reverse cache for 'suma*'
-                        # and this would only double the size of the fts4 cache, the largest cache in the whole db! a steal!
-                        # it also would not fix '*amu*', but with some cleverness could speed up '*amus ar*'
-                        
-                        query = 'SELECT docid FROM {} WHERE subtag LIKE ?;'.format( subtags_fts4_table_name )
-                        query_args = ( like_param, )
-                        
-                    else:
-                        
-                        # we have an optimisation here--rather than searching all subtags for bl*ah, let's search all the bl* subtags for bl*ah!
-                        
-                        prefix_fts4_wildcard = subtag_wildcard.split( '*' )[0]
-                        
-                        prefix_fts4_wildcard_param = '"{}*"'.format( prefix_fts4_wildcard )
-                        
-                        query = 'SELECT docid FROM {} WHERE subtag MATCH ? AND subtag LIKE ?;'.format( subtags_fts4_table_name )
-                        query_args = ( prefix_fts4_wildcard_param, like_param )
-                        
-                    
-                else:
-                    
-                    # we want the " " wrapping our search text to keep whitespace words connected and in order
-                    # "samus ar*" should not match "around samus"
-                    
-                    # simple 'sam*' style subtag, so we can search fts4 no prob
-                    
-                    subtags_fts4_param = '"{}"'.format( subtag_wildcard )
-                    
-                    query = 'SELECT docid FROM {} WHERE subtag MATCH ?;'.format( subtags_fts4_table_name )
-                    query_args = ( subtags_fts4_param, )
-                    
+                ( query, query_args ) = self._GetSubtagIdsFromWildcardQuery( file_service_id, search_tag_service_id, subtag_wildcard )
                 
                 loop_of_subtag_ids = self._STL( self._ExecuteCancellable( query, query_args, cancelled_hook ) )
                 
@@ -956,58 +1300,7 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
             if '*' in subtag_wildcard:
                 
-                subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, search_tag_service_id )
-                
-                wildcard_has_fts4_searchable_characters = WildcardHasFTS4SearchableCharacters( subtag_wildcard )
-                
-                if subtag_wildcard == '*':
-                    
-                    # hellmode, but shouldn't be called normally
-                    query = self._Execute( 'SELECT docid FROM {};'.format( subtags_fts4_table_name ) )
-                    query_args = ()
-                    
-                elif ClientSearch.IsComplexWildcard( subtag_wildcard ) or not wildcard_has_fts4_searchable_characters:
-                    
-                    # FTS4 does not support complex wildcards, so instead we'll search our raw subtags
-                    # however, since we want to search 'searchable' text, we use the 'searchable subtags map' to cross between real and searchable
-                    
-                    like_param = ConvertWildcardToSQLiteLikeParameter( subtag_wildcard )
-                    
-                    if subtag_wildcard.startswith( '*' ) or not wildcard_has_fts4_searchable_characters:
-                        
-                        # this is a SCAN, but there we go
-                        # a potential optimisation here, in future, is to store fts4 of subtags reversed, then for '*amus', we can just search that reverse cache for 'suma*'
-                        # and this would only double the size of the fts4 cache, the largest cache in the whole db! a steal!
-                        # it also would not fix '*amu*', but with some cleverness could speed up '*amus ar*'
-                        
-                        query = 'SELECT docid FROM {} WHERE subtag LIKE ?;'.format( subtags_fts4_table_name )
-                        query_args = ( like_param, )
-                        
-                    else:
-                        
-                        # we have an optimisation here--rather than searching all subtags for bl*ah, let's search all the bl* subtags for bl*ah!
-                        
-                        prefix_fts4_wildcard = subtag_wildcard.split( '*' )[0]
-                        
-                        prefix_fts4_wildcard_param = '"{}*"'.format( prefix_fts4_wildcard )
-                        
-                        query = 'SELECT docid FROM {} WHERE subtag MATCH ? AND subtag LIKE ?;'.format( subtags_fts4_table_name )
-                        
-                        query_args = ( prefix_fts4_wildcard_param, like_param )
-                        
-                    
-                else:
-                    
-                    # we want the " " wrapping our search text to keep whitespace words connected and in order
-                    # "samus ar*" should not match "around samus"
-                    
-                    # simple 'sam*' style subtag, so we can search fts4 no prob
-                    
-                    subtags_fts4_param = '"{}"'.format( subtag_wildcard )
-                    
-                    query = 'SELECT docid FROM {} WHERE subtag MATCH ?;'.format( subtags_fts4_table_name )
-                    query_args = ( subtags_fts4_param, )
-                    
+                ( query, query_args ) = self._GetSubtagIdsFromWildcardQuery( file_service_id, search_tag_service_id, subtag_wildcard )
                 
                 loop_of_subtag_id_tuples = self._ExecuteCancellable( query, query_args, cancelled_hook )
                 
@@ -1065,6 +1358,25 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         return subtags_fts4_table_name
         
     
+    def GetSubtagsReversedFTS4TableName( self, file_service_id, tag_service_id ):
+        
+        if file_service_id == self.modules_services.combined_file_service_id:
+            
+            subtags_reversed_fts4_table_name = GenerateCombinedFilesSubtagsReversedFTS4TableName( tag_service_id )
+            
+        else:
+            
+            if self.modules_services.FileServiceIsCoveredByAllLocalFiles( file_service_id ):
+                
+                file_service_id = self.modules_services.combined_local_file_service_id
+                
+            
+            subtags_reversed_fts4_table_name = GenerateSpecificSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+            
+        
+        return subtags_reversed_fts4_table_name
+        
+    
     def GetSubtagsSearchableMapTableName( self, file_service_id, tag_service_id ):
         
         if file_service_id == self.modules_services.combined_file_service_id:
@@ -1084,6 +1396,25 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         return subtags_searchable_map_table_name
         
     
+    def GetSubtagsTrigramTableName( self, file_service_id, tag_service_id ):
+        
+        if file_service_id == self.modules_services.combined_file_service_id:
+            
+            subtags_trigram_table_name = GenerateCombinedFilesSubtagsTrigramTableName( tag_service_id )
+            
+        else:
+            
+            if self.modules_services.FileServiceIsCoveredByAllLocalFiles( file_service_id ):
+                
+                file_service_id = self.modules_services.combined_local_file_service_id
+                
+            
+            subtags_trigram_table_name = GenerateSpecificSubtagsTrigramTableName( file_service_id, tag_service_id )
+            
+        
+        return subtags_trigram_table_name
+        
+    
     def GetTablesAndColumnsThatUseDefinitions( self, content_type: int ) -> typing.List[ typing.Tuple[ str, str ] ]:
         
         tables_and_columns = []
@@ -1104,8 +1435,18 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                     tags_table_name = self.GetTagsTableName( file_service_id, tag_service_id )
                     subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
                     
+                    subtags_reversed_fts4_table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+                    
                     tables_and_columns.append( ( tags_table_name, 'tag_id' ) )
                     tables_and_columns.append( ( subtags_fts4_table_name, 'docid' ) )
+                    tables_and_columns.append( ( subtags_reversed_fts4_table_name, 'docid' ) )
+                    
+                    subtags_trigram_table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+                    
+                    if self._trigram_index_ok and self._TableExists( subtags_trigram_table_name ):
+                        
+                        tables_and_columns.append( ( subtags_trigram_table_name, 'rowid' ) )
+                        
                     
                 
             
@@ -1322,6 +1663,41 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         return result is not None
         
     
+    def MaintainWildcardCaches( self, time_to_stop: float ) -> bool:
+        
+        file_service_ids = list( self.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_TAG_LOOKUP_CACHES ) )
+        file_service_ids.append( self.modules_services.combined_file_service_id )
+        
+        tag_service_ids = list( self.modules_services.GetServiceIds( HC.REAL_TAG_SERVICES ) )
+        
+        still_work_to_do = True
+        
+        for ( file_service_id, tag_service_id ) in itertools.product( file_service_ids, tag_service_ids ):
+            
+            for trigram in ( False, True ):
+                
+                if trigram and not self._trigram_index_ok:
+                    
+                    continue
+                    
+                
+                while self._GetWildcardCacheStatus( file_service_id, tag_service_id )[ 1 if trigram else 0 ] is not None:
+                    
+                    if HydrusTime.TimeHasPassedFloat( time_to_stop ):
+                        
+                        return still_work_to_do
+                        
+                    
+                    self._PopulateWildcardCacheChunk( file_service_id, tag_service_id, trigram )
+                    
+                
+            
+        
+        still_work_to_do = False
+        
+        return still_work_to_do
+        
+    
     def RegenerateSearchableSubtagMap( self, file_service_id, tag_service_id, status_hook = None ):
         
         subtags_fts4_table_name = self.GetSubtagsFTS4TableName( file_service_id, tag_service_id )
@@ -1329,12 +1705,19 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         
         self._Execute( 'DELETE FROM {};'.format( subtags_searchable_map_table_name ) )
         
+        self._ClearWildcardSubtags( file_service_id, tag_service_id )
+        
+        # we fill them completely right here, so they count as populated
+        self._SetWildcardCacheStatus( file_service_id, tag_service_id, None, None if self._trigram_index_ok else 0 )
+        
         query = 'SELECT docid FROM {};'.format( subtags_fts4_table_name )
         
         BLOCK_SIZE = 10000
         
         for ( group_of_subtag_ids, num_done, num_to_do ) in HydrusDB.ReadLargeIdQueryInSeparateChunks( self._c, query, BLOCK_SIZE ):
             
+            subtag_ids_and_searchable_subtags = []
+            
             for subtag_id in group_of_subtag_ids:
                 
                 result = self._Execute( 'SELECT subtag FROM subtags WHERE subtag_id = ?;', ( subtag_id, ) ).fetchone()
@@ -1348,6 +1731,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                 
                 searchable_subtag = ClientSearch.ConvertSubtagToSearchable( subtag )
                 
+                subtag_ids_and_searchable_subtags.append( ( subtag_id, searchable_subtag ) )
+                
                 if searchable_subtag != subtag:
                     
                     searchable_subtag_id = self.modules_tags.GetSubtagId( searchable_subtag )
@@ -1356,6 +1741,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                     
                 
             
+            self._AddWildcardSubtags( file_service_id, tag_service_id, subtag_ids_and_searchable_subtags )
+            
             message = HydrusData.ConvertValueRangeToPrettyString( num_done, num_to_do )
             
             HG.client_controller.frame_splash_status.SetSubtext( message )
@@ -1376,6 +1763,19 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
         
         missing_subtag_ids = self._STS( self._Execute( 'SELECT subtag_id FROM {} EXCEPT SELECT docid FROM {};'.format( tags_table_name, subtags_fts4_table_name ) ) )
         
+        subtags_reversed_fts4_table_name = self.GetSubtagsReversedFTS4TableName( file_service_id, tag_service_id )
+        
+        missing_subtag_ids.update( self._STI( self._Execute( 'SELECT subtag_id FROM {} EXCEPT SELECT docid FROM {};'.format( tags_table_name, subtags_reversed_fts4_table_name ) ) ) )
+        
+        if self._trigram_index_ok and self._TrigramCacheIsWriteable( file_service_id, tag_service_id ):
+            
+            subtags_trigram_table_name = self.GetSubtagsTrigramTableName( file_service_id, tag_service_id )
+            
+            missing_subtag_ids.update( self._STI( self._Execute( 'SELECT subtag_id FROM {} EXCEPT SELECT rowid FROM {};'.format( tags_table_name, subtags_trigram_table_name ) ) ) )
+            
+        
+        subtag_ids_and_searchable_subtags = []
+        
         for subtag_id in missing_subtag_ids:
             
             result = self._Execute( 'SELECT subtag FROM subtags WHERE subtag_id = ?;', ( subtag_id, ) ).fetchone()
@@ -1389,6 +1789,8 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
             
             searchable_subtag = ClientSearch.ConvertSubtagToSearchable( subtag )
             
+            subtag_ids_and_searchable_subtags.append( ( subtag_id, searchable_subtag ) )
+            
             if searchable_subtag != subtag:
                 
                 searchable_subtag_id = self.modules_tags.GetSubtagId( searchable_subtag )
@@ -1418,9 +1820,24 @@ class ClientDBTagSearch( ClientDBModule.ClientDBModule ):
                 
             
         
+        self._AddWildcardSubtags( file_service_id, tag_service_id, subtag_ids_and_searchable_subtags )
+        
         if len( missing_subtag_ids ) > 0:
             
             HydrusData.ShowText( 'Repopulated {} missing subtags for {}_{}.'.format( HydrusData.ToHumanInt( len( missing_subtag_ids ) ), file_service_id, tag_service_id ) )
             
         
     
+    def ResetCaches( self ):
+        
+        self._service_ids_to_wildcard_cache_status = {}
+        
+        self._InitCaches()
+        
+    
+    def ResetWildcardCaches( self, file_service_id, tag_service_id ):
+        
+        # the background maintenance will clear and refill them, and searches will not use them until it is done
+        self._SetWildcardCacheStatus( file_service_id, tag_service_id, 0, 0 )
+        
+    
@@ -148,6 +148,8 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
                 self._service_ids_to_applicable_service_ids = None
                 self._service_ids_to_interested_service_ids = None
                 
+                self._NotifyCachesChanged()
+                
                 self.Regen( ( service_id, ) )
                 
                 cursor_transaction_wrapper.CommitAndBegin()
@@ -173,6 +175,8 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
             
             del self._service_ids_to_display_application_status[ service_id ]
             
+            self._NotifyCachesChanged()
+            
         
     
     def DeleteTagSiblings( self, service_id, pairs ):
@@ -198,6 +202,8 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
         self._service_ids_to_applicable_service_ids = None
         self._service_ids_to_interested_service_ids = None
         
+        self._NotifyCachesChanged()
+        
     
     def FilterChained( self, display_type, tag_service_id, tag_ids ):
         
@@ -282,6 +288,8 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
         self._service_ids_to_applicable_service_ids = None
         self._service_ids_to_interested_service_ids = None
         
+        self._NotifyCachesChanged()
+        
         self.Regen( ( tag_service_id, ) )
         
     
@@ -826,6 +834,8 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
             
             self._service_ids_to_display_application_status[ tag_service_id ] = ( sibling_rows_to_add, sibling_rows_to_remove, num_actual_rows, num_ideal_rows )
             
+            self._NotifyCachesChanged()
+            
         
     
     def NotifySiblingDeleteRowSynced( self, tag_service_id, row ):
@@ -840,6 +850,8 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
             
             self._service_ids_to_display_application_status[ tag_service_id ] = ( sibling_rows_to_add, sibling_rows_to_remove, num_actual_rows, num_ideal_rows )
             
+            self._NotifyCachesChanged()
+            
         
     
     def PendTagSiblings( self, service_id, triples ):
@@ -906,6 +918,8 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
                 
                 del self._service_ids_to_display_application_status[ tag_service_id ]
                 
+                self._NotifyCachesChanged()
+                
             
         
     
@@ -964,9 +978,19 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
                 
                 del self._service_ids_to_display_application_status[ tag_service_id ]
                 
+                self._NotifyCachesChanged()
+                
             
         
     
+    def ResetCaches( self ):
+        
+        self._service_ids_to_display_application_status = {}
+        
+        self._service_ids_to_applicable_service_ids = None
+        self._service_ids_to_interested_service_ids = None
+        
+    
     def SetApplication( self, service_keys_to_applicable_service_keys ):
         
         if self._service_ids_to_applicable_service_ids is None:
@@ -1017,6 +1041,8 @@ class ClientDBTagSiblings( ClientDBModule.ClientDBModule ):
         self._service_ids_to_applicable_service_ids = None
         self._service_ids_to_interested_service_ids = None
         
+        self._NotifyCachesChanged()
+        
         return service_ids_to_sync
         
     
@@ -1,3 +1,4 @@
+import collections
 import re
 import sqlite3
 import typing
@@ -57,6 +58,26 @@ class ClientDBURLMap( ClientDBModule.ClientDBModule ):
         return hash_ids
         
     
+    def GetURLsToHashIds( self, search_urls: typing.Collection[ str ] ) -> typing.Dict[ str, typing.Set[ int ] ]:
+        
+        urls_to_url_ids = self.modules_urls.GetURLsToURLIds( search_urls )
+        
+        url_ids_to_hash_ids = collections.defaultdict( set )
+        
+        if len( urls_to_url_ids ) > 0:
+            
+            with self._MakeTemporaryIntegerTable( urls_to_url_ids.values(), 'url_id' ) as temp_url_ids_table_name:
+                
+                for ( url_id, hash_id ) in self._Execute( 'SELECT url_id, hash_id FROM {} CROSS JOIN url_map USING ( url_id );'.format( temp_url_ids_table_name ) ):
+                    
+                    url_ids_to_hash_ids[ url_id ].add( hash_id )
+                    
+                
+            
+        
+        return { search_url : set( url_ids_to_hash_ids[ urls_to_url_ids[ search_url ] ] ) if search_url in urls_to_url_ids else set() for search_url in search_urls }
+        
+    
     def GetHashIdsFromURLRule( self, rule_type, rule, hash_ids = None, hash_ids_table_name = None ):
         
         if rule_type == 'exact_match':
@@ -47,6 +47,7 @@ from hydrus.client import ClientPDFHandling
 from hydrus.client import ClientServices
 from hydrus.client import ClientThreading
 from hydrus.client import ClientTime
+from hydrus.client.caches import ClientCachesBase
 from hydrus.client.exporting import ClientExportingFiles
 from hydrus.client.gui import ClientGUIAsync
 from hydrus.client.gui import ClientGUICharts
@@ -93,6 +94,7 @@ from hydrus.client.gui.parsing import ClientGUIParsingLegacy
 from hydrus.client.gui.services import ClientGUIClientsideServices
 from hydrus.client.gui.services import ClientGUIServersideServices
 from hydrus.client.gui.widgets import ClientGUICommon
+from hydrus.client.media import ClientMediaManagers
 from hydrus.client.media import ClientMediaResult
 from hydrus.client.metadata import ClientTags
 
@@ -1165,6 +1167,28 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
             
         
     
+    def _MigrateThumbnailStorage( self, use_packed_thumbnail_store: bool ):
+        
+        if use_packed_thumbnail_store:
+            
+            text = 'This will move all your thumbnails out of their individual files and into one pack file per thumbnail folder. Reading many thumbnails at once, like when a big page loads, is much faster this way, particularly on HDDs and network storage.'
+            
+        else:
+            
+            text = 'This will move all your thumbnails out of their pack files and back into individual files.'
+            
+        
+        text += os.linesep * 2
+        text += 'Thumbnails will be unavailable to other jobs while each folder is moved, so it is best to leave the client alone until it is done. It is safe to cancel halfway.'
+        
+        result = ClientGUIDialogsQuick.GetYesNo( self, text )
+        
+        if result == QW.QDialog.Accepted:
+            
+            self._controller.CallToThread( self._controller.client_files_manager.MigrateThumbnailStorage, use_packed_thumbnail_store )
+            
+        
+    
     def _ClearOrphanFiles( self ):
         
         text = 'This job will iterate through every file in your database\'s file storage, extracting any it does not expect to be there. This is particularly useful for \'re-syncing\' your file storage to what it should be, and is particularly useful if you are marrying an older/newer database with a newer/older file storage.'
@@ -1638,6 +1662,34 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
             
         
     
+    def _DebugBenchmarkSimilarFilesSearch( self ):
+        
+        def do_it():
+            
+            HydrusData.ShowText( 'Benchmarking similar files search. This may take a while.' )
+            
+            ( num_perceptual_hashes, num_searches, index_build_time, rows ) = HG.client_controller.Read( 'similar_files_benchmark' )
+            
+            lines = []
+            
+            lines.append( '{} perceptual hashes, {} searches. In-memory index built in {}.'.format( HydrusData.ToHumanInt( num_perceptual_hashes ), HydrusData.ToHumanInt( num_searches ), HydrusTime.TimeDeltaToPrettyTimeDelta( index_build_time ) ) )
+            
+            for ( max_hamming_distance, tree_time, num_tree_results, batched_tree_time, num_batched_tree_results, index_time, num_index_results, file_time, num_file_results, batched_file_time, num_batched_file_results ) in rows:
+                
+                lines.append( 'distance {}: tree {} ({} results), tree batched {} ({} results), index {} ({} results), files one at a time {} ({} results), files batched {} ({} results)'.format( max_hamming_distance, HydrusTime.TimeDeltaToPrettyTimeDelta( tree_time ), HydrusData.ToHumanInt( num_tree_results ), HydrusTime.TimeDeltaToPrettyTimeDelta( batched_tree_time ), HydrusData.ToHumanInt( num_batched_tree_results ), HydrusTime.TimeDeltaToPrettyTimeDelta( index_time ), HydrusData.ToHumanInt( num_index_results ), HydrusTime.TimeDeltaToPrettyTimeDelta( file_time ), HydrusData.ToHumanInt( num_file_results ), HydrusTime.TimeDeltaToPrettyTimeDelta( batched_file_time ), HydrusData.ToHumanInt( num_batched_file_results ) ) )
+                
+                if batched_file_time > 0:
+                    
+                    lines.append( 'distance {}: files batched were {:.1f}x as fast as one at a time'.format( max_hamming_distance, file_time / batched_file_time ) )
+                    
+                
+            
+            HydrusData.ShowText( os.linesep.join( lines ) )
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
     def _DebugResetColumnListManager( self ):
         
         message = 'This will reset all saved column widths for all multi-column lists across the program. You may need to restart the client to see changes.'
@@ -1688,6 +1740,70 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
         HydrusMemory.PrintCurrentMemoryUse( ( QW.QWidget, ) )
         
     
+    def _DebugBenchmarkTagsManagerMemory( self ):
+        
+        def do_it():
+            
+            HydrusData.ShowText( 'Benchmarking tags manager memory' + HC.UNICODE_ELLIPSIS )
+            
+            results = ClientMediaManagers.BenchmarkTagsManagerMemory()
+            
+            lines = []
+            
+            for ( label, num_files, num_bytes, time_took ) in results:
+                
+                lines.append( '{}: {} files in {}, {} per file, made in {}'.format( label, HydrusData.ToHumanInt( num_files ), HydrusData.ToHumanBytes( num_bytes ), HydrusData.ToHumanBytes( num_bytes // num_files ), HydrusTime.TimeDeltaToPrettyTimeDelta( time_took ) ) )
+                
+            
+            lines.append( 'tag intern table: {} tags'.format( HydrusData.ToHumanInt( ClientTags.tag_intern_table.GetNumTags() ) ) )
+            
+            HydrusData.ShowText( os.linesep.join( lines ) )
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
+    def _DebugBenchmarkThumbnailReads( self ):
+        
+        def do_it():
+            
+            HydrusData.ShowText( 'Benchmarking thumbnail reads' + HC.UNICODE_ELLIPSIS )
+            
+            results = self._controller.client_files_manager.BenchmarkThumbnailReads()
+            
+            lines = []
+            
+            for ( label, num_thumbnails, num_bytes, time_took ) in results:
+                
+                time_took = max( time_took, 0.0001 )
+                
+                lines.append( '{}: {} thumbnails ({}) in {}, {} thumbs/s, {}/s'.format( label, HydrusData.ToHumanInt( num_thumbnails ), HydrusData.ToHumanBytes( num_bytes ), HydrusTime.TimeDeltaToPrettyTimeDelta( time_took ), HydrusData.ToHumanInt( int( num_thumbnails / time_took ) ), HydrusData.ToHumanBytes( int( num_bytes / time_took ) ) ) )
+                
+            
+            HydrusData.ShowText( os.linesep.join( lines ) )
+            
+        
+        self._controller.CallToThread( do_it )
+        
+    
+    def _DebugShowCacheStats( self ):
+        
+        lines = []
+        
+        for stats in ClientCachesBase.GetAllDataCacheStats():
+            
+            hit_rate = 'n/a' if stats[ 'hit_rate' ] is None else HydrusData.ConvertFloatToPercentage( stats[ 'hit_rate' ] )
+            mean_entry_lifetime = 'n/a' if stats[ 'mean_entry_lifetime' ] is None else HydrusTime.TimeDeltaToPrettyTimeDelta( stats[ 'mean_entry_lifetime' ] )
+            
+            lines.append( '{} ({}): {} entries, {}'.format( stats[ 'name' ], stats[ 'eviction_policy' ], HydrusData.ToHumanInt( stats[ 'num_entries' ] ), HydrusData.ConvertValueRangeToBytes( stats[ 'current_size' ], stats[ 'size_limit' ] ) ) )
+            lines.append( '    {} hits, {} misses, hit rate {}'.format( HydrusData.ToHumanInt( stats[ 'hits' ] ), HydrusData.ToHumanInt( stats[ 'misses' ] ), hit_rate ) )
+            lines.append( '    {} added, {} evicted ({}), {} timed out, mean entry lifetime {}'.format( HydrusData.ToHumanInt( stats[ 'additions' ] ), HydrusData.ToHumanInt( stats[ 'evictions' ] ), HydrusData.ToHumanBytes( stats[ 'bytes_evicted' ] ), HydrusData.ToHumanInt( stats[ 'timeouts' ] ), mean_entry_lifetime ) )
+            
+        
+        HydrusData.ShowText( 'cache stats:' )
+        HydrusData.ShowText( os.linesep.join( lines ) )
+        
+    
     def _DebugShowScheduledJobs( self ):
         
         self._controller.DebugShowScheduledJobs()
@@ -2929,6 +3045,8 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
                         
                         ClientGUIMenus.AppendMenuItem( submenu, 'change update period', 'Change the update period for this service.', self._ManageServiceOptionsUpdatePeriod, service_key )
                         
+                        ClientGUIMenus.AppendMenuItem( submenu, 'change update format', 'Change the file format of the updates this service makes from now on.', self._ManageServiceOptionsUpdateFormat, service_key )
+                        
                         ClientGUIMenus.AppendMenuItem( submenu, 'change anonymisation period', 'Change the account history nullification period for this service.', self._ManageServiceOptionsNullificationPeriod, service_key )
                         
                         if service_type == HC.TAG_REPOSITORY:
@@ -3114,6 +3232,12 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
         
         ClientGUIMenus.AppendMenuItem( file_maintenance_menu, 'clear orphan files', 'Clear out surplus files that have found their way into the file structure.', self._ClearOrphanFiles )
         
+        ClientGUIMenus.AppendSeparator( file_maintenance_menu )
+        
+        ClientGUIMenus.AppendMenuItem( file_maintenance_menu, 'pack thumbnails into pack files', 'Move your thumbnails into one pack file per thumbnail folder for faster bulk reads.', self._MigrateThumbnailStorage, True )
+        ClientGUIMenus.AppendMenuItem( file_maintenance_menu, 'unpack thumbnails to loose files', 'Move your thumbnails out of their pack files and back into one file per thumbnail.', self._MigrateThumbnailStorage, False )
+        
+        
         ClientGUIMenus.AppendMenu( menu, file_maintenance_menu, 'file maintenance' )
         
         #
@@ -3350,11 +3474,14 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
         profile_mode_message += os.linesep * 2
         profile_mode_message += 'A new Query Planner mode also makes very detailed database analysis. This is an alternate profiling mode hydev is testing.'
         profile_mode_message += os.linesep * 2
+        profile_mode_message += 'Slow Query mode times every database statement and logs the slow ones, with their query plans, to a \'client slow queries.log\' in your database directory. The Client API can fetch the statements that took the most time under /manage_database/get_query_stats.'
+        profile_mode_message += os.linesep * 2
         profile_mode_message += 'More information is available in the help, under \'reducing program lag\'.'
         
         ClientGUIMenus.AppendMenuItem( profiling, 'what is this?', 'Show profile info.', ClientGUIDialogsMessage.ShowInformation, self, profile_mode_message )
         ClientGUIMenus.AppendMenuCheckItem( profiling, 'profile mode', 'Run detailed \'profiles\'.', HG.profile_mode, HG.client_controller.FlipProfileMode )
         ClientGUIMenus.AppendMenuCheckItem( profiling, 'query planner mode', 'Run detailed \'query plans\'.', HG.query_planner_mode, HG.client_controller.FlipQueryPlannerMode )
+        ClientGUIMenus.AppendMenuCheckItem( profiling, 'slow query mode', 'Time every database statement and log the slow ones.', HG.slow_query_mode, HG.client_controller.FlipSlowQueryMode )
         
         ClientGUIMenus.AppendMenu( debug, profiling, 'profiling' )
         
@@ -3421,6 +3548,11 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
         
         ClientGUIMenus.AppendMenuCheckItem( data_actions, 'db ui-hang relief mode', 'Have UI-synchronised database jobs process pending Qt events while they wait.', HG.db_ui_hang_relief_mode, self._SwitchBoolean, 'db_ui_hang_relief_mode' )
         ClientGUIMenus.AppendMenuItem( data_actions, 'review threads', 'Show current threads and what they are doing.', self._ReviewThreads )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'benchmark similar files search', 'Time some similar files searches with the database tree against the in-memory index.', self._DebugBenchmarkSimilarFilesSearch )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'benchmark tags manager memory', 'Measure the memory of a hundred thousand and a million synthetic tags managers against the old sets-of-strings layout. This needs a couple of GB and takes a while.', self._DebugBenchmarkTagsManagerMemory )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'benchmark thumbnail reads', 'Time reading a sample of thumbnails one at a time and in batches.', self._DebugBenchmarkThumbnailReads )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'show cache stats', 'Print hit rates, evictions, and entry lifetimes for the thumbnail, image, image tile, and media result caches.', self._DebugShowCacheStats )
+        ClientGUIMenus.AppendMenuItem( data_actions, 'show db job timings', 'Print how long db jobs have waited in the queue against how long they took to run.', self._controller.DebugShowDBJobTimings )
         ClientGUIMenus.AppendMenuItem( data_actions, 'show scheduled jobs', 'Print some information about the currently scheduled jobs log.', self._DebugShowScheduledJobs )
         ClientGUIMenus.AppendMenuItem( data_actions, 'subscription manager snapshot', 'Have the subscription system show what it is doing.', self._controller.subscriptions_manager.ShowSnapshot )
         ClientGUIMenus.AppendMenuItem( data_actions, 'flush log', 'Command the log to write any buffered contents to hard drive.', HydrusData.DebugPrint, 'Flushing log' )
@@ -4580,6 +4712,58 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
             
         
     
+    def _ManageServiceOptionsUpdateFormat( self, service_key ):
+        
+        service = self._controller.services_manager.GetService( service_key )
+        
+        update_format = service.GetUpdateFormat()
+        
+        choice_tuples = [ ( HydrusNetwork.update_format_string_lookup[ f ], f ) for f in ( HydrusNetwork.UPDATE_FORMAT_JSON, HydrusNetwork.UPDATE_FORMAT_BINARY ) ]
+        
+        try:
+            
+            update_format = ClientGUIDialogsQuick.SelectFromList( self, 'select update format', choice_tuples, value_to_select = update_format, sort_tuples = False )
+            
+        except HydrusExceptions.CancelledException:
+            
+            return
+            
+        
+        job_status = ClientThreading.JobStatus()
+        
+        job_status.SetStatusTitle( 'setting update format' )
+        job_status.SetStatusText( 'uploading' + HC.UNICODE_ELLIPSIS )
+        
+        self._controller.pub( 'message', job_status )
+        
+        def work_callable():
+            
+            service.Request( HC.POST, 'options_update_format', { 'update_format' : update_format } )
+            
+            return 1
+            
+        
+        def publish_callable( gumpf ):
+            
+            job_status.SetStatusText( 'done!' )
+            
+            job_status.FinishAndDismiss( 5 )
+            
+            service.SetAccountRefreshDueNow()
+            
+        
+        def errback_ui_cleanup_callable():
+            
+            job_status.SetStatusText( 'error!' )
+            
+            job_status.Finish()
+            
+        
+        job = ClientGUIAsync.AsyncQtJob( self, work_callable, publish_callable, errback_ui_cleanup_callable = errback_ui_cleanup_callable )
+        
+        job.start()
+        
+    
     def _ManageServiceOptionsUpdatePeriod( self, service_key ):
         
         service = self._controller.services_manager.GetService( service_key )
@@ -5120,11 +5304,26 @@ class FrameGUI( CAC.ApplicationCommandProcessorMixin, ClientGUITopLevelWindows.M
             busy_tooltip = None
             
         
-        ( db_status, job_name ) = HG.client_controller.GetDBStatus()
+        ( db_status, job_name, lanes_to_status ) = HG.client_controller.GetDBStatus()
+        
+        db_tooltip_lines = []
         
         if job_name is not None and job_name != '':
             
-            db_tooltip = 'current db job: {}'.format( job_name )
+            db_tooltip_lines.append( 'current db job: {}'.format( job_name ) )
+            
+        
+        for ( lane, ( depth, percentiles ) ) in lanes_to_status.items():
+            
+            if depth > 0:
+                
+                db_tooltip_lines.append( '{} jobs waiting: {}'.format( lane, HydrusData.ToHumanInt( depth ) ) )
+                
+            
+        
+        if len( db_tooltip_lines ) > 0:
+            
+            db_tooltip = os.linesep.join( db_tooltip_lines )
             
         else:
             
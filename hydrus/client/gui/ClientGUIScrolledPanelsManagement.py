@@ -1824,9 +1824,32 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            import_folders_panel = ClientGUICommon.StaticBox( self, 'import folders' )
+            
+            self._file_import_num_worker_processes = ClientGUICommon.BetterSpinBox( import_folders_panel, min = 0, max = 64 )
+            
+            tt = 'If 0, import folders import one file at a time, start to finish. Otherwise, they import through a pipeline that copies and hashes the next files, checks what the database already knows about them in batches, and commits them to the database in batches, all at the same time. The heavy parsing of images is done in this many separate worker processes, so big import folders can use more than one core.'
+            tt += os.linesep * 2
+            tt += 'Each worker process takes some memory, so do not set this higher than your number of cores. A summary of how fast each stage went is written to the log after each run.'
+            
+            self._file_import_num_worker_processes.setToolTip( tt )
+            
+            self._file_import_num_worker_processes.setValue( self._new_options.GetInteger( 'file_import_num_worker_processes' ) )
+            
+            rows = []
+            
+            rows.append( ( 'Worker processes for import folders: ', self._file_import_num_worker_processes ) )
+            
+            gridbox = ClientGUICommon.WrapInGrid( import_folders_panel, rows )
+            
+            import_folders_panel.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
+            
+            #
+            
             vbox = QP.VBoxLayout()
             
             QP.AddToLayout( vbox, default_fios, CC.FLAGS_EXPAND_PERPENDICULAR )
+            QP.AddToLayout( vbox, import_folders_panel, CC.FLAGS_EXPAND_PERPENDICULAR )
             vbox.addStretch( 1 )
             
             self.setLayout( vbox )
@@ -1837,6 +1860,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetDefaultFileImportOptions( FileImportOptions.IMPORT_TYPE_QUIET, self._quiet_fios.GetFileImportOptions() )
             self._new_options.SetDefaultFileImportOptions( FileImportOptions.IMPORT_TYPE_LOUD, self._loud_fios.GetFileImportOptions() )
             
+            self._new_options.SetInteger( 'file_import_num_worker_processes', self._file_import_num_worker_processes.value() )
+            
         
     
     class _MaintenanceAndProcessingPanel( QW.QWidget ):
@@ -1901,6 +1926,14 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._file_maintenance_idle_throttle_velocity.setToolTip( tt )
             self._file_maintenance_active_throttle_velocity.setToolTip( tt )
             
+            self._file_maintenance_num_worker_processes = ClientGUICommon.BetterSpinBox( self._file_maintenance_panel, min = 0, max = 64 )
+            
+            tt = 'If 0, all file maintenance work happens in the normal file maintenance thread. Otherwise, the heavy CPU parts of thumbnail regeneration, pixel hashes, perceptual hashes, and blurhashes for images are done in this many separate worker processes, so they can use more than one core.'
+            tt += os.linesep * 2
+            tt += 'The throttles above still apply. Each worker process takes some memory, so do not set this higher than your number of cores.'
+            
+            self._file_maintenance_num_worker_processes.setToolTip( tt )
+            
             #
             
             self._repository_processing_panel = ClientGUICommon.StaticBox( self, 'repository processing' )
@@ -1968,6 +2001,10 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._maintain_similar_files_duplicate_pairs_during_idle = QW.QCheckBox( self._duplicates_panel )
             
+            self._similar_files_use_in_memory_index = QW.QCheckBox( self._duplicates_panel )
+            tt = 'Instead of walking the search tree in the database, keep every perceptual hash in memory and check them all at once. This is much faster for large clients, at the cost of some memory (about 40MB per million files) and a few seconds to load the first time it is used.'
+            self._similar_files_use_in_memory_index.setToolTip( tt )
+            
             self._potential_duplicates_search_work_time = ClientGUITime.TimeDeltaCtrl( self._duplicates_panel, min = 0.1, seconds = True, milliseconds = True )
             tt = 'DO NOT CHANGE UNLESS YOU KNOW WHAT YOU ARE DOING. Potential search operates on a work-rest cycle. This setting determines how long it should work for in each work packet. Actual work time will normally be a little larger than this, and on large databases the minimum work time may be upwards of several seconds.'
             self._potential_duplicates_search_work_time.setToolTip( tt )
@@ -2035,6 +2072,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._file_maintenance_active_throttle_velocity.SetValue( file_maintenance_active_throttle_velocity )
             
+            self._file_maintenance_num_worker_processes.setValue( self._new_options.GetInteger( 'file_maintenance_num_worker_processes' ) )
+            
             self._repository_processing_work_time_very_idle.SetValue( self._new_options.GetInteger( 'repository_processing_work_time_ms_very_idle' ) / 1000 )
             self._repository_processing_rest_percentage_very_idle.setValue( self._new_options.GetInteger( 'repository_processing_rest_percentage_very_idle' ) )
             
@@ -2057,6 +2096,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._tag_display_processing_rest_percentage_work_hard.setValue( self._new_options.GetInteger( 'tag_display_processing_rest_percentage_work_hard' ) )
             
             self._maintain_similar_files_duplicate_pairs_during_idle.setChecked( self._new_options.GetBoolean( 'maintain_similar_files_duplicate_pairs_during_idle' ) )
+            self._similar_files_use_in_memory_index.setChecked( self._new_options.GetBoolean( 'similar_files_use_in_memory_index' ) )
             self._potential_duplicates_search_work_time.SetValue( self._new_options.GetInteger( 'potential_duplicates_search_work_time_ms' ) / 1000 )
             self._potential_duplicates_search_rest_percentage.setValue( self._new_options.GetInteger( 'potential_duplicates_search_rest_percentage' ) )
             
@@ -2143,6 +2183,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Idle throttle: ', self._file_maintenance_idle_throttle_velocity ) )
             rows.append( ( 'Run file maintenance during normal time: ', self._file_maintenance_during_active ) )
             rows.append( ( 'Normal throttle: ', self._file_maintenance_active_throttle_velocity ) )
+            rows.append( ( 'Worker processes for heavy file jobs: ', self._file_maintenance_num_worker_processes ) )
             
             gridbox = ClientGUICommon.WrapInGrid( self._file_maintenance_panel, rows )
             
@@ -2197,6 +2238,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows = []
             
             rows.append( ( 'Search for potential duplicates in idle time/shutdown: ', self._maintain_similar_files_duplicate_pairs_during_idle ) )
+            rows.append( ( 'Search similar files with an in-memory index: ', self._similar_files_use_in_memory_index ) )
             rows.append( ( '"Idle" ideal work packet time: ', self._potential_duplicates_search_work_time ) )
             rows.append( ( '"Idle" rest time percentage: ', self._potential_duplicates_search_rest_percentage ) )
             
@@ -2304,6 +2346,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'file_maintenance_active_throttle_files', file_maintenance_active_throttle_files )
             self._new_options.SetInteger( 'file_maintenance_active_throttle_time_delta', file_maintenance_active_throttle_time_delta )
             
+            self._new_options.SetInteger( 'file_maintenance_num_worker_processes', self._file_maintenance_num_worker_processes.value() )
+            
             self._new_options.SetInteger( 'repository_processing_work_time_ms_very_idle', int( self._repository_processing_work_time_very_idle.GetValue() * 1000 ) )
             self._new_options.SetInteger( 'repository_processing_rest_percentage_very_idle', self._repository_processing_rest_percentage_very_idle.value() )
             
@@ -2326,6 +2370,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetInteger( 'tag_display_processing_rest_percentage_work_hard', self._tag_display_processing_rest_percentage_work_hard.value() )
             
             self._new_options.SetBoolean( 'maintain_similar_files_duplicate_pairs_during_idle', self._maintain_similar_files_duplicate_pairs_during_idle.isChecked() )
+            self._new_options.SetBoolean( 'similar_files_use_in_memory_index', self._similar_files_use_in_memory_index.isChecked() )
             self._new_options.SetInteger( 'potential_duplicates_search_work_time_ms', int( self._potential_duplicates_search_work_time.GetValue() * 1000 ) )
             self._new_options.SetInteger( 'potential_duplicates_search_rest_percentage', self._potential_duplicates_search_rest_percentage.value() )
             
@@ -3231,6 +3276,12 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._save_page_sort_on_change = QW.QCheckBox( self._file_sort_panel )
             
+            self._keep_pages_sorted_on_content_updates = QW.QCheckBox( self._file_sort_panel )
+            self._keep_pages_sorted_on_content_updates.setToolTip( 'If on, when you tag, rate, archive, or otherwise change a file that is in a page, it will move to its new sorted position straight away. If off, it stays where it is until you sort again.' )
+            
+            self._keep_pages_collected_on_content_updates = QW.QCheckBox( self._file_sort_panel )
+            self._keep_pages_collected_on_content_updates.setToolTip( 'If on, when you change the tags or ratings of a file in a collected page, it will move to its new collection straight away. If off, it stays where it is until you collect again.' )
+            
             self._default_media_collect = ClientGUIResultsSortCollect.MediaCollectControl( self._file_sort_panel )
             
             namespace_sorting_box = ClientGUICommon.StaticBox( self._file_sort_panel, 'namespace file sorting' )
@@ -3242,6 +3293,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._namespace_sort_by.AddDatas( [ media_sort.sort_type[1] for media_sort in HG.client_controller.new_options.GetDefaultNamespaceSorts() ] )
             
             self._save_page_sort_on_change.setChecked( self._new_options.GetBoolean( 'save_page_sort_on_change' ) )
+            self._keep_pages_sorted_on_content_updates.setChecked( self._new_options.GetBoolean( 'keep_pages_sorted_on_content_updates' ) )
+            self._keep_pages_collected_on_content_updates.setChecked( self._new_options.GetBoolean( 'keep_pages_collected_on_content_updates' ) )
             
             #
             
@@ -3271,7 +3324,9 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             rows.append( ( 'Default file sort: ', self._default_media_sort ) )
             rows.append( ( 'Secondary file sort (when primary gives two equal values): ', self._fallback_media_sort ) )
             rows.append( ( 'Update default file sort every time a new sort is manually chosen: ', self._save_page_sort_on_change ) )
+            rows.append( ( 'Move files to their new sorted position when they change: ', self._keep_pages_sorted_on_content_updates ) )
             rows.append( ( 'Default collect: ', self._default_media_collect ) )
+            rows.append( ( 'Move files to their new collection when they change: ', self._keep_pages_collected_on_content_updates ) )
             
             gridbox = ClientGUICommon.WrapInGrid( self, rows )
             
@@ -3312,6 +3367,8 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             self._new_options.SetDefaultSort( self._default_media_sort.GetSort() )
             self._new_options.SetFallbackSort( self._fallback_media_sort.GetSort() )
             self._new_options.SetBoolean( 'save_page_sort_on_change', self._save_page_sort_on_change.isChecked() )
+            self._new_options.SetBoolean( 'keep_pages_sorted_on_content_updates', self._keep_pages_sorted_on_content_updates.isChecked() )
+            self._new_options.SetBoolean( 'keep_pages_collected_on_content_updates', self._keep_pages_collected_on_content_updates.isChecked() )
             self._new_options.SetDefaultCollect( self._default_media_collect.GetValue() )
             
             namespace_sorts = [ ClientMedia.MediaSort( sort_type = ( 'namespaces', sort_data ) ) for sort_data in self._namespace_sort_by.GetData() ]
@@ -3330,6 +3387,21 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            eviction_panel = ClientGUICommon.StaticBox( self, 'cache eviction' )
+            
+            self._data_cache_eviction_policy = ClientGUICommon.BetterChoice( eviction_panel )
+            
+            for eviction_policy_type in ( CC.CACHE_EVICTION_POLICY_LRU, CC.CACHE_EVICTION_POLICY_W_TINYLFU ):
+                
+                self._data_cache_eviction_policy.addItem( CC.cache_eviction_policy_str_lookup[ eviction_policy_type ], eviction_policy_type )
+                
+            
+            tt = 'This decides what the thumbnail, image, and image tile caches throw out when they are full. \'least recently used\' discards whatever has gone untouched the longest. \'W-TinyLFU\' remembers how often things have been asked for recently, and a new entry only displaces an older one if it is more popular, so a few big one-off images will not flush out a load of small, frequently viewed ones.'
+            tt += os.linesep * 2
+            tt += 'You can see how well each cache is doing under help->debug->data actions->show cache stats.'
+            
+            self._data_cache_eviction_policy.setToolTip( tt )
+            
             thumbnail_cache_panel = ClientGUICommon.StaticBox( self, 'thumbnail cache' )
             
             self._thumbnail_cache_size = ClientGUIControls.BytesControl( thumbnail_cache_panel )
@@ -3349,6 +3421,14 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             self._thumbnail_cache_timeout.setToolTip( tt )
             
+            self._thumbnail_bitmap_disk_cache_size = ClientGUIControls.NoneableBytesControl( thumbnail_cache_panel, initial_value = 256 * 1024 * 1024, none_label = 'do not use' )
+            
+            tt = 'If set, thumbnails that have been decoded and resized are also saved to a file in your database directory. When a thumbnail is not in the memory cache, it can be copied straight from this file rather than loaded and resized all over again, which makes big pages load faster the first time.'
+            tt += os.linesep * 2
+            tt += 'Every thumbnail gets a slot big enough for the largest possible thumbnail at your current thumbnail size, so the file is exactly this size. When it is full, the oldest thumbnails are overwritten.'
+            
+            self._thumbnail_bitmap_disk_cache_size.setToolTip( tt )
+            
             image_cache_panel = ClientGUICommon.StaticBox( self, 'image cache' )
             
             self._image_cache_size = ClientGUIControls.BytesControl( image_cache_panel )
@@ -3442,11 +3522,14 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            self._data_cache_eviction_policy.SetValue( self._new_options.GetInteger( 'data_cache_eviction_policy' ) )
+            
             self._thumbnail_cache_size.SetValue( self._new_options.GetInteger( 'thumbnail_cache_size' ) )
             self._image_cache_size.SetValue( self._new_options.GetInteger( 'image_cache_size' ) )
             self._image_tile_cache_size.SetValue( self._new_options.GetInteger( 'image_tile_cache_size' ) )
             
             self._thumbnail_cache_timeout.SetValue( self._new_options.GetInteger( 'thumbnail_cache_timeout' ) )
+            self._thumbnail_bitmap_disk_cache_size.SetValue( self._new_options.GetNoneableInteger( 'thumbnail_bitmap_disk_cache_size' ) )
             self._image_cache_timeout.SetValue( self._new_options.GetInteger( 'image_cache_timeout' ) )
             self._image_tile_cache_timeout.SetValue( self._new_options.GetInteger( 'image_tile_cache_timeout' ) )
             
@@ -3505,6 +3588,18 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             #
             
+            rows = []
+            
+            rows.append( ( 'Eviction policy:', self._data_cache_eviction_policy ) )
+            
+            gridbox = ClientGUICommon.WrapInGrid( eviction_panel, rows )
+            
+            eviction_panel.Add( gridbox, CC.FLAGS_EXPAND_SIZER_PERPENDICULAR )
+            
+            QP.AddToLayout( vbox, eviction_panel, CC.FLAGS_EXPAND_PERPENDICULAR )
+            
+            #
+            
             text = 'Does not change much, thumbs are cheap.'
             
             st = ClientGUICommon.BetterStaticText( thumbnail_cache_panel, text )
@@ -3515,6 +3610,7 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
             
             rows.append( ( 'Memory reserved for thumbnail cache:', thumbnails_sizer ) )
             rows.append( ( 'Thumbnail cache timeout:', self._thumbnail_cache_timeout ) )
+            rows.append( ( 'Disk reserved for decoded thumbnails:', self._thumbnail_bitmap_disk_cache_size ) )
             
             gridbox = ClientGUICommon.WrapInGrid( thumbnail_cache_panel, rows )
             
@@ -3715,11 +3811,14 @@ class ManageOptionsPanel( ClientGUIScrolledPanels.ManagePanel ):
         
         def UpdateOptions( self ):
             
+            self._new_options.SetInteger( 'data_cache_eviction_policy', self._data_cache_eviction_policy.GetValue() )
+            
             self._new_options.SetInteger( 'thumbnail_cache_size', self._thumbnail_cache_size.GetValue() )
             self._new_options.SetInteger( 'image_cache_size', self._image_cache_size.GetValue() )
             self._new_options.SetInteger( 'image_tile_cache_size', self._image_tile_cache_size.GetValue() )
             
             self._new_options.SetInteger( 'thumbnail_cache_timeout', self._thumbnail_cache_timeout.GetValue() )
+            self._new_options.SetNoneableInteger( 'thumbnail_bitmap_disk_cache_size', self._thumbnail_bitmap_disk_cache_size.GetValue() )
             self._new_options.SetInteger( 'image_cache_timeout', self._image_cache_timeout.GetValue() )
             self._new_options.SetInteger( 'image_tile_cache_timeout', self._image_tile_cache_timeout.GetValue() )
             
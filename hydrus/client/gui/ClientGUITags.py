@@ -18,6 +18,7 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTags
 from hydrus.core import HydrusText
+from hydrus.core import HydrusTime
 from hydrus.core.networking import HydrusNetwork
 
 from hydrus.client import ClientApplicationCommand as CAC
@@ -5741,6 +5742,13 @@ class ReviewTagDisplayMaintenancePanel( ClientGUIScrolledPanels.ReviewPanel ):
                             
                         
                     
+                    sync_time_estimate = status[ 'sync_time_estimate' ]
+                    
+                    if sync_time_estimate is not None:
+                        
+                        message += ' About {} of work left.'.format( HydrusTime.TimeDeltaToPrettyTimeDelta( sync_time_estimate ) )
+                        
+                    
                     sync_work_to_do = True
                     
                 
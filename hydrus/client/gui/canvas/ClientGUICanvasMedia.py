@@ -2770,11 +2770,11 @@ class EmbedButton( QW.QWidget ):
         
         if needs_thumb:
             
-            thumbnail_path = HG.client_controller.client_files_manager.GetThumbnailPath( self._media )
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( self._media )
             
-            thumbnail_mime = HydrusFileHandling.GetThumbnailMime( thumbnail_path )
+            thumbnail_mime = HydrusFileHandling.GetThumbnailMimeFromBytes( thumbnail_bytes )
             
-            self._thumbnail_qt_pixmap = ClientRendering.GenerateHydrusBitmap( thumbnail_path, thumbnail_mime ).GetQtPixmap()
+            self._thumbnail_qt_pixmap = ClientRendering.GenerateHydrusBitmapFromBytes( thumbnail_bytes, thumbnail_mime ).GetQtPixmap()
             
             self.update()
             
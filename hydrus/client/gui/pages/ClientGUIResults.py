@@ -3173,6 +3173,26 @@ class MediaPanelThumbnails( MediaPanel ):
             
         
     
+    def _RecalcAfterRecollect( self ):
+        
+        MediaPanel._RecalcAfterRecollect( self )
+        
+        self._RecalculateVirtualSize()
+        
+        self._DirtyAllPages()
+        
+        self.widget().update()
+        
+    
+    def _RecalcAfterResort( self ):
+        
+        MediaPanel._RecalcAfterResort( self )
+        
+        self._DirtyAllPages()
+        
+        self.widget().update()
+        
+    
     def _RecalculateVirtualSize( self, called_from_resize_event = False ):
         
         my_size = QP.ScrollAreaVisibleRect( self ).size()
@@ -1,4 +1,5 @@
 import collections
+import heapq
 import itertools
 import os
 import random
@@ -37,6 +38,9 @@ from hydrus.client.networking import ClientNetworkingFunctions
 FILE_SEED_TYPE_HDD = 0
 FILE_SEED_TYPE_URL = 1
 
+# prefetched pre-import statuses are only a shortcut for the next few minutes of work. after that, we ask the db again
+PREFETCHED_PRE_IMPORT_STATUS_TIMEOUT = 300
+
 def FileURLMappingHasUntrustworthyNeighbours( hash: bytes, url: str ):
     
     # let's see if the file that has this url has any other interesting urls
@@ -152,6 +156,9 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         self._names_and_notes_dict = dict()
         self._hashes = {}
         
+        # the file seed cache looks up our pre-import statuses in bulk with our neighbours. we use these once, if they are fresh, instead of asking the db again
+        self._prefetched_pre_import_statuses = None
+        
     
     def __eq__( self, other ):
         
@@ -326,6 +333,76 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return lookup_url
         
     
+    def _GetPrefetchedPreImportStatus( self, lookup ):
+        
+        if self._prefetched_pre_import_statuses is None:
+            
+            return None
+            
+        
+        ( prefetch_time, lookups_to_statuses ) = self._prefetched_pre_import_statuses
+        
+        if HydrusTime.TimeHasPassed( prefetch_time + PREFETCHED_PRE_IMPORT_STATUS_TIMEOUT ):
+            
+            self._prefetched_pre_import_statuses = None
+            
+            return None
+            
+        
+        return lookups_to_statuses.get( lookup, None )
+        
+    
+    def _GetPreImportHashLookups( self ):
+        
+        jobs = []
+        
+        if 'sha256' in self._hashes:
+            
+            jobs.append( ( 'sha256', self._hashes[ 'sha256' ] ) )
+            
+        
+        for ( hash_type, found_hash ) in self._hashes.items():
+            
+            if hash_type == 'sha256':
+                
+                continue
+                
+            
+            jobs.append( ( hash_type, found_hash ) )
+            
+        
+        return jobs
+        
+    
+    def _GetPreImportURLLookups( self, file_url = None ):
+        
+        urls = []
+        
+        if self.file_seed_type == FILE_SEED_TYPE_URL:
+            
+            urls.append( self.file_seed_data )
+            
+        
+        if file_url is not None:
+            
+            urls.append( file_url )
+            
+        
+        urls.extend( self._primary_urls )
+        
+        # now that we store primary and source urls separately, we'll trust any primary but be careful about source
+        # trusting classless source urls was too much of a hassle with too many boorus providing bad source urls like user account pages
+        
+        urls.extend( ( url for url in self._source_urls if HG.client_controller.network_engine.domain_manager.URLDefinitelyRefersToOneFile( url ) ) )
+        
+        # now discard gallery pages or post urls that can hold multiple files
+        urls = [ url for url in urls if not HG.client_controller.network_engine.domain_manager.URLCanReferToMultipleFiles( url ) ]
+        
+        lookup_urls = HG.client_controller.network_engine.domain_manager.NormaliseURLs( urls )
+        
+        return lookup_urls
+        
+    
     def _SetupNoteImportOptions( self, given_note_import_options: NoteImportOptions.NoteImportOptions ) -> NoteImportOptions.NoteImportOptions:
         
         if given_note_import_options.IsDefault():
@@ -802,6 +879,31 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return dict( self._hashes )
         
     
+    def GetPreImportStatusLookups( self, file_import_options: FileImportOptions.FileImportOptions ):
+        
+        # what GetPreImportStatusPrediction(Hash|URL) will ask the db about, so the file seed cache can do it in bulk
+        
+        if file_import_options.GetPreImportHashCheckType() == FileImportOptions.DO_NOT_CHECK:
+            
+            hash_lookups = []
+            
+        else:
+            
+            hash_lookups = self._GetPreImportHashLookups()
+            
+        
+        if file_import_options.GetPreImportURLCheckType() == FileImportOptions.DO_NOT_CHECK:
+            
+            url_lookups = []
+            
+        else:
+            
+            url_lookups = self._GetPreImportURLLookups()
+            
+        
+        return ( hash_lookups, url_lookups )
+        
+    
     def GetPreImportStatusPredictionHash( self, file_import_options: FileImportOptions.FileImportOptions ) -> typing.Tuple[ bool, bool, ClientImportFiles.FileImportStatus ]:
         
         # TODO: a user raised the spectre of multiple hash parses on some site that actually provides somehow the pre- and post- optimised versions of a file
@@ -819,27 +921,17 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         
         # hashes
         
-        jobs = []
+        jobs = self._GetPreImportHashLookups()
         
-        if 'sha256' in self._hashes:
-            
-            jobs.append( ( 'sha256', self._hashes[ 'sha256' ] ) )
+        for ( hash_type, found_hash ) in jobs:
             
-        
-        for ( hash_type, found_hash ) in self._hashes.items():
+            file_import_status = self._GetPrefetchedPreImportStatus( ( 'hash', hash_type, found_hash ) )
             
-            if hash_type == 'sha256':
+            if file_import_status is None:
                 
-                continue
+                file_import_status = HG.client_controller.Read( 'hash_status', hash_type, found_hash, prefix = '{} hash recognised'.format( hash_type ) )
                 
             
-            jobs.append( ( hash_type, found_hash ) )
-            
-        
-        for ( hash_type, found_hash ) in jobs:
-            
-            file_import_status = HG.client_controller.Read( 'hash_status', hash_type, found_hash, prefix = '{} hash recognised'.format( hash_type ) )
-            
             # there's some subtle gubbins going on here
             # an sha256 'haven't seen this before' result will not set the hash here and so will not count as a match
             # this is the same as if we do an md5 lookup and get no sha256 result back. we just aren't trusting a novel sha256 as a 'match'
@@ -876,29 +968,7 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         
         # urls
         
-        urls = []
-        
-        if self.file_seed_type == FILE_SEED_TYPE_URL:
-            
-            urls.append( self.file_seed_data )
-            
-        
-        if file_url is not None:
-            
-            urls.append( file_url )
-            
-        
-        urls.extend( self._primary_urls )
-        
-        # now that we store primary and source urls separately, we'll trust any primary but be careful about source
-        # trusting classless source urls was too much of a hassle with too many boorus providing bad source urls like user account pages
-        
-        urls.extend( ( url for url in self._source_urls if HG.client_controller.network_engine.domain_manager.URLDefinitelyRefersToOneFile( url ) ) )
-        
-        # now discard gallery pages or post urls that can hold multiple files
-        urls = [ url for url in urls if not HG.client_controller.network_engine.domain_manager.URLCanReferToMultipleFiles( url ) ]
-        
-        lookup_urls = HG.client_controller.network_engine.domain_manager.NormaliseURLs( urls )
+        lookup_urls = self._GetPreImportURLLookups( file_url = file_url )
         
         untrustworthy_domains = set()
         
@@ -909,7 +979,12 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
                 continue
                 
             
-            results = HG.client_controller.Read( 'url_statuses', lookup_url )
+            results = self._GetPrefetchedPreImportStatus( ( 'url', lookup_url ) )
+            
+            if results is None:
+                
+                results = HG.client_controller.Read( 'url_statuses', lookup_url )
+                
             
             if len( results ) == 0: # if no match found, this is a new URL, no useful data discovered
                 
@@ -993,6 +1068,11 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         return self.GetHash() is not None
         
     
+    def HasPrefetchedPreImportStatuses( self ):
+        
+        return self._prefetched_pre_import_statuses is not None
+        
+    
     def Import( self, temp_path: str, file_import_options: FileImportOptions.FileImportOptions, status_hook = None ):
         
         if file_import_options.IsDefault():
@@ -1062,6 +1142,40 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
         file_seed_cache.NotifyFileSeedsUpdated( ( self, ) )
         
     
+    def ImportPathFromPipelineResult( self, file_seed_cache: "FileSeedCache", file_import_options: FileImportOptions.FileImportOptions, file_import_status_or_exception ):
+        
+        # the second half of ImportPath, for when the import pipeline did the actual work
+        
+        try:
+            
+            if isinstance( file_import_status_or_exception, Exception ):
+                
+                raise file_import_status_or_exception
+                
+            
+            file_import_status = file_import_status_or_exception
+            
+            self.SetStatus( file_import_status.status, note = file_import_status.note )
+            self.SetHash( file_import_status.hash )
+            
+            self.WriteContentUpdates( file_import_options = file_import_options )
+            
+        except HydrusExceptions.VetoException as e:
+            
+            self.SetStatus( CC.STATUS_VETOED, note = str( e ) )
+            
+        except HydrusExceptions.UnsupportedFileException as e:
+            
+            self.SetStatus( CC.STATUS_ERROR, note = str( e ) )
+            
+        except Exception as e:
+            
+            self.SetStatus( CC.STATUS_ERROR, exception = e )
+            
+        
+        file_seed_cache.NotifyFileSeedsUpdated( ( self, ) )
+        
+    
     def IsAPostURL( self ):
         
         if self.file_seed_type == FILE_SEED_TYPE_URL:
@@ -1211,6 +1325,9 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             self._UpdateModified()
             
         
+        # the prefetch is good for one go. if we come back here, we might have imported stuff since
+        self._prefetched_pre_import_statuses = None
+        
         return ( should_download_metadata, should_download_file )
         
     
@@ -1234,6 +1351,11 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def SetPrefetchedPreImportStatuses( self, lookups_to_statuses ):
+        
+        self._prefetched_pre_import_statuses = ( HydrusTime.GetNow(), lookups_to_statuses )
+        
+    
     def SetReferralURL( self, referral_url: str ):
         
         self._referral_url = referral_url
@@ -1335,6 +1457,8 @@ class FileSeed( HydrusSerialisable.SerialisableBase ):
             
             status_hook( 'checking url status' )
             
+            file_seed_cache.PrefetchPreImportStatuses( self, file_import_options )
+            
             ( should_download_metadata, should_download_file ) = self.PredictPreImportStatus( file_import_options, tag_import_options, note_import_options )
             
             if self.IsAPostURL():
@@ -2307,6 +2431,14 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         return file_seed
         
     
+    def _GetNextFileSeeds( self, status: int, num_to_get: int ) -> typing.List[ FileSeed ]:
+        
+        statuses_to_file_seeds = self._GetStatusesToFileSeeds()
+        file_seeds_to_indices = self._GetFileSeedsToIndices()
+        
+        return heapq.nsmallest( num_to_get, statuses_to_file_seeds[ status ], key = lambda f_s: file_seeds_to_indices[ f_s ] )
+        
+    
     def _GetSerialisableInfo( self ):
         
         return self._file_seeds.GetSerialisableTuple()
@@ -3125,6 +3257,74 @@ class FileSeedCache( HydrusSerialisable.SerialisableBase ):
         self._NotifyFileSeedsUpdated( file_seeds )
         
     
+    def PrefetchPreImportStatuses( self, file_seed: FileSeed, file_import_options: FileImportOptions.FileImportOptions, num_to_prefetch = 64 ):
+        
+        # a gallery page can give us hundreds of new urls, and asking the db about each one is a lot of slow round trips
+        # so when we get to a file seed with nothing prefetched, we look up its statuses and those of the next bunch of unknown file seeds in one go
+        
+        if file_seed.HasPrefetchedPreImportStatuses():
+            
+            return
+            
+        
+        with self._lock:
+            
+            next_file_seeds = self._GetNextFileSeeds( CC.STATUS_UNKNOWN, num_to_prefetch )
+            
+        
+        file_seeds = [ file_seed ]
+        
+        file_seeds.extend( ( f_s for f_s in next_file_seeds if f_s != file_seed and not f_s.HasPrefetchedPreImportStatuses() ) )
+        
+        file_seeds_to_lookups = {}
+        
+        hash_types_to_hashes = collections.defaultdict( set )
+        all_lookup_urls = set()
+        
+        for f_s in file_seeds:
+            
+            ( hash_lookups, lookup_urls ) = f_s.GetPreImportStatusLookups( file_import_options )
+            
+            file_seeds_to_lookups[ f_s ] = [ ( 'hash', hash_type, hash ) for ( hash_type, hash ) in hash_lookups ] + [ ( 'url', lookup_url ) for lookup_url in lookup_urls ]
+            
+            for ( hash_type, hash ) in hash_lookups:
+                
+                hash_types_to_hashes[ hash_type ].add( hash )
+                
+            
+            all_lookup_urls.update( lookup_urls )
+            
+        
+        lookups_to_statuses = {}
+        
+        for ( hash_type, hashes ) in hash_types_to_hashes.items():
+            
+            hashes = list( hashes )
+            
+            statuses = HG.client_controller.Read( 'hash_statuses', hash_type, hashes, prefix = '{} hash recognised'.format( hash_type ) )
+            
+            for ( hash, status ) in zip( hashes, statuses ):
+                
+                lookups_to_statuses[ ( 'hash', hash_type, hash ) ] = status
+                
+            
+        
+        if len( all_lookup_urls ) > 0:
+            
+            urls_to_statuses = HG.client_controller.Read( 'url_statuses_bulk', list( all_lookup_urls ) )
+            
+            for ( lookup_url, statuses ) in urls_to_statuses.items():
+                
+                lookups_to_statuses[ ( 'url', lookup_url ) ] = statuses
+                
+            
+        
+        for ( f_s, lookups ) in file_seeds_to_lookups.items():
+            
+            f_s.SetPrefetchedPreImportStatuses( { lookup : lookups_to_statuses[ lookup ] for lookup in lookups if lookup in lookups_to_statuses } )
+            
+        
+    
     def RemoveFileSeeds( self, file_seeds_to_delete: typing.Iterable[ FileSeed ] ):
         
         with self._lock:
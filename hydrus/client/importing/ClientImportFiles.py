@@ -12,7 +12,7 @@ from hydrus.core.files.images import HydrusImageOpening
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientFiles
-from hydrus.client import ClientImageHandling
+from hydrus.client import ClientFilesMaintenanceWorkers
 from hydrus.client.importing.options import FileImportOptions
 
 class FileImportStatus( object ):
@@ -102,6 +102,178 @@ def CheckFileImportStatus( file_import_status: FileImportStatus ) -> FileImportS
     
     return file_import_status
     
+
+def GenerateFileImportInfo( path, mime, thumbnail_generation_settings, allows_decompression_bombs, force_pil, status_hook = None ):
+    
+    # all the heavy parsing for a file import. this does not talk to the controller, so the import pipeline can run it in a worker process
+    
+    if mime in HC.DECOMPRESSION_BOMB_IMAGES and not allows_decompression_bombs:
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job testing for decompression bomb' )
+            
+        
+        if HydrusImageHandling.IsDecompressionBomb( path ):
+            
+            if HG.file_import_report_mode:
+                
+                HydrusData.ShowText( 'File import job: it was a decompression bomb' )
+                
+            
+            raise HydrusExceptions.DecompressionBombException( 'Image seems to be a Decompression Bomb!' )
+            
+        
+    
+    if status_hook is not None:
+        
+        status_hook( 'generating file metadata' )
+        
+    
+    file_info = HydrusFileHandling.GetFileInfo( path, mime = mime )
+    
+    ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = file_info
+    
+    if HG.file_import_report_mode:
+        
+        HydrusData.ShowText( 'File import job file info: {}'.format( file_info ) )
+        
+    
+    thumbnail_bytes = None
+    blurhash = None
+    
+    if mime in HC.MIMES_WITH_THUMBNAILS:
+        
+        if status_hook is not None:
+            
+            status_hook( 'generating thumbnail' )
+            
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job generating thumbnail' )
+            
+        
+        ( bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent, percentage_in ) = thumbnail_generation_settings
+        
+        target_resolution = HydrusImageHandling.GetThumbnailResolution( ( width, height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
+        
+        thumbnail_numpy = HydrusFileHandling.GenerateThumbnailNumPy( path, target_resolution, mime, duration, num_frames, percentage_in = percentage_in )
+        
+        # this guy handles almost all his own exceptions now, so no need for clever catching. if it fails, we are prob talking an I/O failure, which is not a 'thumbnail failed' error
+        thumbnail_bytes = HydrusImageHandling.GenerateThumbnailBytesFromNumPy( thumbnail_numpy )
+        
+        try:
+            
+            blurhash = HydrusBlurhash.GetBlurhashFromNumPy( thumbnail_numpy )
+            
+        except:
+            
+            pass
+            
+        
+    
+    perceptual_hashes = None
+    
+    if mime in HC.FILES_THAT_HAVE_PERCEPTUAL_HASH:
+        
+        if status_hook is not None:
+            
+            status_hook( 'generating similar files metadata' )
+            
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job generating perceptual_hashes' )
+            
+        
+        perceptual_hashes = ClientFilesMaintenanceWorkers.GetPerceptualHashes( path, mime, force_pil )
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job generated {} perceptual_hashes: {}'.format( len( perceptual_hashes ), [ perceptual_hash.hex() for perceptual_hash in perceptual_hashes ] ) )
+            
+        
+    
+    if HG.file_import_report_mode:
+        
+        HydrusData.ShowText( 'File import job generating other hashes' )
+        
+    
+    if status_hook is not None:
+        
+        status_hook( 'generating additional hashes' )
+        
+    
+    extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( path )
+    
+    #
+    
+    has_transparency = ClientFiles.HasTransparency( path, mime, duration = duration, num_frames = num_frames, resolution = ( width, height ) )
+    
+    has_exif = False
+    
+    raw_pil_image = None
+    
+    if mime in HC.FILES_THAT_CAN_HAVE_EXIF:
+        
+        try:
+            
+            if raw_pil_image is None:
+                
+                raw_pil_image = HydrusImageOpening.RawOpenPILImage( path )
+                
+            
+            has_exif = HydrusImageMetadata.HasEXIF( raw_pil_image )
+            
+        except:
+            
+            pass
+            
+        
+    
+    has_human_readable_embedded_metadata = ClientFiles.HasHumanReadableEmbeddedMetadata( path, mime )
+    
+    has_icc_profile = False
+    
+    if mime in HC.FILES_THAT_CAN_HAVE_ICC_PROFILE:
+        
+        try:
+            
+            if mime == HC.APPLICATION_PSD:
+                
+                has_icc_profile = HydrusPSDHandling.PSDHasICCProfile( path )
+                
+            else:
+                
+                if raw_pil_image is None:
+                    
+                    raw_pil_image = HydrusImageOpening.RawOpenPILImage( path )
+                    
+                
+                has_icc_profile = HydrusImageMetadata.HasICCProfile( raw_pil_image )
+                
+            
+        except:
+            
+            pass
+            
+        
+    
+    #
+    
+    pixel_hash = None
+    
+    if mime in HC.FILES_THAT_CAN_HAVE_PIXEL_HASH and duration is None:
+        
+        pixel_hash = ClientFilesMaintenanceWorkers.GetPixelHash( path, mime )
+        
+    
+    file_modified_timestamp = HydrusFileHandling.GetFileModifiedTimestamp( path )
+    
+    return ( file_info, thumbnail_bytes, blurhash, perceptual_hashes, extra_hashes, has_transparency, has_exif, has_human_readable_embedded_metadata, has_icc_profile, pixel_hash, file_modified_timestamp )
+    
+
 class FileImportJob( object ):
     
     def __init__( self, temp_path: str, file_import_options: FileImportOptions.FileImportOptions ):
@@ -135,6 +307,47 @@ class FileImportJob( object ):
         self._blurhash = None
         
     
+    def AddExistingFileToDestinations( self ):
+        
+        # if the file is already in the database but not in all the desired file services, let's push content updates to make it happen
+        if self._pre_import_file_status.status == CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
+            
+            media_result = HG.client_controller.Read( 'media_result', self._pre_import_file_status.hash )
+            
+            destination_location_context = self._file_import_options.GetDestinationLocationContext()
+            
+            desired_file_service_keys = destination_location_context.current_service_keys
+            current_file_service_keys = media_result.GetLocationsManager().GetCurrent()
+            
+            file_service_keys_to_add_to = set( desired_file_service_keys ).difference( current_file_service_keys )
+            
+            if len( file_service_keys_to_add_to ) > 0:
+                
+                file_info_manager = media_result.GetFileInfoManager()
+                now = HydrusTime.GetNow()
+                
+                service_keys_to_content_updates = {}
+                
+                for service_key in file_service_keys_to_add_to:
+                    
+                    service_keys_to_content_updates[ service_key ] = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, now ) ) ]
+                    
+                
+                HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
+                
+            
+        
+    
+    def AddFileToClientFiles( self, status_hook = None ):
+        
+        if status_hook is not None:
+            
+            status_hook( 'copying file into file storage' )
+            
+        
+        HG.client_controller.client_files_manager.AddFile( self.GetHash(), self.GetMime(), self._temp_path, thumbnail_bytes = self._thumbnail_bytes )
+        
+    
     def CheckIsGoodToImport( self ):
         
         if HG.file_import_report_mode:
@@ -156,37 +369,13 @@ class FileImportJob( object ):
         
         self.GeneratePreImportHashAndStatus( status_hook = status_hook )
         
-        if self._pre_import_file_status.ShouldImport( self._file_import_options ):
+        if self.ShouldImport():
             
             self.GenerateInfo( status_hook = status_hook )
             
-            try:
-                
-                self.CheckIsGoodToImport()
-                
-                ok_to_go = True
-                
-            except HydrusExceptions.FileImportRulesException as e:
-                
-                ok_to_go = False
+            if self.IsGoodToImport():
                 
-                not_ok_file_import_status = self._pre_import_file_status.Duplicate()
-                
-                not_ok_file_import_status.status = CC.STATUS_VETOED
-                not_ok_file_import_status.note = str( e )
-                
-            
-            if ok_to_go:
-                
-                hash = self._pre_import_file_status.hash
-                mime = self._pre_import_file_status.mime
-                
-                if status_hook is not None:
-                    
-                    status_hook( 'copying file into file storage' )
-                    
-                
-                HG.client_controller.client_files_manager.AddFile( hash, mime, self._temp_path, thumbnail_bytes = self._thumbnail_bytes )
+                self.AddFileToClientFiles( status_hook = status_hook )
                 
                 if status_hook is not None:
                     
@@ -197,40 +386,10 @@ class FileImportJob( object ):
                 
                 self._post_import_file_status = HG.client_controller.WriteSynchronous( 'import_file', self )
                 
-            else:
-                
-                self._post_import_file_status = not_ok_file_import_status
-                
             
         else:
             
-            # if the file is already in the database but not in all the desired file services, let's push content updates to make it happen
-            if self._pre_import_file_status.status == CC.STATUS_SUCCESSFUL_BUT_REDUNDANT:
-                
-                media_result = HG.client_controller.Read( 'media_result', self._pre_import_file_status.hash )
-                
-                destination_location_context = self._file_import_options.GetDestinationLocationContext()
-                
-                desired_file_service_keys = destination_location_context.current_service_keys
-                current_file_service_keys = media_result.GetLocationsManager().GetCurrent()
-                
-                file_service_keys_to_add_to = set( desired_file_service_keys ).difference( current_file_service_keys )
-                
-                if len( file_service_keys_to_add_to ) > 0:
-                    
-                    file_info_manager = media_result.GetFileInfoManager()
-                    now = HydrusTime.GetNow()
-                    
-                    service_keys_to_content_updates = {}
-                    
-                    for service_key in file_service_keys_to_add_to:
-                        
-                        service_keys_to_content_updates[ service_key ] = [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( file_info_manager, now ) ) ]
-                        
-                    
-                    HG.client_controller.WriteSynchronous( 'content_updates', service_keys_to_content_updates )
-                    
-                
+            self.AddExistingFileToDestinations()
             
             self._post_import_file_status = self._pre_import_file_status.Duplicate()
             
@@ -245,7 +404,7 @@ class FileImportJob( object ):
         return self._post_import_file_status
         
     
-    def GeneratePreImportHashAndStatus( self, status_hook = None ):
+    def GenerateHash( self, status_hook = None ):
         
         if status_hook is not None:
             
@@ -259,223 +418,64 @@ class FileImportJob( object ):
             HydrusData.ShowText( 'File import job hash: {}'.format( hash.hex() ) )
             
         
-        if status_hook is not None:
-            
-            status_hook( 'checking for file status' )
-            
-        
-        self._pre_import_file_status = HG.client_controller.Read( 'hash_status', 'sha256', hash, prefix = 'file recognised' )
-        
-        if self._pre_import_file_status.hash is None:
-            
-            self._pre_import_file_status.hash = hash
-            
-        
-        self._pre_import_file_status = CheckFileImportStatus( self._pre_import_file_status )
-        
-        if HG.file_import_report_mode:
-            
-            HydrusData.ShowText( 'File import job pre-import status: {}'.format( self._pre_import_file_status.ToString() ) )
-            
+        self._pre_import_file_status.hash = hash
         
     
-    def GenerateInfo( self, status_hook = None ):
+    def GeneratePreImportHashAndStatus( self, status_hook = None ):
         
-        if self._pre_import_file_status.mime is None:
-            
-            if status_hook is not None:
-                
-                status_hook( 'generating filetype' )
-                
-            
-            mime = HydrusFileHandling.GetMime( self._temp_path )
-            
-            self._pre_import_file_status.mime = mime
-            
-        else:
-            
-            mime = self._pre_import_file_status.mime
-            
+        self.GenerateHash( status_hook = status_hook )
         
-        if HG.file_import_report_mode:
+        if status_hook is not None:
             
-            HydrusData.ShowText( 'File import job mime: {}'.format( HC.mime_string_lookup[ mime ] ) )
+            status_hook( 'checking for file status' )
             
         
-        new_options = HG.client_controller.new_options
+        file_import_status = HG.client_controller.Read( 'hash_status', 'sha256', self.GetHash(), prefix = 'file recognised' )
         
-        if mime in HC.DECOMPRESSION_BOMB_IMAGES and not self._file_import_options.AllowsDecompressionBombs():
-            
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job testing for decompression bomb' )
-                
-            
-            if HydrusImageHandling.IsDecompressionBomb( self._temp_path ):
-                
-                if HG.file_import_report_mode:
-                    
-                    HydrusData.ShowText( 'File import job: it was a decompression bomb' )
-                    
-                
-                raise HydrusExceptions.DecompressionBombException( 'Image seems to be a Decompression Bomb!' )
-                
-            
+        self.SetPreImportFileStatus( file_import_status )
         
-        if status_hook is not None:
-            
-            status_hook( 'generating file metadata' )
-            
+    
+    def GenerateInfo( self, status_hook = None ):
         
-        self._file_info = HydrusFileHandling.GetFileInfo( self._temp_path, mime = mime )
+        self.GenerateMime( status_hook = status_hook )
         
-        ( size, mime, width, height, duration, num_frames, has_audio, num_words ) = self._file_info
+        file_import_info = GenerateFileImportInfo( *self.GetGenerateInfoArgs(), status_hook = status_hook )
         
-        if HG.file_import_report_mode:
-            
-            HydrusData.ShowText( 'File import job file info: {}'.format( self._file_info ) )
-            
+        self.SetInfo( file_import_info )
         
-        if mime in HC.MIMES_WITH_THUMBNAILS:
-            
-            if status_hook is not None:
-                
-                status_hook( 'generating thumbnail' )
-                
-            
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job generating thumbnail' )
-                
-            
-            bounding_dimensions = HG.client_controller.options[ 'thumbnail_dimensions' ]
-            thumbnail_scale_type = HG.client_controller.new_options.GetInteger( 'thumbnail_scale_type' )
-            thumbnail_dpr_percent = HG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
-            
-            target_resolution = HydrusImageHandling.GetThumbnailResolution( ( width, height ), bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent )
-            
-            percentage_in = HG.client_controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
-            
-            thumbnail_numpy = HydrusFileHandling.GenerateThumbnailNumPy(self._temp_path, target_resolution, mime, duration, num_frames, percentage_in = percentage_in)
-
-            # this guy handles almost all his own exceptions now, so no need for clever catching. if it fails, we are prob talking an I/O failure, which is not a 'thumbnail failed' error
-            self._thumbnail_bytes = HydrusImageHandling.GenerateThumbnailBytesFromNumPy( thumbnail_numpy )
-            
-            try:
-                
-                self._blurhash = HydrusBlurhash.GetBlurhashFromNumPy( thumbnail_numpy )
-                
-            except:
-                
-                pass
-                
-            
-
+    
+    def GenerateMime( self, status_hook = None ):
         
-        if mime in HC.FILES_THAT_HAVE_PERCEPTUAL_HASH:
+        if self._pre_import_file_status.mime is None:
             
             if status_hook is not None:
                 
-                status_hook( 'generating similar files metadata' )
-                
-            
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job generating perceptual_hashes' )
+                status_hook( 'generating filetype' )
                 
             
-            self._perceptual_hashes = ClientImageHandling.GenerateShapePerceptualHashes( self._temp_path, mime )
-            
-            if HG.file_import_report_mode:
-                
-                HydrusData.ShowText( 'File import job generated {} perceptual_hashes: {}'.format( len( self._perceptual_hashes ), [ perceptual_hash.hex() for perceptual_hash in self._perceptual_hashes ] ) )
-                
+            self._pre_import_file_status.mime = HydrusFileHandling.GetMime( self._temp_path )
             
         
         if HG.file_import_report_mode:
             
-            HydrusData.ShowText( 'File import job generating other hashes' )
-            
-        
-        if status_hook is not None:
-            
-            status_hook( 'generating additional hashes' )
+            HydrusData.ShowText( 'File import job mime: {}'.format( HC.mime_string_lookup[ self._pre_import_file_status.mime ] ) )
             
         
-        self._extra_hashes = HydrusFileHandling.GetExtraHashesFromPath( self._temp_path )
-        
-        #
-        
-        self._has_transparency = ClientFiles.HasTransparency( self._temp_path, mime, duration = duration, num_frames = num_frames, resolution = ( width, height ) )
-        
-        has_exif = False
-        
-        raw_pil_image = None
-        
-        if mime in HC.FILES_THAT_CAN_HAVE_EXIF:
-            
-            try:
-                
-                if raw_pil_image is None:
-                    
-                    raw_pil_image = HydrusImageOpening.RawOpenPILImage( self._temp_path )
-                    
-                
-                has_exif = HydrusImageMetadata.HasEXIF( raw_pil_image )
-                
-            except:
-                
-                pass
-                
-            
-        
-        self._has_exif = has_exif
-        
-        self._has_human_readable_embedded_metadata = ClientFiles.HasHumanReadableEmbeddedMetadata( self._temp_path, mime )
-        
-        has_icc_profile = False
+    
+    def GetGenerateInfoArgs( self ):
         
-        if mime in HC.FILES_THAT_CAN_HAVE_ICC_PROFILE:
-            
-            try:
-                
-                if mime == HC.APPLICATION_PSD:
-                    
-                    has_icc_profile = HydrusPSDHandling.PSDHasICCProfile( self._temp_path )
-                    
-                else:
-                    
-                    if raw_pil_image is None:
-                        
-                        raw_pil_image = HydrusImageOpening.RawOpenPILImage( self._temp_path )
-                        
-                    
-                    has_icc_profile = HydrusImageMetadata.HasICCProfile( raw_pil_image )
-                    
-                
-            except:
-                
-                pass
-                
-            
+        bounding_dimensions = HG.client_controller.options[ 'thumbnail_dimensions' ]
+        thumbnail_scale_type = HG.client_controller.new_options.GetInteger( 'thumbnail_scale_type' )
+        thumbnail_dpr_percent = HG.client_controller.new_options.GetInteger( 'thumbnail_dpr_percent' )
+        percentage_in = HG.client_controller.new_options.GetInteger( 'video_thumbnail_percentage_in' )
         
-        self._has_icc_profile = has_icc_profile
+        thumbnail_generation_settings = ( bounding_dimensions, thumbnail_scale_type, thumbnail_dpr_percent, percentage_in )
         
-        #
+        allows_decompression_bombs = self._file_import_options.AllowsDecompressionBombs()
         
-        if mime in HC.FILES_THAT_CAN_HAVE_PIXEL_HASH and duration is None:
-            
-            try:
-                
-                self._pixel_hash = HydrusImageHandling.GetImagePixelHash( self._temp_path, mime )
-                
-            except:
-                
-                pass
-                
-            
+        force_pil = HG.client_controller.new_options.GetBoolean( 'load_images_with_pil' )
         
-        self._file_modified_timestamp = HydrusFileHandling.GetFileModifiedTimestamp( self._temp_path )
+        return ( self._temp_path, self.GetMime(), thumbnail_generation_settings, allows_decompression_bombs, force_pil )
         
     
     def GetExtraHashes( self ):
@@ -518,6 +518,21 @@ class FileImportJob( object ):
         return self._pixel_hash
         
     
+    def GetPostImportFileStatus( self ) -> FileImportStatus:
+        
+        return self._post_import_file_status
+        
+    
+    def GetPreImportFileStatus( self ) -> FileImportStatus:
+        
+        return self._pre_import_file_status
+        
+    
+    def GetTempPath( self ) -> str:
+        
+        return self._temp_path
+        
+    
     def HasEXIF( self ) -> bool:
         
         return self._has_exif
@@ -538,6 +553,29 @@ class FileImportJob( object ):
         return self._has_transparency
         
     
+    def IsGoodToImport( self ) -> bool:
+        
+        # if not, the post-import status is set to vetoed
+        
+        try:
+            
+            self.CheckIsGoodToImport()
+            
+            return True
+            
+        except HydrusExceptions.FileImportRulesException as e:
+            
+            not_ok_file_import_status = self._pre_import_file_status.Duplicate()
+            
+            not_ok_file_import_status.status = CC.STATUS_VETOED
+            not_ok_file_import_status.note = str( e )
+            
+            self._post_import_file_status = not_ok_file_import_status
+            
+            return False
+            
+        
+    
     def GetBlurhash( self ) -> str:
         
         return self._blurhash
@@ -555,3 +593,37 @@ class FileImportJob( object ):
             
         
     
+    def SetInfo( self, file_import_info ):
+        
+        ( self._file_info, self._thumbnail_bytes, self._blurhash, self._perceptual_hashes, self._extra_hashes, self._has_transparency, self._has_exif, self._has_human_readable_embedded_metadata, self._has_icc_profile, self._pixel_hash, self._file_modified_timestamp ) = file_import_info
+        
+    
+    def SetPostImportFileStatus( self, file_import_status: FileImportStatus ):
+        
+        self._post_import_file_status = file_import_status
+        
+    
+    def SetPreImportFileStatus( self, file_import_status: FileImportStatus ):
+        
+        hash = self.GetHash()
+        
+        self._pre_import_file_status = file_import_status
+        
+        if self._pre_import_file_status.hash is None:
+            
+            self._pre_import_file_status.hash = hash
+            
+        
+        self._pre_import_file_status = CheckFileImportStatus( self._pre_import_file_status )
+        
+        if HG.file_import_report_mode:
+            
+            HydrusData.ShowText( 'File import job pre-import status: {}'.format( self._pre_import_file_status.ToString() ) )
+            
+        
+    
+    def ShouldImport( self ) -> bool:
+        
+        return self._pre_import_file_status.ShouldImport( self._file_import_options )
+        
+    
@@ -0,0 +1,512 @@
+import os
+import queue
+import threading
+import time
+import typing
+
+from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
+from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusPaths
+from hydrus.core import HydrusTemp
+from hydrus.core import HydrusThreading
+
+from hydrus.client import ClientFilesMaintenanceWorkers
+from hydrus.client.importing import ClientImportFiles
+from hydrus.client.importing.options import FileImportOptions
+
+# a staged version of FileImportJob.DoWork for big batches of paths, like an import folder
+# each stage is its own thread, with a small bounded queue between each, so while one file is being hashed, the one before is being analysed and the one before that is being committed
+# the analysis stage, which is the CPU-heavy part, sends images to a pool of worker processes
+# every stage is first in first out, so the results come out in the same order the paths went in
+
+PIPELINE_STAGE_COPY_AND_HASH = 0
+PIPELINE_STAGE_STATUS = 1
+PIPELINE_STAGE_ANALYSIS = 2
+PIPELINE_STAGE_COMMIT = 3
+
+pipeline_stage_str_lookup = {
+    PIPELINE_STAGE_COPY_AND_HASH : 'copy and hash',
+    PIPELINE_STAGE_STATUS : 'status check',
+    PIPELINE_STAGE_ANALYSIS : 'analysis',
+    PIPELINE_STAGE_COMMIT : 'database commit'
+}
+
+class FileImportPipelineItem( object ):
+    
+    def __init__( self, key, path ):
+        
+        self.key = key
+        self.path = path
+        
+        self.os_file_handle = None
+        self.temp_path = None
+        
+        self.file_import_job = None
+        self.future = None
+        
+        # a FileImportStatus or an Exception, once we know how it went
+        self.result = None
+        
+    
+
+class FileImportPipeline( object ):
+    
+    def __init__( self, file_import_options: FileImportOptions.FileImportOptions, num_worker_processes: int, max_queue_size: int = 32, status_batch_size: int = 64, commit_batch_size: int = 16 ):
+        
+        self._file_import_options = file_import_options
+        self._num_worker_processes = num_worker_processes
+        self._max_queue_size = max_queue_size
+        self._status_batch_size = status_batch_size
+        self._commit_batch_size = commit_batch_size
+        
+        self._worker_pool = ClientFilesMaintenanceWorkers.FileMaintenanceWorkerPool()
+        
+        self._stages_to_num_done = { stage : 0 for stage in pipeline_stage_str_lookup.keys() }
+        self._stages_to_time_busy = { stage : 0.0 for stage in pipeline_stage_str_lookup.keys() }
+        
+        self._time_started = None
+        self._time_finished = None
+        
+        self._stop_feeding = threading.Event()
+        
+        self._lock = threading.Lock()
+        
+    
+    def _CleanUpItem( self, item: FileImportPipelineItem ):
+        
+        if item.temp_path is not None:
+            
+            HydrusTemp.CleanUpTempPath( item.os_file_handle, item.temp_path )
+            
+            item.os_file_handle = None
+            item.temp_path = None
+            
+        
+    
+    def _GetBatch( self, source_queue: queue.Queue, batch_size: int ):
+        
+        # wait for one, then take whatever else is already waiting, up to the batch size
+        
+        batch = [ source_queue.get() ]
+        
+        while len( batch ) < batch_size and batch[-1] is not None:
+            
+            try:
+                
+                batch.append( source_queue.get_nowait() )
+                
+            except queue.Empty:
+                
+                break
+                
+            
+        
+        return batch
+        
+    
+    def _RecordStageWork( self, stage: int, num_done: int, time_busy: float ):
+        
+        with self._lock:
+            
+            self._stages_to_num_done[ stage ] += num_done
+            self._stages_to_time_busy[ stage ] += time_busy
+            
+        
+    
+    def _WorkOnAnalysis( self, items: typing.List[ FileImportPipelineItem ] ):
+        
+        for item in items:
+            
+            if item.result is not None:
+                
+                continue
+                
+            
+            file_import_job = item.file_import_job
+            
+            if not file_import_job.ShouldImport():
+                
+                continue
+                
+            
+            try:
+                
+                file_import_job.GenerateMime()
+                
+                args = file_import_job.GetGenerateInfoArgs()
+                
+                if self._worker_pool.IsActive() and file_import_job.GetMime() in ClientFilesMaintenanceWorkers.MIMES_WORKERS_CAN_LOAD:
+                    
+                    # the commit stage will wait on this
+                    item.future = self._worker_pool.Submit( ClientImportFiles.GenerateFileImportInfo, *args )
+                    
+                else:
+                    
+                    file_import_job.SetInfo( ClientImportFiles.GenerateFileImportInfo( *args ) )
+                    
+                
+            except Exception as e:
+                
+                item.result = e
+                
+            
+        
+    
+    def _WorkOnCommit( self, items: typing.List[ FileImportPipelineItem ] ):
+        
+        items_to_import = []
+        
+        for item in items:
+            
+            if item.result is not None:
+                
+                continue
+                
+            
+            file_import_job = item.file_import_job
+            
+            try:
+                
+                if file_import_job.ShouldImport():
+                    
+                    if item.future is not None:
+                        
+                        file_import_job.SetInfo( self._worker_pool.GetResult( item.future ) )
+                        
+                        item.future = None
+                        
+                    
+                    if file_import_job.IsGoodToImport():
+                        
+                        file_import_job.AddFileToClientFiles()
+                        
+                        items_to_import.append( item )
+                        
+                    
+                else:
+                    
+                    file_import_job.AddExistingFileToDestinations()
+                    
+                    file_import_job.SetPostImportFileStatus( file_import_job.GetPreImportFileStatus().Duplicate() )
+                    
+                
+            except Exception as e:
+                
+                item.result = e
+                
+            
+        
+        if len( items_to_import ) > 0:
+            
+            try:
+                
+                self._file_import_options.CheckReadyToImport()
+                
+                file_import_statuses = HG.client_controller.WriteSynchronous( 'import_files', [ item.file_import_job for item in items_to_import ] )
+                
+                for ( item, file_import_status ) in zip( items_to_import, file_import_statuses ):
+                    
+                    item.file_import_job.SetPostImportFileStatus( file_import_status )
+                    
+                
+            except HydrusExceptions.ShutdownException:
+                
+                raise
+                
+            except Exception as e:
+                
+                # something in the batch was bad and the whole db job was rolled back. we'll go one by one to figure out which
+                
+                HydrusData.Print( 'A batch import of {} files failed, so they will be imported one by one. The batch error was:'.format( HydrusData.ToHumanInt( len( items_to_import ) ) ) )
+                
+                HydrusData.PrintException( e, do_wait = False )
+                
+                for item in items_to_import:
+                    
+                    try:
+                        
+                        self._file_import_options.CheckReadyToImport()
+                        
+                        file_import_status = HG.client_controller.WriteSynchronous( 'import_file', item.file_import_job )
+                        
+                        item.file_import_job.SetPostImportFileStatus( file_import_status )
+                        
+                    except Exception as e:
+                        
+                        item.result = e
+                        
+                    
+                
+            
+        
+        for item in items:
+            
+            if item.result is None:
+                
+                item.file_import_job.PubsubContentUpdates()
+                
+                item.result = item.file_import_job.GetPostImportFileStatus()
+                
+            
+            self._CleanUpItem( item )
+            
+        
+    
+    def _WorkOnCopyAndHash( self, items: typing.List[ FileImportPipelineItem ] ):
+        
+        for item in items:
+            
+            try:
+                
+                if not os.path.exists( item.path ):
+                    
+                    raise HydrusExceptions.VetoException( 'Source file does not exist!' )
+                    
+                
+                ( item.os_file_handle, item.temp_path ) = HydrusTemp.GetTempPath()
+                
+                HydrusPaths.MirrorFile( item.path, item.temp_path )
+                
+                item.file_import_job = ClientImportFiles.FileImportJob( item.temp_path, self._file_import_options )
+                
+                item.file_import_job.GenerateHash()
+                
+            except Exception as e:
+                
+                item.result = e
+                
+                self._CleanUpItem( item )
+                
+            
+        
+    
+    def _WorkOnStatus( self, items: typing.List[ FileImportPipelineItem ] ):
+        
+        items_to_check = [ item for item in items if item.result is None ]
+        
+        if len( items_to_check ) == 0:
+            
+            return
+            
+        
+        try:
+            
+            hashes = [ item.file_import_job.GetHash() for item in items_to_check ]
+            
+            file_import_statuses = HG.client_controller.Read( 'hash_statuses', 'sha256', hashes, prefix = 'file recognised' )
+            
+            for ( item, file_import_status ) in zip( items_to_check, file_import_statuses ):
+                
+                item.file_import_job.SetPreImportFileStatus( file_import_status )
+                
+            
+        except Exception as e:
+            
+            for item in items_to_check:
+                
+                item.result = e
+                
+            
+        
+    
+    def _THREADFeed( self, keys_and_paths, dest_queue: queue.Queue ):
+        
+        try:
+            
+            for ( key, path ) in keys_and_paths:
+                
+                if self._stop_feeding.is_set() or HydrusThreading.IsThreadShuttingDown():
+                    
+                    break
+                    
+                
+                dest_queue.put( FileImportPipelineItem( key, path ) )
+                
+            
+        finally:
+            
+            dest_queue.put( None )
+            
+        
+    
+    def _THREADStage( self, stage: int, work_callable, batch_size: int, source_queue: queue.Queue, dest_queue: queue.Queue ):
+        
+        while True:
+            
+            batch = self._GetBatch( source_queue, batch_size )
+            
+            done = batch[-1] is None
+            
+            items = [ item for item in batch if item is not None ]
+            
+            if len( items ) > 0:
+                
+                time_started = time.perf_counter()
+                
+                try:
+                    
+                    if HydrusThreading.IsThreadShuttingDown():
+                        
+                        raise HydrusExceptions.ShutdownException( 'Application shutting down!' )
+                        
+                    
+                    work_callable( items )
+                    
+                except Exception as e:
+                    
+                    # the work callables catch per-item problems themselves, so this is something like a shutdown. fail the batch, but keep the queues moving
+                    
+                    for item in items:
+                        
+                        if item.result is None:
+                            
+                            item.result = e
+                            
+                        
+                        self._CleanUpItem( item )
+                        
+                    
+                
+                self._RecordStageWork( stage, len( items ), time.perf_counter() - time_started )
+                
+                for item in items:
+                    
+                    dest_queue.put( item )
+                    
+                
+            
+            if done:
+                
+                dest_queue.put( None )
+                
+                return
+                
+            
+        
+    
+    def GetStageReport( self ) -> str:
+        
+        with self._lock:
+            
+            statements = []
+            
+            for ( stage, stage_str ) in pipeline_stage_str_lookup.items():
+                
+                num_done = self._stages_to_num_done[ stage ]
+                time_busy = self._stages_to_time_busy[ stage ]
+                
+                if time_busy > 0:
+                    
+                    rate_str = '{:.1f} files/s'.format( num_done / time_busy )
+                    
+                else:
+                    
+                    rate_str = 'n/a'
+                    
+                
+                statements.append( '{}: {} files, busy {:.1f}s, {}'.format( stage_str, HydrusData.ToHumanInt( num_done ), time_busy, rate_str ) )
+                
+            
+            if self._time_started is not None:
+                
+                time_finished = self._time_finished if self._time_finished is not None else time.perf_counter()
+                
+                time_taken = time_finished - self._time_started
+                
+                num_done = self._stages_to_num_done[ PIPELINE_STAGE_COMMIT ]
+                
+                if time_taken > 0:
+                    
+                    statements.append( 'overall: {} files in {:.1f}s, {:.1f} files/s'.format( HydrusData.ToHumanInt( num_done ), time_taken, num_done / time_taken ) )
+                    
+                
+            
+            return '; '.join( statements )
+            
+        
+    
+    def GetStagesToThroughput( self ) -> typing.Dict[ int, typing.Tuple[ int, float ] ]:
+        
+        with self._lock:
+            
+            return { stage : ( self._stages_to_num_done[ stage ], self._stages_to_time_busy[ stage ] ) for stage in pipeline_stage_str_lookup.keys() }
+            
+        
+    
+    def Import( self, keys_and_paths: typing.Iterable[ typing.Tuple[ typing.Any, str ] ] ):
+        
+        # yields ( key, FileImportStatus or Exception ) in the same order as the input
+        # if you stop iterating early, or call StopFeeding, whatever is already in the pipeline is finished off and the rest is left alone
+        
+        self._stop_feeding.clear()
+        
+        with self._lock:
+            
+            self._time_started = time.perf_counter()
+            self._time_finished = None
+            
+        
+        self._worker_pool.SetNumWorkers( self._num_worker_processes )
+        
+        queues = [ queue.Queue( maxsize = self._max_queue_size ) for i in range( 5 ) ]
+        
+        stages = [
+            ( PIPELINE_STAGE_COPY_AND_HASH, self._WorkOnCopyAndHash, 1 ),
+            ( PIPELINE_STAGE_STATUS, self._WorkOnStatus, self._status_batch_size ),
+            ( PIPELINE_STAGE_ANALYSIS, self._WorkOnAnalysis, 1 ),
+            ( PIPELINE_STAGE_COMMIT, self._WorkOnCommit, self._commit_batch_size )
+        ]
+        
+        HG.client_controller.CallToThreadLongRunning( self._THREADFeed, keys_and_paths, queues[0] )
+        
+        for ( i, ( stage, work_callable, batch_size ) ) in enumerate( stages ):
+            
+            HG.client_controller.CallToThreadLongRunning( self._THREADStage, stage, work_callable, batch_size, queues[ i ], queues[ i + 1 ] )
+            
+        
+        output_queue = queues[-1]
+        
+        pipeline_is_empty = False
+        
+        try:
+            
+            while True:
+                
+                item = output_queue.get()
+                
+                if item is None:
+                    
+                    pipeline_is_empty = True
+                    
+                    break
+                    
+                
+                yield ( item.key, item.result )
+                
+            
+        finally:
+            
+            self._stop_feeding.set()
+            
+            # if we were abandoned partway, we still have to drain the pipeline so the stages can finish and clean up their temp files
+            
+            while not pipeline_is_empty:
+                
+                pipeline_is_empty = output_queue.get() is None
+                
+            
+            self._worker_pool.Shutdown()
+            
+            with self._lock:
+                
+                self._time_finished = time.perf_counter()
+                
+            
+        
+    
+    def StopFeeding( self ):
+        
+        self._stop_feeding.set()
+        
+    
@@ -22,6 +22,7 @@ from hydrus.client import ClientThreading
 from hydrus.client.importing import ClientImportControl
 from hydrus.client.importing import ClientImporting
 from hydrus.client.importing import ClientImportFileSeeds
+from hydrus.client.importing import ClientImportFilesPipeline
 from hydrus.client.importing.options import FileImportOptions
 from hydrus.client.importing.options import TagImportOptions
 from hydrus.client.metadata import ClientMetadataMigration
@@ -772,19 +773,53 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
         # num_to_do is num currently unknown
         num_total = self._file_seed_cache.GetFileSeedCount( CC.STATUS_UNKNOWN )
         
+        num_worker_processes = HG.client_controller.new_options.GetInteger( 'file_import_num_worker_processes' )
+        
+        file_import_pipeline = None
+        file_seeds_and_results = None
+        
+        if num_worker_processes > 0 and num_total > 1:
+            
+            real_file_import_options = FileImportOptions.GetRealFileImportOptions( self._file_import_options, FileImportOptions.IMPORT_TYPE_QUIET )
+            
+            file_import_pipeline = ClientImportFilesPipeline.FileImportPipeline( real_file_import_options, num_worker_processes )
+            
+            file_seeds = self._file_seed_cache.GetFileSeeds( CC.STATUS_UNKNOWN )
+            
+            file_seeds_and_results = file_import_pipeline.Import( ( ( file_seed, file_seed.file_seed_data ) for file_seed in file_seeds ) )
+            
+        
         while True:
             
-            file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+            if file_seeds_and_results is None:
+                
+                file_seed = self._file_seed_cache.GetNextFileSeed( CC.STATUS_UNKNOWN )
+                
+            else:
+                
+                ( file_seed, file_import_status_or_exception ) = next( file_seeds_and_results, ( None, None ) )
+                
             
             p1 = HG.client_controller.new_options.GetBoolean( 'pause_import_folders_sync' ) or self._paused
             p2 = HydrusThreading.IsThreadShuttingDown()
             p3 = job_status.IsCancelled()
             
-            if file_seed is None or p1 or p2 or p3:
+            if file_seed is None:
                 
                 break
                 
             
+            if p1 or p2 or p3:
+                
+                if file_import_pipeline is None or p2:
+                    
+                    break
+                    
+                
+                # no new files go in, but we'll finish off and record what is already in the pipeline
+                file_import_pipeline.StopFeeding()
+                
+            
             did_work = True
             
             if HydrusTime.TimeHasPassed( time_to_save ):
@@ -801,7 +836,14 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
             
             path = file_seed.file_seed_data
             
-            file_seed.ImportPath( self._file_seed_cache, self._file_import_options, FileImportOptions.IMPORT_TYPE_QUIET )
+            if file_import_pipeline is None:
+                
+                file_seed.ImportPath( self._file_seed_cache, self._file_import_options, FileImportOptions.IMPORT_TYPE_QUIET )
+                
+            else:
+                
+                file_seed.ImportPathFromPipelineResult( self._file_seed_cache, real_file_import_options, file_import_status_or_exception )
+                
             
             if file_seed.status in CC.SUCCESSFUL_IMPORT_STATES:
                 
@@ -903,6 +945,14 @@ class ImportFolder( HydrusSerialisable.SerialisableBaseNamed ):
                 
             
         
+        if file_import_pipeline is not None:
+            
+            # if we stopped early, this finishes off whatever is still in there
+            file_seeds_and_results.close()
+            
+            HydrusData.Print( 'Import folder {} import pipeline: {}'.format( self._name, file_import_pipeline.GetStageReport() ) )
+            
+        
         if num_files_imported > 0:
             
             HydrusData.Print( 'Import folder ' + self._name + ' imported ' + HydrusData.ToHumanInt( num_files_imported ) + ' files.' )
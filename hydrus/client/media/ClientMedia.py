@@ -1,4 +1,5 @@
 import collections
+import numpy
 import random
 import typing
 
@@ -522,6 +523,8 @@ class MediaList( object ):
         self._singleton_media = set( self._sorted_media )
         self._collected_media = set()
         
+        self._collection_keys_to_collected_media = {}
+        
         self._RecalcHashes()
         
     
@@ -534,31 +537,9 @@ class MediaList( object ):
         
         keys_to_medias = collections.defaultdict( list )
         
-        namespaces_to_collect_by = list( media_collect.namespaces )
-        ratings_to_collect_by = list( media_collect.rating_service_keys )
-        tag_context = media_collect.tag_context
-        
         for media in medias:
             
-            if len( namespaces_to_collect_by ) > 0:
-                
-                namespace_key = media.GetTagsManager().GetNamespaceSlice( tag_context.service_key, namespaces_to_collect_by, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL )
-                
-            else:
-                
-                namespace_key = frozenset()
-                
-            
-            if len( ratings_to_collect_by ) > 0:
-                
-                rating_key = media.GetRatingsManager().GetStarRatingSlice( ratings_to_collect_by )
-                
-            else:
-                
-                rating_key = frozenset()
-                
-            
-            keys_to_medias[ ( namespace_key, rating_key ) ].append( media )
+            keys_to_medias[ self._GetCollectionKey( media_collect, media ) ].append( media )
             
         
         return keys_to_medias
@@ -574,6 +555,29 @@ class MediaList( object ):
         return MediaSingleton( media_result )
         
     
+    def _GetCollectionKey( self, media_collect: MediaCollect, media ):
+        
+        if len( media_collect.namespaces ) > 0:
+            
+            namespace_key = media.GetTagsManager().GetNamespaceSlice( media_collect.tag_context.service_key, media_collect.namespaces, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL )
+            
+        else:
+            
+            namespace_key = frozenset()
+            
+        
+        if len( media_collect.rating_service_keys ) > 0:
+            
+            rating_key = media.GetRatingsManager().GetStarRatingSlice( media_collect.rating_service_keys )
+            
+        else:
+            
+            rating_key = frozenset()
+            
+        
+        return ( namespace_key, rating_key )
+        
+    
     def _GetFirst( self ):
         
         if len( self._sorted_media ) > 0:
@@ -712,6 +716,159 @@ class MediaList( object ):
             
         
     
+    def _RecalcAfterRecollect( self ):
+        
+        self._RecalcHashes()
+        
+    
+    def _RecalcAfterResort( self ):
+        
+        self._RecalcHashes()
+        
+    
+    def _RecollectMediaByHashes( self, hashes ):
+        
+        # some files' collect-by metadata changed, so move just them between collections, rather than collecting everything again
+        
+        if not self._media_collect.DoesACollect():
+            
+            return
+            
+        
+        started = HydrusTime.GetNowPrecise()
+        
+        unmatched_key = ( frozenset(), frozenset() )
+        
+        removee_singleton_media = set()
+        touched_collected_media = set()
+        new_singleton_media = []
+        new_collected_media = set()
+        
+        for hash in hashes:
+            
+            if hash in self._hashes_to_singleton_media:
+                
+                current_collection = None
+                
+                singleton_media = self._hashes_to_singleton_media[ hash ]
+                
+            elif hash in self._hashes_to_collected_media:
+                
+                current_collection = self._hashes_to_collected_media[ hash ]
+                
+                singleton_media = current_collection._hashes_to_singleton_media[ hash ]
+                
+            else:
+                
+                continue
+                
+            
+            key = self._GetCollectionKey( self._media_collect, singleton_media )
+            
+            if key == unmatched_key and not self._media_collect.collect_unmatched:
+                
+                if current_collection is None:
+                    
+                    continue
+                    
+                
+                target_collection = None
+                
+            else:
+                
+                target_collection = self._collection_keys_to_collected_media.get( key, None )
+                
+                if target_collection is not None and target_collection not in self._collected_media and target_collection not in new_collected_media:
+                    
+                    # this collection was removed since we last collected
+                    
+                    target_collection = None
+                    
+                
+                if target_collection is not None and target_collection == current_collection:
+                    
+                    continue
+                    
+                
+            
+            media_result = singleton_media.GetMediaResult()
+            
+            if current_collection is None:
+                
+                removee_singleton_media.add( singleton_media )
+                
+            else:
+                
+                current_collection._RemoveMediaByHashes( { hash } )
+                
+                touched_collected_media.add( current_collection )
+                
+            
+            if key == unmatched_key and not self._media_collect.collect_unmatched:
+                
+                new_singleton_media.append( self._GenerateMediaSingleton( media_result ) )
+                
+            elif target_collection is None:
+                
+                target_collection = self._GenerateMediaCollection( [ media_result ] )
+                
+                self._collection_keys_to_collected_media[ key ] = target_collection
+                
+                new_collected_media.add( target_collection )
+                
+            else:
+                
+                target_collection.AddMedia( [ target_collection._GenerateMediaSingleton( media_result ) ] )
+                
+                touched_collected_media.add( target_collection )
+                
+            
+        
+        if len( removee_singleton_media ) == 0 and len( touched_collected_media ) == 0:
+            
+            return
+            
+        
+        removee_collected_media = { collection for collection in touched_collected_media if collection.HasNoMedia() }
+        
+        for collection in touched_collected_media.difference( removee_collected_media ):
+            
+            collection.RecalcInternals()
+            
+            collection.Sort()
+            
+        
+        if len( removee_collected_media ) > 0:
+            
+            self._collection_keys_to_collected_media = { key : collection for ( key, collection ) in self._collection_keys_to_collected_media.items() if collection not in removee_collected_media }
+            
+        
+        if len( removee_singleton_media ) > 0 or len( removee_collected_media ) > 0:
+            
+            self._RemoveMediaDirectly( removee_singleton_media, removee_collected_media )
+            
+        
+        # existing collections that changed may sort differently now
+        
+        self._sorted_media.resort_items( touched_collected_media.difference( removee_collected_media ).difference( new_collected_media ) )
+        
+        new_media = new_singleton_media + list( new_collected_media )
+        
+        self._singleton_media.update( new_singleton_media )
+        self._collected_media.update( new_collected_media )
+        
+        self._sorted_media.insert_items( new_media )
+        
+        self._RecalcAfterRecollect()
+        
+        if HG.profile_mode:
+            
+            summary = 'Recollected {} files, touching {} collections, in {}.'.format( HydrusData.ToHumanInt( len( hashes ) ), HydrusData.ToHumanInt( len( touched_collected_media ) + len( new_collected_media ) ), HydrusTime.TimeDeltaToPrettyTimeDelta( HydrusTime.GetNowPrecise() - started ) )
+            
+            HG.client_controller.PrintProfile( summary )
+            
+        
+    
     def _RemoveMediaByHashes( self, hashes ):
         
         if not isinstance( hashes, set ):
@@ -754,6 +911,18 @@ class MediaList( object ):
         self._RecalcAfterMediaRemove()
         
     
+    def _ResortMediaByHashes( self, hashes ):
+        
+        # some files' metadata changed, so just move them, rather than resorting everything
+        
+        affected_media = self._GetMedia( hashes )
+        
+        if self._sorted_media.resort_items( affected_media ):
+            
+            self._RecalcAfterResort()
+            
+        
+    
     def AddMedia( self, new_media ):
         
         new_media = FlattenMedia( new_media )
@@ -791,6 +960,8 @@ class MediaList( object ):
         self._selected_media = set()
         self._sorted_media = SortedList()
         
+        self._collection_keys_to_collected_media = {}
+        
         self._RecalcAfterMediaRemove()
         
     
@@ -803,6 +974,8 @@ class MediaList( object ):
         
         self._media_collect = media_collect
         
+        started = HydrusTime.GetNowPrecise()
+        
         flat_media = list( self._singleton_media )
         
         for media in self._collected_media:
@@ -832,7 +1005,9 @@ class MediaList( object ):
                     
                 
             
-            self._collected_media = { self._GenerateMediaCollection( [ media.GetMediaResult() for media in medias ] ) for ( key, medias ) in keys_to_medias.items() }# if len( medias ) > 1 }
+            self._collection_keys_to_collected_media = { key : self._GenerateMediaCollection( [ media.GetMediaResult() for media in medias ] ) for ( key, medias ) in keys_to_medias.items() }# if len( medias ) > 1 }
+            
+            self._collected_media = set( self._collection_keys_to_collected_media.values() )
             
         else:
             
@@ -840,11 +1015,21 @@ class MediaList( object ):
             
             self._collected_media = set()
             
+            self._collection_keys_to_collected_media = {}
+            
         
         self._sorted_media = SortedList( list( self._singleton_media ) + list( self._collected_media ) )
         
         self._RecalcHashes()
         
+        if HG.profile_mode:
+            
+            summary = 'Collected {} files into {} collections in {}.'.format( HydrusData.ToHumanInt( len( flat_media ) ), HydrusData.ToHumanInt( len( self._collected_media ) ), HydrusTime.TimeDeltaToPrettyTimeDelta( HydrusTime.GetNowPrecise() - started ) )
+            
+            HG.client_controller.PrintProfile( summary )
+            
+        
+        
     
     def DeletePending( self, service_key ):
         
@@ -1132,6 +1317,9 @@ class MediaList( object ):
             m.ProcessContentUpdates( service_keys_to_content_updates )
             
         
+        affected_hashes = set()
+        collect_affected_hashes = set()
+        
         for ( service_key, content_updates ) in service_keys_to_content_updates.items():
             
             for content_update in content_updates:
@@ -1140,6 +1328,13 @@ class MediaList( object ):
                 
                 hashes = content_update.GetHashes()
                 
+                affected_hashes.update( hashes )
+                
+                if data_type in ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_TYPE_RATINGS ):
+                    
+                    collect_affected_hashes.update( hashes )
+                    
+                
                 if data_type == HC.CONTENT_TYPE_FILES:
                     
                     if action in ( HC.CONTENT_UPDATE_DELETE, HC.CONTENT_UPDATE_DELETE_FROM_SOURCE_AFTER_MIGRATE ):
@@ -1174,6 +1369,16 @@ class MediaList( object ):
                 
             
         
+        if HG.client_controller.new_options.GetBoolean( 'keep_pages_collected_on_content_updates' ):
+            
+            self._RecollectMediaByHashes( collect_affected_hashes )
+            
+        
+        if HG.client_controller.new_options.GetBoolean( 'keep_pages_sorted_on_content_updates' ):
+            
+            self._ResortMediaByHashes( affected_hashes )
+            
+        
         self._RecalcAfterContentUpdates( service_keys_to_content_updates )
         
     
@@ -1225,11 +1430,9 @@ class MediaList( object ):
         
         media_sort_fallback = HG.client_controller.new_options.GetFallbackSort()
         
-        media_sort_fallback.Sort( self._location_context, self._sorted_media )
-        
-        # this is a stable sort, so the fallback order above will remain for equal items
+        # the fallback breaks ties in the primary sort
         
-        self._media_sort.Sort( self._location_context, self._sorted_media )
+        self._media_sort.Sort( self._location_context, self._sorted_media, media_sort_fallback = media_sort_fallback )
         
         self._RecalcHashes()
         
@@ -2686,7 +2889,7 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
                 
                 x_tags_manager = x.GetTagsManager()
                 
-                return [ x_tags_manager.GetComparableNamespaceSlice( self.tag_context.service_key, ( namespace, ), tag_display_type ) for namespace in namespaces ]
+                return tuple( ( x_tags_manager.GetComparableNamespaceSlice( self.tag_context.service_key, ( namespace, ), tag_display_type ) for namespace in namespaces ) )
                 
             
         elif sort_metadata == 'rating':
@@ -2787,7 +2990,7 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
         return sort_string
         
     
-    def Sort( self, location_context: ClientLocation.LocationContext, media_results_list: "SortedList" ):
+    def Sort( self, location_context: ClientLocation.LocationContext, media_results_list: "SortedList", media_sort_fallback: typing.Optional[ "MediaSort" ] = None ):
         
         ( sort_metadata, sort_data ) = self.sort_type
         
@@ -2797,9 +3000,14 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
             
         else:
             
-            ( sort_key, reverse ) = self.GetSortKeyAndReverse( location_context )
+            sort_levels = [ self.GetSortKeyAndReverse( location_context ) ]
             
-            media_results_list.sort( sort_key = sort_key, reverse = reverse )
+            if media_sort_fallback is not None:
+                
+                sort_levels.append( media_sort_fallback.GetSortKeyAndReverse( location_context ) )
+                
+            
+            media_results_list.sort_by_levels( sort_levels )
             
         
     
@@ -2847,6 +3055,73 @@ class MediaSort( HydrusSerialisable.SerialisableBase ):
 
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_MEDIA_SORT ] = MediaSort
 
+def GetSortKeyColumns( keys: list, reverse: bool ):
+    
+    # turns a list of python sort keys into numpy columns for lexsort, most significant first
+    # numbers and fixed-length tuples of numbers go straight in. anything else, like namespace slices, is swapped for its ordinal among the unique keys, so the only python comparisons are over the unique values
+    # returns None if we can't do it, in which case just do a normal python sort
+    
+    keys_array = None
+    
+    if len( keys ) > 0:
+        
+        first_key = keys[0]
+        
+        first_key_values = first_key if isinstance( first_key, tuple ) else ( first_key, )
+        
+        if False not in ( isinstance( value, ( int, float ) ) for value in first_key_values ):
+            
+            try:
+                
+                keys_array = numpy.array( keys )
+                
+            except ValueError:
+                
+                pass
+                
+            
+        
+    
+    if keys_array is not None and keys_array.dtype.kind in 'biuf' and keys_array.ndim in ( 1, 2 ):
+        
+        if keys_array.dtype.kind != 'f':
+            
+            keys_array = keys_array.astype( numpy.int64 )
+            
+        
+        if keys_array.ndim == 1:
+            
+            columns = [ keys_array ]
+            
+        else:
+            
+            columns = list( keys_array.T )
+            
+        
+    else:
+        
+        try:
+            
+            unique_keys = sorted( set( keys ) )
+            
+        except TypeError:
+            
+            return None
+            
+        
+        keys_to_ordinals = { key : ordinal for ( ordinal, key ) in enumerate( unique_keys ) }
+        
+        columns = [ numpy.array( list( map( keys_to_ordinals.__getitem__, keys ) ), dtype = numpy.int64 ) ]
+        
+    
+    if reverse:
+        
+        columns = [ - column for column in columns ]
+        
+    
+    return columns
+    
+
 class SortedList( object ):
     
     def __init__( self, initial_items = None ):
@@ -2856,8 +3131,8 @@ class SortedList( object ):
             initial_items = []
             
         
-        self._sort_key = None
-        self._sort_reverse = False
+        # ( sort_key, reverse ) pairs, most significant first
+        self._sort_levels = []
         
         self._sorted_list = list( initial_items )
         
@@ -2890,6 +3165,28 @@ class SortedList( object ):
         return len( self._sorted_list )
         
     
+    def _ComesBefore( self, key_a, key_b ):
+        
+        for ( a, b, ( sort_key, reverse ) ) in zip( key_a, key_b, self._sort_levels ):
+            
+            if reverse:
+                
+                ( a, b ) = ( b, a )
+                
+            
+            if a < b:
+                
+                return True
+                
+            elif b < a:
+                
+                return False
+                
+            
+        
+        return False
+        
+    
     def _DirtyIndices( self ):
         
         self._indices_dirty = True
@@ -2897,6 +3194,46 @@ class SortedList( object ):
         self._items_to_indices = {}
         
     
+    def _GetInsertIndex( self, key, before_equal = False ):
+        
+        # after anything equal by default, like a stable sort
+        
+        low = 0
+        high = len( self._sorted_list )
+        
+        while low < high:
+            
+            middle = ( low + high ) // 2
+            
+            middle_key = self._GetSortKey( self._sorted_list[ middle ] )
+            
+            if before_equal:
+                
+                goes_before_middle = not self._ComesBefore( middle_key, key )
+                
+            else:
+                
+                goes_before_middle = self._ComesBefore( key, middle_key )
+                
+            
+            if goes_before_middle:
+                
+                high = middle
+                
+            else:
+                
+                low = middle + 1
+                
+            
+        
+        return low
+        
+    
+    def _GetSortKey( self, item ):
+        
+        return [ sort_key( item ) for ( sort_key, reverse ) in self._sort_levels ]
+        
+    
     def _RecalcIndices( self ):
         
         self._items_to_indices = { item : index for ( index, item ) in enumerate( self._sorted_list ) }
@@ -2904,6 +3241,13 @@ class SortedList( object ):
         self._indices_dirty = False
         
     
+    def _ShouldResortEverything( self, num_items ):
+        
+        # each incremental item costs a binary search's worth of sort keys, so past a point it is quicker to do them all
+        
+        return num_items * 32 > len( self._sorted_list )
+        
+    
     def append_items( self, items ):
         
         if self._indices_dirty is None:
@@ -2940,9 +3284,21 @@ class SortedList( object ):
     
     def insert_items( self, items ):
         
-        self.append_items( items )
+        if len( self._sort_levels ) == 0 or self._ShouldResortEverything( len( items ) ):
+            
+            self.append_items( items )
+            
+            self.sort()
+            
+            return
+            
+        
+        for item in items:
+            
+            self._sorted_list.insert( self._GetInsertIndex( self._GetSortKey( item ) ), item )
+            
         
-        self.sort()
+        self._DirtyIndices()
         
     
     def remove_items( self, items ):
@@ -2966,27 +3322,136 @@ class SortedList( object ):
             return random.random()
             
         
-        self._sort_key = sort_key
+        self._sort_levels = [ ( sort_key, False ) ]
         
         random.shuffle( self._sorted_list )
         
         self._DirtyIndices()
         
     
+    def resort_items( self, items ) -> bool:
+        
+        # for when the sort data of a few items has changed. rather than sorting everything again, we pull them all out and binary search each back in
+        # they all have to come out first, since a binary search is only good against a list that is still in order, and any changed item left in there may not be
+        # returns True if anything moved
+        
+        if len( self._sort_levels ) == 0:
+            
+            return False
+            
+        
+        if self._indices_dirty:
+            
+            self._RecalcIndices()
+            
+        
+        items = list( { item for item in items if item in self._items_to_indices } )
+        
+        if len( items ) == 0:
+            
+            return False
+            
+        
+        if self._ShouldResortEverything( len( items ) ):
+            
+            old_sorted_list = list( self._sorted_list )
+            
+            self.sort()
+            
+            return self._sorted_list != old_sorted_list
+            
+        
+        items_to_old_indices = { item : self._items_to_indices[ item ] for item in items }
+        
+        for old_index in sorted( items_to_old_indices.values(), reverse = True ):
+            
+            del self._sorted_list[ old_index ]
+            
+        
+        # going in old order, an item that has not really moved can go back exactly where it was, as long as that is still among its equals
+        
+        items.sort( key = lambda item: items_to_old_indices[ item ] )
+        
+        for item in items:
+            
+            key = self._GetSortKey( item )
+            
+            first_ok_index = self._GetInsertIndex( key, before_equal = True )
+            last_ok_index = self._GetInsertIndex( key )
+            
+            new_index = min( max( items_to_old_indices[ item ], first_ok_index ), last_ok_index )
+            
+            self._sorted_list.insert( new_index, item )
+            
+        
+        self._RecalcIndices()
+        
+        # if all of these are back where they were, nothing else moved either
+        
+        return True in ( self._items_to_indices[ item ] != old_index for ( item, old_index ) in items_to_old_indices.items() )
+        
+    
     def sort( self, sort_key = None, reverse = False ):
         
         if sort_key is None:
             
-            sort_key = self._sort_key
-            reverse = self._sort_reverse
+            sort_levels = self._sort_levels
             
         else:
             
-            self._sort_key = sort_key
-            self._sort_reverse = reverse
+            sort_levels = [ ( sort_key, reverse ) ]
             
         
-        self._sorted_list.sort( key = sort_key, reverse = reverse )
+        self.sort_by_levels( sort_levels )
+        
+    
+    def sort_by_levels( self, sort_levels ):
+        
+        # sort_levels is ( sort_key, reverse ) pairs, most significant first, i.e. a primary sort with some tie-breakers
+        # we generate every key once, turn them into numpy columns, and lexsort, which is stable
+        
+        self._sort_levels = list( sort_levels )
+        
+        if len( self._sort_levels ) == 0:
+            
+            return
+            
+        
+        columns = []
+        
+        for ( sort_key, reverse ) in self._sort_levels:
+            
+            keys = [ sort_key( item ) for item in self._sorted_list ]
+            
+            level_columns = GetSortKeyColumns( keys, reverse )
+            
+            if level_columns is None:
+                
+                columns = None
+                
+                break
+                
+            
+            columns.extend( level_columns )
+            
+        
+        if columns is None:
+            
+            # a sort key numpy can't handle, so python stable sorts, least significant first
+            
+            for ( sort_key, reverse ) in reversed( self._sort_levels ):
+                
+                self._sorted_list.sort( key = sort_key, reverse = reverse )
+                
+            
+        else:
+            
+            # lexsort's primary key is the last one
+            
+            order = numpy.lexsort( columns[ : : -1 ] )
+            
+            self._sorted_list = list( map( self._sorted_list.__getitem__, order.tolist() ) )
+            
         
         self._DirtyIndices()
         
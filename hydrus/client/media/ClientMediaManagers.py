@@ -1,6 +1,11 @@
+import array
+import bisect
 import collections
+import gc
 import itertools
+import random
 import threading
+import tracemalloc
 import typing
 
 from hydrus.core import HydrusConstants as HC
@@ -18,6 +23,8 @@ from hydrus.client.search import ClientSearch
 
 class FileDuplicatesManager( object ):
     
+    __slots__ = ( 'media_group_king_hash', 'alternates_group_id', 'dupe_statuses_to_count' )
+    
     def __init__( self, media_group_king_hash, alternates_group_id, dupe_statuses_to_counts ):
         
         self.media_group_king_hash = media_group_king_hash
@@ -44,6 +51,9 @@ class FileDuplicatesManager( object ):
     
 class FileInfoManager( object ):
     
+    # there is one of each of these per file in a media result, and a big page can have a million of them, so no per-instance __dict__
+    __slots__ = ( 'hash_id', 'hash', 'size', 'mime', 'width', 'height', 'duration', 'num_frames', 'has_audio', 'num_words', 'original_mime', 'has_transparency', 'has_exif', 'has_human_readable_embedded_metadata', 'has_icc_profile', 'blurhash', 'pixel_hash' )
+    
     def __init__(
         self,
         hash_id: int,
@@ -123,6 +133,8 @@ class FileInfoManager( object ):
 
 class TimestampsManager( object ):
     
+    __slots__ = ( '_simple_timestamp_types_to_timestamps', '_domains_to_modified_timestamps', '_timestamp_types_to_service_keys_to_timestamps', '_canvas_types_to_last_viewed_timestamps', '_aggregate_modified_is_generated' )
+    
     def __init__( self ):
         
         self._simple_timestamp_types_to_timestamps = {}
@@ -532,6 +544,8 @@ class TimestampsManager( object ):
 
 class FileViewingStatsManager( object ):
     
+    __slots__ = ( '_timestamps_manager', 'views', 'viewtimes' )
+    
     def __init__(
         self,
         timestamps_manager: TimestampsManager,
@@ -709,6 +723,8 @@ class FileViewingStatsManager( object ):
 
 class LocationsManager( object ):
     
+    __slots__ = ( '_current', '_deleted', '_pending', '_petitioned', '_timestamps_manager', 'inbox', '_urls', '_service_keys_to_filenames', '_local_file_deletion_reason' )
+    
     def __init__(
         self,
         current: typing.Set[ bytes ],
@@ -1273,6 +1289,8 @@ class LocationsManager( object ):
     
 class NotesManager( object ):
     
+    __slots__ = ( '_names_to_notes', )
+    
     def __init__( self, names_to_notes: typing.Dict[ str, str ] ):
         
         self._names_to_notes = names_to_notes
@@ -1355,6 +1373,8 @@ class NotesManager( object ):
     
 class RatingsManager( object ):
     
+    __slots__ = ( '_service_keys_to_ratings', )
+    
     def __init__( self, service_keys_to_ratings: typing.Dict[ bytes, typing.Union[ None, float, int ] ] ):
         
         self._service_keys_to_ratings = service_keys_to_ratings
@@ -1460,17 +1480,107 @@ class RatingsManager( object ):
         
     
 
+EMPTY_TAG_IDS = array.array( 'I' )
+
+# the statuses are 0-3, so a service's tags are a tuple of four tag id arrays we index by status
+TAG_STATUSES = ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_PENDING, HC.CONTENT_STATUS_DELETED, HC.CONTENT_STATUS_PETITIONED )
+
+EMPTY_TAG_IDS_BY_STATUS = tuple( ( EMPTY_TAG_IDS for status in TAG_STATUSES ) )
+
+# tag id arrays are sorted and are never edited in place, only replaced, so it is fine for several statuses or tags managers to share one
+
+def AddTagIdToTagIds( tag_ids: array.array, tag_id: int ) -> array.array:
+    
+    i = bisect.bisect_left( tag_ids, tag_id )
+    
+    if i < len( tag_ids ) and tag_ids[ i ] == tag_id:
+        
+        return tag_ids
+        
+    
+    new_tag_ids = array.array( 'I', tag_ids )
+    
+    new_tag_ids.insert( i, tag_id )
+    
+    return new_tag_ids
+    
+
+def MergeTagIds( several_tag_ids: typing.Collection[ array.array ] ) -> array.array:
+    
+    several_tag_ids = [ tag_ids for tag_ids in several_tag_ids if len( tag_ids ) > 0 ]
+    
+    if len( several_tag_ids ) == 0:
+        
+        return EMPTY_TAG_IDS
+        
+    elif len( several_tag_ids ) == 1:
+        
+        ( tag_ids, ) = several_tag_ids
+        
+        return tag_ids
+        
+    
+    return array.array( 'I', sorted( set().union( *several_tag_ids ) ) )
+    
+
+def RemoveTagIdFromTagIds( tag_ids: array.array, tag_id: int ) -> array.array:
+    
+    if not TagIdsHasTagId( tag_ids, tag_id ):
+        
+        return tag_ids
+        
+    
+    if len( tag_ids ) == 1:
+        
+        return EMPTY_TAG_IDS
+        
+    
+    new_tag_ids = array.array( 'I', tag_ids )
+    
+    new_tag_ids.remove( tag_id )
+    
+    return new_tag_ids
+    
+
+def ShareTagIdsByStatus( tag_ids_by_status: tuple, other_tag_ids_by_status: tuple ) -> tuple:
+    
+    # display tags are usually the same as storage tags, so where they are, we'll point at the same arrays
+    
+    if tag_ids_by_status == other_tag_ids_by_status:
+        
+        return other_tag_ids_by_status
+        
+    
+    return tuple( ( other_tag_ids if tag_ids == other_tag_ids else tag_ids for ( tag_ids, other_tag_ids ) in zip( tag_ids_by_status, other_tag_ids_by_status ) ) )
+    
+
+def TagIdsHasTagId( tag_ids: array.array, tag_id: int ) -> bool:
+    
+    i = bisect.bisect_left( tag_ids, tag_id )
+    
+    return i < len( tag_ids ) and tag_ids[ i ] == tag_id
+    
+
 class TagsManager( object ):
     
+    __slots__ = ( '_tag_display_types_to_service_keys_to_tag_ids_by_status', '_storage_cache_is_dirty', '_display_cache_is_dirty', '_single_media_cache_is_dirty', '_selection_list_cache_is_dirty', '_lock' )
+    
     def __init__(
         self,
         service_keys_to_statuses_to_storage_tags: typing.Dict[ bytes, typing.Dict[ int, typing.Set[ str ] ] ],
         service_keys_to_statuses_to_display_tags: typing.Dict[ bytes, typing.Dict[ int, typing.Set[ str ] ] ]
         ):
         
-        self._tag_display_types_to_service_keys_to_statuses_to_tags = {
-            ClientTags.TAG_DISPLAY_STORAGE : service_keys_to_statuses_to_storage_tags,
-            ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL : service_keys_to_statuses_to_display_tags
+        # a big page can have a million of these, so we don't hold sets of strings. every service gets a tuple of sorted arrays of ids from the tag intern table
+        # storage and display actual are what we were given. the combined service and the display-filtered views are worked out from them when dirty
+        # sets of strings are only made when someone asks for tags, and we don't keep them
+        
+        service_keys_to_storage_tag_ids_by_status = self._ConvertToTagIds( service_keys_to_statuses_to_storage_tags )
+        service_keys_to_display_tag_ids_by_status = self._ConvertToTagIds( service_keys_to_statuses_to_display_tags, service_keys_to_statuses_to_storage_tags, service_keys_to_storage_tag_ids_by_status )
+        
+        self._tag_display_types_to_service_keys_to_tag_ids_by_status = {
+            ClientTags.TAG_DISPLAY_STORAGE : service_keys_to_storage_tag_ids_by_status,
+            ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL : service_keys_to_display_tag_ids_by_status
         }
         
         self._storage_cache_is_dirty = True
@@ -1481,7 +1591,69 @@ class TagsManager( object ):
         self._lock = threading.Lock()
         
     
-    def _GetServiceKeysToStatusesToTags( self, tag_display_type ):
+    def _ConvertToTagIds( self, service_keys_to_statuses_to_tags, service_keys_to_statuses_to_shareable_tags = None, service_keys_to_shareable_tag_ids_by_status = None ):
+        
+        # display tags are usually the same as storage tags, so where they are, we'll point at the same arrays rather than intern them again
+        
+        service_keys_to_tag_ids_by_status = {}
+        
+        for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+            
+            if service_key == CC.COMBINED_TAG_SERVICE_KEY:
+                
+                continue
+                
+            
+            if service_keys_to_shareable_tag_ids_by_status is not None and service_key in service_keys_to_shareable_tag_ids_by_status:
+                
+                statuses_to_shareable_tags = service_keys_to_statuses_to_shareable_tags[ service_key ]
+                shareable_tag_ids_by_status = service_keys_to_shareable_tag_ids_by_status[ service_key ]
+                
+            else:
+                
+                statuses_to_shareable_tags = {}
+                shareable_tag_ids_by_status = EMPTY_TAG_IDS_BY_STATUS
+                
+            
+            tag_ids_by_status = []
+            
+            for status in TAG_STATUSES:
+                
+                tags = statuses_to_tags.get( status, None )
+                
+                if tags is None or len( tags ) == 0:
+                    
+                    tag_ids = EMPTY_TAG_IDS
+                    
+                elif tags == statuses_to_shareable_tags.get( status, None ):
+                    
+                    tag_ids = shareable_tag_ids_by_status[ status ]
+                    
+                else:
+                    
+                    tag_ids = ClientTags.tag_intern_table.GetTagIds( tags )
+                    
+                
+                tag_ids_by_status.append( tag_ids )
+                
+            
+            tag_ids_by_status = tuple( tag_ids_by_status )
+            
+            if tag_ids_by_status == shareable_tag_ids_by_status:
+                
+                tag_ids_by_status = shareable_tag_ids_by_status
+                
+            
+            if tag_ids_by_status != EMPTY_TAG_IDS_BY_STATUS:
+                
+                service_keys_to_tag_ids_by_status[ service_key ] = tag_ids_by_status
+                
+            
+        
+        return service_keys_to_tag_ids_by_status
+        
+    
+    def _GetServiceKeysToTagIdsByStatus( self, tag_display_type ):
         
         # this gets called a lot, so we are hardcoding some gubbins to avoid too many method calls
         
@@ -1502,31 +1674,44 @@ class TagsManager( object ):
             self._RecalcDisplayFilteredCache( ClientTags.TAG_DISPLAY_SINGLE_MEDIA )
             
         
-        return self._tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ]
+        return self._tag_display_types_to_service_keys_to_tag_ids_by_status[ tag_display_type ]
         
     
-    def _RecalcStorageCache( self ):
+    def _GetTagIdsByStatus( self, service_key, tag_display_type ):
         
-        service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
+        service_keys_to_tag_ids_by_status = self._GetServiceKeysToTagIdsByStatus( tag_display_type )
         
-        # just combined service merge calculation
+        return service_keys_to_tag_ids_by_status.get( service_key, EMPTY_TAG_IDS_BY_STATUS )
+        
+    
+    def _GetTags( self, service_key, tag_display_type, statuses ):
+        
+        tag_ids_by_status = self._GetTagIdsByStatus( service_key, tag_display_type )
+        
+        return ClientTags.tag_intern_table.GetTags( itertools.chain.from_iterable( ( tag_ids_by_status[ status ] for status in statuses ) ) )
         
-        combined_statuses_to_tags = HydrusData.default_dict_set()
+    
+    def _MergeServices( self, service_keys_to_tag_ids_by_status ):
+        
+        several_tag_ids_by_status = [ tag_ids_by_status for ( service_key, tag_ids_by_status ) in service_keys_to_tag_ids_by_status.items() if service_key != CC.COMBINED_TAG_SERVICE_KEY ]
         
-        for ( service_key, source_statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
+        if len( several_tag_ids_by_status ) == 1:
             
-            if service_key == CC.COMBINED_TAG_SERVICE_KEY:
-                
-                continue
-                
+            ( tag_ids_by_status, ) = several_tag_ids_by_status
             
-            for ( status, tags ) in source_statuses_to_tags.items():
-                
-                combined_statuses_to_tags[ status ].update( tags )
-                
+            return tag_ids_by_status
             
         
-        service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+        return tuple( ( MergeTagIds( [ tag_ids_by_status[ status ] for tag_ids_by_status in several_tag_ids_by_status ] ) for status in TAG_STATUSES ) )
+        
+    
+    def _RecalcStorageCache( self ):
+        
+        service_keys_to_tag_ids_by_status = self._tag_display_types_to_service_keys_to_tag_ids_by_status[ ClientTags.TAG_DISPLAY_STORAGE ]
+        
+        # just combined service merge calculation
+        
+        service_keys_to_tag_ids_by_status[ CC.COMBINED_TAG_SERVICE_KEY ] = self._MergeServices( service_keys_to_tag_ids_by_status )
         
         #
         
@@ -1542,41 +1727,36 @@ class TagsManager( object ):
         
         # display tags don't have petitioned or deleted, so we just copy from storage
         
-        source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_STORAGE ]
+        source_service_keys_to_tag_ids_by_status = self._tag_display_types_to_service_keys_to_tag_ids_by_status[ ClientTags.TAG_DISPLAY_STORAGE ]
         
-        destination_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ]
+        destination_service_keys_to_tag_ids_by_status = self._tag_display_types_to_service_keys_to_tag_ids_by_status[ ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ]
         
-        combined_statuses_to_tags = HydrusData.default_dict_set()
+        combined_service_keys_to_tag_ids_by_status = {}
         
-        for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+        for ( service_key, source_tag_ids_by_status ) in source_service_keys_to_tag_ids_by_status.items():
             
             if service_key == CC.COMBINED_TAG_SERVICE_KEY:
                 
                 continue
                 
             
-            destination_statuses_to_tags = destination_service_keys_to_statuses_to_tags[ service_key ]
+            destination_tag_ids_by_status = destination_service_keys_to_tag_ids_by_status.get( service_key, EMPTY_TAG_IDS_BY_STATUS )
             
-            for status in ( HC.CONTENT_STATUS_DELETED, HC.CONTENT_STATUS_PETITIONED ):
-                
-                if status in destination_statuses_to_tags:
-                    
-                    del destination_statuses_to_tags[ status ]
-                    
-                
-                if status in source_statuses_to_tags:
-                    
-                    destination_statuses_to_tags[ status ] = set( source_statuses_to_tags[ status ] )
-                    
-                
+            destination_tag_ids_by_status = (
+                destination_tag_ids_by_status[ HC.CONTENT_STATUS_CURRENT ],
+                destination_tag_ids_by_status[ HC.CONTENT_STATUS_PENDING ],
+                source_tag_ids_by_status[ HC.CONTENT_STATUS_DELETED ],
+                source_tag_ids_by_status[ HC.CONTENT_STATUS_PETITIONED ]
+            )
             
-            for ( status, tags ) in destination_statuses_to_tags.items():
-                
-                combined_statuses_to_tags[ status ].update( tags )
-                
+            destination_tag_ids_by_status = ShareTagIdsByStatus( destination_tag_ids_by_status, source_tag_ids_by_status )
+            
+            destination_service_keys_to_tag_ids_by_status[ service_key ] = destination_tag_ids_by_status
+            
+            combined_service_keys_to_tag_ids_by_status[ service_key ] = destination_tag_ids_by_status
             
         
-        destination_service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+        destination_service_keys_to_tag_ids_by_status[ CC.COMBINED_TAG_SERVICE_KEY ] = self._MergeServices( combined_service_keys_to_tag_ids_by_status )
         
         #
         
@@ -1594,13 +1774,11 @@ class TagsManager( object ):
         
         tag_display_manager = HG.client_controller.tag_display_manager
         
-        source_service_keys_to_statuses_to_tags = self._tag_display_types_to_service_keys_to_statuses_to_tags[ ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ]
-        
-        destination_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+        source_service_keys_to_tag_ids_by_status = self._tag_display_types_to_service_keys_to_tag_ids_by_status[ ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ]
         
-        combined_statuses_to_tags = HydrusData.default_dict_set()
+        destination_service_keys_to_tag_ids_by_status = {}
         
-        for ( service_key, source_statuses_to_tags ) in source_service_keys_to_statuses_to_tags.items():
+        for ( service_key, source_tag_ids_by_status ) in source_service_keys_to_tag_ids_by_status.items():
             
             if service_key == CC.COMBINED_TAG_SERVICE_KEY:
                 
@@ -1609,41 +1787,35 @@ class TagsManager( object ):
             
             if tag_display_manager.FiltersTags( tag_display_type, service_key ):
                 
-                destination_statuses_to_tags = HydrusData.default_dict_set()
+                destination_tag_ids_by_status = []
                 
-                for ( status, source_tags ) in source_statuses_to_tags.items():
+                for source_tag_ids in source_tag_ids_by_status:
                     
-                    dest_tags = tag_display_manager.FilterTags( tag_display_type, service_key, source_tags )
+                    dest_tags = tag_display_manager.FilterTags( tag_display_type, service_key, ClientTags.tag_intern_table.GetTags( source_tag_ids ) )
                     
-                    if len( source_tags ) != len( dest_tags ):
+                    if len( source_tag_ids ) != len( dest_tags ):
                         
-                        if len( dest_tags ) > 0:
-                            
-                            destination_statuses_to_tags[ status ] = dest_tags
-                            
+                        destination_tag_ids_by_status.append( ClientTags.tag_intern_table.GetTagIds( dest_tags ) if len( dest_tags ) > 0 else EMPTY_TAG_IDS )
                         
                     else:
                         
-                        destination_statuses_to_tags[ status ] = source_tags
+                        destination_tag_ids_by_status.append( source_tag_ids )
                         
                     
                 
+                destination_tag_ids_by_status = tuple( destination_tag_ids_by_status )
+                
             else:
                 
-                destination_statuses_to_tags = source_statuses_to_tags
+                destination_tag_ids_by_status = source_tag_ids_by_status
                 
             
-            destination_service_keys_to_statuses_to_tags[ service_key ] = destination_statuses_to_tags
-            
-            for ( status, tags ) in destination_statuses_to_tags.items():
-                
-                combined_statuses_to_tags[ status ].update( tags )
-                
+            destination_service_keys_to_tag_ids_by_status[ service_key ] = destination_tag_ids_by_status
             
         
-        destination_service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+        destination_service_keys_to_tag_ids_by_status[ CC.COMBINED_TAG_SERVICE_KEY ] = self._MergeServices( destination_service_keys_to_tag_ids_by_status )
         
-        self._tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ] = destination_service_keys_to_statuses_to_tags
+        self._tag_display_types_to_service_keys_to_tag_ids_by_status[ tag_display_type ] = destination_service_keys_to_tag_ids_by_status
         
         #
         
@@ -1718,14 +1890,18 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+            service_keys_to_tag_ids_by_status = self._tag_display_types_to_service_keys_to_tag_ids_by_status[ ClientTags.TAG_DISPLAY_STORAGE ]
             
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+            if service_key not in service_keys_to_tag_ids_by_status:
+                
+                return
+                
             
-            if len( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] ) + len( statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] ) > 0:
+            ( current_tag_ids, pending_tag_ids, deleted_tag_ids, petitioned_tag_ids ) = service_keys_to_tag_ids_by_status[ service_key ]
+            
+            if len( pending_tag_ids ) + len( petitioned_tag_ids ) > 0:
                 
-                statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] = set()
-                statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ] = set()
+                service_keys_to_tag_ids_by_status[ service_key ] = ( current_tag_ids, EMPTY_TAG_IDS, deleted_tag_ids, EMPTY_TAG_IDS )
                 
                 self._SetDirty()
                 
@@ -1738,30 +1914,15 @@ class TagsManager( object ):
             
             dupe_tags_manager = TagsManager( {}, {} )
             
-            dupe_tag_display_types_to_service_keys_to_statuses_to_tags = dict()
+            # the tuples and arrays are never edited in place, so we only need new dicts
             
-            for ( tag_display_type, service_keys_to_statuses_to_tags ) in self._tag_display_types_to_service_keys_to_statuses_to_tags.items():
-                
-                dupe_service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+            for tag_display_type in ( ClientTags.TAG_DISPLAY_STORAGE, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ):
                 
-                for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items():
-                    
-                    dupe_statuses_to_tags = HydrusData.default_dict_set()
-                    
-                    for ( status, tags ) in statuses_to_tags.items():
-                        
-                        dupe_statuses_to_tags[ status ] = set( tags )
-                        
-                    
-                    dupe_service_keys_to_statuses_to_tags[ service_key ] = dupe_statuses_to_tags
-                    
+                service_keys_to_tag_ids_by_status = self._tag_display_types_to_service_keys_to_tag_ids_by_status[ tag_display_type ]
                 
-                dupe_tag_display_types_to_service_keys_to_statuses_to_tags[ tag_display_type ] = dupe_service_keys_to_statuses_to_tags
+                dupe_tags_manager._tag_display_types_to_service_keys_to_tag_ids_by_status[ tag_display_type ] = { service_key : tag_ids_by_status for ( service_key, tag_ids_by_status ) in service_keys_to_tag_ids_by_status.items() if service_key != CC.COMBINED_TAG_SERVICE_KEY }
                 
             
-            dupe_tags_manager._tag_display_types_to_service_keys_to_statuses_to_tags = dupe_tag_display_types_to_service_keys_to_statuses_to_tags
-            dupe_tags_manager._display_cache_is_dirty = self._display_cache_is_dirty
-            
             return dupe_tags_manager
             
         
@@ -1770,11 +1931,7 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-            
-            combined_tags = statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+            combined_tags = self._GetTags( service_key, tag_display_type, ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_PENDING ) )
             
             pairs = [ HydrusTags.SplitTag( tag ) for tag in combined_tags ]
             
@@ -1795,11 +1952,7 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-            
-            return statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]
+            return self._GetTags( service_key, tag_display_type, ( HC.CONTENT_STATUS_CURRENT, ) )
             
         
     
@@ -1807,11 +1960,7 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-            
-            return statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+            return self._GetTags( service_key, tag_display_type, ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_PENDING ) )
             
         
     
@@ -1819,11 +1968,7 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-            
-            return statuses_to_tags[ HC.CONTENT_STATUS_DELETED ]
+            return self._GetTags( service_key, tag_display_type, ( HC.CONTENT_STATUS_DELETED, ) )
             
         
     
@@ -1831,11 +1976,7 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-            
-            combined_tags = statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].union( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+            combined_tags = self._GetTags( service_key, tag_display_type, ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_PENDING ) )
             
             namespaces_with_colons = [ '{}:'.format( namespace ) for namespace in namespaces ]
             
@@ -1851,12 +1992,10 @@ class TagsManager( object ):
             
             num_tags = 0
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+            tag_ids_by_status = self._GetTagIdsByStatus( tag_context.service_key, tag_display_type )
             
-            statuses_to_tags = service_keys_to_statuses_to_tags[ tag_context.service_key ]
-            
-            if tag_context.include_current_tags: num_tags += len( statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] )
-            if tag_context.include_pending_tags: num_tags += len( statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] )
+            if tag_context.include_current_tags: num_tags += len( tag_ids_by_status[ HC.CONTENT_STATUS_CURRENT ] )
+            if tag_context.include_pending_tags: num_tags += len( tag_ids_by_status[ HC.CONTENT_STATUS_PENDING ] )
             
             return num_tags
             
@@ -1866,11 +2005,7 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-            
-            return statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
+            return self._GetTags( service_key, tag_display_type, ( HC.CONTENT_STATUS_PENDING, ) )
             
         
     
@@ -1878,11 +2013,7 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-            
-            return statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ]
+            return self._GetTags( service_key, tag_display_type, ( HC.CONTENT_STATUS_PETITIONED, ) )
             
         
     
@@ -1890,7 +2021,24 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+            service_keys_to_tag_ids_by_status = self._GetServiceKeysToTagIdsByStatus( tag_display_type )
+            
+            service_keys_to_statuses_to_tags = collections.defaultdict( HydrusData.default_dict_set )
+            
+            for ( service_key, tag_ids_by_status ) in service_keys_to_tag_ids_by_status.items():
+                
+                statuses_to_tags = HydrusData.default_dict_set()
+                
+                for ( status, tag_ids ) in zip( TAG_STATUSES, tag_ids_by_status ):
+                    
+                    if len( tag_ids ) > 0:
+                        
+                        statuses_to_tags[ status ] = ClientTags.tag_intern_table.GetTags( tag_ids )
+                        
+                    
+                
+                service_keys_to_statuses_to_tags[ service_key ] = statuses_to_tags
+                
             
             return service_keys_to_statuses_to_tags
             
@@ -1900,40 +2048,46 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+            tag_ids_by_status = self._GetTagIdsByStatus( service_key, tag_display_type )
             
-            if service_key in service_keys_to_statuses_to_tags:
-                
-                return service_keys_to_statuses_to_tags[ service_key ]
-                
-            else:
+            statuses_to_tags = collections.defaultdict( set )
+            
+            for ( status, tag_ids ) in zip( TAG_STATUSES, tag_ids_by_status ):
                 
-                return collections.defaultdict( set )
+                if len( tag_ids ) > 0:
+                    
+                    statuses_to_tags[ status ] = ClientTags.tag_intern_table.GetTags( tag_ids )
+                    
                 
             
+            return statuses_to_tags
+            
         
     
     def HasTag( self, tag, tag_display_type ):
         
-        with self._lock:
-            
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
-            
-            combined_statuses_to_tags = service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
-            
-            return tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] or tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ]
-            
+        return self.HasAnyOfTheseTags( ( tag, ), tag_display_type )
         
     
     def HasAnyOfTheseTags( self, tags, tag_display_type ):
         
+        # a tag that was never interned is not on anything, so no need to grow the table to check
+        
+        tag_ids = [ tag_id for tag_id in ( ClientTags.tag_intern_table.GetTagId( tag ) for tag in tags ) if tag_id is not None ]
+        
+        if len( tag_ids ) == 0:
+            
+            return False
+            
+        
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( tag_display_type )
+            combined_tag_ids_by_status = self._GetTagIdsByStatus( CC.COMBINED_TAG_SERVICE_KEY, tag_display_type )
             
-            combined_statuses_to_tags = service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ]
+            current_tag_ids = combined_tag_ids_by_status[ HC.CONTENT_STATUS_CURRENT ]
+            pending_tag_ids = combined_tag_ids_by_status[ HC.CONTENT_STATUS_PENDING ]
             
-            return True in ( tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ] or tag in combined_statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] for tag in tags )
+            return True in ( TagIdsHasTagId( current_tag_ids, tag_id ) or TagIdsHasTagId( pending_tag_ids, tag_id ) for tag_id in tag_ids )
             
         
     
@@ -1949,116 +2103,214 @@ class TagsManager( object ):
         
         with self._lock:
             
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
-            
             ( data_type, action, row ) = content_update.ToTuple()
             
             ( tag, hashes ) = row
             
-            if action == HC.CONTENT_UPDATE_ADD:
-                
-                statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].add( tag )
-                
-                statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].discard( tag )
-                statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].discard( tag )
-                
-            elif action == HC.CONTENT_UPDATE_DELETE:
-                
-                statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].add( tag )
+            ( tag_id, ) = ClientTags.tag_intern_table.GetTagIds( ( tag, ) )
+            
+            # this does not need to do clever sibling collapse or parent gubbins for the display tags, because in that case, the db forces tagsmanager refresh
+            # so this is just handling things if the content update has no sibling/parent tags
+            
+            for tag_display_type in ( ClientTags.TAG_DISPLAY_STORAGE, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ):
                 
-                statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].discard( tag )
-                statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ].discard( tag )
+                service_keys_to_tag_ids_by_status = self._tag_display_types_to_service_keys_to_tag_ids_by_status[ tag_display_type ]
                 
-            elif action == HC.CONTENT_UPDATE_PEND:
+                tag_ids_by_status = list( service_keys_to_tag_ids_by_status.get( service_key, EMPTY_TAG_IDS_BY_STATUS ) )
                 
-                if tag not in statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]:
+                def add( status ):
                     
-                    statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].add( tag )
+                    tag_ids_by_status[ status ] = AddTagIdToTagIds( tag_ids_by_status[ status ], tag_id )
                     
                 
-            elif action == HC.CONTENT_UPDATE_RESCIND_PEND:
-                
-                statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].discard( tag )
-                
-            elif action == HC.CONTENT_UPDATE_PETITION:
-                
-                if tag in statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]:
+                def discard( status ):
                     
-                    statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ].add( tag )
+                    tag_ids_by_status[ status ] = RemoveTagIdFromTagIds( tag_ids_by_status[ status ], tag_id )
                     
                 
-            elif action == HC.CONTENT_UPDATE_RESCIND_PETITION:
-                
-                statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ].discard( tag )
-                
-            elif action == HC.CONTENT_UPDATE_CLEAR_DELETE_RECORD:
+                if action == HC.CONTENT_UPDATE_ADD:
+                    
+                    add( HC.CONTENT_STATUS_CURRENT )
+                    
+                    discard( HC.CONTENT_STATUS_DELETED )
+                    discard( HC.CONTENT_STATUS_PENDING )
+                    
+                elif action == HC.CONTENT_UPDATE_DELETE:
+                    
+                    add( HC.CONTENT_STATUS_DELETED )
+                    
+                    discard( HC.CONTENT_STATUS_CURRENT )
+                    discard( HC.CONTENT_STATUS_PETITIONED )
+                    
+                elif action == HC.CONTENT_UPDATE_PEND:
+                    
+                    if not TagIdsHasTagId( tag_ids_by_status[ HC.CONTENT_STATUS_CURRENT ], tag_id ):
+                        
+                        add( HC.CONTENT_STATUS_PENDING )
+                        
+                    
+                elif action == HC.CONTENT_UPDATE_RESCIND_PEND:
+                    
+                    discard( HC.CONTENT_STATUS_PENDING )
+                    
+                elif action == HC.CONTENT_UPDATE_PETITION and tag_display_type == ClientTags.TAG_DISPLAY_STORAGE:
+                    
+                    if TagIdsHasTagId( tag_ids_by_status[ HC.CONTENT_STATUS_CURRENT ], tag_id ):
+                        
+                        add( HC.CONTENT_STATUS_PETITIONED )
+                        
+                    
+                elif action == HC.CONTENT_UPDATE_RESCIND_PETITION and tag_display_type == ClientTags.TAG_DISPLAY_STORAGE:
+                    
+                    discard( HC.CONTENT_STATUS_PETITIONED )
+                    
+                elif action == HC.CONTENT_UPDATE_CLEAR_DELETE_RECORD:
+                    
+                    discard( HC.CONTENT_STATUS_DELETED )
+                    
                 
-                statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].discard( tag )
+                service_keys_to_tag_ids_by_status[ service_key ] = tuple( tag_ids_by_status )
                 
             
             #
             
-            # this does not need to do clever sibling collapse or parent gubbins, because in that case, the db forces tagsmanager refresh
-            # so this is just handling things if the content update has no sibling/parent tags
-            
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL )
-            
-            statuses_to_tags = service_keys_to_statuses_to_tags[ service_key ]
+            self._SetDirty()
             
-            ( data_type, action, row ) = content_update.ToTuple()
+        
+    
+    def ResetService( self, service_key ):
+        
+        with self._lock:
             
-            ( tag, hashes ) = row
+            service_keys_to_tag_ids_by_status = self._tag_display_types_to_service_keys_to_tag_ids_by_status[ ClientTags.TAG_DISPLAY_STORAGE ]
             
-            if action == HC.CONTENT_UPDATE_ADD:
-                
-                statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].add( tag )
-                
-                statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].discard( tag )
-                statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].discard( tag )
-                
-            elif action == HC.CONTENT_UPDATE_DELETE:
-                
-                statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].add( tag )
+            if service_key in service_keys_to_tag_ids_by_status:
                 
-                statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ].discard( tag )
-                statuses_to_tags[ HC.CONTENT_STATUS_PETITIONED ].discard( tag )
+                del service_keys_to_tag_ids_by_status[ service_key ]
                 
-            elif action == HC.CONTENT_UPDATE_PEND:
-                
-                if tag not in statuses_to_tags[ HC.CONTENT_STATUS_CURRENT ]:
-                    
-                    statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].add( tag )
-                    
+                self._SetDirty()
                 
-            elif action == HC.CONTENT_UPDATE_RESCIND_PEND:
+            
+        
+    
+
+def BenchmarkTagsManagerMemory( nums_files = ( 100000, 1000000 ), num_tags_per_file = 20, num_different_tags = 50000, max_num_string_set_files = 100000 ):
+    
+    # synthetic files with current tags on two services and a few deleted and pending, measured with tracemalloc
+    # the old sets-of-strings layout (storage, display, and combined storage sets) is measured on at most max_num_string_set_files and scaled up, since at a million files it alone wants several GB
+    # the tags go in the real intern table and stay there for the rest of the session
+    
+    service_keys = ( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, HydrusData.GenerateKey() )
+    
+    all_tags = [ 'benchmark:tag {}'.format( i ) for i in range( num_different_tags ) ]
+    
+    tag_context = ClientSearch.TagContext()
+    
+    def generate_statuses_to_tags( r: random.Random ):
+        
+        service_keys_to_statuses_to_tags = {}
+        
+        for service_key in service_keys:
+            
+            statuses_to_tags = { HC.CONTENT_STATUS_CURRENT : set( r.sample( all_tags, num_tags_per_file // len( service_keys ) ) ) }
+            
+            if r.random() < 0.1:
                 
-                statuses_to_tags[ HC.CONTENT_STATUS_PENDING ].discard( tag )
+                statuses_to_tags[ HC.CONTENT_STATUS_DELETED ] = set( r.sample( all_tags, 2 ) )
                 
-            elif action == HC.CONTENT_UPDATE_CLEAR_DELETE_RECORD:
+            
+            if r.random() < 0.05:
                 
-                statuses_to_tags[ HC.CONTENT_STATUS_DELETED ].discard( tag )
+                statuses_to_tags[ HC.CONTENT_STATUS_PENDING ] = set( r.sample( all_tags, 1 ) )
                 
             
-            #
-            
-            self._SetDirty()
+            service_keys_to_statuses_to_tags[ service_key ] = statuses_to_tags
             
         
+        return service_keys_to_statuses_to_tags
+        
     
-    def ResetService( self, service_key ):
+    def measure( num_files, generate_one ):
         
-        with self._lock:
-            
-            service_keys_to_statuses_to_tags = self._GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE )
+        r = random.Random( num_files )
+        
+        gc.collect()
+        
+        ( memory_before, peak ) = tracemalloc.get_traced_memory()
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        things = [ generate_one( r ) for i in range( num_files ) ]
+        
+        time_took = HydrusTime.GetNowPrecise() - time_started
+        
+        gc.collect()
+        
+        ( memory_after, peak ) = tracemalloc.get_traced_memory()
+        
+        del things
+        
+        return ( memory_after - memory_before, time_took )
+        
+    
+    def generate_tags_manager( r: random.Random ):
+        
+        service_keys_to_statuses_to_tags = generate_statuses_to_tags( r )
+        
+        tags_manager = TagsManager( service_keys_to_statuses_to_tags, service_keys_to_statuses_to_tags )
+        
+        # the media result cache's tag index asks for combined storage tags on everything, so that cache is always built
+        tags_manager.GetNumTags( tag_context, ClientTags.TAG_DISPLAY_STORAGE )
+        
+        return tags_manager
+        
+    
+    def generate_string_sets( r: random.Random ):
+        
+        service_keys_to_statuses_to_tags = generate_statuses_to_tags( r )
+        
+        service_keys_to_statuses_to_display_tags = { service_key : { status : set( tags ) for ( status, tags ) in statuses_to_tags.items() } for ( service_key, statuses_to_tags ) in service_keys_to_statuses_to_tags.items() }
+        
+        combined_statuses_to_tags = collections.defaultdict( set )
+        
+        for statuses_to_tags in service_keys_to_statuses_to_tags.values():
             
-            if service_key in service_keys_to_statuses_to_tags:
+            for ( status, tags ) in statuses_to_tags.items():
                 
-                del service_keys_to_statuses_to_tags[ service_key ]
-                
-                self._SetDirty()
+                combined_statuses_to_tags[ status ].update( tags )
                 
             
         
+        service_keys_to_statuses_to_tags[ CC.COMBINED_TAG_SERVICE_KEY ] = combined_statuses_to_tags
+        
+        return ( service_keys_to_statuses_to_tags, service_keys_to_statuses_to_display_tags )
+        
+    
+    results = []
+    
+    tracemalloc.start()
+    
+    try:
+        
+        for num_files in nums_files:
+            
+            ( num_bytes, time_took ) = measure( num_files, generate_tags_manager )
+            
+            results.append( ( 'tag id arrays', num_files, num_bytes, time_took ) )
+            
+            num_string_set_files = min( num_files, max_num_string_set_files )
+            
+            ( num_bytes, time_took ) = measure( num_string_set_files, generate_string_sets )
+            
+            label = 'sets of strings' if num_string_set_files == num_files else 'sets of strings (scaled up from {})'.format( HydrusData.ToHumanInt( num_string_set_files ) )
+            
+            results.append( ( label, num_files, int( num_bytes * num_files / num_string_set_files ), time_took * num_files / num_string_set_files ) )
+            
+        
+    finally:
+        
+        tracemalloc.stop()
+        
+    
+    return results
     
@@ -6,8 +6,14 @@ from hydrus.core import HydrusGlobals as HG
 
 from hydrus.client.media import ClientMediaManagers
 
+# a page holds one of these, and its managers, for every file, so they all use __slots__ to keep a big page smaller
+# there is no columnar batch of media results. the managers are the source of truth for content updates, and page sort instead lexsorts numpy columns built from the media when it sorts, see ClientMedia.GetSortKeyColumns
+
 class MediaResult( object ):
     
+    # the media result cache holds these weakly
+    __slots__ = ( '_file_info_manager', '_tags_manager', '_timestamps_manager', '_locations_manager', '_ratings_manager', '_notes_manager', '_file_viewing_stats_manager', '__weakref__' )
+    
     def __init__(
         self,
         file_info_manager: ClientMediaManagers.FileInfoManager,
@@ -1,3 +1,4 @@
+import collections
 import threading
 import typing
 import weakref
@@ -9,6 +10,7 @@ from hydrus.core import HydrusLists
 from hydrus.core import HydrusThreading
 from hydrus.core import HydrusTime
 
+from hydrus.client import ClientConstants as CC
 from hydrus.client.media import ClientMediaResult
 from hydrus.client.metadata import ClientTags
 from hydrus.client.caches import ClientCachesBase
@@ -41,12 +43,72 @@ class MediaResultCache( object ):
         # then that won't be a chance for the weakvaluedict to step in. we'll keep this scratchpad of stuff
         self._fifo_timeout_cache = ClientCachesBase.DataCache( HG.client_controller, 'media result cache', 2048, 120 )
         
+        # an inverted index of the combined current and pending storage tags of everything we hold, so a sibling/parent change can find its files without scanning every media result
+        # the weakvaluedict drops dead media results without telling us, so this can hold some dead hash_ids. we filter them on read and prune them now and then
+        self._tags_to_hash_ids = collections.defaultdict( set )
+        self._hash_ids_to_indexed_tags = {}
+        
         HG.client_controller.sub( self, 'ProcessContentUpdates', 'content_updates_data' )
         HG.client_controller.sub( self, 'ProcessServiceUpdates', 'service_updates_data' )
         HG.client_controller.sub( self, 'NewForceRefreshTags', 'notify_new_force_refresh_tags_data' )
         HG.client_controller.sub( self, 'NewTagDisplayRules', 'notify_new_tag_display_rules' )
         
     
+    def _IndexMediaResult( self, media_result: ClientMediaResult.MediaResult ):
+        
+        tags = media_result.GetTagsManager().GetCurrentAndPending( CC.COMBINED_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE )
+        
+        self._SetIndexedTags( media_result.GetHashId(), tags )
+        
+    
+    def _PruneDeadIndexEntries( self ):
+        
+        dead_hash_ids = [ hash_id for hash_id in self._hash_ids_to_indexed_tags.keys() if hash_id not in self._hash_ids_to_media_results ]
+        
+        for hash_id in dead_hash_ids:
+            
+            self._SetIndexedTags( hash_id, set() )
+            
+        
+    
+    def _SetIndexedTags( self, hash_id: int, tags: typing.Collection[ str ] ):
+        
+        old_tags = self._hash_ids_to_indexed_tags.get( hash_id, frozenset() )
+        
+        tags = frozenset( tags )
+        
+        if tags == old_tags:
+            
+            return
+            
+        
+        for tag in old_tags.difference( tags ):
+            
+            hash_ids = self._tags_to_hash_ids[ tag ]
+            
+            hash_ids.discard( hash_id )
+            
+            if len( hash_ids ) == 0:
+                
+                del self._tags_to_hash_ids[ tag ]
+                
+            
+        
+        for tag in tags.difference( old_tags ):
+            
+            self._tags_to_hash_ids[ tag ].add( hash_id )
+            
+        
+        if len( tags ) == 0:
+            
+            del self._hash_ids_to_indexed_tags[ hash_id ]
+            
+        else:
+            
+            self._hash_ids_to_indexed_tags[ hash_id ] = tags
+            
+        
+    
     def AddMediaResults( self, media_results: typing.Iterable[ ClientMediaResult.MediaResult ] ):
         
         with self._lock:
@@ -61,6 +123,13 @@ class MediaResultCache( object ):
                 
                 self._fifo_timeout_cache.AddData( hash_id, MediaResultCacheContainer( media_result ) )
                 
+                self._IndexMediaResult( media_result )
+                
+            
+            if len( self._hash_ids_to_indexed_tags ) > 2 * len( self._hash_ids_to_media_results ) + 1024:
+                
+                self._PruneDeadIndexEntries()
+                
             
         
     
@@ -84,6 +153,8 @@ class MediaResultCache( object ):
             
             self._fifo_timeout_cache.DeleteData( hash_id )
             
+            self._SetIndexedTags( hash_id, set() )
+            
         
     
     def FilterFiles( self, hash_ids: typing.Collection[ int ] ):
@@ -98,7 +169,17 @@ class MediaResultCache( object ):
         
         with self._lock:
             
-            return { hash_id for ( hash_id, media_result ) in self._hash_ids_to_media_results.items() if media_result.GetTagsManager().HasAnyOfTheseTags( tags, ClientTags.TAG_DISPLAY_STORAGE ) }
+            hash_ids = set()
+            
+            for tag in tags:
+                
+                if tag in self._tags_to_hash_ids:
+                    
+                    hash_ids.update( self._tags_to_hash_ids[ tag ] )
+                    
+                
+            
+            return { hash_id for hash_id in hash_ids if hash_id in self._hash_ids_to_media_results }
             
         
     
@@ -162,6 +243,8 @@ class MediaResultCache( object ):
                             
                             media_result.SetTagsManager( tags_manager )
                             
+                            self._IndexMediaResult( media_result )
+                            
                         
                     
                 
@@ -208,6 +291,11 @@ class MediaResultCache( object ):
                             
                             media_result.ProcessContentUpdate( service_key, content_update )
                             
+                            if content_update.GetDataType() == HC.CONTENT_TYPE_MAPPINGS:
+                                
+                                self._IndexMediaResult( media_result )
+                                
+                            
                         
                     
                 
@@ -237,6 +325,8 @@ class MediaResultCache( object ):
                                 media_result.ResetService( service_key )
                                 
                             
+                            self._IndexMediaResult( media_result )
+                            
                         
                     
                 
@@ -255,6 +345,8 @@ class MediaResultCache( object ):
                     
                     media_result.SetTagsManager( tags_manager )
                     
+                    self._IndexMediaResult( media_result )
+                    
                 
             
         
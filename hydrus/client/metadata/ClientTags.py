@@ -1,4 +1,6 @@
+import array
 import collections
+import collections.abc
 import threading
 import typing
 
@@ -105,3 +107,82 @@ class ServiceKeysToTags( HydrusSerialisable.SerialisableBase, collections.defaul
         
     
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_SERVICE_KEYS_TO_TAGS ] = ServiceKeysToTags
+
+class TagInternTable( object ):
+    
+    # every TagsManager in the client stores its tags as sorted arrays of ids from here, so each tag string is held once no matter how many files have it
+    # these ids are nothing to do with the db's tag_ids. they only mean anything in this process, and the table only grows, but it is bounded by how many different tags the session has seen
+    
+    def __init__( self ):
+        
+        self._tags_to_tag_ids = {}
+        self._tag_ids_to_tags = []
+        
+        self._lock = threading.Lock()
+        
+    
+    def _InternTag( self, tag: str ) -> int:
+        
+        tag_id = self._tags_to_tag_ids.get( tag, None )
+        
+        if tag_id is None:
+            
+            tag_id = len( self._tag_ids_to_tags )
+            
+            # list first, so anyone who can see the id can already see the tag
+            self._tag_ids_to_tags.append( tag )
+            self._tags_to_tag_ids[ tag ] = tag_id
+            
+        
+        return tag_id
+        
+    
+    def GetNumTags( self ) -> int:
+        
+        return len( self._tag_ids_to_tags )
+        
+    
+    def GetTagId( self, tag: str ) -> typing.Optional[ int ]:
+        
+        # no interning here, so a lookup for a tag nothing has does not grow the table
+        
+        return self._tags_to_tag_ids.get( tag, None )
+        
+    
+    def GetTagIds( self, tags: typing.Iterable[ str ] ) -> array.array:
+        
+        if not isinstance( tags, collections.abc.Collection ):
+            
+            # we may go over these twice, so a generator has to be caught now
+            
+            tags = list( tags )
+            
+        
+        tags_to_tag_ids = self._tags_to_tag_ids
+        
+        try:
+            
+            # this is called for every tags manager we load, so the usual case, where we have seen everything before, gets a comprehension
+            
+            tag_ids = { tags_to_tag_ids[ tag ] for tag in tags }
+            
+        except KeyError:
+            
+            with self._lock:
+                
+                tag_ids = { self._InternTag( tag ) for tag in tags }
+                
+            
+        
+        return array.array( 'I', sorted( tag_ids ) )
+        
+    
+    def GetTags( self, tag_ids: typing.Iterable[ int ] ) -> typing.Set[ str ]:
+        
+        tag_ids_to_tags = self._tag_ids_to_tags
+        
+        return { tag_ids_to_tags[ tag_id ] for tag_id in tag_ids }
+        
+    
+
+tag_intern_table = TagInternTable()
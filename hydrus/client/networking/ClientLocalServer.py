@@ -115,7 +115,9 @@ class HydrusServiceClientAPI( HydrusClientService ):
         manage_database.putChild( b'mr_bones', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageDatabaseMrBones( self._service, self._client_requests_domain ) )
         manage_database.putChild( b'lock_on', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageDatabaseLockOn( self._service, self._client_requests_domain ) )
         manage_database.putChild( b'lock_off', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageDatabaseLockOff( self._service, self._client_requests_domain ) )
+        manage_database.putChild( b'get_cache_stats', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageDatabaseGetCacheStats( self._service, self._client_requests_domain ) )
         manage_database.putChild( b'get_client_options', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageDatabaseGetClientOptions( self._service, self._client_requests_domain ) )
+        manage_database.putChild( b'get_query_stats', ClientLocalServerResources.HydrusResourceClientAPIRestrictedManageDatabaseGetQueryStats( self._service, self._client_requests_domain ) )
         
         manage_file_relationships = NoResource()
         
@@ -1,7 +1,9 @@
+import base64
 import collections
 import collections.abc
 import json
 import os
+import re
 import threading
 import time
 import traceback
@@ -23,8 +25,10 @@ from twisted.web.static import File as FileResource
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusLists
 from hydrus.core import HydrusPaths
 from hydrus.core import HydrusTags
 from hydrus.core import HydrusTemp
@@ -42,6 +46,7 @@ from hydrus.client import ClientLocation
 from hydrus.client import ClientThreading
 from hydrus.client import ClientRendering
 from hydrus.client import ClientImageHandling
+from hydrus.client.caches import ClientCachesBase
 from hydrus.client.importing import ClientImportFiles
 from hydrus.client.importing.options import FileImportOptions
 from hydrus.client.media import ClientMedia
@@ -66,12 +71,15 @@ LOCAL_BOORU_STRING_PARAMS = set()
 LOCAL_BOORU_JSON_PARAMS = set()
 LOCAL_BOORU_JSON_BYTE_LIST_PARAMS = set()
 
+# every page of a streamed search runs the search again, so these are big
+STREAMED_SEARCH_PAGE_SIZE = 4096
+
 # if a variable name isn't defined here, a GET with it won't work
 
-CLIENT_API_INT_PARAMS = { 'file_id', 'file_sort_type', 'potentials_search_type', 'pixel_duplicates', 'max_hamming_distance', 'max_num_pairs' }
+CLIENT_API_INT_PARAMS = { 'file_id', 'file_sort_type', 'potentials_search_type', 'pixel_duplicates', 'max_hamming_distance', 'max_num_pairs', 'limit' }
 CLIENT_API_BYTE_PARAMS = { 'hash', 'destination_page_key', 'page_key', 'service_key', 'Hydrus-Client-API-Access-Key', 'Hydrus-Client-API-Session-Key', 'file_service_key', 'deleted_file_service_key', 'tag_service_key', 'tag_service_key_1', 'tag_service_key_2', 'rating_service_key', 'job_status_key' }
-CLIENT_API_STRING_PARAMS = { 'name', 'url', 'domain', 'search', 'service_name', 'reason', 'tag_display_type', 'source_hash_type', 'desired_hash_type' }
-CLIENT_API_JSON_PARAMS = { 'basic_permissions', 'tags', 'tags_1', 'tags_2', 'file_ids', 'download', 'only_return_identifiers', 'only_return_basic_information', 'include_blurhash', 'create_new_file_ids', 'detailed_url_information', 'hide_service_keys_tags', 'simple', 'file_sort_asc', 'return_hashes', 'return_file_ids', 'include_notes', 'include_services_object', 'notes', 'note_names', 'doublecheck_file_system', 'only_in_view' }
+CLIENT_API_STRING_PARAMS = { 'name', 'url', 'domain', 'search', 'service_name', 'reason', 'tag_display_type', 'source_hash_type', 'desired_hash_type', 'after', 'fields' }
+CLIENT_API_JSON_PARAMS = { 'basic_permissions', 'tags', 'tags_1', 'tags_2', 'file_ids', 'download', 'only_return_identifiers', 'only_return_basic_information', 'include_blurhash', 'create_new_file_ids', 'detailed_url_information', 'hide_service_keys_tags', 'simple', 'file_sort_asc', 'return_hashes', 'return_file_ids', 'include_notes', 'include_services_object', 'notes', 'note_names', 'doublecheck_file_system', 'only_in_view', 'stream', 'columnar' }
 CLIENT_API_JSON_BYTE_LIST_PARAMS = { 'file_service_keys', 'deleted_file_service_keys', 'hashes' }
 CLIENT_API_JSON_BYTE_DICT_PARAMS = { 'service_keys_to_tags', 'service_keys_to_actions_to_tags', 'service_keys_to_additional_tags' }
 
@@ -651,6 +659,41 @@ def ParseDuplicateSearch( request: HydrusServerRequest.HydrusRequest ):
     )
     
 
+def GenerateFileSearchAfterToken( sort_by: ClientMedia.MediaSort, after ) -> str:
+    
+    # an opaque (to the client) pointer to the last file of a page, which is the sort key and hash_id of that file
+    
+    ( sort_metadata, sort_data ) = sort_by.sort_type
+    ( sort_key, hash_id ) = after
+    
+    token_json = json.dumps( [ sort_data, sort_by.sort_order, sort_key, hash_id ] )
+    
+    return str( base64.urlsafe_b64encode( bytes( token_json, 'utf-8' ) ), 'ascii' )
+    
+
+def ParseFileSearchAfterToken( request: HydrusServerRequest.HydrusRequest, sort_by: ClientMedia.MediaSort ):
+    
+    after_token = request.parsed_request_args.GetValue( 'after', str )
+    
+    try:
+        
+        ( sort_data, sort_order, sort_key, hash_id ) = json.loads( str( base64.urlsafe_b64decode( bytes( after_token, 'ascii' ) ), 'utf-8' ) )
+        
+        hash_id = int( hash_id )
+        
+    except:
+        
+        raise HydrusExceptions.BadRequestException( 'Sorry, did not understand that "after" token!' )
+        
+    
+    if ( 'system', sort_data ) != sort_by.sort_type or sort_order != sort_by.sort_order:
+        
+        raise HydrusExceptions.BadRequestException( 'Sorry, that "after" token is from a search with a different sort! Please use the same file_sort_type and file_sort_asc as the search that gave it to you.' )
+        
+    
+    return ( sort_key, hash_id )
+    
+
 def ParseLocationContext( request: HydrusServerRequest.HydrusRequest, default: ClientLocation.LocationContext, deleted_allowed = True ):
     
     current_file_service_keys = set()
@@ -1228,11 +1271,15 @@ class HydrusResourceBooruThumbnail( HydrusResourceBooru ):
             
             client_files_manager = HG.client_controller.client_files_manager
             
-            path = client_files_manager.GetThumbnailPath( media_result )
-            
-            response_context_mime = HC.APPLICATION_UNKNOWN
-            
-            if not os.path.exists( path ):
+            try:
+                
+                thumbnail_bytes = client_files_manager.GetThumbnailBytes( media_result )
+                
+                response_context = HydrusServerResources.ResponseContext( 200, mime = HC.APPLICATION_UNKNOWN, body = thumbnail_bytes )
+                
+                return response_context
+                
+            except HydrusExceptions.FileMissingException:
                 
                 path = HydrusPaths.mimes_to_default_thumbnail_paths[ mime ]
                 
@@ -2780,6 +2827,84 @@ class HydrusResourceClientAPIRestrictedGetFiles( HydrusResourceClientAPIRestrict
 
 class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClientAPIRestrictedGetFiles ):
     
+    def _IterateStreamedSearchChunks( self, hash_ids, return_hashes, return_file_ids, do_paging, next_after_token ):
+        
+        # newline-delimited json, one object per file, so the client can start on the first files while we are still fetching hashes for the rest
+        # the last line is a footer, so the client knows it got everything
+        
+        yield from self._IterateStreamedSearchLines( hash_ids, return_hashes, return_file_ids )
+        
+        footer_dict = { 'num_files' : len( hash_ids ) }
+        
+        if do_paging:
+            
+            footer_dict[ 'next_after' ] = next_after_token
+            
+        
+        yield bytes( json.dumps( footer_dict ) + '\n', 'utf-8' )
+        
+    
+    def _IterateStreamedSearchLines( self, hash_ids, return_hashes, return_file_ids ):
+        
+        for block_of_hash_ids in HydrusLists.SplitListIntoChunks( hash_ids, 256 ):
+            
+            if return_hashes:
+                
+                hash_ids_to_hashes = HG.client_controller.Read( 'hash_ids_to_hashes', hash_ids = block_of_hash_ids )
+                
+            
+            lines = []
+            
+            for hash_id in block_of_hash_ids:
+                
+                line_dict = {}
+                
+                if return_file_ids:
+                    
+                    line_dict[ 'file_id' ] = hash_id
+                    
+                
+                if return_hashes:
+                    
+                    line_dict[ 'hash' ] = hash_ids_to_hashes[ hash_id ].hex()
+                    
+                
+                lines.append( json.dumps( line_dict ) )
+                
+            
+            yield bytes( '\n'.join( lines ) + '\n', 'utf-8' )
+            
+        
+    
+    def _IterateStreamedSearchPages( self, request: HydrusServerRequest.HydrusRequest, file_search_context, sort_by, job_status, return_hashes, return_file_ids ):
+        
+        # the same as a streamed full search, but we walk through the results a page at a time as we send them, rather than sorting and loading them all first
+        
+        streamed_hash_ids = []
+        
+        after = None
+        
+        while True:
+            
+            ( hash_ids, after ) = HG.client_controller.Read( 'file_query_ids_page', file_search_context, sort_by, job_status = job_status, limit = STREAMED_SEARCH_PAGE_SIZE, after = after )
+            
+            streamed_hash_ids.extend( hash_ids )
+            
+            yield from self._IterateStreamedSearchLines( hash_ids, return_hashes, return_file_ids )
+            
+            if after is None:
+                
+                break
+                
+            
+        
+        # like a normal search, the client can look at these files once it has the lot
+        
+        request.client_api_permissions.SetLastSearchResults( streamed_hash_ids )
+        
+        yield bytes( json.dumps( { 'num_files' : len( streamed_hash_ids ) } ) + '\n', 'utf-8' )
+        
+    
     def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
         
         location_context = ParseLocationContext( request, ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_LOCAL_MEDIA_SERVICE_KEY ) )
@@ -2797,6 +2922,11 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
         return_hashes = False
         return_file_ids = True
         
+        do_paging = 'limit' in request.parsed_request_args or 'after' in request.parsed_request_args
+        stream = request.parsed_request_args.GetValue( 'stream', bool, default_value = False )
+        
+        next_after_token = None
+        
         if len( predicates ) == 0:
             
             hash_ids = []
@@ -2843,11 +2973,59 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
             
             request.disconnect_callables.append( job_status.Cancel )
             
-            hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context, job_status = job_status, sort_by = sort_by, apply_implicit_limit = False )
+            if do_paging:
+                
+                if file_sort_type not in CC.PAGEABLE_SYSTEM_SORT_TYPES:
+                    
+                    raise HydrusExceptions.BadRequestException( 'Sorry, that sort type cannot be paged through! Try import time, or anything else that gives every file a fixed position.' )
+                    
+                
+                limit = request.parsed_request_args.GetValue( 'limit', int, default_value = None )
+                
+                if limit is not None and limit < 1:
+                    
+                    raise HydrusExceptions.BadRequestException( 'Sorry, the limit has to be at least 1!' )
+                    
+                
+                after = None
+                
+                if 'after' in request.parsed_request_args:
+                    
+                    after = ParseFileSearchAfterToken( request, sort_by )
+                    
+                
+                ( hash_ids, next_after ) = HG.client_controller.Read( 'file_query_ids_page', file_search_context, sort_by, job_status = job_status, limit = limit, after = after )
+                
+                if next_after is not None:
+                    
+                    next_after_token = GenerateFileSearchAfterToken( sort_by, next_after )
+                    
+                
+            elif stream and file_sort_type in CC.PAGEABLE_SYSTEM_SORT_TYPES:
+                
+                body_chunks = self._IterateStreamedSearchPages( request, file_search_context, sort_by, job_status, return_hashes, return_file_ids )
+                
+                response_context = HydrusServerResources.ResponseContext( 200, body_chunks = body_chunks, content_type = 'application/x-ndjson' )
+                
+                return response_context
+                
+            else:
+                
+                hash_ids = HG.client_controller.Read( 'file_query_ids', file_search_context, job_status = job_status, sort_by = sort_by, apply_implicit_limit = False )
+                
             
         
         request.client_api_permissions.SetLastSearchResults( hash_ids )
         
+        if stream:
+            
+            body_chunks = self._IterateStreamedSearchChunks( hash_ids, return_hashes, return_file_ids, do_paging, next_after_token )
+            
+            response_context = HydrusServerResources.ResponseContext( 200, body_chunks = body_chunks, content_type = 'application/x-ndjson' )
+            
+            return response_context
+            
+        
         body_dict = {}
         
         if return_hashes:
@@ -2863,6 +3041,11 @@ class HydrusResourceClientAPIRestrictedGetFilesSearchFiles( HydrusResourceClient
             body_dict[ 'file_ids' ] = list( hash_ids )
             
         
+        if do_paging:
+            
+            body_dict[ 'next_after' ] = next_after_token
+            
+        
         body = Dumps( body_dict, request.preferred_mime )
         
         response_context = HydrusServerResources.ResponseContext( 200, mime = request.preferred_mime, body = body )
@@ -3047,6 +3230,144 @@ class HydrusResourceClientAPIRestrictedGetFilesFileHashes( HydrusResourceClientA
         
     
 
+# what you can ask for in a file_metadata 'fields' projection, and which db column each needs
+FILE_METADATA_PROJECTION_FIELDS_TO_COLUMNS = {
+    'file_id' : 'file_id',
+    'hash' : 'hash',
+    'size' : 'size',
+    'mime' : 'mime',
+    'filetype_human' : 'mime',
+    'filetype_enum' : 'mime',
+    'ext' : 'mime',
+    'width' : 'width',
+    'height' : 'height',
+    'duration' : 'duration',
+    'num_frames' : 'num_frames',
+    'num_words' : 'num_words',
+    'has_audio' : 'has_audio',
+    'blurhash' : 'blurhash',
+    'pixel_hash' : 'pixel_hash',
+    'is_inbox' : 'is_inbox',
+    'known_urls' : 'known_urls'
+}
+
+FILE_METADATA_PROJECTION_TAG_FIELD_RE = re.compile( r'^(tags|display_tags)\[(.+)\]\.(current|pending|deleted|petitioned)$' )
+
+FILE_METADATA_PROJECTION_TAG_STATUSES = {
+    'current' : HC.CONTENT_STATUS_CURRENT,
+    'pending' : HC.CONTENT_STATUS_PENDING,
+    'deleted' : HC.CONTENT_STATUS_DELETED,
+    'petitioned' : HC.CONTENT_STATUS_PETITIONED
+}
+
+def ParseFileMetadataProjection( request: HydrusServerRequest.HydrusRequest ):
+    
+    # 'hash,size,tags[my tags].current' -> [ ( 'hash', 'hash', None ), ( 'size', 'size', None ), ( 'tags[my tags].current', None, ( service_key, tag_display_type, status ) ) ]
+    
+    fields_text = request.parsed_request_args.GetValue( 'fields', str )
+    
+    field_specs = []
+    
+    # service names can have commas, so we do not split inside the brackets
+    
+    current_field_text = ''
+    bracket_depth = 0
+    
+    for c in fields_text + ',':
+        
+        if c == ',' and bracket_depth == 0:
+            
+            field_text = current_field_text.strip()
+            
+            current_field_text = ''
+            
+            if field_text != '':
+                
+                field_specs.append( field_text )
+                
+            
+            continue
+            
+        
+        if c == '[':
+            
+            bracket_depth += 1
+            
+        elif c == ']':
+            
+            bracket_depth = max( 0, bracket_depth - 1 )
+            
+        
+        current_field_text += c
+        
+    
+    if len( field_specs ) == 0:
+        
+        raise HydrusExceptions.BadRequestException( 'Sorry, the fields parameter did not have any fields in it!' )
+        
+    
+    projection = []
+    
+    for field_spec in HydrusData.DedupeList( field_specs ):
+        
+        if field_spec in FILE_METADATA_PROJECTION_FIELDS_TO_COLUMNS:
+            
+            projection.append( ( field_spec, FILE_METADATA_PROJECTION_FIELDS_TO_COLUMNS[ field_spec ], None ) )
+            
+            continue
+            
+        
+        m = FILE_METADATA_PROJECTION_TAG_FIELD_RE.match( field_spec )
+        
+        if m is None:
+            
+            raise HydrusExceptions.BadRequestException( 'Sorry, did not understand the field "{}"! Fields are any of {}, or "tags[service].status" or "display_tags[service].status".'.format( field_spec, ', '.join( sorted( FILE_METADATA_PROJECTION_FIELDS_TO_COLUMNS.keys() ) ) ) )
+            
+        
+        ( tags_type, service_text, status_text ) = m.groups()
+        
+        tag_display_type = ClientTags.TAG_DISPLAY_STORAGE if tags_type == 'tags' else ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL
+        status = FILE_METADATA_PROJECTION_TAG_STATUSES[ status_text ]
+        
+        if tag_display_type == ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL and status not in ( HC.CONTENT_STATUS_CURRENT, HC.CONTENT_STATUS_PENDING ):
+            
+            raise HydrusExceptions.BadRequestException( 'Sorry, display tags only have current and pending!' )
+            
+        
+        try:
+            
+            tag_service_key = bytes.fromhex( service_text )
+            
+            if not HG.client_controller.services_manager.ServiceExists( tag_service_key ):
+                
+                raise HydrusExceptions.DataMissing()
+                
+            
+        except:
+            
+            try:
+                
+                tag_service_key = HG.client_controller.services_manager.GetServiceKeyFromName( HC.REAL_TAG_SERVICES, service_text )
+                
+            except HydrusExceptions.DataMissing:
+                
+                raise HydrusExceptions.BadRequestException( 'Could not find the tag service "{}"!'.format( service_text ) )
+                
+            
+        
+        service = CheckTagService( tag_service_key )
+        
+        if service.GetServiceType() not in HC.REAL_TAG_SERVICES:
+            
+            raise HydrusExceptions.BadRequestException( 'Sorry, you can only ask for tags from a local tag service or a tag repository!' )
+            
+        
+        projection.append( ( field_spec, None, ( tag_service_key, tag_display_type, status ) ) )
+        
+    
+    return projection
+    
+
 def AddMissingHashToFileMetadata( metadata: list, hash: bytes ):
     
     metadata_row = {
@@ -3059,6 +3380,88 @@ def AddMissingHashToFileMetadata( metadata: list, hash: bytes ):
 
 class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClientAPIRestrictedGetFiles ):
     
+    def _GetProjectedMetadata( self, request: HydrusServerRequest.HydrusRequest, hashes, hashes_to_hash_ids, columnar: bool ):
+        
+        # only the fields that were asked for, pulled as columns straight from the db
+        
+        projection = ParseFileMetadataProjection( request )
+        
+        found_hashes = [ hash for hash in hashes if hash in hashes_to_hash_ids ]
+        
+        hash_ids = [ hashes_to_hash_ids[ hash ] for hash in found_hashes ]
+        
+        # we already know the hashes
+        column_names = { column_name for ( field_spec, column_name, tag_field ) in projection if column_name not in ( None, 'hash' ) }
+        tag_fields = { tag_field for ( field_spec, column_name, tag_field ) in projection if tag_field is not None }
+        
+        ( columns, tag_columns ) = HG.client_controller.Read( 'file_metadata_columns', hash_ids, column_names, tag_fields )
+        
+        # cbor can carry bytes, so a columnar cbor response gets the raw hashes
+        hashes_as_bytes = columnar and request.preferred_mime == HC.APPLICATION_CBOR
+        
+        found_hashes_to_indices = { hash : i for ( i, hash ) in enumerate( found_hashes ) }
+        
+        output_columns = {}
+        
+        for ( field_spec, column_name, tag_field ) in projection:
+            
+            if field_spec == 'hash':
+                
+                output_columns[ field_spec ] = [ hash if hashes_as_bytes else hash.hex() for hash in hashes ]
+                
+                continue
+                
+            
+            if tag_field is not None:
+                
+                values = [ sorted( tags, key = HydrusTags.ConvertTagToSortable ) for tags in tag_columns[ tag_field ] ]
+                
+            else:
+                
+                values = columns[ column_name ]
+                
+                if field_spec in ( 'mime', 'filetype_human', 'filetype_enum', 'ext' ):
+                    
+                    values = [ HC.APPLICATION_UNKNOWN if mime is None else mime for mime in values ]
+                    
+                    if field_spec == 'mime':
+                        
+                        values = [ HC.mime_mimetype_string_lookup[ mime ] for mime in values ]
+                        
+                    elif field_spec == 'filetype_human':
+                        
+                        values = [ HC.mime_string_lookup[ mime ] for mime in values ]
+                        
+                    elif field_spec == 'ext':
+                        
+                        values = [ HC.mime_ext_lookup[ mime ] for mime in values ]
+                        
+                    
+                elif field_spec == 'known_urls':
+                    
+                    values = [ sorted( urls ) for urls in values ]
+                    
+                elif field_spec == 'pixel_hash' and not hashes_as_bytes:
+                    
+                    values = [ None if value is None else value.hex() for value in values ]
+                    
+                
+            
+            # and now line them up with what was asked for, with a gap for any hash we do not know
+            
+            output_columns[ field_spec ] = [ values[ found_hashes_to_indices[ hash ] ] if hash in found_hashes_to_indices else None for hash in hashes ]
+            
+        
+        if columnar:
+            
+            return output_columns
+            
+        
+        field_specs = [ field_spec for ( field_spec, column_name, tag_field ) in projection ]
+        
+        return [ { field_spec : output_columns[ field_spec ][ i ] for field_spec in field_specs } for i in range( len( hashes ) ) ]
+        
+    
     def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
         
         only_return_identifiers = request.parsed_request_args.GetValue( 'only_return_identifiers', bool, default_value = False )
@@ -3069,6 +3472,12 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
         include_services_object = request.parsed_request_args.GetValue( 'include_services_object', bool, default_value = True )
         create_new_file_ids = request.parsed_request_args.GetValue( 'create_new_file_ids', bool, default_value = False )
         include_blurhash = request.parsed_request_args.GetValue( 'include_blurhash', bool, default_value = False )
+        columnar = request.parsed_request_args.GetValue( 'columnar', bool, default_value = False )
+        
+        if columnar and 'fields' not in request.parsed_request_args:
+            
+            raise HydrusExceptions.BadRequestException( 'Sorry, columnar output needs a fields parameter!' )
+            
         
         hashes = ParseHashes( request )
         
@@ -3084,7 +3493,11 @@ class HydrusResourceClientAPIRestrictedGetFilesFileMetadata( HydrusResourceClien
         
         metadata = []
         
-        if only_return_identifiers:
+        if 'fields' in request.parsed_request_args:
+            
+            metadata = self._GetProjectedMetadata( request, hashes, hashes_to_hash_ids, columnar )
+            
+        elif only_return_identifiers:
             
             for hash in hashes:
                 
@@ -3465,22 +3878,22 @@ class HydrusResourceClientAPIRestrictedGetFilesGetThumbnail( HydrusResourceClien
         
         try:
             
-            path = HG.client_controller.client_files_manager.GetThumbnailPath( media_result )
-            
-            if not os.path.exists( path ):
-                
-                # not _supposed_ to happen, but it seems in odd situations it can
-                raise HydrusExceptions.FileMissingException()
-                
+            thumbnail_bytes = HG.client_controller.client_files_manager.GetThumbnailBytes( media_result )
             
         except HydrusExceptions.FileMissingException:
             
             path = HydrusPaths.mimes_to_default_thumbnail_paths[ media_result.GetMime() ]
             
+            mime = HydrusFileHandling.GetThumbnailMime( path )
+            
+            response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+            
+            return response_context
+            
         
-        mime = HydrusFileHandling.GetThumbnailMime( path )
+        mime = HydrusFileHandling.GetThumbnailMimeFromBytes( thumbnail_bytes )
         
-        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, path = path )
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body = thumbnail_bytes )
         
         return response_context
         
@@ -3956,6 +4369,46 @@ class HydrusResourceClientAPIRestrictedManageDatabaseMrBones( HydrusResourceClie
         
     
 
+class HydrusResourceClientAPIRestrictedManageDatabaseGetCacheStats( HydrusResourceClientAPIRestrictedManageDatabase ):
+    
+    BLOCKED_WHEN_BUSY = False
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        body_dict = { 'cache_stats' : ClientCachesBase.GetAllDataCacheStats() }
+        
+        mime = request.preferred_mime
+        body = Dumps( body_dict, mime )
+        
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body = body )
+        
+        return response_context
+        
+    
+
+class HydrusResourceClientAPIRestrictedManageDatabaseGetQueryStats( HydrusResourceClientAPIRestrictedManageDatabase ):
+    
+    BLOCKED_WHEN_BUSY = False
+    
+    def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
+        
+        limit = request.parsed_request_args.GetValue( 'limit', int, default_value = 20 )
+        
+        body_dict = {
+            'slow_query_mode' : HG.slow_query_mode,
+            'slow_query_min_time_ms' : HG.db_slow_query_min_time_ms,
+            'query_stats' : HydrusDBBase.GetQueryStats( limit = limit )
+        }
+        
+        mime = request.preferred_mime
+        body = Dumps( body_dict, mime )
+        
+        response_context = HydrusServerResources.ResponseContext( 200, mime = mime, body = body )
+        
+        return response_context
+        
+    
+
 class HydrusResourceClientAPIRestrictedManageDatabaseGetClientOptions( HydrusResourceClientAPIRestrictedManageDatabase ):
     
     def _threadDoGETJob( self, request: HydrusServerRequest.HydrusRequest ):
@@ -105,7 +105,7 @@ options = {}
 # Misc
 
 NETWORK_VERSION = 20
-SOFTWARE_VERSION = 557
+SOFTWARE_VERSION = 558
 CLIENT_API_VERSION = 58
 
 SERVER_THUMBNAIL_DIMENSIONS = ( 200, 200 )
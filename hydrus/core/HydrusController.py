@@ -17,6 +17,9 @@ from hydrus.core import HydrusTime
 from hydrus.core.interfaces import HydrusControllerInterface
 from hydrus.core.networking import HydrusNATPunch
 
+SLOW_QUERY_LOG_MAX_SIZE = 8 * 1024 * 1024
+SLOW_QUERY_LOG_NUM_OLD_LOGS = 3
+
 class HydrusController( HydrusControllerInterface.HydrusControllerInterface ):
     
     def __init__( self, db_dir ):
@@ -58,6 +61,8 @@ class HydrusController( HydrusControllerInterface.HydrusControllerInterface ):
         
         self._call_to_thread_lock = threading.Lock()
         
+        self._slow_query_log_lock = threading.Lock()
+        
         self._timestamps_lock = threading.Lock()
         
         self._timestamps = collections.defaultdict( lambda: 0 )
@@ -432,6 +437,28 @@ class HydrusController( HydrusControllerInterface.HydrusControllerInterface ):
             
         
     
+    def DebugShowDBJobTimings( self ):
+        
+        summary = self.db.GetJobTimings().GetPrettySummary()
+        
+        HydrusData.ShowText( 'db job timings:' )
+        HydrusData.ShowText( summary )
+        
+        ( db_status, job_name, lanes_to_status ) = self.db.GetStatus()
+        
+        lines = []
+        
+        for ( lane, ( depth, percentiles ) ) in lanes_to_status.items():
+            
+            pretty_percentiles = ', '.join( ( 'p{} {}'.format( percentile, 'n/a' if wait_time is None else HydrusTime.TimeDeltaToPrettyTimeDelta( wait_time ) ) for ( percentile, wait_time ) in sorted( percentiles.items() ) ) )
+            
+            lines.append( '{}: {} waiting, recent queue waits {}'.format( lane, HydrusData.ToHumanInt( depth ), pretty_percentiles ) )
+            
+        
+        HydrusData.ShowText( 'db job lanes:' )
+        HydrusData.ShowText( os.linesep.join( lines ) )
+        
+    
     def DebugShowScheduledJobs( self ):
         
         summary = self._fast_job_scheduler.GetPrettyJobSummary()
@@ -723,6 +750,48 @@ class HydrusController( HydrusControllerInterface.HydrusControllerInterface ):
             
         
     
+    def PrintSlowQuery( self, module_name, query, duration, num_rows, plan_lines ):
+        
+        slow_query_log_filename = '{} slow queries.log'.format( self._name )
+        
+        slow_query_log_path = os.path.join( self.db_dir, slow_query_log_filename )
+        
+        with self._slow_query_log_lock:
+            
+            if os.path.exists( slow_query_log_path ) and os.path.getsize( slow_query_log_path ) > SLOW_QUERY_LOG_MAX_SIZE:
+                
+                for i in range( SLOW_QUERY_LOG_NUM_OLD_LOGS - 1, 0, -1 ):
+                    
+                    old_log_path = '{}.{}'.format( slow_query_log_path, i )
+                    
+                    if os.path.exists( old_log_path ):
+                        
+                        os.replace( old_log_path, '{}.{}'.format( slow_query_log_path, i + 1 ) )
+                        
+                    
+                
+                os.replace( slow_query_log_path, '{}.1'.format( slow_query_log_path ) )
+                
+            
+            with open( slow_query_log_path, 'a', encoding = 'utf-8' ) as f:
+                
+                prefix = time.strftime( '%Y/%m/%d %H:%M:%S: ' )
+                
+                f.write( prefix + '{} took {}, {} rows'.format( module_name, HydrusTime.TimeDeltaToPrettyTimeDelta( duration ), HydrusData.ToHumanInt( num_rows ) ) )
+                f.write( '\n' )
+                f.write( query )
+                
+                for plan_line in plan_lines:
+                    
+                    f.write( '\n' )
+                    f.write( '    ' + plan_line )
+                    
+                
+                f.write( '\n\n' )
+                
+            
+        
+    
     def Read( self, action, *args, **kwargs ):
         
         return self._Read( action, *args, **kwargs )
@@ -1,9 +1,12 @@
 import collections
+import copy
 import os
 import queue
 import sqlite3
+import threading
 import traceback
 import time
+import urllib.request
 
 from hydrus.core import HydrusDBBase
 from hydrus.core import HydrusConstants as HC
@@ -15,6 +18,79 @@ from hydrus.core import HydrusPaths
 from hydrus.core import HydrusProfiling
 from hydrus.core import HydrusTime
 
+JOB_LANE_INTERACTIVE = 'interactive'
+JOB_LANE_API = 'api'
+JOB_LANE_BACKGROUND = 'background'
+
+# highest priority first
+JOB_LANES = [ JOB_LANE_INTERACTIVE, JOB_LANE_API, JOB_LANE_BACKGROUND ]
+
+_thread_job_lanes = threading.local()
+
+def GetThreadJobLane():
+    
+    return getattr( _thread_job_lanes, 'lane', JOB_LANE_INTERACTIVE )
+    
+
+class JobLaneContext( object ):
+    
+    def __init__( self, lane ):
+        
+        self._lane = lane
+        self._previous_lane = None
+        
+    
+    def __enter__( self ):
+        
+        self._previous_lane = GetThreadJobLane()
+        
+        _thread_job_lanes.lane = self._lane
+        
+    
+    def __exit__( self, exc_type, exc_val, exc_tb ):
+        
+        _thread_job_lanes.lane = self._previous_lane
+        
+        return False
+        
+    
+
+def _MakeCoalesceKeyComponent( obj ):
+    
+    if isinstance( obj, ( list, tuple ) ):
+        
+        return ( type( obj ), tuple( ( _MakeCoalesceKeyComponent( item ) for item in obj ) ) )
+        
+    elif isinstance( obj, ( set, frozenset ) ):
+        
+        return ( type( obj ), frozenset( ( _MakeCoalesceKeyComponent( item ) for item in obj ) ) )
+        
+    elif isinstance( obj, dict ):
+        
+        return ( type( obj ), frozenset( ( ( _MakeCoalesceKeyComponent( key ), _MakeCoalesceKeyComponent( value ) ) for ( key, value ) in obj.items() ) ) )
+        
+    else:
+        
+        hash( obj )
+        
+        return ( type( obj ), obj )
+        
+    
+
+def GetJobCoalesceKey( job: HydrusData.JobDatabase ):
+    
+    ( action, args, kwargs ) = job.GetCallableTuple()
+    
+    try:
+        
+        return ( action, _MakeCoalesceKeyComponent( args ), _MakeCoalesceKeyComponent( kwargs ) )
+        
+    except TypeError:
+        
+        return None
+        
+    
+
 def CheckCanVacuum( db_path, stop_time = None ):
     
     db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
@@ -92,6 +168,11 @@ def ReadLargeIdQueryInSeparateChunks( cursor, select_statement, chunk_size ):
     cursor.execute( 'DROP TABLE ' + table_name + ';' )
     
 
+def GetReadOnlyURI( db_path ):
+    
+    return 'file:{}?mode=ro'.format( urllib.request.pathname2url( os.path.abspath( db_path ) ) )
+    
+
 def VacuumDB( db_path ):
     
     db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
@@ -128,9 +209,289 @@ def VacuumDB( db_path ):
     
     c.execute( 'PRAGMA journal_mode = {};'.format( HG.db_journal_mode ) )
     
+class DBJobTimings( object ):
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        
+        # connection -> action -> [ num_jobs, total_wait_time, total_work_time, max_wait_time ]
+        self._connections_to_actions_to_timings = collections.defaultdict( dict )
+        
+    
+    def AddJob( self, connection: str, action: str, wait_time: float, work_time: float ):
+        
+        with self._lock:
+            
+            actions_to_timings = self._connections_to_actions_to_timings[ connection ]
+            
+            if action not in actions_to_timings:
+                
+                actions_to_timings[ action ] = [ 0, 0.0, 0.0, 0.0 ]
+                
+            
+            timings = actions_to_timings[ action ]
+            
+            timings[0] += 1
+            timings[1] += wait_time
+            timings[2] += work_time
+            timings[3] = max( timings[3], wait_time )
+            
+        
+    
+    def GetPrettySummary( self ) -> str:
+        
+        rows = self.GetRows()
+        
+        if len( rows ) == 0:
+            
+            return 'No db jobs recorded yet.'
+            
+        
+        rows.sort( key = lambda row: row[0] != 'main' )
+        
+        lines = []
+        
+        for ( connection, action, num_jobs, mean_wait_time, mean_work_time, max_wait_time ) in rows:
+            
+            lines.append( '{} - {}: {} jobs, mean queue wait {}, mean execution {}, max queue wait {}'.format( connection, action, HydrusData.ToHumanInt( num_jobs ), HydrusTime.TimeDeltaToPrettyTimeDelta( mean_wait_time ), HydrusTime.TimeDeltaToPrettyTimeDelta( mean_work_time ), HydrusTime.TimeDeltaToPrettyTimeDelta( max_wait_time ) ) )
+            
+        
+        return os.linesep.join( lines )
+        
+    
+    def GetRows( self ):
+        
+        rows = []
+        
+        with self._lock:
+            
+            for ( connection, actions_to_timings ) in self._connections_to_actions_to_timings.items():
+                
+                for ( action, ( num_jobs, total_wait_time, total_work_time, max_wait_time ) ) in actions_to_timings.items():
+                    
+                    rows.append( ( connection, action, num_jobs, total_wait_time / num_jobs, total_work_time / num_jobs, max_wait_time ) )
+                    
+                
+            
+        
+        rows.sort( key = lambda row: -row[2] * ( row[3] + row[4] ) )
+        
+        return rows
+        
+    
+
+class DBJobQueue( object ):
+    
+    # how long a job in a lower lane will wait before it gets to jump the queue anyway
+    STARVATION_PERIOD = 10
+    
+    NUM_WAIT_TIMES_TO_KEEP = 1000
+    
+    def __init__( self ):
+        
+        self._lock = threading.Lock()
+        self._new_job_condition = threading.Condition( self._lock )
+        
+        self._lanes_to_jobs = { lane : collections.deque() for lane in JOB_LANES }
+        self._lanes_to_recent_wait_times = { lane : collections.deque( maxlen = self.NUM_WAIT_TIMES_TO_KEEP ) for lane in JOB_LANES }
+        
+        self._thread_idents_to_lanes_to_counts = collections.defaultdict( collections.Counter )
+        
+        self._coalesce_keys_to_jobs = {}
+        self._jobs_to_coalesce_keys = {}
+        
+        self._num_queued_writes = 0
+        self._num_writes_ever_queued = 0
+        
+    
+    def _GetNextLane( self ):
+        
+        now = time.perf_counter()
+        
+        starving_lanes = [ lane for lane in JOB_LANES if len( self._lanes_to_jobs[ lane ] ) > 0 and now - self._lanes_to_jobs[ lane ][0].GetCreationTime() > self.STARVATION_PERIOD ]
+        
+        if len( starving_lanes ) > 0:
+            
+            return min( starving_lanes, key = lambda lane: self._lanes_to_jobs[ lane ][0].GetCreationTime() )
+            
+        
+        for lane in JOB_LANES:
+            
+            if len( self._lanes_to_jobs[ lane ] ) > 0:
+                
+                return lane
+                
+            
+        
+        return None
+        
+    
+    def _GetNumJobs( self ):
+        
+        return sum( ( len( jobs ) for jobs in self._lanes_to_jobs.values() ) )
+        
+    
+    def Empty( self ):
+        
+        with self._lock:
+            
+            return self._GetNumJobs() == 0
+            
+        
+    
+    def Get( self, timeout = None ):
+        
+        with self._lock:
+            
+            if self._GetNumJobs() == 0:
+                
+                self._new_job_condition.wait( timeout )
+                
+                if self._GetNumJobs() == 0:
+                    
+                    raise queue.Empty()
+                    
+                
+            
+            lane = self._GetNextLane()
+            
+            job = self._lanes_to_jobs[ lane ].popleft()
+            
+            lanes_to_counts = self._thread_idents_to_lanes_to_counts[ job.GetThreadIdent() ]
+            
+            lanes_to_counts[ lane ] -= 1
+            
+            if sum( lanes_to_counts.values() ) == 0:
+                
+                del self._thread_idents_to_lanes_to_counts[ job.GetThreadIdent() ]
+                
+            
+            if job in self._jobs_to_coalesce_keys:
+                
+                coalesce_key = self._jobs_to_coalesce_keys.pop( job )
+                
+                del self._coalesce_keys_to_jobs[ coalesce_key ]
+                
+            
+            if job.GetType() in ( 'read_write', 'write' ):
+                
+                self._num_queued_writes -= 1
+                
+            
+            self._lanes_to_recent_wait_times[ lane ].append( time.perf_counter() - job.GetCreationTime() )
+            
+            return job
+            
+        
+    
+    def GetLaneStatus( self ):
+        
+        lanes_to_status = {}
+        
+        with self._lock:
+            
+            for lane in JOB_LANES:
+                
+                depth = len( self._lanes_to_jobs[ lane ] )
+                
+                wait_times = sorted( self._lanes_to_recent_wait_times[ lane ] )
+                
+                if len( wait_times ) == 0:
+                    
+                    percentiles = { 50 : None, 90 : None, 99 : None }
+                    
+                else:
+                    
+                    percentiles = { percentile : wait_times[ min( len( wait_times ) - 1, ( len( wait_times ) * percentile ) // 100 ) ] for percentile in ( 50, 90, 99 ) }
+                    
+                
+                lanes_to_status[ lane ] = ( depth, percentiles )
+                
+            
+        
+        return lanes_to_status
+        
+    
+    def HasQueuedWrites( self ):
+        
+        with self._lock:
+            
+            return self._num_queued_writes > 0
+            
+        
+    
+    def Put( self, job: HydrusData.JobDatabase ):
+        
+        with self._lock:
+            
+            lane = job.GetLane()
+            
+            if lane is None:
+                
+                lane = JOB_LANE_INTERACTIVE
+                
+            
+            # a thread's jobs must run in the order it asked for them, so we can't let a job overtake one the same thread already has waiting in a lower lane
+            
+            lanes_to_counts = self._thread_idents_to_lanes_to_counts.get( job.GetThreadIdent(), collections.Counter() )
+            
+            for pending_lane in JOB_LANES[ JOB_LANES.index( lane ) + 1 : ]:
+                
+                if lanes_to_counts[ pending_lane ] > 0:
+                    
+                    lane = pending_lane
+                    
+                
+            
+            job.SetLane( lane )
+            
+            if job.GetType() == 'read':
+                
+                coalesce_key = GetJobCoalesceKey( job )
+                
+                if coalesce_key is not None:
+                    
+                    # a read that comes in after a write must see that write, so it only shares with jobs that were queued before the same writes
+                    coalesce_key = ( lane, self._num_writes_ever_queued, coalesce_key )
+                    
+                    if coalesce_key in self._coalesce_keys_to_jobs:
+                        
+                        self._coalesce_keys_to_jobs[ coalesce_key ].AddCoalescedJob( job )
+                        
+                        return
+                        
+                    
+                    self._coalesce_keys_to_jobs[ coalesce_key ] = job
+                    self._jobs_to_coalesce_keys[ job ] = coalesce_key
+                    
+                
+            else:
+                
+                self._num_queued_writes += 1
+                self._num_writes_ever_queued += 1
+                
+            
+            self._thread_idents_to_lanes_to_counts[ job.GetThreadIdent() ][ lane ] += 1
+            
+            self._lanes_to_jobs[ lane ].append( job )
+            
+            self._new_job_condition.notify()
+            
+        
+    
+
 class HydrusDB( HydrusDBBase.DBBase ):
     
     READ_WRITE_ACTIONS = []
+    
+    # pure reads that are happy to see the last committed state of the database
+    # while the main db thread is busy with a job, these may be served by a read-only connection on a worker thread
+    READ_POOL_ACTIONS = set()
+    
+    # maintenance work that nothing is waiting on. it gives way to jobs from the ui and the api
+    BACKGROUND_ACTIONS = set()
+    
     UPDATE_WAIT = 2
     
     def __init__( self, controller, db_dir, db_name ):
@@ -197,7 +558,19 @@ class HydrusDB( HydrusDBBase.DBBase ):
         self._ready_to_serve_requests = False
         self._could_not_initialise = False
         
-        self._jobs = queue.Queue()
+        self._jobs = DBJobQueue()
+        
+        self._read_pool_jobs = DBJobQueue()
+        self._read_pool_lock = threading.Lock()
+        self._read_pool_num_workers = 0
+        self._read_pool_num_open_readers = 0
+        self._read_pool_generation = 0
+        self._read_pool_data_generation = 0
+        self._read_pool_module_cache_generations = []
+        self._read_pool_accepting_connections = False
+        self._read_pool_snapshot_is_current = False
+        
+        self._job_timings = DBJobTimings()
         
         self._currently_doing_job = False
         self._current_status = ''
@@ -304,6 +677,16 @@ class HydrusDB( HydrusDBBase.DBBase ):
                 
             
         
+        if HG.db_journal_mode == 'WAL' and len( self.READ_POOL_ACTIONS ) > 0:
+            
+            for i in range( HG.db_read_pool_size ):
+                
+                self._controller.CallToThreadLongRunning( self.ReadPoolLoop )
+                
+            
+            self._read_pool_num_workers = HG.db_read_pool_size
+            
+        
     
     def _AttachExternalDatabases( self ):
         
@@ -336,6 +719,8 @@ class HydrusDB( HydrusDBBase.DBBase ):
     
     def _CloseDBConnection( self ):
         
+        self._ReleaseReadPoolConnections()
+        
         HydrusDBBase.TemporaryIntegerTableNameCache.instance().Clear()
         
         if self._db is not None:
@@ -361,6 +746,22 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
         
     
+    def _CloseReadPoolConnection( self ):
+        
+        if self._db is not None:
+            
+            self._CloseCursor()
+            
+            self._db.close()
+            
+            self._db = None
+            
+            self._cursor_transaction_wrapper = None
+            
+            self._UnloadModules()
+            
+        
+    
     def _CreateDB( self ):
         
         raise NotImplementedError()
@@ -385,6 +786,31 @@ class HydrusDB( HydrusDBBase.DBBase ):
         return HydrusData.JobDatabase( job_type, synchronous, action, *args, **kwargs )
         
     
+    def _GenerateReadPoolReader( self ) -> 'HydrusDB':
+        
+        # a shallow copy shares all our static db info but gets its own connection and modules
+        reader = copy.copy( self )
+        
+        reader._db = None
+        reader._c = None
+        reader._cursor_transaction_wrapper = None
+        reader._modules = []
+        
+        reader._InitReadPoolConnection()
+        
+        return reader
+        
+    
+    def _GetJobLane( self, action ):
+        
+        if action in self.BACKGROUND_ACTIONS:
+            
+            return JOB_LANE_BACKGROUND
+            
+        
+        return GetThreadJobLane()
+        
+    
     def _GetPossibleAdditionalDBFilenames( self ):
         
         return [ self._ssl_cert_filename, self._ssl_key_filename ]
@@ -471,7 +897,7 @@ class HydrusDB( HydrusDBBase.DBBase ):
                 raise HydrusExceptions.DBAccessException( '"{}" seems to be read-only!'.format( db_path ) )
                 
             
-            self._db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES )
+            self._db = sqlite3.connect( db_path, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES, cached_statements = HydrusDBBase.STATEMENT_CACHE_SIZE )
             
             c = self._db.cursor()
             
@@ -479,7 +905,7 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
             self._is_connected = True
             
-            self._cursor_transaction_wrapper = HydrusDBBase.DBCursorTransactionWrapper( self._c, HG.db_transaction_commit_period )
+            self._cursor_transaction_wrapper = HydrusDBBase.DBCursorTransactionWrapper( self._c, HG.db_transaction_commit_period, commit_hook = self._NotifyReadPoolDataChanged )
             
             if HG.no_db_temp_files:
                 
@@ -558,12 +984,61 @@ class HydrusDB( HydrusDBBase.DBBase ):
             raise HydrusExceptions.DBAccessException( str( e ) )
             
         
+        with self._read_pool_lock:
+            
+            self._read_pool_accepting_connections = True
+            self._read_pool_snapshot_is_current = True
+            
+            self._read_pool_module_cache_generations = [ module.GetCacheGeneration() for module in self._modules ]
+            
+        
     
     def _InitExternalDatabases( self ):
         
         pass
         
     
+    def _InitReadPoolConnection( self ):
+        
+        db_path = os.path.join( self._db_dir, self._db_filenames[ 'main' ] )
+        
+        self._db = sqlite3.connect( GetReadOnlyURI( db_path ), uri = True, isolation_level = None, detect_types = sqlite3.PARSE_DECLTYPES, cached_statements = HydrusDBBase.STATEMENT_CACHE_SIZE )
+        
+        c = self._db.cursor()
+        
+        self._SetCursor( c )
+        
+        self._cursor_transaction_wrapper = HydrusDBBase.DBCursorTransactionWrapper( self._c, HG.db_transaction_commit_period )
+        
+        if HG.no_db_temp_files:
+            
+            self._Execute( 'PRAGMA temp_store = 2;' )
+            
+        
+        for ( name, filename ) in self._db_filenames.items():
+            
+            if name == 'main':
+                
+                continue
+                
+            
+            self._Execute( 'ATTACH ? AS ' + name + ';', ( GetReadOnlyURI( os.path.join( self._db_dir, filename ) ), ) )
+            
+        
+        self._LoadModules()
+        
+        self._Execute( 'ATTACH ":memory:" AS mem;' )
+        
+        HydrusDBBase.TemporaryIntegerTableNameCache.instance().Clear()
+        
+        db_names = [ name for ( index, name, path ) in self._Execute( 'PRAGMA database_list;' ) if name not in ( 'mem', 'temp' ) ]
+        
+        for db_name in db_names:
+            
+            self._Execute( 'PRAGMA {}.cache_size = -{};'.format( db_name, HG.db_cache_size * 1024 ) )
+            
+        
+    
     def _LoadModules( self ):
         
         pass
@@ -574,6 +1049,43 @@ class HydrusDB( HydrusDBBase.DBBase ):
         raise NotImplementedError()
         
     
+    def _NotifyJobRolledBack( self ):
+        
+        # anything we hold in memory that mirrors the db may now have rows the db does not
+        
+        pass
+        
+    
+    def _NotifyReadPoolDataChanged( self ):
+        
+        # readers keep their connection and modules across commits. we just record which module caches moved on, and they reset those before their next job
+        
+        with self._read_pool_lock:
+            
+            self._read_pool_data_generation += 1
+            self._read_pool_module_cache_generations = [ module.GetCacheGeneration() for module in self._modules ]
+            self._read_pool_snapshot_is_current = True
+            
+        
+    
+    def _ProcessReadPoolJob( self, reader: 'HydrusDB', job ):
+        
+        ( action, args, kwargs ) = job.GetCallableTuple()
+        
+        reader._Execute( 'BEGIN DEFERRED;' )
+        
+        try:
+            
+            result = reader._Read( action, *args, **kwargs )
+            
+        finally:
+            
+            reader._Execute( 'COMMIT;' )
+            
+        
+        job.PutResult( result )
+        
+    
     def _ProcessJob( self, job ):
         
         job_type = job.GetType()
@@ -584,6 +1096,13 @@ class HydrusDB( HydrusDBBase.DBBase ):
             
             if job_type in ( 'read_write', 'write' ):
                 
+                # from the moment this starts, the read pool's committed snapshot may be behind us, and it stays that way until we commit
+                
+                with self._read_pool_lock:
+                    
+                    self._read_pool_snapshot_is_current = False
+                    
+                
                 self._current_status = 'db write locked'
                 
                 self._cursor_transaction_wrapper.NotifyWriteOccuring()
@@ -630,6 +1149,8 @@ class HydrusDB( HydrusDBBase.DBBase ):
                 
                 self._cursor_transaction_wrapper.Rollback()
                 
+                self._NotifyJobRolledBack()
+                
             except Exception as rollback_e:
                 
                 HydrusData.Print( 'When the transaction failed, attempting to rollback the database failed. Please restart the client as soon as is convenient.' )
@@ -656,6 +1177,71 @@ class HydrusDB( HydrusDBBase.DBBase ):
         raise NotImplementedError()
         
     
+    def _ReadPoolResetStaleCaches( self, reader: 'HydrusDB', reader_module_cache_generations ):
+        
+        with self._read_pool_lock:
+            
+            module_cache_generations = self._read_pool_module_cache_generations
+            
+        
+        if len( module_cache_generations ) != len( reader._modules ) or len( reader_module_cache_generations ) != len( reader._modules ):
+            
+            modules_to_reset = reader._modules
+            
+        else:
+            
+            modules_to_reset = [ module for ( module, generation, reader_generation ) in zip( reader._modules, module_cache_generations, reader_module_cache_generations ) if generation != reader_generation ]
+            
+        
+        for module in modules_to_reset:
+            
+            module.ResetCaches()
+            
+        
+        return module_cache_generations
+        
+    
+    def _ReadPoolShouldTakeJob( self, action, *args, **kwargs ):
+        
+        if action not in self.READ_POOL_ACTIONS or self._read_pool_num_workers == 0:
+            
+            return False
+            
+        
+        # if the main thread is free, it may as well do the job and get a perfectly fresh answer
+        # and a read pool connection only sees committed data, so it can only help if every finished or queued write is already in that snapshot
+        
+        with self._read_pool_lock:
+            
+            return self._read_pool_accepting_connections and self._read_pool_snapshot_is_current and not self._jobs.HasQueuedWrites() and self._currently_doing_job
+            
+        
+    
+    def _ReleaseReadPoolConnections( self ):
+        
+        with self._read_pool_lock:
+            
+            self._read_pool_accepting_connections = False
+            self._read_pool_generation += 1
+            
+        
+        # readers notice the new generation and close within about a second, or when their current job is done
+        
+        started = HydrusTime.GetNowPrecise()
+        
+        while self._read_pool_num_open_readers > 0:
+            
+            if HydrusTime.TimeHasPassedPrecise( started + 60 ):
+                
+                HydrusData.Print( 'Waited a long time for the db read pool to close its connections, but they did not! Continuing anyway.' )
+                
+                break
+                
+            
+            time.sleep( 0.02 )
+            
+        
+    
     def _RepairDB( self, version ):
         
         for module in self._modules:
@@ -749,7 +1335,12 @@ class HydrusDB( HydrusDBBase.DBBase ):
     
     def GetStatus( self ):
         
-        return ( self._current_status, self._current_job_name )
+        return ( self._current_status, self._current_job_name, self._jobs.GetLaneStatus() )
+        
+    
+    def GetJobTimings( self ) -> DBJobTimings:
+        
+        return self._job_timings
         
     
     def IsConnected( self ):
@@ -774,7 +1365,7 @@ class HydrusDB( HydrusDBBase.DBBase ):
     
     def JobsQueueEmpty( self ):
         
-        return self._jobs.empty()
+        return self._jobs.Empty()
         
     
     def MainLoop( self ):
@@ -798,17 +1389,19 @@ class HydrusDB( HydrusDBBase.DBBase ):
         
         error_count = 0
         
-        while not ( ( self._local_shutdown or HG.model_shutdown ) and self._jobs.empty() ):
+        while not ( ( self._local_shutdown or HG.model_shutdown ) and self._jobs.Empty() ):
             
             try:
                 
-                job = self._jobs.get( timeout = 1 )
+                job = self._jobs.Get( timeout = 1 )
                 
                 self._currently_doing_job = True
                 self._current_job_name = job.ToString()
                 
                 self.publish_status_update()
                 
+                job_started = HydrusTime.GetNowPrecise()
+                
                 try:
                     
                     if HG.db_report_mode:
@@ -840,11 +1433,13 @@ class HydrusDB( HydrusDBBase.DBBase ):
                         raise
                         
                     
-                    self._jobs.put( job ) # couldn't lock db; put job back on queue
+                    self._jobs.Put( job ) # couldn't lock db; put job back on queue
                     
                     time.sleep( 5 )
                     
                 
+                self._job_timings.AddJob( 'main', job.GetAction(), job_started - job.GetCreationTime(), HydrusTime.GetNowPrecise() - job_started )
+                
                 self._currently_doing_job = False
                 self._current_job_name = ''
                 
@@ -905,16 +1500,176 @@ class HydrusDB( HydrusDBBase.DBBase ):
         
         job = self._GenerateDBJob( job_type, synchronous, action, *args, **kwargs )
         
+        job.SetLane( self._GetJobLane( action ) )
+        
         if HG.model_shutdown:
             
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        if self._ReadPoolShouldTakeJob( action, *args, **kwargs ):
+            
+            self._read_pool_jobs.Put( job )
+            
+        else:
+            
+            self._jobs.Put( job )
+            
         
         return job.GetResult()
         
     
+    def ReadPoolLoop( self ):
+        
+        reader = None
+        reader_generation = None
+        reader_data_generation = None
+        reader_module_cache_generations = []
+        
+        def close_reader():
+            
+            reader._CloseReadPoolConnection()
+            
+            with self._read_pool_lock:
+                
+                self._read_pool_num_open_readers -= 1
+                
+            
+        
+        try:
+            
+            while not ( self._local_shutdown or HG.model_shutdown ):
+                
+                if reader is not None and reader_generation != self._read_pool_generation:
+                    
+                    close_reader()
+                    
+                    reader = None
+                    
+                
+                try:
+                    
+                    job = self._read_pool_jobs.Get( timeout = 1 )
+                    
+                except queue.Empty:
+                    
+                    continue
+                    
+                
+                if reader is not None and reader_generation != self._read_pool_generation:
+                    
+                    close_reader()
+                    
+                    reader = None
+                    
+                
+                if reader is None:
+                    
+                    with self._read_pool_lock:
+                        
+                        if self._read_pool_accepting_connections:
+                            
+                            self._read_pool_num_open_readers += 1
+                            
+                            reader_generation = self._read_pool_generation
+                            reader_data_generation = self._read_pool_data_generation
+                            reader_module_cache_generations = self._read_pool_module_cache_generations
+                            
+                        else:
+                            
+                            reader_generation = None
+                            
+                        
+                    
+                    if reader_generation is None:
+                        
+                        # the main connection is closed for something like a vacuum, so let it take the job once it is back
+                        
+                        self._jobs.Put( job )
+                        
+                        continue
+                        
+                    
+                    try:
+                        
+                        reader = self._GenerateReadPoolReader()
+                        
+                    except Exception as e:
+                        
+                        with self._read_pool_lock:
+                            
+                            self._read_pool_num_open_readers -= 1
+                            
+                        
+                        HydrusData.Print( 'The db read pool could not connect to the database, so that job is going back to the main queue. The error was:' )
+                        HydrusData.PrintException( e, do_wait = False )
+                        
+                        self._jobs.Put( job )
+                        
+                        continue
+                        
+                    
+                
+                job_started = HydrusTime.GetNowPrecise()
+                
+                if HG.db_report_mode:
+                    
+                    HydrusData.ShowText( 'Running db job on read pool: ' + job.ToString() )
+                    
+                
+                try:
+                    
+                    if reader_data_generation != self._read_pool_data_generation:
+                        
+                        reader_data_generation = self._read_pool_data_generation
+                        
+                        reader_module_cache_generations = self._ReadPoolResetStaleCaches( reader, reader_module_cache_generations )
+                        
+                    
+                    self._ProcessReadPoolJob( reader, job )
+                    
+                except Exception as e:
+                    
+                    # probably a schema or cache change we have not caught up with yet. the main thread is authoritative, so it can handle this one
+                    
+                    HydrusData.Print( 'A db read pool job failed, so it is going back to the main queue. The error was:' )
+                    HydrusData.PrintException( e, do_wait = False )
+                    
+                    close_reader()
+                    
+                    reader = None
+                    
+                    self._jobs.Put( job )
+                    
+                    continue
+                    
+                
+                self._job_timings.AddJob( 'read pool', job.GetAction(), job_started - job.GetCreationTime(), HydrusTime.GetNowPrecise() - job_started )
+                
+            
+        finally:
+            
+            if reader is not None:
+                
+                close_reader()
+                
+            
+            while not self._read_pool_jobs.Empty():
+                
+                try:
+                    
+                    job = self._read_pool_jobs.Get( timeout = 0 )
+                    
+                    job.PutResult( HydrusExceptions.ShutdownException( 'Application shut down before db could serve result!' ) )
+                    
+                except queue.Empty:
+                    
+                    break
+                    
+                
+            
+        
+    
     def ReadyToServeRequests( self ):
         
         return self._ready_to_serve_requests
@@ -931,12 +1686,14 @@ class HydrusDB( HydrusDBBase.DBBase ):
         
         job = self._GenerateDBJob( job_type, synchronous, action, *args, **kwargs )
         
+        job.SetLane( self._GetJobLane( action ) )
+        
         if HG.model_shutdown:
             
             raise HydrusExceptions.ShutdownException( 'Application has shut down!' )
             
         
-        self._jobs.put( job )
+        self._jobs.Put( job )
         
         if synchronous: return job.GetResult()
         
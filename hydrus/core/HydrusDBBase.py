@@ -1,4 +1,8 @@
 import collections
+import functools
+import itertools
+import re
+import threading
 import typing
 
 import psutil
@@ -10,6 +14,24 @@ from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTemp
 from hydrus.core import HydrusTime
 
+# how many prepared statements each connection keeps. the sqlite3 default is 128, which our many per-service table names blow through quickly
+STATEMENT_CACHE_SIZE = 1024
+
+# the old default for SQLITE_MAX_VARIABLE_NUMBER. newer sqlite allows more, but we don't gain much past this
+MAX_NUM_QUERY_VARIABLES = 999
+
+MULTI_ROW_INSERT_RE = re.compile( r'^\s*((?:INSERT|REPLACE)\s+(?:OR\s+\w+\s+)?INTO\s+.+?\s+VALUES)\s*(\(\s*\?(?:\s*,\s*\?)*\s*\))\s*;?\s*$', re.IGNORECASE | re.DOTALL )
+
+# SplayListForDB and friends inline ids and strings into statements, so we strip literals before keying query stats
+QUERY_STATS_STRING_LITERAL_RE = re.compile( r"'(?:[^']|'')*'" )
+QUERY_STATS_NUMBER_LITERAL_RE = re.compile( r'(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])' )
+QUERY_STATS_IN_LIST_RE = re.compile( r'\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE )
+QUERY_STATS_VALUES_ROWS_RE = re.compile( r'(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+' )
+QUERY_STATS_WHITESPACE_RE = re.compile( r'\s+' )
+
+# we don't want a long session of slow query mode to eat memory, so beyond this we throw out the cheapest statement
+MAX_NUM_QUERY_STATS = 1000
+
 def CheckHasSpaceForDBTransaction( db_dir, num_bytes ):
     
     space_needed = int( num_bytes * 1.1 )
@@ -75,6 +97,71 @@ def CheckHasSpaceForDBTransaction( db_dir, num_bytes ):
         
     
 
+def ExecuteManyInChunks( cursor: sqlite3.Cursor, query, args_iterator ) -> typing.Optional[ int ]:
+    
+    # a simple 'INSERT INTO blah VALUES ( ?, ? );' is much faster as a few big multi-row inserts than as thousands of executemany steps
+    # note a failure is per chunk, not per row. each chunk is one statement, so if one row in it hits a constraint, none of that chunk goes in
+    # the chunks before it stay in, just as the rows before a bad one do with executemany. either way the caller gets the exception and the job rolls back
+    # 'OR IGNORE' and 'OR REPLACE' conflicts are handled row by row inside the statement, so they work as before
+    
+    num_params = GetMultiRowInsertNumParams( query )
+    
+    if num_params == 0:
+        
+        cursor.executemany( query, args_iterator )
+        
+        return None
+        
+    
+    num_rows_per_chunk = max( 1, MAX_NUM_QUERY_VARIABLES // num_params )
+    
+    args_iterator = iter( args_iterator )
+    
+    row_count = 0
+    
+    while True:
+        
+        chunk = list( itertools.islice( args_iterator, num_rows_per_chunk ) )
+        
+        if len( chunk ) == 0:
+            
+            break
+            
+        
+        cursor.execute( GetMultiRowInsertQuery( query, len( chunk ) ), list( itertools.chain.from_iterable( chunk ) ) )
+        
+        if cursor.rowcount > 0:
+            
+            row_count += cursor.rowcount
+            
+        
+    
+    return row_count
+    
+
+@functools.lru_cache( maxsize = 4096 )
+def GetMultiRowInsertNumParams( query ) -> int:
+    
+    match = MULTI_ROW_INSERT_RE.match( query )
+    
+    if match is None:
+        
+        return 0
+        
+    
+    return match.group( 2 ).count( '?' )
+    
+
+@functools.lru_cache( maxsize = 4096 )
+def GetMultiRowInsertQuery( query, num_rows ) -> str:
+    
+    match = MULTI_ROW_INSERT_RE.match( query )
+    
+    ( prefix, row_placeholder ) = match.groups()
+    
+    return '{} {};'.format( prefix, ', '.join( itertools.repeat( row_placeholder, num_rows ) ) )
+    
+
 def ReadFromCancellableCursor( cursor, largest_group_size, cancelled_hook = None ):
     
     if cancelled_hook is None:
@@ -113,13 +200,161 @@ def ReadFromCancellableCursor( cursor, largest_group_size, cancelled_hook = None
     return results
     
 
+# what every statement has cost since slow query mode was last switched on, keyed by ( module name, normalised query )
+query_stats = {}
+query_stats_lock = threading.Lock()
+
+def ClearQueryStats():
+    
+    with query_stats_lock:
+        
+        query_stats.clear()
+        
+    
+
+def GetQueryStats( limit = None ) -> typing.List[ dict ]:
+    
+    with query_stats_lock:
+        
+        all_stats = [ dict( stats ) for stats in query_stats.values() ]
+        
+    
+    all_stats.sort( key = lambda stats: stats[ 'total_time' ], reverse = True )
+    
+    if limit is not None:
+        
+        all_stats = all_stats[ : limit ]
+        
+    
+    for stats in all_stats:
+        
+        stats[ 'mean_time' ] = stats[ 'total_time' ] / stats[ 'count' ]
+        
+    
+    return all_stats
+    
+
+def NormaliseQueryForStats( query ):
+    
+    query = QUERY_STATS_STRING_LITERAL_RE.sub( '?', query )
+    query = QUERY_STATS_NUMBER_LITERAL_RE.sub( '?', query )
+    query = QUERY_STATS_IN_LIST_RE.sub( 'IN ( ? )', query )
+    query = QUERY_STATS_VALUES_ROWS_RE.sub( r'\1', query )
+    query = QUERY_STATS_WHITESPACE_RE.sub( ' ', query ).strip()
+    
+    return query
+    
+
+def RecordQuery( module_name, query, duration, num_rows, plan_lines = None ):
+    
+    query = NormaliseQueryForStats( query )
+    
+    key = ( module_name, query )
+    
+    with query_stats_lock:
+        
+        if key not in query_stats:
+            
+            if len( query_stats ) >= MAX_NUM_QUERY_STATS:
+                
+                cheapest_key = min( query_stats.keys(), key = lambda k: query_stats[ k ][ 'total_time' ] )
+                
+                del query_stats[ cheapest_key ]
+                
+            
+            query_stats[ key ] = {
+                'module' : module_name,
+                'query' : query,
+                'count' : 0,
+                'total_time' : 0.0,
+                'max_time' : 0.0,
+                'total_rows' : 0,
+                'num_slow' : 0,
+                'query_plan' : None
+            }
+            
+        
+        stats = query_stats[ key ]
+        
+        stats[ 'count' ] += 1
+        stats[ 'total_time' ] += duration
+        stats[ 'max_time' ] = max( stats[ 'max_time' ], duration )
+        stats[ 'total_rows' ] += num_rows
+        
+        if plan_lines is not None:
+            
+            stats[ 'num_slow' ] += 1
+            stats[ 'query_plan' ] = plan_lines
+            
+        
+    
+
+class FetchedCursor( object ):
+    
+    # in slow query mode we read select results immediately so we can time them. this is enough of a cursor for what our callers do with results
+    
+    def __init__( self, rows ):
+        
+        self._rows = rows
+        self._index = 0
+        
+    
+    def __iter__( self ):
+        
+        return self
+        
+    
+    def __next__( self ):
+        
+        if self._index >= len( self._rows ):
+            
+            raise StopIteration
+            
+        
+        row = self._rows[ self._index ]
+        
+        self._index += 1
+        
+        return row
+        
+    
+    def fetchall( self ):
+        
+        rows = self._rows[ self._index : ]
+        
+        self._index = len( self._rows )
+        
+        return rows
+        
+    
+    def fetchmany( self, size = 1 ):
+        
+        rows = self._rows[ self._index : self._index + size ]
+        
+        self._index += len( rows )
+        
+        return rows
+        
+    
+    def fetchone( self ):
+        
+        if self._index >= len( self._rows ):
+            
+            return None
+            
+        
+        return next( self )
+        
+    
+
 class TemporaryIntegerTableNameCache( object ):
     
-    my_instance = None
+    # each connection has its own 'mem' database, so each db thread needs its own cache of what it has created there
+    my_instances = threading.local()
     
     def __init__( self ):
         
-        TemporaryIntegerTableNameCache.my_instance = self
+        TemporaryIntegerTableNameCache.my_instances.instance = self
         
         self._column_names_to_table_names = collections.defaultdict( collections.deque )
         self._column_names_counter = collections.Counter()
@@ -128,15 +363,15 @@ class TemporaryIntegerTableNameCache( object ):
     @staticmethod
     def instance() -> 'TemporaryIntegerTableNameCache':
         
-        if TemporaryIntegerTableNameCache.my_instance is None:
-            
-            raise Exception( 'TemporaryIntegerTableNameCache is not yet initialised!' )
-            
-        else:
+        my_instance = getattr( TemporaryIntegerTableNameCache.my_instances, 'instance', None )
+        
+        if my_instance is None:
             
-            return TemporaryIntegerTableNameCache.my_instance
+            my_instance = TemporaryIntegerTableNameCache()
             
         
+        return my_instance
+        
     
     def Clear( self ):
         
@@ -163,6 +398,21 @@ class TemporaryIntegerTableNameCache( object ):
             self._column_names_counter[ column_name ] += 1
             
         
+        if HG.profile_mode:
+            
+            with HG.profile_counter_lock:
+                
+                if initialised:
+                    
+                    HG.db_temp_tables_reused += 1
+                    
+                else:
+                    
+                    HG.db_temp_tables_created += 1
+                    
+                
+            
+        
         table_name = table_names.pop()
         
         return ( initialised, table_name )
@@ -196,7 +446,7 @@ class TemporaryIntegerTable( object ):
             self._cursor.execute( 'CREATE TABLE IF NOT EXISTS {} ( {} INTEGER PRIMARY KEY );'.format( self._table_name, self._column_name ) )
             
         
-        self._cursor.executemany( 'INSERT INTO {} ( {} ) VALUES ( ? );'.format( self._table_name, self._column_name ), ( ( i, ) for i in self._integer_iterable ) )
+        ExecuteManyInChunks( self._cursor, 'INSERT INTO {} ( {} ) VALUES ( ? );'.format( self._table_name, self._column_name ), ( ( i, ) for i in self._integer_iterable ) )
         
         return self._table_name
         
@@ -216,6 +466,8 @@ class DBBase( object ):
         
         self._c = None
         
+        self._row_count_override = None
+        
     
     def _AnalyzeTempTable( self, temp_table_name ):
         
@@ -277,6 +529,8 @@ class DBBase( object ):
     
     def _Execute( self, query, *query_args ) -> sqlite3.Cursor:
         
+        self._row_count_override = None
+        
         if HG.query_planner_mode and query not in HG.queries_planned:
             
             plan_lines = self._c.execute( 'EXPLAIN QUERY PLAN {}'.format( query ), *query_args ).fetchall()
@@ -286,9 +540,38 @@ class DBBase( object ):
             HG.controller.PrintQueryPlan( query, plan_lines )
             
         
+        if HG.slow_query_mode:
+            
+            return self._ExecuteAndRecord( query, query_args )
+            
+        
         return self._c.execute( query, *query_args )
         
     
+    def _ExecuteAndRecord( self, query, query_args ):
+        
+        time_started = HydrusTime.GetNowPrecise()
+        
+        cursor = self._c.execute( query, *query_args )
+        
+        if cursor.description is None:
+            
+            num_rows = self._GetRowCount()
+            
+        else:
+            
+            rows = cursor.fetchall()
+            
+            num_rows = len( rows )
+            
+            cursor = FetchedCursor( rows )
+            
+        
+        self._RecordQuery( query, query_args, HydrusTime.GetNowPrecise() - time_started, num_rows )
+        
+        return cursor
+        
+    
     def _ExecuteCancellable( self, query, query_args, cancelled_hook: typing.Callable[ [], bool ] ):
         
         cursor = self._Execute( query, query_args )
@@ -298,6 +581,15 @@ class DBBase( object ):
     
     def _ExecuteMany( self, query, args_iterator ):
         
+        record_query = HG.slow_query_mode
+        
+        if record_query:
+            
+            args_iterator = list( args_iterator )
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+        
         if HG.query_planner_mode and query not in HG.queries_planned:
             
             args_iterator = list( args_iterator )
@@ -312,7 +604,14 @@ class DBBase( object ):
                 
             
         
-        self._c.executemany( query, args_iterator )
+        # when the work was split into several statements, the cursor only knows the last one's rowcount, so we remember the sum
+        # if a chunk fails, we raise before this is set, and the rowcount is not worth anything anyway
+        self._row_count_override = ExecuteManyInChunks( self._c, query, args_iterator )
+        
+        if record_query and len( args_iterator ) > 0:
+            
+            self._RecordQuery( query, ( args_iterator[0], ), HydrusTime.GetNowPrecise() - time_started, self._GetRowCount() )
+            
         
     
     def _GenerateIdealIndexName( self, table_name, columns ):
@@ -343,6 +642,11 @@ class DBBase( object ):
     
     def _GetRowCount( self ):
         
+        if self._row_count_override is not None:
+            
+            return self._row_count_override
+            
+        
         row_count = self._c.rowcount
         
         if row_count == -1:
@@ -448,6 +752,30 @@ class DBBase( object ):
         return TemporaryIntegerTable( self._c, integer_iterable, column_name )
         
     
+    def _RecordQuery( self, query, query_args, duration, num_rows ):
+        
+        module_name = type( self ).__name__
+        
+        plan_lines = None
+        
+        if duration * 1000 >= HG.db_slow_query_min_time_ms:
+            
+            try:
+                
+                # a fresh cursor, so we don't stomp on the results or rowcount of the one we were called with
+                plan_lines = [ detail for ( node_id, parent_id, unused, detail ) in self._c.connection.execute( 'EXPLAIN QUERY PLAN {}'.format( query ), *query_args ).fetchall() ]
+                
+            except sqlite3.Error:
+                
+                plan_lines = []
+                
+            
+            HG.controller.PrintSlowQuery( module_name, query, duration, num_rows, plan_lines )
+            
+        
+        RecordQuery( module_name, query, duration, num_rows, plan_lines = plan_lines )
+        
+    
     def _SetCursor( self, c: sqlite3.Cursor ):
         
         self._c = c
@@ -509,13 +837,14 @@ WAL_TRUNCATE_CHECKPOINT_PERIOD = 900
 
 class DBCursorTransactionWrapper( DBBase ):
     
-    def __init__( self, c: sqlite3.Cursor, transaction_commit_period: int ):
+    def __init__( self, c: sqlite3.Cursor, transaction_commit_period: int, commit_hook: typing.Optional[ typing.Callable[ [], None ] ] = None ):
         
         DBBase.__init__( self )
         
         self._SetCursor( c )
         
         self._transaction_commit_period = transaction_commit_period
+        self._commit_hook = commit_hook
         
         self._transaction_start_time = 0
         self._in_transaction = False
@@ -585,6 +914,11 @@ class DBCursorTransactionWrapper( DBBase ):
             self._in_transaction = False
             self._transaction_contains_writes = False
             
+            if self._commit_hook is not None:
+                
+                self._commit_hook()
+                
+            
             if HG.db_journal_mode == 'WAL' and HydrusTime.TimeHasPassed( self._last_wal_passive_checkpoint_time + WAL_PASSIVE_CHECKPOINT_PERIOD ):
                 
                 if HydrusTime.TimeHasPassed( self._last_wal_truncate_checkpoint_time + WAL_TRUNCATE_CHECKPOINT_PERIOD ):
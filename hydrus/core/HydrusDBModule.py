@@ -14,6 +14,8 @@ class HydrusDBModule( HydrusDBBase.DBBase ):
         
         self.name = name
         
+        self._cache_generation = 0
+        
         self._SetCursor( cursor )
         
     
@@ -31,9 +33,11 @@ class HydrusDBModule( HydrusDBBase.DBBase ):
     
     def _CreateTable( self, create_query_without_name: str, table_name: str ):
         
-        if 'fts4(' in create_query_without_name.lower():
+        create_query_without_name_lower = create_query_without_name.lower()
+        
+        if 'fts4(' in create_query_without_name_lower or 'fts5(' in create_query_without_name_lower:
             
-            # when we want to repair a missing fts4 table, the damaged old virtual table sometimes still has some sub-tables hanging around, which breaks the new create
+            # when we want to repair a missing fts table, the damaged old virtual table sometimes still has some sub-tables hanging around, which breaks the new create
             # so, let's route all table creation through here and check for and clear any subtables beforehand!
             
             if '.' in table_name:
@@ -51,7 +55,14 @@ class HydrusDBModule( HydrusDBBase.DBBase ):
             # little test here to make sure we stay idempotent if the primary table actually already exists--don't want to delete things that are actually good!
             if self._Execute( 'SELECT 1 FROM {} WHERE name = ?;'.format( sqlite_master_table ), ( raw_table_name, ) ).fetchone() is None:
                 
-                possible_suffixes = [ '_content', '_docsize', '_segdir', '_segments', '_stat' ]
+                if 'fts4(' in create_query_without_name_lower:
+                    
+                    possible_suffixes = [ '_content', '_docsize', '_segdir', '_segments', '_stat' ]
+                    
+                else:
+                    
+                    possible_suffixes = [ '_config', '_content', '_data', '_docsize', '_idx' ]
+                    
                 
                 possible_subtable_names = [ '{}{}'.format( raw_table_name, suffix ) for suffix in possible_suffixes ]
                 
@@ -127,6 +138,13 @@ class HydrusDBModule( HydrusDBBase.DBBase ):
         return []
         
     
+    def _NotifyCachesChanged( self ):
+        
+        # anything a read pool copy of us holds in memory may now be stale, so it will reset its caches once this is committed
+        
+        self._cache_generation += 1
+        
+    
     def _PresentMissingIndicesWarningToUser( self, index_names ):
         
         raise NotImplementedError()
@@ -176,6 +194,11 @@ class HydrusDBModule( HydrusDBBase.DBBase ):
         return list( table_generation_dict.keys() )
         
     
+    def GetCacheGeneration( self ) -> int:
+        
+        return self._cache_generation
+        
+    
     def GetSurplusServiceTableNames( self, all_table_names ) -> set:
         
         prefixes = self._GetServiceTablePrefixes()
@@ -298,3 +321,11 @@ class HydrusDBModule( HydrusDBBase.DBBase ):
                 
             
         
+    
+    def ResetCaches( self ):
+        
+        # a read pool copy calls this when our generation moved on. drop whatever mirrors db data so it reloads from the new snapshot
+        
+        pass
+        
+    
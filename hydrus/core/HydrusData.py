@@ -1,4 +1,5 @@
 import collections
+import copy
 import decimal
 import fractions
 import itertools
@@ -1490,6 +1491,12 @@ class JobDatabase( object ):
         self._args = args
         self._kwargs = kwargs
         
+        self._creation_time = time.perf_counter()
+        self._thread_ident = threading.get_ident()
+        
+        self._lane = None
+        self._coalesced_jobs = []
+        
         self._result_ready = threading.Event()
         
     
@@ -1503,11 +1510,31 @@ class JobDatabase( object ):
         pass
         
     
+    def AddCoalescedJob( self, job ):
+        
+        self._coalesced_jobs.append( job )
+        
+    
+    def GetAction( self ):
+        
+        return self._action
+        
+    
     def GetCallableTuple( self ):
         
         return ( self._action, self._args, self._kwargs )
         
     
+    def GetCreationTime( self ):
+        
+        return self._creation_time
+        
+    
+    def GetLane( self ):
+        
+        return self._lane
+        
+    
     def GetResult( self ):
         
         time.sleep( 0.00001 ) # this one neat trick can save hassle on superquick jobs as event.wait can be laggy
@@ -1541,6 +1568,11 @@ class JobDatabase( object ):
             
         
     
+    def GetThreadIdent( self ):
+        
+        return self._thread_ident
+        
+    
     def GetType( self ):
         
         return self._type
@@ -1557,6 +1589,24 @@ class JobDatabase( object ):
         
         self._result_ready.set()
         
+        for job in self._coalesced_jobs:
+            
+            # jobs that shared our execution get their own top-level container, so a caller that sorts or appends to its list does not surprise the others
+            if isinstance( result, ( list, set, dict ) ):
+                
+                job.PutResult( copy.copy( result ) )
+                
+            else:
+                
+                job.PutResult( result )
+                
+            
+        
+    
+    def SetLane( self, lane ):
+        
+        self._lane = lane
+        
     
     def ToString( self ):
         
@@ -21,6 +21,7 @@ boot_debug = False
 
 db_cache_size = 256
 db_transaction_commit_period = 30
+db_read_pool_size = 2
 
 # if this is set to 1, transactions are not immediately synced to the journal so multiple can be undone following a power-loss
 # if set to 2, all transactions are synced, so once a new one starts you know the last one is on disk
@@ -49,8 +50,13 @@ queries_planned = set()
 profile_start_time = 0
 profile_slow_count = 0
 profile_fast_count = 0
+db_temp_tables_created = 0
+db_temp_tables_reused = 0
 profile_counter_lock = threading.Lock()
 
+slow_query_mode = False
+db_slow_query_min_time_ms = 100
+
 canvas_tile_outline_mode = False
 
 db_ui_hang_relief_mode = False
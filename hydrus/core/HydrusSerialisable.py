@@ -145,8 +145,19 @@ SERIALISABLE_TYPE_FILE_FILTER = 126
 
 SERIALISABLE_TYPES_TO_OBJECT_TYPES = {}
 
+# some objects have a compact non-json network form, which starts with its own magic bytes
+NETWORK_BYTES_MAGIC_TO_PARSERS = {}
+
 def CreateFromNetworkBytes( network_bytes: bytes, raise_error_on_future_version = False ):
     
+    for ( magic, parser ) in NETWORK_BYTES_MAGIC_TO_PARSERS.items():
+        
+        if network_bytes.startswith( magic ):
+            
+            return parser( network_bytes )
+            
+        
+    
     obj_string = HydrusCompression.DecompressBytesToString( network_bytes )
     
     return CreateFromString( obj_string, raise_error_on_future_version = raise_error_on_future_version )
@@ -835,3 +835,32 @@ def GetThumbnailMime( path ):
     
     return GetMime( path )
     
+
+def GetThumbnailMimeFromBytes( thumbnail_bytes: bytes ):
+    
+    bit_to_check = thumbnail_bytes[:256]
+    
+    for ( offsets_and_headers, mime ) in headers_and_mime_thumbnails:
+        
+        if passes_offsets_and_headers( offsets_and_headers, bit_to_check ):
+            
+            return mime
+            
+        
+    
+    ( os_file_handle, temp_path ) = HydrusTemp.GetTempPath()
+    
+    try:
+        
+        with open( temp_path, 'wb' ) as f:
+            
+            f.write( thumbnail_bytes )
+            
+        
+        return GetMime( temp_path )
+        
+    finally:
+        
+        HydrusTemp.CleanUpTempPath( os_file_handle, temp_path )
+        
+    
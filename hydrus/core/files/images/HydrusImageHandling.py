@@ -235,6 +235,75 @@ def GenerateNumPyImage( path, mime, force_pil = False ) -> numpy.array:
     
     return numpy_image
     
+def GenerateNumPyImageFromBytes( image_bytes: bytes, mime, force_pil = False ) -> numpy.array:
+    
+    # for simple image formats held in memory, like our thumbnails. PSD and friends need a path
+    
+    if HG.media_load_report_mode:
+        
+        HydrusData.ShowText( 'Loading media from {} bytes'.format( HydrusData.ToHumanInt( len( image_bytes ) ) ) )
+        
+    
+    if mime in PIL_ONLY_MIMETYPES:
+        
+        force_pil = True
+        
+    
+    if not force_pil:
+        
+        pil_image = HydrusImageOpening.RawOpenPILImage( io.BytesIO( image_bytes ) )
+        
+        if pil_image.mode == 'LAB':
+            
+            force_pil = True
+            
+        
+        if HydrusImageMetadata.HasICCProfile( pil_image ):
+            
+            force_pil = True
+            
+        
+    
+    if force_pil:
+        
+        pil_image = GeneratePILImage( io.BytesIO( image_bytes ) )
+        
+        numpy_image = GenerateNumPyImageFromPILImage( pil_image )
+        
+    else:
+        
+        if mime in ( HC.IMAGE_JPEG, HC.IMAGE_TIFF ):
+            
+            flags = CV_IMREAD_FLAGS_JPEG
+            
+        elif mime == HC.IMAGE_PNG:
+            
+            flags = CV_IMREAD_FLAGS_PNG
+            
+        else:
+            
+            flags = CV_IMREAD_FLAGS_WEIRD
+            
+        
+        numpy_image = cv2.imdecode( numpy.frombuffer( image_bytes, dtype = 'uint8' ), flags )
+        
+        if numpy_image is None:
+            
+            pil_image = GeneratePILImage( io.BytesIO( image_bytes ) )
+            
+            numpy_image = GenerateNumPyImageFromPILImage( pil_image )
+            
+        else:
+            
+            numpy_image = HydrusImageNormalisation.DequantizeFreshlyLoadedNumPyImage( numpy_image )
+            
+            numpy_image = HydrusImageNormalisation.StripOutAnyUselessAlphaChannel( numpy_image )
+            
+        
+    
+    return numpy_image
+    
+
 def GenerateNumPyImageFromPILImage( pil_image: PILImage.Image, strip_useless_alpha = True ) -> numpy.array:
     
     try:
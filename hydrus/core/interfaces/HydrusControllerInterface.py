@@ -158,6 +158,11 @@ class HydrusControllerInterface( object ):
         raise NotImplementedError()
         
     
+    def PrintSlowQuery( self, module_name, query, duration, num_rows, plan_lines ):
+        
+        raise NotImplementedError()
+        
+    
     def Read( self, action, *args, **kwargs ):
         
         raise NotImplementedError()
@@ -1,8 +1,12 @@
 import collections
+import itertools
+import numpy
+import struct
 import threading
 import time
 import typing
 
+from hydrus.core import HydrusCompression
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
@@ -20,6 +24,141 @@ MAX_UPDATE_PERIOD = 100000 * 100 # three months or so jej
 MIN_NULLIFICATION_PERIOD = 86400
 MAX_NULLIFICATION_PERIOD = 86400 * 365 * 5
 
+UPDATE_FORMAT_JSON = 0
+UPDATE_FORMAT_BINARY = 1
+
+update_format_string_lookup = {
+    UPDATE_FORMAT_JSON : 'json',
+    UPDATE_FORMAT_BINARY : 'compact binary'
+}
+
+# zlib'd json always starts with 0x78, so an old update can never be mistaken for one of these
+BINARY_UPDATE_MAGIC = b'HyUp'
+BINARY_UPDATE_VERSION = 1
+
+BINARY_UPDATE_TYPE_DEFINITIONS = 0
+BINARY_UPDATE_TYPE_CONTENT = 1
+
+BINARY_UPDATE_COMPRESSION_NONE = 0
+BINARY_UPDATE_COMPRESSION_ZLIB = 1
+BINARY_UPDATE_COMPRESSION_LZ4 = 2
+
+BINARY_UPDATE_HASH_LENGTH = 32
+
+def CreateUpdateFromBinaryNetworkBytes( network_bytes: bytes ):
+    
+    header_length = len( BINARY_UPDATE_MAGIC ) + 3
+    
+    if len( network_bytes ) < header_length or not network_bytes.startswith( BINARY_UPDATE_MAGIC ):
+        
+        raise HydrusExceptions.SerialisationException( 'This did not look like a binary update!' )
+        
+    
+    ( version, update_type, compression ) = struct.unpack_from( '<BBB', network_bytes, len( BINARY_UPDATE_MAGIC ) )
+    
+    if version > BINARY_UPDATE_VERSION:
+        
+        raise HydrusExceptions.SerialisationException( 'This binary update is version {}, but this program only understands up to version {}! Do you need to update?'.format( version, BINARY_UPDATE_VERSION ) )
+        
+    
+    compressed_payload = network_bytes[ header_length : ]
+    
+    if compression == BINARY_UPDATE_COMPRESSION_NONE:
+        
+        payload = compressed_payload
+        
+    elif compression == BINARY_UPDATE_COMPRESSION_ZLIB:
+        
+        payload = HydrusCompression.DecompressBytesToBytes( compressed_payload )
+        
+    elif compression == BINARY_UPDATE_COMPRESSION_LZ4:
+        
+        if not HydrusCompression.LZ4_OK:
+            
+            raise HydrusExceptions.SerialisationException( 'This binary update is lz4 compressed, but lz4 is not available!' )
+            
+        
+        payload = HydrusCompression.DecompressFastBytesToBytes( compressed_payload )
+        
+    else:
+        
+        raise HydrusExceptions.SerialisationException( 'This binary update has an unknown compression type, {}!'.format( compression ) )
+        
+    
+    if update_type == BINARY_UPDATE_TYPE_DEFINITIONS:
+        
+        update = DefinitionsUpdate()
+        
+    elif update_type == BINARY_UPDATE_TYPE_CONTENT:
+        
+        update = ContentUpdate()
+        
+    else:
+        
+        raise HydrusExceptions.SerialisationException( 'This binary update has an unknown update type, {}!'.format( update_type ) )
+        
+    
+    try:
+        
+        update.InitialiseFromBinaryPayload( payload )
+        
+    except ( struct.error, ValueError, UnicodeDecodeError ) as e:
+        
+        raise HydrusExceptions.SerialisationException( 'Could not parse this binary update: {}'.format( e ) )
+        
+    
+    return update
+    
+def DumpUpdateToBinaryNetworkBytes( update, compression = BINARY_UPDATE_COMPRESSION_ZLIB ) -> bytes:
+    
+    if isinstance( update, DefinitionsUpdate ):
+        
+        update_type = BINARY_UPDATE_TYPE_DEFINITIONS
+        
+    elif isinstance( update, ContentUpdate ):
+        
+        update_type = BINARY_UPDATE_TYPE_CONTENT
+        
+    else:
+        
+        raise HydrusExceptions.SerialisationException( 'Only definitions and content updates have a binary format!' )
+        
+    
+    payload = update.GetBinaryPayload()
+    
+    if compression == BINARY_UPDATE_COMPRESSION_LZ4 and not HydrusCompression.LZ4_OK:
+        
+        compression = BINARY_UPDATE_COMPRESSION_ZLIB
+        
+    
+    if compression == BINARY_UPDATE_COMPRESSION_ZLIB:
+        
+        payload = HydrusCompression.CompressBytesToBytes( payload )
+        
+    elif compression == BINARY_UPDATE_COMPRESSION_LZ4:
+        
+        payload = HydrusCompression.CompressFastBytesToBytes( payload )
+        
+    
+    return BINARY_UPDATE_MAGIC + struct.pack( '<BBB', BINARY_UPDATE_VERSION, update_type, compression ) + payload
+    
+def DumpUpdateToNetworkBytes( update, update_format = UPDATE_FORMAT_JSON ) -> bytes:
+    
+    if update_format == UPDATE_FORMAT_BINARY:
+        
+        try:
+            
+            return DumpUpdateToBinaryNetworkBytes( update )
+            
+        except HydrusExceptions.SerialisationException as e:
+            
+            # something odd in there, so we fall back to json, which can hold anything
+            HydrusData.Print( 'Could not make a binary update, so falling back to json: {}'.format( e ) )
+            
+        
+    
+    return update.DumpToNetworkBytes()
+    
 def GenerateDefaultServiceDictionary( service_type ):
     
     # don't store bytes key/value data here until ~version 537
@@ -43,6 +182,7 @@ def GenerateDefaultServiceDictionary( service_type ):
             
             dictionary[ 'service_options' ][ 'update_period' ] = update_period
             dictionary[ 'service_options' ][ 'nullification_period' ] = 90 * 86400
+            dictionary[ 'service_options' ][ 'update_format' ] = UPDATE_FORMAT_JSON
             
             dictionary[ 'next_nullification_update_index' ] = 0
             
@@ -144,6 +284,65 @@ def GetPossiblePermissions( service_type ):
     
     return permissions
     
+def PackIntArray( values, delta = False ) -> bytes:
+    
+    values = list( values )
+    
+    if len( values ) == 0:
+        
+        array = numpy.zeros( 0, dtype = numpy.int64 )
+        
+    else:
+        
+        array = numpy.array( values )
+        
+        # None, floats, or ints too big for int64 all come out as something else
+        if array.dtype.kind != 'i':
+            
+            raise HydrusExceptions.SerialisationException( 'Binary updates can only hold integers that fit in 64 bits!' )
+            
+        
+        array = array.astype( numpy.int64 )
+        
+    
+    if delta:
+        
+        array = numpy.diff( array, prepend = 0 )
+        
+    
+    if len( array ) == 0 or ( array.min() >= -( 2 ** 31 ) and array.max() < 2 ** 31 ):
+        
+        width = 4
+        
+    else:
+        
+        width = 8
+        
+    
+    return struct.pack( '<BBI', width, delta, len( array ) ) + array.astype( '<i{}'.format( width ) ).tobytes()
+    
+def UnpackIntArray( payload: bytes, offset: int ):
+    
+    ( width, delta, num_values ) = struct.unpack_from( '<BBI', payload, offset )
+    
+    offset += 6
+    
+    if width not in ( 4, 8 ):
+        
+        raise ValueError( 'Unknown int array width {}!'.format( width ) )
+        
+    
+    array = numpy.frombuffer( payload, dtype = '<i{}'.format( width ), count = num_values, offset = offset )
+    
+    offset += width * num_values
+    
+    if delta:
+        
+        array = numpy.cumsum( array, dtype = numpy.int64 )
+        
+    
+    return ( array.tolist(), offset )
+    
 class Account( object ):
     
     def __init__( self, account_key: bytes, account_type: "AccountType", created: int, expires: typing.Optional[ int ] ):
@@ -1538,6 +1737,55 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         self._content_data = {}
         
     
+    def _GetBinarySection( self, content_type, action, data ) -> bytes:
+        
+        if content_type == HC.CONTENT_TYPE_MAPPINGS:
+            
+            # tag order is kept, but each tag's hash_ids are sorted so the deltas are small
+            tag_ids = [ tag_id for ( tag_id, hash_ids ) in data ]
+            hash_id_blocks = [ sorted( hash_ids ) for ( tag_id, hash_ids ) in data ]
+            
+            return PackIntArray( tag_ids ) + PackIntArray( [ len( hash_id_block ) for hash_id_block in hash_id_blocks ] ) + PackIntArray( itertools.chain.from_iterable( hash_id_blocks ), delta = True )
+            
+        elif content_type in ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_TYPE_TAG_SIBLINGS ):
+            
+            pairs = sorted( ( tuple( pair ) for pair in data ) )
+            
+            return PackIntArray( [ a for ( a, b ) in pairs ], delta = True ) + PackIntArray( [ b for ( a, b ) in pairs ] )
+            
+        elif content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_DELETE:
+            
+            return PackIntArray( sorted( data ), delta = True )
+            
+        elif content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_ADD:
+            
+            rows = sorted( ( tuple( row ) for row in data ), key = lambda row: row[0] )
+            
+            num_columns = len( rows[0] ) if len( rows ) > 0 else 0
+            
+            if True in ( len( row ) != num_columns for row in rows ):
+                
+                raise HydrusExceptions.SerialisationException( 'Binary updates need all file rows to be the same length!' )
+                
+            
+            # width, duration and so on are often None, so we note those in a bitmask per row
+            none_masks = [ sum( ( 1 << i for ( i, value ) in enumerate( row ) if value is None ) ) for row in rows ]
+            
+            blocks = [ struct.pack( '<B', num_columns ), PackIntArray( none_masks ) ]
+            
+            for i in range( num_columns ):
+                
+                blocks.append( PackIntArray( [ 0 if row[ i ] is None else row[ i ] for row in rows ], delta = i == 0 ) )
+                
+            
+            return b''.join( blocks )
+            
+        else:
+            
+            raise HydrusExceptions.SerialisationException( 'Binary updates do not support content type {}, action {}!'.format( content_type, action ) )
+            
+        
+    
     def _GetContent( self, content_type, action ):
         
         if content_type in self._content_data:
@@ -1592,6 +1840,21 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         self._content_data[ content_type ][ action ].append( data )
         
     
+    def GetBinaryPayload( self ) -> bytes:
+        
+        sections = []
+        
+        for ( content_type, actions_to_datas ) in self._content_data.items():
+            
+            for ( action, data ) in actions_to_datas.items():
+                
+                sections.append( struct.pack( '<BB', content_type, action ) + self._GetBinarySection( content_type, action, data ) )
+                
+            
+        
+        return struct.pack( '<I', len( sections ) ) + b''.join( sections )
+        
+    
     def GetDeletedFiles( self ):
         
         return self._GetContent( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE )
@@ -1663,6 +1926,96 @@ class ContentUpdate( HydrusSerialisable.SerialisableBase ):
         return num
         
     
+    def InitialiseFromBinaryPayload( self, payload: bytes ):
+        
+        self._content_data = {}
+        
+        ( num_sections, ) = struct.unpack_from( '<I', payload, 0 )
+        
+        offset = 4
+        
+        for i in range( num_sections ):
+            
+            ( content_type, action ) = struct.unpack_from( '<BB', payload, offset )
+            
+            offset += 2
+            
+            if content_type == HC.CONTENT_TYPE_MAPPINGS:
+                
+                ( tag_ids, offset ) = UnpackIntArray( payload, offset )
+                ( hash_id_block_lengths, offset ) = UnpackIntArray( payload, offset )
+                ( all_hash_ids, offset ) = UnpackIntArray( payload, offset )
+                
+                data = []
+                
+                position = 0
+                
+                for ( tag_id, hash_id_block_length ) in zip( tag_ids, hash_id_block_lengths ):
+                    
+                    data.append( ( tag_id, all_hash_ids[ position : position + hash_id_block_length ] ) )
+                    
+                    position += hash_id_block_length
+                    
+                
+            elif content_type in ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_TYPE_TAG_SIBLINGS ):
+                
+                ( a_ids, offset ) = UnpackIntArray( payload, offset )
+                ( b_ids, offset ) = UnpackIntArray( payload, offset )
+                
+                data = list( zip( a_ids, b_ids ) )
+                
+            elif content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_DELETE:
+                
+                ( data, offset ) = UnpackIntArray( payload, offset )
+                
+            elif content_type == HC.CONTENT_TYPE_FILES and action == HC.CONTENT_UPDATE_ADD:
+                
+                ( num_columns, ) = struct.unpack_from( '<B', payload, offset )
+                
+                offset += 1
+                
+                ( none_masks, offset ) = UnpackIntArray( payload, offset )
+                
+                columns = []
+                
+                for j in range( num_columns ):
+                    
+                    ( column, offset ) = UnpackIntArray( payload, offset )
+                    
+                    columns.append( column )
+                    
+                
+                data = [ list( row ) for row in zip( *columns ) ]
+                
+                for ( row, none_mask ) in zip( data, none_masks ):
+                    
+                    if none_mask != 0:
+                        
+                        for j in range( num_columns ):
+                            
+                            if none_mask & ( 1 << j ):
+                                
+                                row[ j ] = None
+                                
+                            
+                        
+                    
+                
+            
+            else:
+                
+                raise ValueError( 'Unknown content type {}, action {}!'.format( content_type, action ) )
+                
+            
+            if content_type not in self._content_data:
+                
+                self._content_data[ content_type ] = {}
+                
+            
+            self._content_data[ content_type ][ action ] = data
+            
+        
+    
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_CONTENT_UPDATE ] = ContentUpdate
 
 class Credentials( HydrusSerialisable.SerialisableBase ):
@@ -1935,6 +2288,30 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
             
         
     
+    def GetBinaryPayload( self ) -> bytes:
+        
+        hash_ids = sorted( self._hash_ids_to_hashes.keys() )
+        hashes = [ self._hash_ids_to_hashes[ hash_id ] for hash_id in hash_ids ]
+        
+        if True in ( len( hash ) != BINARY_UPDATE_HASH_LENGTH for hash in hashes ):
+            
+            raise HydrusExceptions.SerialisationException( 'Binary updates only support {}-byte hashes!'.format( BINARY_UPDATE_HASH_LENGTH ) )
+            
+        
+        tag_ids = sorted( self._tag_ids_to_tags.keys() )
+        encoded_tags = [ bytes( self._tag_ids_to_tags[ tag_id ], 'utf-8' ) for tag_id in tag_ids ]
+        
+        blocks = [
+            PackIntArray( hash_ids, delta = True ),
+            b''.join( hashes ),
+            PackIntArray( tag_ids, delta = True ),
+            PackIntArray( [ len( encoded_tag ) for encoded_tag in encoded_tags ] ),
+            b''.join( encoded_tags )
+        ]
+        
+        return b''.join( blocks )
+        
+    
     def GetHashIdsToHashes( self ):
         
         return self._hash_ids_to_hashes
@@ -1950,7 +2327,45 @@ class DefinitionsUpdate( HydrusSerialisable.SerialisableBase ):
         return self._tag_ids_to_tags
         
     
+    def InitialiseFromBinaryPayload( self, payload: bytes ):
+        
+        ( hash_ids, offset ) = UnpackIntArray( payload, 0 )
+        
+        hashes_length = BINARY_UPDATE_HASH_LENGTH * len( hash_ids )
+        
+        hashes_bytes = payload[ offset : offset + hashes_length ]
+        
+        if len( hashes_bytes ) != hashes_length:
+            
+            raise ValueError( 'The hashes block was truncated!' )
+            
+        
+        offset += hashes_length
+        
+        self._hash_ids_to_hashes = { hash_id : hashes_bytes[ i * BINARY_UPDATE_HASH_LENGTH : ( i + 1 ) * BINARY_UPDATE_HASH_LENGTH ] for ( i, hash_id ) in enumerate( hash_ids ) }
+        
+        ( tag_ids, offset ) = UnpackIntArray( payload, offset )
+        ( tag_lengths, offset ) = UnpackIntArray( payload, offset )
+        
+        if offset + sum( tag_lengths ) > len( payload ):
+            
+            raise ValueError( 'The tags block was truncated!' )
+            
+        
+        tags = []
+        
+        for tag_length in tag_lengths:
+            
+            tags.append( str( payload[ offset : offset + tag_length ], 'utf-8' ) )
+            
+            offset += tag_length
+            
+        
+        self._tag_ids_to_tags = dict( zip( tag_ids, tags ) )
+        
+    
 HydrusSerialisable.SERIALISABLE_TYPES_TO_OBJECT_TYPES[ HydrusSerialisable.SERIALISABLE_TYPE_DEFINITIONS_UPDATE ] = DefinitionsUpdate
+HydrusSerialisable.NETWORK_BYTES_MAGIC_TO_PARSERS[ BINARY_UPDATE_MAGIC ] = CreateUpdateFromBinaryNetworkBytes
 
 class Metadata( HydrusSerialisable.SerialisableBase ):
     
@@ -2178,11 +2593,18 @@ class Metadata( HydrusSerialisable.SerialisableBase ):
             
         
     
-    def GetSlice( self, from_update_index ):
+    def GetSlice( self, from_update_index, update_hashes_to_alternate_update_hashes = None ):
         
         with self._lock:
             
-            metadata = { update_index : row for ( update_index, row ) in self._metadata.items() if update_index >= from_update_index }
+            if update_hashes_to_alternate_update_hashes is None:
+                
+                metadata = { update_index : row for ( update_index, row ) in self._metadata.items() if update_index >= from_update_index }
+                
+            else:
+                
+                metadata = { update_index : ( [ update_hashes_to_alternate_update_hashes.get( update_hash, update_hash ) for update_hash in update_hashes ], begin, end ) for ( update_index, ( update_hashes, begin, end ) ) in self._metadata.items() if update_index >= from_update_index }
+                
             
             return Metadata( metadata, self._next_update_due )
             
@@ -2935,6 +3357,9 @@ class ServerServiceRepository( ServerServiceRestricted ):
         dictionary[ 'metadata' ] = self._metadata
         dictionary[ 'next_nullification_update_index' ] = self._next_nullification_update_index
         
+        # no bytes keys in here, so hex
+        dictionary[ 'binary_update_hashes' ] = HydrusSerialisable.SerialisableDictionary( { update_hash.hex() : binary_update_hash.hex() for ( update_hash, binary_update_hash ) in self._update_hashes_to_binary_update_hashes.items() } )
+        
         return dictionary
         
     
@@ -2963,6 +3388,11 @@ class ServerServiceRepository( ServerServiceRestricted ):
             self._service_options[ 'nullification_period' ] = default_nullification_period
             
         
+        if 'update_format' not in self._service_options:
+            
+            self._service_options[ 'update_format' ] = UPDATE_FORMAT_JSON
+            
+        
         if 'next_nullification_update_index' not in dictionary:
             
             dictionary[ 'next_nullification_update_index' ] = 0
@@ -2972,6 +3402,15 @@ class ServerServiceRepository( ServerServiceRestricted ):
         
         self._metadata = dictionary[ 'metadata' ]
         
+        if 'binary_update_hashes' not in dictionary:
+            
+            dictionary[ 'binary_update_hashes' ] = HydrusSerialisable.SerialisableDictionary()
+            
+        
+        # the binary twins of json updates made while the update format was binary. only clients that say they can read binary are told about them
+        self._update_hashes_to_binary_update_hashes = { bytes.fromhex( update_hash_hex ) : bytes.fromhex( binary_update_hash_hex ) for ( update_hash_hex, binary_update_hash_hex ) in dictionary[ 'binary_update_hashes' ].items() }
+        self._binary_update_hashes = set( self._update_hashes_to_binary_update_hashes.values() )
+        
     
     def GetMetadata( self ):
         
@@ -2981,10 +3420,15 @@ class ServerServiceRepository( ServerServiceRestricted ):
             
         
     
-    def GetMetadataSlice( self, from_update_index ):
+    def GetMetadataSlice( self, from_update_index, update_format = UPDATE_FORMAT_JSON ):
         
         with self._lock:
             
+            if update_format == UPDATE_FORMAT_BINARY:
+                
+                return self._metadata.GetSlice( from_update_index, update_hashes_to_alternate_update_hashes = self._update_hashes_to_binary_update_hashes )
+                
+            
             return self._metadata.GetSlice( from_update_index )
             
         
@@ -2997,6 +3441,14 @@ class ServerServiceRepository( ServerServiceRestricted ):
             
         
     
+    def GetUpdateFormat( self ) -> int:
+        
+        with self._lock:
+            
+            return self._service_options[ 'update_format' ]
+            
+        
+    
     def GetUpdatePeriod( self ) -> int:
         
         with self._lock:
@@ -3009,7 +3461,7 @@ class ServerServiceRepository( ServerServiceRestricted ):
         
         with self._lock:
             
-            return self._metadata.HasUpdateHash( update_hash )
+            return self._metadata.HasUpdateHash( update_hash ) or update_hash in self._binary_update_hashes
             
         
     
@@ -3123,6 +3575,19 @@ class ServerServiceRepository( ServerServiceRestricted ):
         HG.server_controller.pub( 'notify_new_nullification' )
         
     
+    def SetUpdateFormat( self, update_format: int ):
+        
+        # update files are named by their hash, so this only affects updates made from now on
+        # in binary, every update is still made in json as well, for clients that cannot read binary
+        
+        with self._lock:
+            
+            self._service_options[ 'update_format' ] = update_format
+            
+            self._SetDirty()
+            
+        
+    
     def SetUpdatePeriod( self, update_period: int ):
         
         with self._lock:
@@ -3167,10 +3632,11 @@ class ServerServiceRepository( ServerServiceRestricted ):
                         
                     
                     update_period = self._service_options[ 'update_period' ]
+                    update_format = self._service_options[ 'update_format' ]
                     
                     end = begin + update_period
                     
-                    update_hashes = HG.server_controller.WriteSynchronous( 'create_update', service_key, begin, end )
+                    ( update_hashes, update_hashes_to_binary_update_hashes ) = HG.server_controller.WriteSynchronous( 'create_update', service_key, begin, end, update_format = update_format )
                     
                     update_created = True
                     
@@ -3180,6 +3646,9 @@ class ServerServiceRepository( ServerServiceRestricted ):
                         
                         self._metadata.AppendUpdate( update_hashes, begin, end, next_update_due )
                         
+                        self._update_hashes_to_binary_update_hashes.update( update_hashes_to_binary_update_hashes )
+                        self._binary_update_hashes.update( update_hashes_to_binary_update_hashes.values() )
+                        
                         update_due = self._metadata.UpdateDue()
                         
                     
@@ -20,7 +20,7 @@ from hydrus.core.files import HydrusFileHandling
 from hydrus.core.files.images import HydrusImageHandling
 from hydrus.core.networking import HydrusNetwork
 
-INT_PARAMS = { 'expires', 'num', 'since', 'content_type', 'action', 'status' }
+INT_PARAMS = { 'expires', 'num', 'since', 'content_type', 'action', 'status', 'update_format' }
 BYTE_PARAMS = { 'access_key', 'account_type_key', 'subject_account_key', 'registration_key', 'hash', 'subject_hash', 'update_hash' }
 STRING_PARAMS = { 'subject_tag', 'reason', 'message' }
 JSON_PARAMS = set()
@@ -4,13 +4,16 @@ import time
 
 import twisted.internet.error
 from twisted.internet import reactor, defer
+from twisted.internet.interfaces import IPushProducer
 from twisted.internet.threads import deferToThread
 from twisted.web.server import NOT_DONE_YET
 from twisted.web.resource import Resource
 from twisted.web.static import File as FileResource, NoRangeStaticProducer, SingleRangeStaticProducer, MultipleRangeStaticProducer
+from zope.interface import implementer
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDB
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusProfiling
@@ -427,6 +430,8 @@ class HydrusDomain( object ):
     
 class HydrusResource( Resource ):
     
+    DB_JOB_LANE = HydrusDB.JOB_LANE_API
+    
     def __init__( self, service, domain ):
         
         Resource.__init__( self )
@@ -461,14 +466,7 @@ class HydrusResource( Resource ):
             return request
             
         
-        if HG.profile_mode:
-            
-            d = deferToThread( self._profileJob, self._threadDoGETJob, request )
-            
-        else:
-            
-            d = deferToThread( self._threadDoGETJob, request )
-            
+        d = deferToThread( self._threadDoJob, self._threadDoGETJob, request )
         
         d.addCallback( wrap_thread_result )
         
@@ -484,14 +482,7 @@ class HydrusResource( Resource ):
             return request
             
         
-        if HG.profile_mode:
-            
-            d = deferToThread( self._profileJob, self._threadDoOPTIONSJob, request )
-            
-        else:
-            
-            d = deferToThread( self._threadDoOPTIONSJob, request )
-            
+        d = deferToThread( self._threadDoJob, self._threadDoOPTIONSJob, request )
         
         d.addCallback( wrap_thread_result )
         
@@ -507,14 +498,7 @@ class HydrusResource( Resource ):
             return request
             
         
-        if HG.profile_mode:
-            
-            d = deferToThread( self._profileJob, self._threadDoPOSTJob, request )
-            
-        else:
-            
-            d = deferToThread( self._threadDoPOSTJob, request )
-            
+        d = deferToThread( self._threadDoJob, self._threadDoPOSTJob, request )
         
         d.addCallback( wrap_thread_result )
         
@@ -695,6 +679,24 @@ class HydrusResource( Resource ):
 
             request.write( body_bytes )
             
+        elif response_context.HasBodyChunks():
+            
+            content_type = response_context.GetContentType()
+            
+            request.setHeader( 'Content-Type', content_type )
+            request.setHeader( 'Content-Disposition', content_disposition_type )
+            
+            # no Content-Length, so twisted will send this chunked as we go
+            
+            producer = BodyChunksProducer( request, response_context.GetBodyChunks(), lambda num_bytes: self._reportDataUsed( request, num_bytes ) )
+            
+            producer.start()
+            
+            # the producer reports the data used when it is done
+            content_length = 0
+            
+            do_finish = False
+            
         else:
             
             content_length = 0
@@ -1079,6 +1081,23 @@ class HydrusResource( Resource ):
         raise HydrusExceptions.NotFoundException( 'This service does not support that request!' )
         
     
+    def _threadDoJob( self, call, request: HydrusServerRequest.HydrusRequest ):
+        
+        # any db work this request does waits in our lane, so a busy api client doesn't get ahead of the ui
+        
+        with HydrusDB.JobLaneContext( self.DB_JOB_LANE ):
+            
+            if HG.profile_mode:
+                
+                return self._profileJob( call, request )
+                
+            else:
+                
+                return call( request )
+                
+            
+        
+    
     def _threadDoOPTIONSJob( self, request: HydrusServerRequest.HydrusRequest ):
         
         allowed_methods = []
@@ -1244,9 +1263,118 @@ class HydrusResourceWelcome( HydrusResource ):
         return response_context
         
     
+@implementer( IPushProducer )
+class BodyChunksProducer( object ):
+    
+    def __init__( self, request: HydrusServerRequest.HydrusRequest, body_chunks, report_data_used_callable ):
+        
+        # body_chunks is an iterator of bytes that may do db work, so we pull from it in a thread, one chunk at a time
+        
+        self._request = request
+        self._body_chunks = body_chunks
+        self._report_data_used_callable = report_data_used_callable
+        
+        self._num_bytes_written = 0
+        
+        self._paused = False
+        self._stopped = False
+        self._fetching = False
+        
+    
+    def _FetchNextChunk( self ):
+        
+        if self._paused or self._stopped or self._fetching:
+            
+            return
+            
+        
+        self._fetching = True
+        
+        d = deferToThread( next, self._body_chunks, None )
+        
+        d.addCallbacks( self._WriteChunk, self._ErrbackChunk )
+        
+    
+    def _ErrbackChunk( self, failure ):
+        
+        self._fetching = False
+        
+        HydrusData.Print( 'A streamed response failed partway through:' )
+        HydrusData.Print( failure.getTraceback() )
+        
+        if self._stopped:
+            
+            return
+            
+        
+        self._stopped = True
+        
+        # headers are long gone, so the best we can do is cut the connection and have the client notice the response never ended properly
+        
+        self._request.unregisterProducer()
+        
+        self._request.loseConnection()
+        
+        self._report_data_used_callable( self._num_bytes_written )
+        
+    
+    def _WriteChunk( self, chunk ):
+        
+        self._fetching = False
+        
+        if self._stopped:
+            
+            return
+            
+        
+        if chunk is None:
+            
+            self._stopped = True
+            
+            self._request.unregisterProducer()
+            
+            self._request.finish()
+            
+            self._report_data_used_callable( self._num_bytes_written )
+            
+            return
+            
+        
+        self._request.write( chunk )
+        
+        self._num_bytes_written += len( chunk )
+        
+        self._FetchNextChunk()
+        
+    
+    def pauseProducing( self ):
+        
+        self._paused = True
+        
+    
+    def resumeProducing( self ):
+        
+        self._paused = False
+        
+        self._FetchNextChunk()
+        
+    
+    def start( self ):
+        
+        self._request.registerProducer( self, True )
+        
+        self._FetchNextChunk()
+        
+    
+    def stopProducing( self ):
+        
+        self._stopped = True
+        
+    
+
 class ResponseContext( object ):
     
-    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None, is_attachment = False, max_age = None ):
+    def __init__( self, status_code, mime = HC.APPLICATION_JSON, body = None, path = None, cookies = None, is_attachment = False, max_age = None, body_chunks = None, content_type = None ):
         
         if body is None:
             
@@ -1293,6 +1421,8 @@ class ResponseContext( object ):
         self._cookies = cookies
         self._is_attachment = is_attachment
         self._max_age = max_age
+        self._body_chunks = body_chunks
+        self._content_type = content_type
         
     
     def GetBodyBytes( self ):
@@ -1300,6 +1430,21 @@ class ResponseContext( object ):
         return self._body_bytes
         
     
+    def GetBodyChunks( self ):
+        
+        return self._body_chunks
+        
+    
+    def GetContentType( self ):
+        
+        if self._content_type is not None:
+            
+            return self._content_type
+            
+        
+        return HC.mime_mimetype_string_lookup[ self._mime ]
+        
+    
     def GetCookies( self ):
         
         return self._cookies
@@ -1335,6 +1480,11 @@ class ResponseContext( object ):
         return self._body_bytes is not None
         
     
+    def HasBodyChunks( self ):
+        
+        return self._body_chunks is not None
+        
+    
     def HasPath( self ):
         
         return self._path is not None
@@ -88,6 +88,7 @@ def GenerateRepositoryUpdateTableName( service_id ):
 class DB( HydrusDB.HydrusDB ):
     
     READ_WRITE_ACTIONS = [ 'access_key', 'immediate_content_update', 'registration_keys' ]
+    BACKGROUND_ACTIONS = { 'analyze', 'clear_deferred_physical_delete', 'create_update', 'deferred_physical_delete', 'maintenance_regen_service_info', 'nullify_history', 'vacuum' }
     
     def __init__( self, controller, db_dir, db_name ):
         
@@ -2066,7 +2067,7 @@ class DB( HydrusDB.HydrusDB ):
         self._RepositoryRegenerateServiceInfo( service_id = service_id )
         
     
-    def _RepositoryCreateUpdate( self, service_key, begin, end ):
+    def _RepositoryCreateUpdate( self, service_key, begin, end, update_format = HydrusNetwork.UPDATE_FORMAT_JSON ):
         
         service_id = self._GetServiceId( service_key )
         
@@ -2077,6 +2078,7 @@ class DB( HydrusDB.HydrusDB ):
         updates = self._RepositoryGenerateUpdates( service_id, begin, end )
         
         update_hashes = []
+        update_hashes_to_binary_update_hashes = {}
         
         total_definition_rows = 0
         total_content_rows = 0
@@ -2096,6 +2098,7 @@ class DB( HydrusDB.HydrusDB ):
                     total_content_rows += num_rows
                     
                 
+                # json is what everyone gets in the metadata, so every client can read every update
                 update_bytes = update.DumpToNetworkBytes()
                 
                 update_hash = hashlib.sha256( update_bytes ).digest()
@@ -2109,10 +2112,37 @@ class DB( HydrusDB.HydrusDB ):
                 
                 update_hashes.append( update_hash )
                 
+                if update_format == HydrusNetwork.UPDATE_FORMAT_BINARY:
+                    
+                    # and clients that say they can read binary get this twin instead
+                    
+                    try:
+                        
+                        binary_update_bytes = HydrusNetwork.DumpUpdateToBinaryNetworkBytes( update )
+                        
+                    except HydrusExceptions.SerialisationException as e:
+                        
+                        HydrusData.Print( 'Could not make a binary update, so that update will only be json: {}'.format( e ) )
+                        
+                        continue
+                        
+                    
+                    binary_update_hash = hashlib.sha256( binary_update_bytes ).digest()
+                    
+                    dest_path = ServerFiles.GetExpectedFilePath( binary_update_hash )
+                    
+                    with open( dest_path, 'wb' ) as f:
+                        
+                        f.write( binary_update_bytes )
+                        
+                    
+                    update_hashes_to_binary_update_hashes[ update_hash ] = binary_update_hash
+                    
+                
             
             update_table_name = GenerateRepositoryUpdateTableName( service_id )
             
-            master_hash_ids = self._GetMasterHashIds( update_hashes )
+            master_hash_ids = self._GetMasterHashIds( update_hashes + list( update_hashes_to_binary_update_hashes.values() ) )
             
             self._ExecuteMany( 'INSERT OR IGNORE INTO ' + update_table_name + ' ( master_hash_id ) VALUES ( ? );', ( ( master_hash_id, ) for master_hash_id in master_hash_ids ) )
             
@@ -2124,7 +2154,7 @@ class DB( HydrusDB.HydrusDB ):
         
         HydrusData.Print( 'Update OK. ' + HydrusData.ToHumanInt( total_definition_rows ) + ' definition rows and ' + HydrusData.ToHumanInt( total_content_rows ) + ' content rows in ' + HydrusData.ToHumanInt( len( updates ) ) + ' update files.' )
         
-        return update_hashes
+        return ( update_hashes, update_hashes_to_binary_update_hashes )
         
     
     def _RepositoryDeleteAllCurrentContent( self, service_id, admin_account_id, subject_account_id ):
@@ -14,6 +14,7 @@ from twisted.internet import reactor
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTags
@@ -3570,6 +3571,70 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( len( file_search_context.GetPredicates() ), 2 )
         
+        #
+        
+        path = '/manage_database/get_cache_stats'
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        cache_names_to_stats = { cache_stats[ 'name' ] : cache_stats for cache_stats in d[ 'cache_stats' ] }
+        
+        self.assertIn( 'thumbnail cache', cache_names_to_stats )
+        
+        for key in ( 'eviction_policy', 'size_limit', 'current_size', 'num_entries', 'hits', 'misses', 'hit_rate', 'evictions', 'bytes_evicted', 'mean_entry_lifetime' ):
+            
+            self.assertIn( key, cache_names_to_stats[ 'thumbnail cache' ] )
+            
+        
+        #
+        
+        HydrusDBBase.ClearQueryStats()
+        
+        HydrusDBBase.RecordQuery( 'ClientDBFilesSearchTags', 'SELECT hash_id FROM current_mappings_8 WHERE tag_id = ?;', 0.5, 100, plan_lines = [ 'SEARCH current_mappings_8 USING PRIMARY KEY (tag_id=?)' ] )
+        HydrusDBBase.RecordQuery( 'ClientDBFilesSearchTags', 'SELECT hash_id FROM current_mappings_8 WHERE tag_id = ?;', 0.1, 20 )
+        HydrusDBBase.RecordQuery( 'ClientDBMaster', 'SELECT hash FROM hashes WHERE hash_id = ?;', 0.01, 1 )
+        
+        path = '/manage_database/get_query_stats?limit=1'
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'slow_query_mode' ], False )
+        self.assertEqual( len( d[ 'query_stats' ] ), 1 )
+        
+        stats = d[ 'query_stats' ][0]
+        
+        self.assertEqual( stats[ 'module' ], 'ClientDBFilesSearchTags' )
+        self.assertEqual( stats[ 'count' ], 2 )
+        self.assertEqual( stats[ 'total_rows' ], 120 )
+        self.assertEqual( stats[ 'num_slow' ], 1 )
+        self.assertAlmostEqual( stats[ 'total_time' ], 0.6 )
+        self.assertAlmostEqual( stats[ 'max_time' ], 0.5 )
+        self.assertAlmostEqual( stats[ 'mean_time' ], 0.3 )
+        self.assertEqual( stats[ 'query_plan' ], [ 'SEARCH current_mappings_8 USING PRIMARY KEY (tag_id=?)' ] )
+        
+        HydrusDBBase.ClearQueryStats()
+        
+    
     
     def _test_manage_duplicates( self, connection, set_up_permissions ):
         
@@ -4536,6 +4601,177 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( response.status, 400 )
         
+        # paged
+        
+        HG.test_controller.ClearReads( 'file_query_ids_page' )
+        
+        page_hash_ids = random.sample( list( hash_ids ), 3 )
+        
+        HG.test_controller.SetRead( 'file_query_ids_page', ( page_hash_ids, ( 1234567, page_hash_ids[-1] ) ) )
+        
+        tags = [ 'kino', 'green' ]
+        
+        path = '/get_files/search_files?tags={}&limit={}'.format( urllib.parse.quote( json.dumps( tags ) ), 3 )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'file_ids' ], page_hash_ids )
+        
+        next_after_token = d[ 'next_after' ]
+        
+        self.assertIsNotNone( next_after_token )
+        
+        [ ( args, kwargs ) ] = HG.test_controller.GetRead( 'file_query_ids_page' )
+        
+        ( file_search_context, sort_by ) = args
+        
+        self.assertEqual( sort_by.sort_type, ( 'system', CC.SORT_FILES_BY_IMPORT_TIME ) )
+        self.assertEqual( sort_by.sort_order, CC.SORT_DESC )
+        
+        self.assertEqual( kwargs[ 'limit' ], 3 )
+        self.assertEqual( kwargs[ 'after' ], None )
+        
+        # next page
+        
+        HG.test_controller.SetRead( 'file_query_ids_page', ( page_hash_ids[:1], None ) )
+        
+        path = '/get_files/search_files?tags={}&limit={}&after={}'.format( urllib.parse.quote( json.dumps( tags ) ), 3, next_after_token )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        self.assertEqual( d[ 'file_ids' ], page_hash_ids[:1] )
+        self.assertEqual( d[ 'next_after' ], None )
+        
+        [ ( args, kwargs ) ] = HG.test_controller.GetRead( 'file_query_ids_page' )
+        
+        self.assertEqual( kwargs[ 'after' ], ( 1234567, page_hash_ids[-1] ) )
+        
+        # token from a different sort
+        
+        path = '/get_files/search_files?tags={}&limit={}&after={}&file_sort_asc=true'.format( urllib.parse.quote( json.dumps( tags ) ), 3, next_after_token )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
+        # garbage token
+        
+        path = '/get_files/search_files?tags={}&limit={}&after={}'.format( urllib.parse.quote( json.dumps( tags ) ), 3, 'lmao' )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
+        # random sort cannot be paged
+        
+        path = '/get_files/search_files?tags={}&limit={}&file_sort_type={}'.format( urllib.parse.quote( json.dumps( tags ) ), 3, CC.SORT_FILES_BY_RANDOM )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        self.assertEqual( response.status, 400 )
+        
+        # streamed
+        
+        HG.test_controller.ClearReads( 'file_query_ids_page' )
+        
+        stream_hash_ids = list( range( 1, 600 ) )
+        
+        hash_ids_to_hashes = { hash_id : os.urandom( 32 ) for hash_id in stream_hash_ids }
+        
+        HG.test_controller.SetRead( 'file_query_ids_page', ( stream_hash_ids, None ) )
+        HG.test_controller.SetRead( 'hash_ids_to_hashes', hash_ids_to_hashes )
+        
+        path = '/get_files/search_files?tags={}&limit={}&return_hashes=true&stream=true'.format( urllib.parse.quote( json.dumps( tags ) ), 1000 )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( response.getheader( 'Content-Type' ), 'application/x-ndjson' )
+        self.assertEqual( response.getheader( 'Transfer-Encoding' ), 'chunked' )
+        
+        lines = [ json.loads( line ) for line in text.splitlines() ]
+        
+        footer = lines.pop()
+        
+        self.assertEqual( footer, { 'num_files' : len( stream_hash_ids ), 'next_after' : None } )
+        
+        self.assertEqual( [ line[ 'file_id' ] for line in lines ], stream_hash_ids )
+        self.assertEqual( [ line[ 'hash' ] for line in lines ], [ hash_ids_to_hashes[ hash_id ].hex() for hash_id in stream_hash_ids ] )
+        
+        # streamed without a limit still goes through the search a page at a time
+        
+        HG.test_controller.ClearReads( 'file_query_ids' )
+        HG.test_controller.ClearReads( 'file_query_ids_page' )
+        
+        HG.test_controller.SetRead( 'file_query_ids_page', ( stream_hash_ids, None ) )
+        
+        path = '/get_files/search_files?tags={}&return_hashes=true&stream=true'.format( urllib.parse.quote( json.dumps( tags ) ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        self.assertEqual( response.getheader( 'Content-Type' ), 'application/x-ndjson' )
+        
+        lines = [ json.loads( line ) for line in text.splitlines() ]
+        
+        footer = lines.pop()
+        
+        self.assertEqual( footer, { 'num_files' : len( stream_hash_ids ) } )
+        
+        self.assertEqual( [ line[ 'file_id' ] for line in lines ], stream_hash_ids )
+        self.assertEqual( [ line[ 'hash' ] for line in lines ], [ hash_ids_to_hashes[ hash_id ].hex() for hash_id in stream_hash_ids ] )
+        
+        [ ( args, kwargs ) ] = HG.test_controller.GetRead( 'file_query_ids_page' )
+        
+        self.assertEqual( kwargs[ 'limit' ], ClientLocalServerResources.STREAMED_SEARCH_PAGE_SIZE )
+        self.assertEqual( kwargs[ 'after' ], None )
+        
+        self.assertEqual( HG.test_controller.GetRead( 'file_query_ids' ), [] )
+        
         # empty
         
         sample_hash_ids = set( random.sample( list( hash_ids ), 3 ) )
@@ -5135,6 +5371,94 @@ class TestClientAPI( unittest.TestCase ):
         
         self.assertEqual( d, expected_identifier_result )
         
+        # projected fields
+        
+        columns = {
+            'file_id' : [ 1, 2, 3 ],
+            'size' : [ 100, 200, None ],
+            'mime' : [ HC.IMAGE_PNG, HC.VIDEO_WEBM, None ]
+        }
+        
+        storage_tag_field = ( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE, HC.CONTENT_STATUS_CURRENT )
+        
+        tag_columns = {
+            storage_tag_field : [ [ 'series:cars', 'car' ], [], [ 'blue eyes' ] ]
+        }
+        
+        HG.test_controller.ClearReads( 'file_metadata_columns' )
+        
+        HG.test_controller.SetRead( 'file_metadata_columns', ( columns, tag_columns ) )
+        
+        fields = 'file_id,hash,size,mime,ext,tags[my tags].current'
+        
+        path = '/get_files/file_metadata?file_ids={}&fields={}&columnar=true'.format( urllib.parse.quote( json.dumps( [ 1, 2, 3 ] ) ), urllib.parse.quote( fields ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        expected_columns = {
+            'file_id' : [ 1, 2, 3 ],
+            'hash' : [ file_ids_to_hashes[ hash_id ].hex() for hash_id in [ 1, 2, 3 ] ],
+            'size' : [ 100, 200, None ],
+            'mime' : [ 'image/png', 'video/webm', 'unknown filetype' ],
+            'ext' : [ '.png', '.webm', '' ],
+            'tags[my tags].current' : [ [ 'car', 'series:cars' ], [], [ 'blue eyes' ] ]
+        }
+        
+        self.assertEqual( d[ 'metadata' ], expected_columns )
+        
+        [ ( args, kwargs ) ] = HG.test_controller.GetRead( 'file_metadata_columns' )
+        
+        ( hash_ids, column_names, tag_fields ) = args
+        
+        self.assertEqual( hash_ids, [ 1, 2, 3 ] )
+        self.assertEqual( column_names, { 'file_id', 'size', 'mime' } )
+        self.assertEqual( tag_fields, { storage_tag_field } )
+        
+        # same as rows
+        
+        path = '/get_files/file_metadata?file_ids={}&fields={}'.format( urllib.parse.quote( json.dumps( [ 1, 2, 3 ] ) ), urllib.parse.quote( fields ) )
+        
+        connection.request( 'GET', path, headers = headers )
+        
+        response = connection.getresponse()
+        
+        data = response.read()
+        
+        text = str( data, 'utf-8' )
+        
+        self.assertEqual( response.status, 200 )
+        
+        d = json.loads( text )
+        
+        expected_rows = [ { field_name : column[ i ] for ( field_name, column ) in expected_columns.items() } for i in range( 3 ) ]
+        
+        self.assertEqual( d[ 'metadata' ], expected_rows )
+        
+        # bad fields
+        
+        for fields in ( 'file_id,lmao', 'tags[not a service].current', 'display_tags[my tags].deleted', '' ):
+            
+            path = '/get_files/file_metadata?file_ids={}&fields={}'.format( urllib.parse.quote( json.dumps( [ 1, 2, 3 ] ) ), urllib.parse.quote( fields ) )
+            
+            connection.request( 'GET', path, headers = headers )
+            
+            response = connection.getresponse()
+            
+            data = response.read()
+            
+            self.assertEqual( response.status, 400 )
+            
+        
         # basic metadata from file_ids
         
         HG.test_controller.SetRead( 'hash_ids_to_hashes', { k : v for ( k, v ) in file_ids_to_hashes.items() if k in [ 1, 2, 3 ] } )
@@ -1,9 +1,18 @@
+import os
+import random
+import threading
+import time
 import unittest
+from unittest.mock import patch
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusPaths
+from hydrus.core import HydrusTemp
 from hydrus.core import HydrusTime
+from hydrus.core.networking import HydrusNetwork
 
 from hydrus.client import ClientConstants as CC
 from hydrus.client import ClientManagers
@@ -122,3 +131,195 @@ class TestManagers( unittest.TestCase ):
         self.assertEqual( ( 'undo archive 2 files', None ), undo_manager.GetUndoRedoStrings() )
         
     
+class TestRepositoryUpdatePrefetcher( unittest.TestCase ):
+    
+    def test_decode( self ):
+        
+        test_dir = HydrusTemp.GetSubTempDir( 'update_prefetch_test' )
+        
+        try:
+            
+            HydrusPaths.MakeSureDirectoryExists( test_dir )
+            
+            update_hashes = [ HydrusData.GenerateKey() for i in range( 5 ) ]
+            
+            for ( i, update_hash ) in enumerate( update_hashes ):
+                
+                with open( os.path.join( test_dir, update_hash.hex() ), 'wb' ) as f:
+                    
+                    if i == 2:
+                        
+                        f.write( b'blarg' )
+                        
+                    else:
+                        
+                        update = HydrusNetwork.DefinitionsUpdate()
+                        
+                        update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, i, 'tag {}'.format( i ) ) )
+                        
+                        f.write( update.DumpToNetworkBytes() )
+                        
+                    
+                
+            
+            def get_file_path( update_hash, mime ):
+                
+                return os.path.join( test_dir, update_hash.hex() )
+                
+            
+            with patch.object( HG.client_controller.client_files_manager, 'GetFilePath', get_file_path ):
+                
+                prefetcher = ClientServices.RepositoryUpdatePrefetcher( update_hashes, HC.APPLICATION_HYDRUS_UPDATE_DEFINITIONS )
+                
+                try:
+                    
+                    for i in range( len( update_hashes ) ):
+                        
+                        if i == 2:
+                            
+                            # a broken update comes out of the worker as the error for that update, and the ones after it still arrive
+                            
+                            with self.assertRaises( HydrusExceptions.SerialisationException ):
+                                
+                                prefetcher.GetNext()
+                                
+                            
+                        else:
+                            
+                            ( update, decode_time, wait_time ) = prefetcher.GetNext()
+                            
+                            self.assertEqual( update.GetTagIdsToTags(), { i : 'tag {}'.format( i ) } )
+                            
+                            self.assertGreaterEqual( decode_time, 0 )
+                            self.assertGreaterEqual( wait_time, 0 )
+                            
+                        
+                    
+                finally:
+                    
+                    prefetcher.Shutdown()
+                    
+                
+            
+        finally:
+            
+            HydrusPaths.DeletePath( test_dir )
+            
+        
+    
+    def test_order( self ):
+        
+        lock = threading.Lock()
+        
+        in_flight = [ 0 ]
+        max_in_flight = [ 0 ]
+        
+        def load_update( update_hash, mime ):
+            
+            with lock:
+                
+                in_flight[0] += 1
+                max_in_flight[0] = max( max_in_flight[0], in_flight[0] )
+                
+            
+            # so later updates often finish before earlier ones
+            time.sleep( random.random() / 50 )
+            
+            with lock:
+                
+                in_flight[0] -= 1
+                
+            
+            if update_hash == b'bad':
+                
+                raise HydrusExceptions.SerialisationException( 'bad update' )
+                
+            
+            return ( ( update_hash, mime ), 0.0 )
+            
+        
+        update_hashes = [ HydrusData.GenerateKey() for i in range( 20 ) ]
+        
+        with patch.object( ClientServices, 'LoadRepositoryUpdate', load_update ):
+            
+            prefetcher = ClientServices.RepositoryUpdatePrefetcher( update_hashes, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+            
+            try:
+                
+                results = [ prefetcher.GetNext()[0] for i in range( len( update_hashes ) ) ]
+                
+            finally:
+                
+                prefetcher.Shutdown()
+                
+            
+            self.assertEqual( results, [ ( update_hash, HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) for update_hash in update_hashes ] )
+            
+            self.assertLessEqual( max_in_flight[0], ClientServices.UPDATE_PREFETCH_NUM )
+            
+            # any error raised in a worker comes out of GetNext for that update
+            
+            prefetcher = ClientServices.RepositoryUpdatePrefetcher( [ b'good', b'bad', b'good' ], HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+            
+            try:
+                
+                self.assertEqual( prefetcher.GetNext()[0], ( b'good', HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) )
+                
+                with self.assertRaises( HydrusExceptions.SerialisationException ):
+                    
+                    prefetcher.GetNext()
+                    
+                
+                self.assertEqual( prefetcher.GetNext()[0], ( b'good', HC.APPLICATION_HYDRUS_UPDATE_CONTENT ) )
+                
+            finally:
+                
+                prefetcher.Shutdown()
+                
+            
+        
+    
+    def test_shutdown( self ):
+        
+        release_event = threading.Event()
+        
+        loaded_hashes = []
+        
+        def load_update( update_hash, mime ):
+            
+            loaded_hashes.append( update_hash )
+            
+            release_event.wait( 5 )
+            
+            return ( update_hash, 0.0 )
+            
+        
+        update_hashes = [ HydrusData.GenerateKey() for i in range( 10 ) ]
+        
+        with patch.object( ClientServices, 'LoadRepositoryUpdate', load_update ):
+            
+            prefetcher = ClientServices.RepositoryUpdatePrefetcher( update_hashes, HC.APPLICATION_HYDRUS_UPDATE_CONTENT )
+            
+            time_started = HydrusTime.GetNowPrecise()
+            
+            # a shutdown mid-sync does not wait on the workers
+            prefetcher.Shutdown()
+            
+            self.assertLess( HydrusTime.GetNowPrecise() - time_started, 1 )
+            
+            release_event.set()
+            
+            time.sleep( 0.2 )
+            
+            # only what was already prefetched was loaded, nothing new was queued up
+            
+            self.assertLessEqual( len( loaded_hashes ), ClientServices.UPDATE_PREFETCH_NUM )
+            self.assertEqual( set( loaded_hashes ).difference( update_hashes[ : ClientServices.UPDATE_PREFETCH_NUM ] ), set() )
+            
+            with self.assertRaises( HydrusExceptions.ShutdownException ):
+                
+                prefetcher.GetNext()
+                
+            
+        
+    
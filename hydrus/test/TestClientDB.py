@@ -1,9 +1,15 @@
 import os
+import queue
+import sqlite3
+import threading
 import time
 import unittest
+from unittest.mock import patch
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusDB
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTime
@@ -16,13 +22,18 @@ from hydrus.client import ClientFilesPhysical
 from hydrus.client import ClientImageHandling
 from hydrus.client import ClientLocation
 from hydrus.client import ClientServices
+from hydrus.client import ClientThreading
 from hydrus.client.db import ClientDB
+from hydrus.client.db import ClientDBMappingsStorage
+from hydrus.client.db import ClientDBTagSearch
 from hydrus.client.exporting import ClientExportingFiles
 from hydrus.client.gui.pages import ClientGUIManagementController
 from hydrus.client.gui.pages import ClientGUISession
 from hydrus.client.importing import ClientImportLocal
 from hydrus.client.importing import ClientImportFiles
+from hydrus.client.importing import ClientImportFilesPipeline
 from hydrus.client.importing.options import FileImportOptions
+from hydrus.client.media import ClientMedia
 from hydrus.client.metadata import ClientTags
 from hydrus.client.search import ClientSearch
 
@@ -65,6 +76,25 @@ class TestClientDB( unittest.TestCase ):
         HG.test_controller.ClearTestDB()
         
     
+    @classmethod
+    def _reboot_db( cls ):
+        
+        cls._db.Shutdown()
+        
+        while not cls._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        del cls._db
+        
+        HG.test_controller.ClearTestDB()
+        
+        cls._db = ClientDB.DB( HG.test_controller, TestController.DB_DIR, 'client' )
+        
+        HG.test_controller.SetTestDB( cls._db )
+        
+    
     @classmethod
     def setUpClass( cls ):
         
@@ -218,6 +248,19 @@ class TestClientDB( unittest.TestCase ):
         
         self.assertEqual( set( result ), preds )
         
+        #
+        
+        # leading and infix wildcards, which go through the reversed and trigram caches
+        
+        for ( search_text, expected_tags ) in [ ( '*ars', { 'series:cars' } ), ( '*r', { 'car' } ), ( '*ord*', { 'maker:ford' } ), ( '*or*', { 'maker:ford' } ), ( '*a*', { 'car', 'series:cars' } ), ( 'c*s', { 'series:cars' } ) ]:
+            
+            result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = search_text )
+            
+            preds = { ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, tag, count = ClientSearch.PredicateCount.STATICCreateCurrentCount( 1 ) ) for tag in expected_tags }
+            
+            self.assertEqual( set( result ), preds )
+            
+        
         #
         
         result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = 'ser*', search_namespaces_into_full_tags = True )
@@ -248,6 +291,96 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( result.GetName(), export_folder.GetName() )
         
     
+    def test_file_metadata_columns( self ):
+        
+        TestClientDB._clear_db()
+        
+        file_import_options = FileImportOptions.FileImportOptions()
+        file_import_options.SetIsDefault( True )
+        
+        hashes = []
+        
+        for path in ( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ) ):
+            
+            file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+            
+            file_import_job.GeneratePreImportHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            hashes.append( file_import_job.GetHash() )
+            
+        
+        content_updates = []
+        
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'car', ( hashes[0], ) ) ) )
+        content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:cars', ( hashes[0], ) ) ) )
+        
+        self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : content_updates } )
+        
+        hash_ids_to_hashes = self._read( 'hash_ids_to_hashes', hashes = hashes )
+        
+        hashes_to_hash_ids = { hash : hash_id for ( hash_id, hash ) in hash_ids_to_hashes.items() }
+        
+        hash_ids = [ hashes_to_hash_ids[ hashes[1] ], hashes_to_hash_ids[ hashes[0] ] ]
+        
+        field_names = { 'file_id', 'hash', 'size', 'mime', 'width', 'height', 'duration', 'has_audio', 'is_inbox', 'known_urls', 'blurhash' }
+        
+        storage_tag_field = ( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE, HC.CONTENT_STATUS_CURRENT )
+        display_tag_field = ( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL, HC.CONTENT_STATUS_CURRENT )
+        deleted_tag_field = ( CC.DEFAULT_LOCAL_TAG_SERVICE_KEY, ClientTags.TAG_DISPLAY_STORAGE, HC.CONTENT_STATUS_DELETED )
+        
+        tag_fields = { storage_tag_field, display_tag_field, deleted_tag_field }
+        
+        # nothing is holding a media result yet, so this comes straight from the tables
+        
+        ( columns, tag_columns ) = self._read( 'file_metadata_columns', hash_ids, field_names, tag_fields )
+        
+        self.assertEqual( set( columns.keys() ), field_names )
+        self.assertEqual( set( tag_columns.keys() ), tag_fields )
+        
+        self.assertEqual( columns[ 'file_id' ], hash_ids )
+        self.assertEqual( columns[ 'hash' ], [ hashes[1], hashes[0] ] )
+        self.assertEqual( columns[ 'size' ][1], 5270 )
+        self.assertEqual( columns[ 'mime' ], [ HC.IMAGE_JPEG, HC.IMAGE_PNG ] )
+        self.assertEqual( columns[ 'width' ][1], 200 )
+        self.assertEqual( columns[ 'height' ][1], 200 )
+        self.assertEqual( columns[ 'duration' ], [ None, None ] )
+        self.assertEqual( columns[ 'is_inbox' ], [ True, True ] )
+        self.assertEqual( columns[ 'known_urls' ], [ [], [] ] )
+        
+        self.assertEqual( [ set( tags ) for tags in tag_columns[ storage_tag_field ] ], [ set(), { 'car', 'series:cars' } ] )
+        self.assertEqual( [ set( tags ) for tags in tag_columns[ display_tag_field ] ], [ set(), { 'car', 'series:cars' } ] )
+        self.assertEqual( tag_columns[ deleted_tag_field ], [ [], [] ] )
+        
+        # and now from cached media results, which should say the same
+        
+        media_results = self._read( 'media_results_from_ids', hash_ids, sorted = True )
+        
+        ( cached_columns, cached_tag_columns ) = self._read( 'file_metadata_columns', hash_ids, field_names, tag_fields )
+        
+        for field_name in field_names:
+            
+            if field_name == 'known_urls':
+                
+                self.assertEqual( [ set( urls ) for urls in cached_columns[ field_name ] ], [ set( urls ) for urls in columns[ field_name ] ] )
+                
+            else:
+                
+                self.assertEqual( cached_columns[ field_name ], columns[ field_name ] )
+                
+            
+        
+        for tag_field in tag_fields:
+            
+            self.assertEqual( [ set( tags ) for tags in cached_tag_columns[ tag_field ] ], [ set( tags ) for tags in tag_columns[ tag_field ] ] )
+            
+        
+        self.assertEqual( [ media_result.GetSize() for media_result in media_results ], columns[ 'size' ] )
+        
+    
     def test_file_query_ids( self ):
         
         TestClientDB._clear_db()
@@ -778,6 +911,150 @@ class TestClientDB( unittest.TestCase ):
         run_system_predicate_tests( tests )
         
     
+    def test_file_query_sort_limit( self ):
+        
+        TestClientDB._clear_db()
+        
+        file_import_options = FileImportOptions.FileImportOptions()
+        file_import_options.SetIsDefault( True )
+        
+        for filename in ( 'muh_apng.png', 'muh_gif.gif', 'muh_jpg.jpg', 'muh_mp4.mp4', 'muh_png.png', 'muh_webm.webm' ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+            
+            file_import_job.GeneratePreImportHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        sort_datas = [
+            CC.SORT_FILES_BY_IMPORT_TIME,
+            CC.SORT_FILES_BY_FILESIZE,
+            CC.SORT_FILES_BY_DURATION,
+            CC.SORT_FILES_BY_WIDTH,
+            CC.SORT_FILES_BY_RATIO,
+            CC.SORT_FILES_BY_NUM_PIXELS,
+            CC.SORT_FILES_BY_FRAMERATE,
+            CC.SORT_FILES_BY_APPROX_BITRATE
+        ]
+        
+        for sort_data in sort_datas:
+            
+            for sort_order in ( CC.SORT_ASC, CC.SORT_DESC ):
+                
+                sort_by = ClientMedia.MediaSort( sort_type = ( 'system', sort_data ), sort_order = sort_order )
+                
+                search_context = ClientSearch.FileSearchContext( location_context = location_context, predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_EVERYTHING ) ] )
+                
+                all_hash_ids = self._read( 'file_query_ids', search_context, sort_by = sort_by, apply_implicit_limit = False )
+                
+                self.assertEqual( len( all_hash_ids ), 6 )
+                
+                # the limited search sorts in sql or with a heap, but it should give the same as sorting everything and then cutting
+                
+                for limit in ( 1, 3, 5 ):
+                    
+                    search_context = ClientSearch.FileSearchContext( location_context = location_context, predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_LIMIT, limit ) ] )
+                    
+                    limited_hash_ids = self._read( 'file_query_ids', search_context, sort_by = sort_by )
+                    
+                    self.assertEqual( limited_hash_ids, all_hash_ids[ : limit ] )
+                    
+                
+            
+        
+    
+    def test_file_query_page( self ):
+        
+        TestClientDB._clear_db()
+        
+        file_import_options = FileImportOptions.FileImportOptions()
+        file_import_options.SetIsDefault( True )
+        
+        for filename in ( 'muh_apng.png', 'muh_gif.gif', 'muh_jpg.jpg', 'muh_mp4.mp4', 'muh_png.png', 'muh_webm.webm' ):
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+            
+            file_import_job.GeneratePreImportHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+        
+        search_context = ClientSearch.FileSearchContext( location_context = location_context, predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_EVERYTHING ) ] )
+        
+        sort_datas = [
+            CC.SORT_FILES_BY_IMPORT_TIME,
+            CC.SORT_FILES_BY_FILESIZE,
+            CC.SORT_FILES_BY_DURATION,
+            CC.SORT_FILES_BY_RATIO,
+            CC.SORT_FILES_BY_APPROX_BITRATE,
+            CC.SORT_FILES_BY_MEDIA_VIEWS,
+            CC.SORT_FILES_BY_HASH
+        ]
+        
+        for sort_data in sort_datas:
+            
+            for sort_order in ( CC.SORT_ASC, CC.SORT_DESC ):
+                
+                sort_by = ClientMedia.MediaSort( sort_type = ( 'system', sort_data ), sort_order = sort_order )
+                
+                ( all_hash_ids, next_after ) = self._read( 'file_query_ids_page', search_context, sort_by )
+                
+                self.assertEqual( len( all_hash_ids ), 6 )
+                self.assertEqual( next_after, None )
+                
+                if sort_data in ( CC.SORT_FILES_BY_FILESIZE, CC.SORT_FILES_BY_HASH ):
+                    
+                    # no ties here, so this should be the normal sort
+                    
+                    self.assertEqual( all_hash_ids, self._read( 'file_query_ids', search_context, sort_by = sort_by, apply_implicit_limit = False ) )
+                    
+                
+                for limit in ( 1, 2, 4 ):
+                    
+                    paged_hash_ids = []
+                    
+                    after = None
+                    
+                    while True:
+                        
+                        ( page_hash_ids, after ) = self._read( 'file_query_ids_page', search_context, sort_by, limit = limit, after = after )
+                        
+                        self.assertLessEqual( len( page_hash_ids ), limit )
+                        
+                        paged_hash_ids.extend( page_hash_ids )
+                        
+                        if after is None:
+                            
+                            break
+                            
+                        
+                    
+                    self.assertEqual( paged_hash_ids, all_hash_ids )
+                    
+                
+            
+        
+        sort_by = ClientMedia.MediaSort( sort_type = ( 'system', CC.SORT_FILES_BY_RANDOM ), sort_order = CC.SORT_ASC )
+        
+        with self.assertRaises( Exception ):
+            
+            self._read( 'file_query_ids_page', search_context, sort_by, limit = 2 )
+            
+        
+    
     def test_file_system_predicates( self ):
         
         TestClientDB._clear_db()
@@ -1359,6 +1636,88 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( item.GetName(), 'imp 1' )
         
     
+    def test_import_pipeline( self ):
+        
+        TestClientDB._clear_db()
+        
+        # the pipeline commits through the controller, so just for this test we send those writes to our db
+        
+        write_synchronous_patcher = patch.object( HG.test_controller, 'WriteSynchronous', self._write )
+        
+        write_synchronous_patcher.start()
+        
+        self.addCleanup( write_synchronous_patcher.stop )
+        
+        jpg_hash = bytes.fromhex( '5d884d84813beeebd59a35e474fa3e4742d0f2b6679faa7609b245ddbbd05444' )
+        png_hash = bytes.fromhex( 'cdc67d3b377e6e1397ffa55edc5b50f6bdf4482c7a6102c6f27fa351429d6f49' )
+        gif_hash = bytes.fromhex( '00dd9e9611ebc929bfc78fde99a0c92800bbb09b9d18e0946cea94c099b211c2' )
+        
+        filenames = [ 'muh_jpg.jpg', 'muh_png.png', 'does_not_exist.png', 'muh_gif.gif', 'muh_jpg.jpg' ]
+        
+        keys_and_paths = [ ( i, os.path.join( HC.STATIC_DIR, 'testing', filename ) ) for ( i, filename ) in enumerate( filenames ) ]
+        
+        file_import_options = FileImportOptions.FileImportOptions()
+        file_import_options.SetIsDefault( True )
+        
+        file_import_options = FileImportOptions.GetRealFileImportOptions( file_import_options, FileImportOptions.IMPORT_TYPE_QUIET )
+        
+        # tiny queues and batches, to make sure things get passed along properly
+        file_import_pipeline = ClientImportFilesPipeline.FileImportPipeline( file_import_options, 0, max_queue_size = 1, status_batch_size = 2, commit_batch_size = 2 )
+        
+        results = list( file_import_pipeline.Import( keys_and_paths ) )
+        
+        self.assertEqual( [ key for ( key, result ) in results ], [ 0, 1, 2, 3, 4 ] )
+        
+        ( jpg_result, png_result, missing_result, gif_result, second_jpg_result ) = [ result for ( key, result ) in results ]
+        
+        self.assertEqual( jpg_result.status, CC.STATUS_SUCCESSFUL_AND_NEW )
+        self.assertEqual( jpg_result.hash, jpg_hash )
+        self.assertEqual( png_result.status, CC.STATUS_SUCCESSFUL_AND_NEW )
+        self.assertEqual( png_result.hash, png_hash )
+        self.assertEqual( gif_result.status, CC.STATUS_SUCCESSFUL_AND_NEW )
+        self.assertEqual( gif_result.hash, gif_hash )
+        
+        self.assertIsInstance( missing_result, HydrusExceptions.VetoException )
+        
+        self.assertEqual( second_jpg_result.status, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT )
+        self.assertEqual( second_jpg_result.hash, jpg_hash )
+        
+        file_import_statuses = self._read( 'hash_statuses', 'sha256', [ jpg_hash, png_hash, gif_hash, os.urandom( 32 ) ] )
+        
+        self.assertEqual( [ file_import_status.status for file_import_status in file_import_statuses ], [ CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, CC.STATUS_UNKNOWN ] )
+        
+        media_result = self._read( 'media_result', png_hash )
+        
+        self.assertEqual( media_result.GetMime(), HC.IMAGE_PNG )
+        self.assertEqual( media_result.GetResolution(), ( 191, 196 ) )
+        
+        stages_to_throughput = file_import_pipeline.GetStagesToThroughput()
+        
+        for ( num_done, time_busy ) in stages_to_throughput.values():
+            
+            self.assertEqual( num_done, 5 )
+            
+        
+        # stopping early finishes off what is in the pipeline and cleans up
+        
+        TestClientDB._clear_db()
+        
+        file_import_pipeline = ClientImportFilesPipeline.FileImportPipeline( file_import_options, 0, max_queue_size = 1, status_batch_size = 1, commit_batch_size = 1 )
+        
+        file_seeds_and_results = file_import_pipeline.Import( keys_and_paths )
+        
+        ( key, result ) = next( file_seeds_and_results )
+        
+        self.assertEqual( key, 0 )
+        self.assertEqual( result.status, CC.STATUS_SUCCESSFUL_AND_NEW )
+        
+        file_seeds_and_results.close()
+        
+        self.assertLess( file_import_pipeline.GetStagesToThroughput()[ ClientImportFilesPipeline.PIPELINE_STAGE_COPY_AND_HASH ][0], len( keys_and_paths ) + 1 )
+        
+        self.assertIn( 'database commit', file_import_pipeline.GetStageReport() )
+        
+    
     def test_init( self ):
         
         self.assertTrue( os.path.exists( TestController.DB_DIR ) )
@@ -1522,12 +1881,32 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( written_hash, hash )
         
     
-    def test_media_results( self ):
+    def test_hash_statuses( self ):
         
         TestClientDB._clear_db()
         
+        hash = b'\xadm5\x99\xa6\xc4\x89\xa5u\xeb\x19\xc0&\xfa\xce\x97\xa9\xcdey\xe7G(\xb0\xce\x94\xa6\x01\xd22\xf3\xc3'
+        
+        md5 = bytes.fromhex( 'fdadb2cae78f2dfeb629449cd005f2a2' )
+        
+        unknown_hash = HydrusData.GenerateKey()
+        
+        url = 'https://site.com/post/123456'
+        unknown_url = 'https://site.com/post/654321'
+        
         path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
         
+        #
+        
+        file_import_statuses = self._read( 'hash_statuses', 'sha256', [ hash, unknown_hash ] )
+        
+        self.assertEqual( [ file_import_status.status for file_import_status in file_import_statuses ], [ CC.STATUS_UNKNOWN, CC.STATUS_UNKNOWN ] )
+        self.assertEqual( [ file_import_status.hash for file_import_status in file_import_statuses ], [ None, None ] )
+        
+        self.assertEqual( self._read( 'url_statuses_bulk', [ url, unknown_url ] ), { url : [], unknown_url : [] } )
+        
+        #
+        
         file_import_options = FileImportOptions.FileImportOptions()
         file_import_options.SetIsDefault( True )
         
@@ -1539,55 +1918,349 @@ class TestClientDB( unittest.TestCase ):
         
         self._write( 'import_file', file_import_job )
         
-        hash = file_import_job.GetHash()
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_URLS, HC.CONTENT_UPDATE_ADD, ( ( url, ), ( hash, ) ) )
+        
+        self._write( 'content_updates', { CC.COMBINED_LOCAL_FILE_SERVICE_KEY : ( content_update, ) } )
         
         #
         
-        media_result = self._read( 'media_result', hash )
+        for ( hash_type, hashes ) in ( ( 'sha256', [ unknown_hash, hash ] ), ( 'md5', [ unknown_hash, md5 ] ) ):
+            
+            file_import_statuses = self._read( 'hash_statuses', hash_type, hashes )
+            
+            self.assertEqual( [ file_import_status.status for file_import_status in file_import_statuses ], [ CC.STATUS_UNKNOWN, CC.STATUS_SUCCESSFUL_BUT_REDUNDANT ] )
+            self.assertEqual( [ file_import_status.hash for file_import_status in file_import_statuses ], [ None, hash ] )
+            
+            # the bulk call should say exactly what the single one does
+            
+            for ( file_import_status, single_hash ) in zip( file_import_statuses, hashes ):
+                
+                single_file_import_status = self._read( 'hash_status', hash_type, single_hash )
+                
+                self.assertEqual( ( file_import_status.status, file_import_status.hash, file_import_status.mime ), ( single_file_import_status.status, single_file_import_status.hash, single_file_import_status.mime ) )
+                
+            
         
-        ( mr_file_info_manager, mr_tags_manager, mr_locations_manager, mr_ratings_manager ) = media_result.ToTuple()
+        urls_to_statuses = self._read( 'url_statuses_bulk', [ url, unknown_url ] )
         
-        ( mr_hash_id, mr_hash, mr_size, mr_mime, mr_width, mr_height, mr_duration, mr_num_frames, mr_has_audio, mr_num_words ) = mr_file_info_manager.ToTuple()
+        self.assertEqual( urls_to_statuses[ unknown_url ], [] )
+        self.assertEqual( [ ( file_import_status.status, file_import_status.hash ) for file_import_status in urls_to_statuses[ url ] ], [ ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, hash ) ] )
         
-        mr_inbox = mr_locations_manager.inbox
+        # if the batch fails, each url gets another go on its own, and only the ones that fail again come back blank
         
-        now = HydrusTime.GetNow()
+        modules_files_metadata_rich = TestClientDB._db.modules_files_metadata_rich
         
-        self.assertEqual( mr_hash, hash )
-        self.assertEqual( mr_inbox, True )
-        self.assertEqual( mr_size, 5270 )
-        self.assertEqual( mr_mime, HC.IMAGE_PNG )
-        self.assertEqual( mr_hash, hash )
-        self.assertEqual( mr_width, 200 )
-        self.assertEqual( mr_height, 200 )
-        self.assertEqual( mr_duration, None )
-        self.assertEqual( mr_num_frames, None )
-        self.assertEqual( mr_has_audio, False )
-        self.assertEqual( mr_num_words, None )
+        original_get_hash_ids_to_statuses = modules_files_metadata_rich.GetHashIdsToStatuses
         
-        ( media_result, ) = self._read( 'media_results_from_ids', ( 1, ) )
+        num_calls = [ 0 ]
         
-        ( mr_file_info_manager, mr_tags_manager, mr_locations_manager, mr_ratings_manager ) = media_result.ToTuple()
+        def get_hash_ids_to_statuses_that_fails_first_time( *args, **kwargs ):
+            
+            num_calls[0] += 1
+            
+            if num_calls[0] == 1:
+                
+                raise Exception( 'test batch failure' )
+                
+            
+            return original_get_hash_ids_to_statuses( *args, **kwargs )
+            
         
-        ( mr_hash_id, mr_hash, mr_size, mr_mime, mr_width, mr_height, mr_duration, mr_num_frames, mr_has_audio, mr_num_words ) = mr_file_info_manager.ToTuple()
+        def get_hash_ids_to_statuses_that_always_fails( *args, **kwargs ):
+            
+            raise Exception( 'test failure' )
+            
         
-        mr_inbox = mr_locations_manager.inbox
+        with patch.object( modules_files_metadata_rich, 'GetHashIdsToStatuses', get_hash_ids_to_statuses_that_fails_first_time ):
+            
+            urls_to_statuses = self._read( 'url_statuses_bulk', [ url, unknown_url ] )
+            
         
-        now = HydrusTime.GetNow()
+        self.assertEqual( urls_to_statuses[ unknown_url ], [] )
+        self.assertEqual( [ ( file_import_status.status, file_import_status.hash ) for file_import_status in urls_to_statuses[ url ] ], [ ( CC.STATUS_SUCCESSFUL_BUT_REDUNDANT, hash ) ] )
         
-        self.assertEqual( mr_hash, hash )
-        self.assertEqual( mr_inbox, True )
-        self.assertEqual( mr_size, 5270 )
-        self.assertEqual( mr_mime, HC.IMAGE_PNG )
-        self.assertEqual( mr_hash, hash )
-        self.assertEqual( mr_width, 200 )
-        self.assertEqual( mr_height, 200 )
-        self.assertEqual( mr_duration, None )
+        with patch.object( modules_files_metadata_rich, 'GetHashIdsToStatuses', get_hash_ids_to_statuses_that_always_fails ):
+            
+            self.assertEqual( self._read( 'url_statuses_bulk', [ url, unknown_url ] ), { url : [], unknown_url : [] } )
+            
+        
+        #
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, ( hash, ), reason = 'test delete' )
+        
+        self._write( 'content_updates', { CC.LOCAL_FILE_SERVICE_KEY : ( content_update, ) } )
+        
+        #
+        
+        file_import_statuses = self._read( 'hash_statuses', 'sha256', [ hash ] )
+        
+        self.assertEqual( file_import_statuses[0].status, CC.STATUS_DELETED )
+        self.assertIn( 'test delete', file_import_statuses[0].note )
+        
+        urls_to_statuses = self._read( 'url_statuses_bulk', [ url ] )
+        
+        self.assertEqual( [ file_import_status.status for file_import_status in urls_to_statuses[ url ] ], [ CC.STATUS_DELETED ] )
+        
+    
+    def test_job_queue( self ):
+        
+        def make_job( job_type, action, *args, lane = HydrusDB.JOB_LANE_INTERACTIVE ):
+            
+            job = HydrusData.JobDatabase( job_type, True, action, *args )
+            
+            job.SetLane( lane )
+            
+            return job
+            
+        
+        # the queue knows jobs by the thread that made them, so these threads hang around until the end of the test so their idents are not reused
+        
+        test_done = threading.Event()
+        
+        def make_job_on_another_thread( *args, **kwargs ):
+            
+            jobs = []
+            job_made = threading.Event()
+            
+            def do_it():
+                
+                jobs.append( make_job( *args, **kwargs ) )
+                
+                job_made.set()
+                
+                test_done.wait()
+                
+            
+            threading.Thread( target = do_it, daemon = True ).start()
+            
+            job_made.wait()
+            
+            return jobs[0]
+            
+        
+        # lanes
+        
+        job_queue = HydrusDB.DBJobQueue()
+        
+        background_job = make_job_on_another_thread( 'write', 'analyze', lane = HydrusDB.JOB_LANE_BACKGROUND )
+        api_job = make_job_on_another_thread( 'read', 'file_hashes', ( 1, ), lane = HydrusDB.JOB_LANE_API )
+        interactive_job = make_job_on_another_thread( 'read', 'file_hashes', ( 2, ) )
+        
+        job_queue.Put( background_job )
+        job_queue.Put( api_job )
+        job_queue.Put( interactive_job )
+        
+        self.assertTrue( job_queue.HasQueuedWrites() )
+        
+        lanes_to_status = job_queue.GetLaneStatus()
+        
+        self.assertEqual( { lane : depth for ( lane, ( depth, percentiles ) ) in lanes_to_status.items() }, { HydrusDB.JOB_LANE_INTERACTIVE : 1, HydrusDB.JOB_LANE_API : 1, HydrusDB.JOB_LANE_BACKGROUND : 1 } )
+        self.assertEqual( lanes_to_status[ HydrusDB.JOB_LANE_INTERACTIVE ][1], { 50 : None, 90 : None, 99 : None } )
+        
+        self.assertIs( job_queue.Get( timeout = 0 ), interactive_job )
+        self.assertIs( job_queue.Get( timeout = 0 ), api_job )
+        self.assertIs( job_queue.Get( timeout = 0 ), background_job )
+        
+        self.assertTrue( job_queue.Empty() )
+        self.assertFalse( job_queue.HasQueuedWrites() )
+        
+        with self.assertRaises( queue.Empty ):
+            
+            job_queue.Get( timeout = 0 )
+            
+        
+        self.assertIsNotNone( job_queue.GetLaneStatus()[ HydrusDB.JOB_LANE_INTERACTIVE ][1][ 50 ] )
+        
+        # a thread's later job does not overtake its earlier one
+        
+        background_job = make_job( 'write', 'analyze', lane = HydrusDB.JOB_LANE_BACKGROUND )
+        interactive_job = make_job( 'read', 'file_hashes', ( 3, ) )
+        other_interactive_job = make_job_on_another_thread( 'read', 'file_hashes', ( 4, ) )
+        
+        job_queue.Put( background_job )
+        job_queue.Put( interactive_job )
+        job_queue.Put( other_interactive_job )
+        
+        self.assertEqual( interactive_job.GetLane(), HydrusDB.JOB_LANE_BACKGROUND )
+        
+        self.assertIs( job_queue.Get( timeout = 0 ), other_interactive_job )
+        self.assertIs( job_queue.Get( timeout = 0 ), background_job )
+        self.assertIs( job_queue.Get( timeout = 0 ), interactive_job )
+        
+        # coalescing
+        
+        first_job = make_job_on_another_thread( 'read', 'file_hashes', [ 1, 2 ], { 'a', 'b' } )
+        second_job = make_job_on_another_thread( 'read', 'file_hashes', [ 1, 2 ], { 'b', 'a' } )
+        different_job = make_job_on_another_thread( 'read', 'file_hashes', [ 1, 3 ], { 'a', 'b' } )
+        
+        job_queue.Put( first_job )
+        job_queue.Put( second_job )
+        job_queue.Put( different_job )
+        
+        self.assertIs( job_queue.Get( timeout = 0 ), first_job )
+        self.assertIs( job_queue.Get( timeout = 0 ), different_job )
+        self.assertTrue( job_queue.Empty() )
+        
+        first_job.PutResult( [ 'result' ] )
+        
+        self.assertEqual( first_job.GetResult(), [ 'result' ] )
+        self.assertEqual( second_job.GetResult(), [ 'result' ] )
+        self.assertIsNot( first_job.GetResult(), second_job.GetResult() )
+        
+        # no sharing across a write, or once the first job has started
+        
+        first_job = make_job_on_another_thread( 'read', 'file_hashes', 5 )
+        write_job = make_job_on_another_thread( 'write', 'content_updates', 5 )
+        second_job = make_job_on_another_thread( 'read', 'file_hashes', 5 )
+        
+        job_queue.Put( first_job )
+        job_queue.Put( write_job )
+        job_queue.Put( second_job )
+        
+        self.assertIs( job_queue.Get( timeout = 0 ), first_job )
+        self.assertIs( job_queue.Get( timeout = 0 ), write_job )
+        self.assertIs( job_queue.Get( timeout = 0 ), second_job )
+        
+        first_job = make_job_on_another_thread( 'read', 'file_hashes', 6 )
+        second_job = make_job_on_another_thread( 'read', 'file_hashes', 6 )
+        
+        job_queue.Put( first_job )
+        
+        self.assertIs( job_queue.Get( timeout = 0 ), first_job )
+        
+        job_queue.Put( second_job )
+        
+        self.assertIs( job_queue.Get( timeout = 0 ), second_job )
+        
+        # unhashable args are never shared
+        
+        first_job = make_job_on_another_thread( 'read', 'file_hashes', bytearray( b'7' ) )
+        second_job = make_job_on_another_thread( 'read', 'file_hashes', bytearray( b'7' ) )
+        
+        job_queue.Put( first_job )
+        job_queue.Put( second_job )
+        
+        self.assertIs( job_queue.Get( timeout = 0 ), first_job )
+        self.assertIs( job_queue.Get( timeout = 0 ), second_job )
+        
+        test_done.set()
+        
+    
+    def test_media_results( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_options = FileImportOptions.FileImportOptions()
+        file_import_options.SetIsDefault( True )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        #
+        
+        media_result = self._read( 'media_result', hash )
+        
+        ( mr_file_info_manager, mr_tags_manager, mr_locations_manager, mr_ratings_manager ) = media_result.ToTuple()
+        
+        ( mr_hash_id, mr_hash, mr_size, mr_mime, mr_width, mr_height, mr_duration, mr_num_frames, mr_has_audio, mr_num_words ) = mr_file_info_manager.ToTuple()
+        
+        mr_inbox = mr_locations_manager.inbox
+        
+        now = HydrusTime.GetNow()
+        
+        self.assertEqual( mr_hash, hash )
+        self.assertEqual( mr_inbox, True )
+        self.assertEqual( mr_size, 5270 )
+        self.assertEqual( mr_mime, HC.IMAGE_PNG )
+        self.assertEqual( mr_hash, hash )
+        self.assertEqual( mr_width, 200 )
+        self.assertEqual( mr_height, 200 )
+        self.assertEqual( mr_duration, None )
+        self.assertEqual( mr_num_frames, None )
+        self.assertEqual( mr_has_audio, False )
+        self.assertEqual( mr_num_words, None )
+        
+        ( media_result, ) = self._read( 'media_results_from_ids', ( 1, ) )
+        
+        ( mr_file_info_manager, mr_tags_manager, mr_locations_manager, mr_ratings_manager ) = media_result.ToTuple()
+        
+        ( mr_hash_id, mr_hash, mr_size, mr_mime, mr_width, mr_height, mr_duration, mr_num_frames, mr_has_audio, mr_num_words ) = mr_file_info_manager.ToTuple()
+        
+        mr_inbox = mr_locations_manager.inbox
+        
+        now = HydrusTime.GetNow()
+        
+        self.assertEqual( mr_hash, hash )
+        self.assertEqual( mr_inbox, True )
+        self.assertEqual( mr_size, 5270 )
+        self.assertEqual( mr_mime, HC.IMAGE_PNG )
+        self.assertEqual( mr_hash, hash )
+        self.assertEqual( mr_width, 200 )
+        self.assertEqual( mr_height, 200 )
+        self.assertEqual( mr_duration, None )
         self.assertEqual( mr_num_frames, None )
         self.assertEqual( mr_has_audio, False )
         self.assertEqual( mr_num_words, None )
         
     
+    def test_media_result_cache_tag_index( self ):
+        
+        TestClientDB._clear_db()
+        
+        path = os.path.join( HC.STATIC_DIR, 'hydrus.png' )
+        
+        file_import_options = FileImportOptions.FileImportOptions()
+        file_import_options.SetIsDefault( True )
+        
+        file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+        
+        file_import_job.GeneratePreImportHashAndStatus()
+        
+        file_import_job.GenerateInfo()
+        
+        self._write( 'import_file', file_import_job )
+        
+        hash = file_import_job.GetHash()
+        
+        self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'car', ( hash, ) ) ) ] } )
+        
+        media_result = self._read( 'media_result', hash )
+        
+        hash_id = media_result.GetHashId()
+        
+        cache = TestClientDB._db._weakref_media_result_cache
+        
+        self.assertEqual( cache.FilterFilesWithTags( { 'car' } ), { hash_id } )
+        self.assertEqual( cache.FilterFilesWithTags( { 'bus' } ), set() )
+        
+        # the db does this after the job returns, so we'll do it ourselves rather than race it
+        
+        cache.ProcessContentUpdates( { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'bus', ( hash, ) ) ) ] } )
+        
+        self.assertEqual( cache.FilterFilesWithTags( { 'bus' } ), { hash_id } )
+        self.assertEqual( cache.FilterFilesWithTags( { 'car', 'bus', 'train' } ), { hash_id } )
+        
+        cache.ProcessContentUpdates( { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'car', ( hash, ) ) ) ] } )
+        
+        self.assertEqual( cache.FilterFilesWithTags( { 'car' } ), set() )
+        self.assertEqual( cache.FilterFilesWithTags( { 'bus' } ), { hash_id } )
+        
+        #
+        
+        cache.DropMediaResult( hash_id, hash )
+        
+        self.assertEqual( cache.FilterFilesWithTags( { 'bus' } ), set() )
+        
+    
     def test_mr_bones( self ):
         
         TestClientDB._clear_db()
@@ -1970,6 +2643,242 @@ class TestClientDB( unittest.TestCase ):
         self.assertEqual( result, [ pixiv_id, password ] )
         
     
+    def test_read_pool( self ):
+        
+        TestClientDB._clear_db()
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+        tag_context = ClientSearch.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        file_search_context = ClientSearch.FileSearchContext( location_context = location_context, tag_context = tag_context )
+        
+        reader = TestClientDB._db._GenerateReadPoolReader()
+        
+        try:
+            
+            for ( action, args ) in [
+                ( 'file_query_ids', ( file_search_context, ) ),
+                ( 'autocomplete_predicates', ( ClientTags.TAG_DISPLAY_STORAGE, file_search_context ) )
+            ]:
+                
+                self.assertIn( action, ClientDB.DB.READ_POOL_ACTIONS )
+                
+                job = HydrusData.JobDatabase( 'read', True, action, *args )
+                
+                TestClientDB._db._ProcessReadPoolJob( reader, job )
+                
+                self.assertEqual( job.GetResult(), self._read( action, *args ) )
+                
+            
+            with self.assertRaises( Exception ):
+                
+                reader._Execute( 'DELETE FROM version;' )
+                
+            
+            # the reader keeps its connection over a commit and only resets the module caches that moved on
+            
+            reader_module_cache_generations = list( TestClientDB._db._read_pool_module_cache_generations )
+            
+            service_key = HydrusData.GenerateKey()
+            
+            services = self._read( 'services' )
+            
+            services.append( ClientServices.GenerateService( service_key, HC.LOCAL_TAG, 'read pool tags' ) )
+            
+            # commit straight after the write, and the read after it waits for that commit
+            
+            TestClientDB._db._cursor_transaction_wrapper._transaction_commit_period = -1
+            
+            try:
+                
+                self._write( 'update_services', services )
+                
+                self._read( 'services' )
+                
+            finally:
+                
+                TestClientDB._db._cursor_transaction_wrapper._transaction_commit_period = HG.db_transaction_commit_period
+                
+            
+            self.assertNotEqual( TestClientDB._db._read_pool_module_cache_generations, reader_module_cache_generations )
+            
+            reader_inbox_hash_ids = reader.modules_files_inbox.inbox_hash_ids
+            
+            with self.assertRaises( HydrusExceptions.DataMissing ):
+                
+                reader.modules_services.GetServiceId( service_key )
+                
+            
+            TestClientDB._db._ReadPoolResetStaleCaches( reader, reader_module_cache_generations )
+            
+            self.assertEqual( reader.modules_services.GetServiceId( service_key ), TestClientDB._db.modules_services.GetServiceId( service_key ) )
+            
+            self.assertIs( reader.modules_files_inbox.inbox_hash_ids, reader_inbox_hash_ids )
+            
+        finally:
+            
+            reader._CloseReadPoolConnection()
+            
+        
+        # similar files searches stay on the main connection
+        
+        similar_file_search_context = ClientSearch.FileSearchContext( location_context = location_context, tag_context = tag_context, predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_SIMILAR_TO_FILES, ( ( os.urandom( 32 ), ), 5 ) ) ] )
+        
+        with patch.object( HydrusDB.HydrusDB, '_ReadPoolShouldTakeJob', return_value = True ):
+            
+            self.assertTrue( TestClientDB._db._ReadPoolShouldTakeJob( 'file_query_ids', file_search_context ) )
+            self.assertFalse( TestClientDB._db._ReadPoolShouldTakeJob( 'file_query_ids', similar_file_search_context ) )
+            self.assertFalse( TestClientDB._db._ReadPoolShouldTakeJob( 'file_query_ids_page', file_search_context = similar_file_search_context ) )
+            
+        
+        # the read pool should not trust its snapshot from the moment a write starts, not just once it is done
+        
+        snapshot_was_current_during_write = []
+        
+        original_write = TestClientDB._db._Write
+        
+        def watching_write( action, *args, **kwargs ):
+            
+            snapshot_was_current_during_write.append( TestClientDB._db._read_pool_snapshot_is_current )
+            
+            return original_write( action, *args, **kwargs )
+            
+        
+        with patch.object( TestClientDB._db, '_Write', watching_write ):
+            
+            self._write( 'serialisable_simple', 'read pool test', 1 )
+            
+        
+        self.assertEqual( snapshot_was_current_during_write, [ False ] )
+        
+        timings = TestClientDB._db.GetJobTimings()
+        
+        self.assertIn( 'file_query_ids', { action for ( lane, action, num_jobs, mean_wait_time, mean_work_time, max_wait_time ) in timings.GetRows() } )
+        
+    
+    def test_repository_bulk_load( self ):
+        
+        TestClientDB._clear_db()
+        
+        service_key = HydrusData.GenerateKey()
+        
+        services = self._read( 'services' )
+        
+        service = ClientServices.GenerateService( service_key, HC.TAG_REPOSITORY, 'bulk tag repo' )
+        
+        services.append( service )
+        
+        self._write( 'update_services', services )
+        
+        #
+        
+        hashes = [ os.urandom( 32 ) for i in range( 64 ) ]
+        
+        job_status = ClientThreading.JobStatus()
+        
+        definition_iterator_dict = {}
+        
+        definition_iterator_dict[ 'service_hash_ids_to_hashes' ] = iter( enumerate( hashes, start = 1 ) )
+        definition_iterator_dict[ 'service_tag_ids_to_tags' ] = iter( [ ( 1, 'bulk' ), ( 2, 'load' ) ] )
+        
+        self._write( 'process_repository_definitions', service_key, os.urandom( 32 ), definition_iterator_dict, ( HC.CONTENT_TYPE_DEFINITIONS, ), job_status, 120 )
+        
+        self.assertFalse( self._read( 'repository_is_bulk_loading', service_key ) )
+        
+        # commit straight after the write, and the read after it waits for that commit
+        
+        TestClientDB._db._cursor_transaction_wrapper._transaction_commit_period = -1
+        
+        try:
+            
+            self._write( 'repository_bulk_load_begin', service_key )
+            
+            self.assertTrue( self._read( 'repository_is_bulk_loading', service_key ) )
+            
+        finally:
+            
+            TestClientDB._db._cursor_transaction_wrapper._transaction_commit_period = HG.db_transaction_commit_period
+            
+        
+        # the storage indices stay put the whole time, since plenty of file work looks up mappings by hash
+        
+        service_id = TestClientDB._db.modules_services.GetServiceId( service_key )
+        
+        ( current_mappings_table_name, deleted_mappings_table_name, pending_mappings_table_name, petitioned_mappings_table_name ) = ClientDBMappingsStorage.GenerateMappingsTableNames( service_id )
+        
+        db = sqlite3.connect( os.path.join( TestController.DB_DIR, 'client.mappings.db' ) )
+        
+        try:
+            
+            for table_name in ( current_mappings_table_name, deleted_mappings_table_name ):
+                
+                table_name = table_name.split( '.', 1 )[1]
+                
+                indexed_columns = [ [ column_name for ( seqno, cid, column_name ) in db.execute( 'PRAGMA index_info( {} );'.format( row[1] ) ) ] for row in db.execute( 'PRAGMA index_list( {} );'.format( table_name ) ) ]
+                
+                self.assertIn( [ 'hash_id', 'tag_id' ], indexed_columns )
+                
+            
+        finally:
+            
+            db.close()
+            
+        
+        content_iterator_dict = {}
+        
+        content_iterator_dict[ 'new_mappings' ] = iter( [ ( 1, list( range( 1, 65 ) ) ), ( 2, list( range( 1, 11 ) ) ) ] )
+        content_iterator_dict[ 'deleted_mappings' ] = iter( [ ( 2, list( range( 1, 6 ) ) ) ] )
+        
+        num_rows_done = self._write( 'process_repository_content', service_key, os.urandom( 32 ), content_iterator_dict, ( HC.CONTENT_TYPE_MAPPINGS, ), job_status, 120 )
+        
+        self.assertEqual( num_rows_done, 64 + 10 + 5 )
+        
+        # the caches catch up one job at a time when the bulk load is finished, and display sync waits for them
+        
+        self.assertFalse( self._write( 'repository_bulk_load_finish', service_key ) )
+        
+        self.assertTrue( self._read( 'repository_is_bulk_loading', service_key ) )
+        
+        status = self._read( 'tag_display_maintenance_status', service_key )
+        
+        self.assertEqual( len( status[ 'waiting_on_tag_repos' ] ), 1 )
+        
+        num_finish_jobs = 1
+        
+        while not self._write( 'repository_bulk_load_finish', service_key ):
+            
+            num_finish_jobs += 1
+            
+        
+        # every specific cache, then the combined one, then the wrap-up
+        self.assertEqual( num_finish_jobs, len( TestClientDB._db.modules_services.GetServiceIds( HC.FILE_SERVICES_WITH_SPECIFIC_MAPPING_CACHES ) ) + 1 )
+        
+        self.assertFalse( self._read( 'repository_is_bulk_loading', service_key ) )
+        
+        status = self._read( 'tag_display_maintenance_status', service_key )
+        
+        self.assertEqual( status[ 'waiting_on_tag_repos' ], [] )
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_FILE_SERVICE_KEY )
+        tag_context = ClientSearch.TagContext( service_key = service_key )
+        
+        file_search_context = ClientSearch.FileSearchContext( location_context = location_context, tag_context = tag_context )
+        
+        result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = '*' )
+        
+        preds = set()
+        
+        preds.add( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'bulk', count = ClientSearch.PredicateCount.STATICCreateCurrentCount( 64 ) ) )
+        preds.add( ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_TAG, 'load', count = ClientSearch.PredicateCount.STATICCreateCurrentCount( 5 ) ) )
+        
+        self.assertEqual( set( result ), preds )
+        self.assertEqual( { p.GetValue() : p.GetCount().GetMinCount( HC.CONTENT_STATUS_CURRENT ) for p in result }, { 'bulk' : 64, 'load' : 5 } )
+        
+        #
+        
+        TestClientDB._clear_db()
+        
+    
     def test_services( self ):
         
         TestClientDB._clear_db()
@@ -2056,3 +2965,141 @@ class TestClientDB( unittest.TestCase ):
             
         
     
+    def test_tag_search_wildcard_caches( self ):
+        
+        TestClientDB._clear_db()
+        
+        location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.COMBINED_FILE_SERVICE_KEY )
+        
+        tag_context = ClientSearch.TagContext( service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY )
+        
+        file_search_context = ClientSearch.FileSearchContext( location_context = location_context, tag_context = tag_context )
+        
+        def add_tag( tag ):
+            
+            content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag, ( HydrusData.GenerateKey(), ) ) )
+            
+            self._write( 'content_updates', { CC.DEFAULT_LOCAL_TAG_SERVICE_KEY : [ content_update ] } )
+            
+        
+        def do_searches( searches ):
+            
+            for ( search_text, expected_tags ) in searches:
+                
+                result = self._read( 'autocomplete_predicates', ClientTags.TAG_DISPLAY_STORAGE, file_search_context, search_text = search_text )
+                
+                self.assertEqual( { predicate.GetValue() for predicate in result }, expected_tags )
+                
+            
+        
+        def get_statuses():
+            
+            return set( TestClientDB._db.modules_tag_search._service_ids_to_wildcard_cache_status.values() )
+            
+        
+        for tag in ( 'car', 'series:cars', 'maker:ford' ):
+            
+            add_tag( tag )
+            
+        
+        searches = [ ( '*ars', { 'series:cars' } ), ( '*or*', { 'maker:ford' } ), ( '*a*', { 'car', 'series:cars' } ) ]
+        
+        do_searches( searches )
+        
+        self.assertEqual( get_statuses(), { ( None, None ) } )
+        
+        # what an update leaves us with: empty caches that the background maintenance has to fill
+        
+        TestClientDB._db.Shutdown()
+        
+        while not TestClientDB._db.LoopIsFinished():
+            
+            time.sleep( 0.1 )
+            
+        
+        db = sqlite3.connect( os.path.join( TestController.DB_DIR, 'client.db' ) )
+        
+        db.execute( 'UPDATE tag_search_wildcard_cache_status SET reversed_populated_to_subtag_id = 0, trigram_populated_to_subtag_id = 0;' )
+        
+        db.commit()
+        
+        db.close()
+        
+        db = sqlite3.connect( os.path.join( TestController.DB_DIR, 'client.caches.db' ) )
+        
+        wildcard_table_names = [ name for ( name, ) in db.execute( 'SELECT name FROM sqlite_master WHERE type = ? AND sql LIKE ?;', ( 'table', 'CREATE VIRTUAL TABLE%' ) ) if 'reversed' in name or 'trigram' in name ]
+        
+        self.assertTrue( len( wildcard_table_names ) > 0 )
+        
+        for name in wildcard_table_names:
+            
+            db.execute( 'DELETE FROM {};'.format( name ) )
+            
+        
+        db.commit()
+        
+        db.close()
+        
+        TestClientDB._reboot_db()
+        
+        self.assertEqual( get_statuses(), { ( 0, 0 ) } )
+        
+        # they are not trusted until they are populated, so we still get everything
+        
+        do_searches( searches )
+        
+        still_work_to_do = self._write( 'maintain_tag_search_wildcard_caches', HydrusTime.GetNowFloat() - 1 )
+        
+        self.assertTrue( still_work_to_do )
+        self.assertEqual( get_statuses(), { ( 0, 0 ) } )
+        
+        with patch.object( ClientDBTagSearch, 'WILDCARD_CACHE_POPULATION_BLOCK_SIZE', 1 ):
+            
+            still_work_to_do = self._write( 'maintain_tag_search_wildcard_caches', HydrusTime.GetNowFloat() + 60 )
+            
+        
+        self.assertFalse( still_work_to_do )
+        
+        trigram_ok = ClientDBTagSearch.SQLiteSupportsTrigramIndex()
+        
+        self.assertEqual( get_statuses(), { ( None, None if trigram_ok else 0 ) } )
+        
+        do_searches( searches )
+        
+        if not trigram_ok:
+            
+            return
+            
+        
+        # now we boot with an sqlite that cannot do trigrams and add a tag, so the trigram cache falls out of sync
+        
+        try:
+            
+            ClientDBTagSearch.sqlite_supports_trigram_index = False
+            
+            TestClientDB._reboot_db()
+            
+            add_tag( 'maker:toyota' )
+            
+            self.assertIn( ( None, 0 ), get_statuses() )
+            
+            do_searches( [ ( '*oyot*', { 'maker:toyota' } ) ] )
+            
+        finally:
+            
+            ClientDBTagSearch.sqlite_supports_trigram_index = None
+            
+        
+        TestClientDB._reboot_db()
+        
+        do_searches( [ ( '*oyot*', { 'maker:toyota' } ) ] )
+        
+        still_work_to_do = self._write( 'maintain_tag_search_wildcard_caches', HydrusTime.GetNowFloat() + 60 )
+        
+        self.assertFalse( still_work_to_do )
+        
+        self.assertEqual( get_statuses(), { ( None, None ) } )
+        
+        do_searches( [ ( '*ars', { 'series:cars' } ), ( '*or*', { 'maker:ford' } ), ( '*a*', { 'car', 'series:cars', 'maker:toyota' } ), ( '*oyot*', { 'maker:toyota' } ) ] )
+        
+    
@@ -1,15 +1,19 @@
 import os
+import random
 import time
 import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 from hydrus.core import HydrusTime
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientFiles
 from hydrus.client import ClientLocation
 from hydrus.client.db import ClientDB
+from hydrus.client.db import ClientDBSimilarFiles
 from hydrus.client.importing import ClientImportFiles
 from hydrus.client.importing.options import FileImportOptions
 from hydrus.client.search import ClientSearch
@@ -1107,3 +1111,193 @@ class TestClientDBDuplicates( unittest.TestCase ):
         self._test_dissolve()
         
     
+    def test_perceptual_hash_index( self ):
+        
+        def flip_bits( perceptual_hash, num_bits ):
+            
+            value = int.from_bytes( perceptual_hash, 'big' )
+            
+            for bit in random.sample( range( 64 ), num_bits ):
+                
+                value ^= 1 << bit
+                
+            
+            return value.to_bytes( 8, 'big' )
+            
+        
+        search_perceptual_hash = os.urandom( 8 )
+        
+        perceptual_hashes = [ os.urandom( 8 ) for i in range( 1000 ) ]
+        perceptual_hashes.extend( ( flip_bits( search_perceptual_hash, num_bits ) for num_bits in range( 16 ) ) )
+        
+        perceptual_hash_ids_and_perceptual_hashes = list( enumerate( perceptual_hashes ) )
+        
+        def get_expected( max_hamming_distance ):
+            
+            expected = set()
+            
+            for ( perceptual_hash_id, perceptual_hash ) in perceptual_hash_ids_and_perceptual_hashes:
+                
+                distance = HydrusData.Get64BitHammingDistance( search_perceptual_hash, perceptual_hash )
+                
+                if distance <= max_hamming_distance:
+                    
+                    expected.add( ( perceptual_hash_id, distance ) )
+                    
+                
+            
+            return expected
+            
+        
+        for min_size_for_bands in ( 0, ClientDBSimilarFiles.PerceptualHashIndex.MIN_SIZE_FOR_BANDS ):
+            
+            perceptual_hash_index = ClientDBSimilarFiles.PerceptualHashIndex( perceptual_hash_ids_and_perceptual_hashes )
+            
+            perceptual_hash_index.MIN_SIZE_FOR_BANDS = min_size_for_bands
+            
+            perceptual_hash_index._Rebuild( perceptual_hash_index._perceptual_hash_ids, perceptual_hash_index._values )
+            
+            for max_hamming_distance in ( 0, 4, 8, 12 ):
+                
+                self.assertEqual( set( perceptual_hash_index.Search( search_perceptual_hash, max_hamming_distance ) ), get_expected( max_hamming_distance ) )
+                
+            
+        
+        # sync
+        
+        ( near_perceptual_hash_id, near_perceptual_hash ) = perceptual_hash_ids_and_perceptual_hashes[ 1001 ]
+        
+        perceptual_hash_index.Remove( ( near_perceptual_hash_id, ) )
+        
+        self.assertNotIn( ( near_perceptual_hash_id, 1 ), perceptual_hash_index.Search( search_perceptual_hash, 4 ) )
+        
+        perceptual_hash_index.Add( 5000, search_perceptual_hash )
+        perceptual_hash_index.Add( near_perceptual_hash_id, near_perceptual_hash )
+        
+        self.assertIn( ( 5000, 0 ), perceptual_hash_index.Search( search_perceptual_hash, 0 ) )
+        self.assertIn( ( near_perceptual_hash_id, 1 ), perceptual_hash_index.Search( search_perceptual_hash, 4 ) )
+        self.assertEqual( len( perceptual_hash_index ), len( perceptual_hashes ) + 1 )
+        
+        # and against the real tree
+        
+        ( num_perceptual_hashes, num_searches, index_build_time, rows ) = self._read( 'similar_files_benchmark', num_searches = 5 )
+        
+        for ( max_hamming_distance, tree_time, num_tree_results, batched_tree_time, num_batched_tree_results, index_time, num_index_results, file_time, num_file_results, batched_file_time, num_batched_file_results ) in rows:
+            
+            self.assertEqual( num_tree_results, num_batched_tree_results )
+            self.assertEqual( num_tree_results, num_index_results )
+            self.assertEqual( num_file_results, num_batched_file_results )
+            
+        
+    
+    def test_perceptual_hash_index_rollback( self ):
+        
+        # a failed job rolls back the perceptual hash rows it made. sqlite hands those ids out again, so the in-memory index has to forget them too
+        
+        TestClientDBDuplicates._clear_db()
+        
+        file_import_options = FileImportOptions.FileImportOptions()
+        file_import_options.SetIsDefault( True )
+        
+        def get_fake_file_import_job( hash, perceptual_hash ):
+            
+            fake_file_import_job = ClientImportFiles.FileImportJob( 'fake path', file_import_options )
+            
+            fake_file_import_job._pre_import_file_status = ClientImportFiles.FileImportStatus( CC.STATUS_UNKNOWN, hash )
+            fake_file_import_job._file_info = ( 65535, HC.IMAGE_JPEG, 640, 480, None, None, False, None )
+            fake_file_import_job._extra_hashes = ( b'abcd', b'abcd', b'abcd' )
+            fake_file_import_job._perceptual_hashes = [ perceptual_hash ]
+            
+            return fake_file_import_job
+            
+        
+        def search( perceptual_hash ):
+            
+            predicates = [ ClientSearch.Predicate( ClientSearch.PREDICATE_TYPE_SYSTEM_SIMILAR_TO_DATA, ( (), ( perceptual_hash, ), 4 ) ) ]
+            
+            location_context = ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY )
+            
+            search_context = ClientSearch.FileSearchContext( location_context = location_context, predicates = predicates )
+            
+            return self._read( 'file_query_ids', search_context )
+            
+        
+        rolled_back_perceptual_hash = os.urandom( 8 )
+        kept_perceptual_hash = os.urandom( 8 )
+        
+        HG.test_controller.new_options.SetBoolean( 'similar_files_use_in_memory_index', True )
+        
+        try:
+            
+            # this loads the index
+            
+            self.assertEqual( search( rolled_back_perceptual_hash ), [] )
+            
+            with self.assertRaises( HydrusExceptions.DBException ):
+                
+                self._write( 'import_files', [ get_fake_file_import_job( HydrusData.GenerateKey(), rolled_back_perceptual_hash ), None ] )
+                
+            
+            self._write( 'import_file', get_fake_file_import_job( HydrusData.GenerateKey(), kept_perceptual_hash ) )
+            
+            # the index saw the rolled back row, so it has to be thrown away and reloaded
+            
+            self.assertIsNone( TestClientDBDuplicates._db.modules_similar_files._perceptual_hash_index )
+            
+            self.assertEqual( len( search( kept_perceptual_hash ) ), 1 )
+            self.assertEqual( search( rolled_back_perceptual_hash ), [] )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'similar_files_use_in_memory_index', False )
+            
+        
+    
+    
+    def test_similar_files_search_benchmark( self ):
+        
+        # potential duplicate search used to go one file at a time through the tree. now it goes a block at a time, through the in-memory index if it is on
+        # how much faster that is depends on the machine, so the debug benchmark reports it. here we just check every way gets the same results
+        
+        TestClientDBDuplicates._clear_db()
+        
+        r = random.Random( 4 )
+        
+        cleared_job_tuples = [ ( r.getrandbits( 256 ).to_bytes( 32, 'big' ), ClientFiles.REGENERATE_FILE_DATA_JOB_SIMILAR_FILES_METADATA, [ r.getrandbits( 64 ).to_bytes( 8, 'big' ) ] ) for i in range( 3000 ) ]
+        
+        self._write( 'file_maintenance_clear_jobs', cleared_job_tuples )
+        
+        max_hamming_distances = ( 4, 8, 12 )
+        
+        ( num_perceptual_hashes, num_searches, index_build_time, tree_rows ) = self._read( 'similar_files_benchmark', num_searches = 256, max_hamming_distances = max_hamming_distances )
+        
+        self.assertEqual( num_perceptual_hashes, 3000 )
+        self.assertEqual( num_searches, 256 )
+        
+        HG.test_controller.new_options.SetBoolean( 'similar_files_use_in_memory_index', True )
+        
+        try:
+            
+            ( num_perceptual_hashes, num_searches, index_build_time, index_rows ) = self._read( 'similar_files_benchmark', num_searches = 256, max_hamming_distances = max_hamming_distances )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'similar_files_use_in_memory_index', False )
+            
+        
+        for ( tree_row, index_row ) in zip( tree_rows, index_rows ):
+            
+            ( max_hamming_distance, tree_time, num_tree_results, batched_tree_time, num_batched_tree_results, index_time, num_index_results, file_time, num_file_results, batched_file_time, num_batched_file_results ) = tree_row
+            
+            self.assertEqual( num_tree_results, num_batched_tree_results )
+            self.assertEqual( num_file_results, num_batched_file_results )
+            
+            ( max_hamming_distance, tree_time, num_tree_results, batched_tree_time, num_batched_tree_results, index_time, num_index_results, index_file_time, num_index_file_results, index_batched_file_time, num_index_batched_file_results ) = index_row
+            
+            # each benchmark run picks its own random files to search, so we only compare within a run
+            
+            self.assertEqual( num_tree_results, num_index_results )
+            self.assertEqual( num_index_file_results, num_index_batched_file_results )
+            
+        
+    
@@ -656,6 +656,105 @@ class TestClientDBTags( unittest.TestCase ):
         self.assertDictEqual( expected_display_tags_to_counts, tags_to_counts )
         
     
+    def test_display_bulk_sync( self ):
+        
+        # a big pile of new siblings and parents is synced in batches rather than row by row, so let's check the batches get the same answer
+        
+        self._clear_db()
+        
+        num_tags = 120
+        
+        bad_tags = [ 'bulk tag {}'.format( i ) for i in range( num_tags ) ]
+        good_tags = [ 'character:bulk tag {}'.format( i ) for i in range( num_tags ) ]
+        parent_tag = 'series:bulk'
+        
+        half = num_tags // 2
+        
+        # import two files, one with current tags and one with pending
+        
+        hashes = []
+        
+        for filename in ( 'muh_jpg.jpg', 'muh_png.png' ):
+            
+            HG.test_controller.SetRead( 'hash_status', ClientImportFiles.FileImportStatus.STATICGetUnknownStatus() )
+            
+            path = os.path.join( HC.STATIC_DIR, 'testing', filename )
+            
+            file_import_options = FileImportOptions.FileImportOptions()
+            file_import_options.SetIsDefault( True )
+            
+            file_import_job = ClientImportFiles.FileImportJob( path, file_import_options )
+            
+            file_import_job.GeneratePreImportHashAndStatus()
+            
+            file_import_job.GenerateInfo()
+            
+            self._write( 'import_file', file_import_job )
+            
+            hashes.append( file_import_job.GetHash() )
+            
+        
+        ( current_hash, pending_hash ) = hashes
+        
+        service_keys_to_content_updates = {}
+        
+        content_updates = []
+        
+        content_updates.extend( ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag, ( current_hash, ) ) ) for tag in bad_tags[ : half ] ) )
+        content_updates.extend( ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_PEND, ( tag, ( pending_hash, ) ) ) for tag in bad_tags[ half : ] ) )
+        
+        service_keys_to_content_updates[ self._public_service_key ] = content_updates
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        # now add all the siblings and parents in one go
+        
+        service_keys_to_content_updates = {}
+        
+        content_updates = []
+        
+        content_updates.extend( ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( bad_tag, good_tag ) ) for ( bad_tag, good_tag ) in zip( bad_tags, good_tags ) ) )
+        content_updates.extend( ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_ADD, ( good_tag, parent_tag ) ) for good_tag in good_tags ) )
+        
+        service_keys_to_content_updates[ self._public_service_key ] = content_updates
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        self._sync_display()
+        
+        ( current_media_result, pending_media_result ) = sorted( self._read( 'media_results', hashes ), key = lambda media_result: hashes.index( media_result.GetHash() ) )
+        
+        self.assertEqual( current_media_result.GetTagsManager().GetCurrent( self._public_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), set( good_tags[ : half ] ).union( { parent_tag } ) )
+        self.assertEqual( current_media_result.GetTagsManager().GetPending( self._public_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), set() )
+        self.assertEqual( pending_media_result.GetTagsManager().GetCurrent( self._public_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), set() )
+        self.assertEqual( pending_media_result.GetTagsManager().GetPending( self._public_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), set( good_tags[ half : ] ).union( { parent_tag } ) )
+        
+        self._test_ac( parent_tag, self._public_service_key, CC.LOCAL_FILE_SERVICE_KEY, {}, { parent_tag : ClientSearch.PredicateCount.STATICCreateStaticCount( 1, 1 ) } )
+        self._test_ac( parent_tag, self._public_service_key, CC.COMBINED_FILE_SERVICE_KEY, {}, { parent_tag : ClientSearch.PredicateCount.STATICCreateStaticCount( 1, 1 ) } )
+        
+        # and take the siblings away again, which leaves the parents hanging off tags no file has
+        
+        service_keys_to_content_updates = {}
+        
+        content_updates = []
+        
+        content_updates.extend( ( HydrusData.ContentUpdate( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_DELETE, ( bad_tag, good_tag ) ) for ( bad_tag, good_tag ) in zip( bad_tags, good_tags ) ) )
+        
+        service_keys_to_content_updates[ self._public_service_key ] = content_updates
+        
+        self._write( 'content_updates', service_keys_to_content_updates )
+        
+        self._sync_display()
+        
+        ( current_media_result, pending_media_result ) = sorted( self._read( 'media_results', hashes ), key = lambda media_result: hashes.index( media_result.GetHash() ) )
+        
+        self.assertEqual( current_media_result.GetTagsManager().GetCurrent( self._public_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), set( bad_tags[ : half ] ) )
+        self.assertEqual( pending_media_result.GetTagsManager().GetPending( self._public_service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), set( bad_tags[ half : ] ) )
+        
+        self._test_ac( parent_tag, self._public_service_key, CC.LOCAL_FILE_SERVICE_KEY, {}, {} )
+        self._test_ac( parent_tag, self._public_service_key, CC.COMBINED_FILE_SERVICE_KEY, {}, {} )
+        
+    
     def test_display_pairs_lookup_web_parents( self ):
         
         self._clear_db()
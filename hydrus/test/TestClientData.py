@@ -1,6 +1,618 @@
+import collections
+import os
+import random
 import unittest
 
 from hydrus.core import HydrusConstants as HC
+from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientLocation
+from hydrus.core import HydrusGlobals as HG
+
+from hydrus.client.caches import ClientCachesBase
+from hydrus.client.caches import ClientCachesDisk
+from hydrus.client.media import ClientMedia
+from hydrus.client.media import ClientMediaManagers
+from hydrus.client.metadata import ClientTags
+from hydrus.client.search import ClientSearch
+
+from hydrus.test import HelperFunctions
+
+class TestCacheableObject( ClientCachesBase.CacheableObject ):
+    
+    def __init__( self, size ):
+        
+        ClientCachesBase.CacheableObject.__init__( self )
+        
+        self._size = size
+        
+    
+    def GetEstimatedMemoryFootprint( self ) -> int:
+        
+        return self._size
+        
+    
+
+class TestDataCache( unittest.TestCase ):
+    
+    def test_lru( self ):
+        
+        data_cache = ClientCachesBase.DataCache( HG.test_controller, 'test lru cache', 100, timeout = 3600, eviction_policy_type = CC.CACHE_EVICTION_POLICY_LRU )
+        
+        for i in range( 10 ):
+            
+            data_cache.AddData( i, TestCacheableObject( 10 ) )
+            
+        
+        self.assertTrue( all( data_cache.HasData( i ) for i in range( 10 ) ) )
+        
+        data_cache.GetData( 0 )
+        
+        data_cache.AddData( 10, TestCacheableObject( 10 ) )
+        
+        self.assertTrue( data_cache.HasData( 0 ) )
+        self.assertFalse( data_cache.HasData( 1 ) )
+        self.assertTrue( data_cache.HasData( 10 ) )
+        
+        # too big on its own, so it goes straight back out, but only after everything else has made way
+        
+        data_cache.AddData( 11, TestCacheableObject( 150 ) )
+        
+        self.assertFalse( data_cache.HasData( 11 ) )
+        
+        self.assertIsNone( data_cache.GetIfHasData( 0 ) )
+        
+        stats = data_cache.GetStats()
+        
+        self.assertEqual( stats[ 'name' ], 'test lru cache' )
+        self.assertEqual( stats[ 'num_entries' ], 0 )
+        self.assertEqual( stats[ 'current_size' ], 0 )
+        self.assertEqual( stats[ 'hits' ], 1 )
+        self.assertEqual( stats[ 'misses' ], 1 )
+        self.assertEqual( stats[ 'hit_rate' ], 0.5 )
+        self.assertEqual( stats[ 'additions' ], 12 )
+        self.assertEqual( stats[ 'evictions' ], 12 )
+        self.assertEqual( stats[ 'bytes_evicted' ], 260 )
+        self.assertIsNotNone( stats[ 'mean_entry_lifetime' ] )
+        
+        self.assertIn( 'test lru cache', [ stats[ 'name' ] for stats in ClientCachesBase.GetAllDataCacheStats() ] )
+        
+    
+    def test_w_tinylfu( self ):
+        
+        data_cache = ClientCachesBase.DataCache( HG.test_controller, 'test w-tinylfu cache', 1000, timeout = 3600, eviction_policy_type = CC.CACHE_EVICTION_POLICY_W_TINYLFU )
+        
+        popular_keys = list( range( 90 ) )
+        
+        for key in popular_keys:
+            
+            data_cache.AddData( key, TestCacheableObject( 10 ) )
+            
+        
+        for i in range( 3 ):
+            
+            for key in popular_keys:
+                
+                data_cache.GetData( key )
+                
+            
+        
+        # a run of big one-off entries should get bounced at the door, not flush the popular stuff
+        
+        for key in range( 1000, 1020 ):
+            
+            data_cache.AddData( key, TestCacheableObject( 200 ) )
+            
+            self.assertLessEqual( data_cache.GetStats()[ 'current_size' ], 1000 )
+            
+        
+        num_popular_kept = len( [ key for key in popular_keys if data_cache.HasData( key ) ] )
+        
+        self.assertEqual( num_popular_kept, 90 )
+        
+        # being new is not enough to stay if you are bigger than the window
+        
+        self.assertFalse( data_cache.HasData( 1019 ) )
+        
+        # and the same run under lru wipes them out
+        
+        data_cache.SetEvictionPolicyType( CC.CACHE_EVICTION_POLICY_LRU )
+        
+        for key in range( 2000, 2020 ):
+            
+            data_cache.AddData( key, TestCacheableObject( 200 ) )
+            
+        
+        num_popular_kept = len( [ key for key in popular_keys if data_cache.HasData( key ) ] )
+        
+        self.assertEqual( num_popular_kept, 0 )
+        
+        data_cache.ResetStats()
+        
+        self.assertEqual( data_cache.GetStats()[ 'evictions' ], 0 )
+        
+    
+    def test_w_tinylfu_size_aware_admission( self ):
+        
+        data_cache = ClientCachesBase.DataCache( HG.test_controller, 'test w-tinylfu admission cache', 1000, timeout = 3600, eviction_policy_type = CC.CACHE_EVICTION_POLICY_W_TINYLFU )
+        
+        # with room to spare, a big entry is fine
+        
+        data_cache.AddData( 'big', TestCacheableObject( 500 ) )
+        
+        self.assertTrue( data_cache.HasData( 'big' ) )
+        
+        data_cache.Clear()
+        
+        hot_keys = list( range( 100 ) )
+        
+        for key in hot_keys:
+            
+            data_cache.AddData( key, TestCacheableObject( 10 ) )
+            
+        
+        for i in range( 3 ):
+            
+            for key in hot_keys:
+                
+                data_cache.GetData( key )
+                
+            
+        
+        # a full cache of small hot entries, and one huge cold one arrives. it would push out half the cache, so it is the one to go
+        
+        data_cache.AddData( 'huge', TestCacheableObject( 500 ) )
+        
+        self.assertFalse( data_cache.HasData( 'huge' ) )
+        self.assertTrue( all( data_cache.HasData( key ) for key in hot_keys ) )
+        self.assertEqual( data_cache.GetStats()[ 'current_size' ], 1000 )
+        
+    
+
+class TestThumbnailBitmapDiskCache( unittest.TestCase ):
+    
+    def test_disk_cache( self ):
+        
+        path = os.path.join( HG.test_controller.db_dir, 'test_thumbnail_bitmaps.cache' )
+        
+        max_bitmap_size = 10 * 10 * 4
+        
+        slot_size = ClientCachesDisk.SLOT_HEADER.size + max_bitmap_size
+        
+        num_bytes = ClientCachesDisk.FILE_HEADER.size + slot_size * 3
+        
+        cache = ClientCachesDisk.ThumbnailBitmapDiskCache( path, max_bitmap_size, num_bytes )
+        
+        self.assertEqual( cache.GetNumSlots(), 3 )
+        
+        ( hash_a, hash_b, hash_c, hash_d ) = [ os.urandom( 32 ) for i in range( 4 ) ]
+        
+        data_a = os.urandom( 10 * 8 * 3 )
+        data_b = os.urandom( 8 * 10 * 4 )
+        
+        cache.AddBitmap( hash_a, ( 10, 8 ), ( 10, 8 ), 3, data_a )
+        cache.AddBitmap( hash_b, ( 10, 8 ), ( 8, 10 ), 4, data_b )
+        
+        # too big, not stored
+        cache.AddBitmap( hash_c, ( 20, 20 ), ( 20, 20 ), 4, os.urandom( 20 * 20 * 4 ) )
+        
+        self.assertEqual( cache.GetBitmap( hash_a, ( 10, 8 ) ), ( ( 10, 8 ), 3, data_a ) )
+        self.assertEqual( cache.GetBitmap( hash_b, ( 10, 8 ) ), ( ( 8, 10 ), 4, data_b ) )
+        self.assertEqual( cache.GetBitmap( hash_a, ( 5, 4 ) ), None )
+        self.assertEqual( cache.GetBitmap( hash_c, ( 20, 20 ) ), None )
+        
+        # reload
+        
+        cache.Close()
+        
+        cache = ClientCachesDisk.ThumbnailBitmapDiskCache( path, max_bitmap_size, num_bytes )
+        
+        self.assertEqual( cache.GetNumEntries(), 2 )
+        self.assertEqual( cache.GetBitmap( hash_a, ( 10, 8 ) ), ( ( 10, 8 ), 3, data_a ) )
+        self.assertEqual( cache.GetBitmap( hash_b, ( 10, 8 ) ), ( ( 8, 10 ), 4, data_b ) )
+        
+        # ring overwrites the oldest
+        
+        data_c = os.urandom( 10 * 10 * 4 )
+        data_d = os.urandom( 10 * 10 * 4 )
+        
+        cache.AddBitmap( hash_c, ( 10, 10 ), ( 10, 10 ), 4, data_c )
+        cache.AddBitmap( hash_d, ( 10, 10 ), ( 10, 10 ), 4, data_d )
+        
+        self.assertFalse( cache.HasBitmap( hash_a, ( 10, 8 ) ) )
+        self.assertTrue( cache.HasBitmap( hash_b, ( 10, 8 ) ) )
+        self.assertEqual( cache.GetBitmap( hash_d, ( 10, 10 ) ), ( ( 10, 10 ), 4, data_d ) )
+        
+        # invalidation sticks across a reload
+        
+        cache.InvalidateHashes( { hash_b } )
+        
+        self.assertFalse( cache.HasBitmap( hash_b, ( 10, 8 ) ) )
+        
+        cache.Close()
+        
+        cache = ClientCachesDisk.ThumbnailBitmapDiskCache( path, max_bitmap_size, num_bytes )
+        
+        self.assertFalse( cache.HasBitmap( hash_b, ( 10, 8 ) ) )
+        self.assertEqual( cache.GetBitmap( hash_c, ( 10, 10 ) ), ( ( 10, 10 ), 4, data_c ) )
+        
+        # a different slot size starts again
+        
+        cache.Close()
+        
+        cache = ClientCachesDisk.ThumbnailBitmapDiskCache( path, max_bitmap_size * 2, num_bytes * 2 )
+        
+        self.assertEqual( cache.GetNumEntries(), 0 )
+        
+        cache.Close()
+        
+        os.remove( path )
+        
+    
+class TestMediaResult( unittest.TestCase ):
+    
+    def test_slots( self ):
+        
+        media_result = HelperFunctions.GetFakeMediaResult( os.urandom( 32 ) )
+        
+        self.assertFalse( hasattr( media_result, '__dict__' ) )
+        self.assertFalse( hasattr( media_result.GetFileInfoManager(), '__dict__' ) )
+        
+    
+class TestSortedList( unittest.TestCase ):
+    
+    def _GetItems( self, num_items ):
+        
+        class SortableItem( object ):
+            
+            def __init__( self, size, namespace_slice ):
+                
+                self.size = size
+                self.namespace_slice = namespace_slice
+                
+            
+        
+        return [ SortableItem( random.randint( 0, 20 ), ( ( random.choice( 'abc' ), ), ) ) for i in range( num_items ) ]
+        
+    
+    def _CheckSortedList( self, sorted_list, sort_levels ):
+        
+        items = list( sorted_list )
+        
+        expected_items = list( items )
+        
+        for ( sort_key, reverse ) in reversed( sort_levels ):
+            
+            expected_items.sort( key = sort_key, reverse = reverse )
+            
+        
+        self.assertEqual( [ [ sort_key( item ) for ( sort_key, reverse ) in sort_levels ] for item in items ], [ [ sort_key( item ) for ( sort_key, reverse ) in sort_levels ] for item in expected_items ] )
+        
+        for ( index, item ) in enumerate( items ):
+            
+            self.assertEqual( sorted_list.index( item ), index )
+            
+        
+    
+    def test_sort( self ):
+        
+        size_key = lambda item: item.size
+        namespace_key = lambda item: item.namespace_slice
+        
+        items = self._GetItems( 500 )
+        
+        for sort_levels in [
+            [ ( size_key, False ) ],
+            [ ( size_key, True ), ( namespace_key, False ) ],
+            [ ( namespace_key, True ), ( size_key, True ) ]
+        ]:
+            
+            sorted_list = ClientMedia.SortedList( items )
+            
+            sorted_list.sort_by_levels( sort_levels )
+            
+            # a stable sort, so the same as python sorting least significant first
+            
+            expected_items = list( items )
+            
+            for ( sort_key, reverse ) in reversed( sort_levels ):
+                
+                expected_items.sort( key = sort_key, reverse = reverse )
+                
+            
+            self.assertEqual( list( sorted_list ), expected_items )
+            
+        
+    
+    def test_resort( self ):
+        
+        size_key = lambda item: item.size
+        namespace_key = lambda item: item.namespace_slice
+        
+        sort_levels = [ ( namespace_key, False ), ( size_key, True ) ]
+        
+        items = self._GetItems( 500 )
+        
+        sorted_list = ClientMedia.SortedList( items )
+        
+        sorted_list.sort_by_levels( sort_levels )
+        
+        # nothing changed, nothing moves
+        
+        self.assertFalse( sorted_list.resort_items( items[ : 5 ] ) )
+        
+        changed_items = random.sample( items, 5 )
+        
+        for item in changed_items:
+            
+            item.size = random.randint( 0, 20 )
+            item.namespace_slice = ( ( random.choice( 'abcd' ), ), )
+            
+        
+        sorted_list.resort_items( changed_items )
+        
+        self._CheckSortedList( sorted_list, sort_levels )
+        
+        # lots of changes does everything
+        
+        for item in items:
+            
+            item.size = random.randint( 0, 20 )
+            
+        
+        self.assertTrue( sorted_list.resort_items( items ) )
+        
+        self._CheckSortedList( sorted_list, sort_levels )
+        
+        new_items = self._GetItems( 3 )
+        
+        sorted_list.insert_items( new_items )
+        
+        self.assertEqual( len( sorted_list ), 503 )
+        
+        self._CheckSortedList( sorted_list, sort_levels )
+        
+    
+    def test_resort_several_changed( self ):
+        
+        # several changed items at once, each of which may be out of place when the others go back in
+        
+        size_key = lambda item: item.size
+        
+        sort_levels = [ ( size_key, False ) ]
+        
+        for i in range( 200 ):
+            
+            items = self._GetItems( 400 )
+            
+            for item in items:
+                
+                item.size = random.randint( 0, 1000 )
+                
+            
+            sorted_list = ClientMedia.SortedList( items )
+            
+            sorted_list.sort_by_levels( sort_levels )
+            
+            changed_items = random.sample( items, 5 )
+            
+            for item in changed_items:
+                
+                item.size = random.randint( 0, 1000 )
+                
+            
+            sorted_list.resort_items( changed_items )
+            
+            self.assertEqual( len( sorted_list ), 400 )
+            
+            self._CheckSortedList( sorted_list, sort_levels )
+            
+        
+    
+class TestMediaListCollect( unittest.TestCase ):
+    
+    def _GetCollectedHashes( self, media_list ):
+        
+        return { frozenset( media.GetHashes() ) for media in media_list.GetSortedMedia() }
+        
+    
+    def test_incremental_collect( self ):
+        
+        service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY
+        
+        hashes = [ os.urandom( 32 ) for i in range( 4 ) ]
+        
+        ( hash_1, hash_2, hash_3, hash_4 ) = hashes
+        
+        hashes_to_tags = { hash_1 : { 'series:a' }, hash_2 : { 'series:a' }, hash_3 : { 'series:b' }, hash_4 : set() }
+        
+        media_results = []
+        
+        for ( hash_id, hash ) in enumerate( hashes, start = 1 ):
+            
+            media_result = HelperFunctions.GetFakeMediaResult( hash )
+            
+            media_result.GetFileInfoManager().hash_id = hash_id
+            
+            tags = hashes_to_tags[ hash ]
+            
+            media_result.SetTagsManager( ClientMediaManagers.TagsManager( { service_key : { HC.CONTENT_STATUS_CURRENT : set( tags ) } }, { service_key : { HC.CONTENT_STATUS_CURRENT : set( tags ) } } ) )
+            
+            media_results.append( media_result )
+            
+        
+        hashes_to_media_results = { media_result.GetHash() : media_result for media_result in media_results }
+        
+        media_collect = ClientMedia.MediaCollect( namespaces = [ 'series' ], collect_unmatched = False, tag_context = ClientSearch.TagContext( service_key = service_key ) )
+        
+        media_list = ClientMedia.MediaList( ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), media_results )
+        
+        media_list.Collect( media_collect )
+        
+        self.assertEqual( self._GetCollectedHashes( media_list ), { frozenset( ( hash_1, hash_2 ) ), frozenset( ( hash_3, ) ), frozenset( ( hash_4, ) ) } )
+        
+        def do_content_updates( content_updates ):
+            
+            for content_update in content_updates:
+                
+                for hash in content_update.GetHashes():
+                    
+                    hashes_to_media_results[ hash ].GetTagsManager().ProcessContentUpdate( service_key, content_update )
+                    
+                
+            
+            media_list.ProcessContentUpdates( { service_key : content_updates } )
+            
+        
+        HG.test_controller.new_options.SetBoolean( 'keep_pages_collected_on_content_updates', True )
+        
+        try:
+            
+            # moving between two existing collections
+            
+            do_content_updates( [
+                HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'series:a', { hash_1 } ) ),
+                HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:b', { hash_1 } ) )
+            ] )
+            
+            self.assertEqual( self._GetCollectedHashes( media_list ), { frozenset( ( hash_2, ) ), frozenset( ( hash_1, hash_3 ) ), frozenset( ( hash_4, ) ) } )
+            
+            # an unmatched singleton makes a new collection, and emptying a collection removes it
+            
+            do_content_updates( [
+                HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'series:c', { hash_4 } ) ),
+                HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 'series:a', { hash_2 } ) )
+            ] )
+            
+            self.assertEqual( self._GetCollectedHashes( media_list ), { frozenset( ( hash_2, ) ), frozenset( ( hash_1, hash_3 ) ), frozenset( ( hash_4, ) ) } )
+            self.assertEqual( len( media_list.GetSortedMedia() ), 3 )
+            
+            for media in media_list.GetSortedMedia():
+                
+                if media.GetHashes() == { hash_4 }:
+                    
+                    self.assertTrue( media.IsCollection() )
+                    self.assertEqual( media.GetTagsManager().GetCurrent( service_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), { 'series:c' } )
+                    
+                elif media.GetHashes() == { hash_2 }:
+                    
+                    self.assertFalse( media.IsCollection() )
+                    
+                
+            
+            # and the same as if we had collected from scratch
+            
+            incremental_result = self._GetCollectedHashes( media_list )
+            
+            media_list.Collect( media_collect )
+            
+            self.assertEqual( self._GetCollectedHashes( media_list ), incremental_result )
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'keep_pages_collected_on_content_updates', False )
+            
+        
+    
+    def test_incremental_collect_resorts( self ):
+        
+        # one content update that moves files between several existing collections, which then all have to resort at once
+        
+        service_key = CC.DEFAULT_LOCAL_TAG_SERVICE_KEY
+        
+        hashes_to_media_results = {}
+        hashes_to_series = {}
+        
+        hash_id = 1
+        
+        for series_num in range( 200 ):
+            
+            series_tag = 'series:{}'.format( series_num )
+            
+            for i in range( random.randint( 1, 4 ) ):
+                
+                hash = os.urandom( 32 )
+                
+                media_result = HelperFunctions.GetFakeMediaResult( hash )
+                
+                media_result.GetFileInfoManager().hash_id = hash_id
+                
+                hash_id += 1
+                
+                media_result.SetTagsManager( ClientMediaManagers.TagsManager( { service_key : { HC.CONTENT_STATUS_CURRENT : { series_tag } } }, { service_key : { HC.CONTENT_STATUS_CURRENT : { series_tag } } } ) )
+                
+                hashes_to_media_results[ hash ] = media_result
+                hashes_to_series[ hash ] = series_tag
+                
+            
+        
+        media_collect = ClientMedia.MediaCollect( namespaces = [ 'series' ], collect_unmatched = False, tag_context = ClientSearch.TagContext( service_key = service_key ) )
+        media_sort = ClientMedia.MediaSort( sort_type = ( 'system', CC.SORT_FILES_BY_NUM_COLLECTION_FILES ), sort_order = CC.SORT_DESC )
+        
+        media_list = ClientMedia.MediaList( ClientLocation.LocationContext.STATICCreateSimple( CC.LOCAL_FILE_SERVICE_KEY ), list( hashes_to_media_results.values() ) )
+        
+        media_list.Collect( media_collect )
+        media_list.Sort( media_sort )
+        
+        HG.test_controller.new_options.SetBoolean( 'keep_pages_collected_on_content_updates', True )
+        
+        try:
+            
+            for i in range( 20 ):
+                
+                content_updates = []
+                
+                # keep every collection alive, so these are all moves between existing collections
+                
+                series_to_hashes = collections.defaultdict( list )
+                
+                for ( hash, series_tag ) in hashes_to_series.items():
+                    
+                    series_to_hashes[ series_tag ].append( hash )
+                    
+                
+                movable_hashes = [ hashes[0] for hashes in series_to_hashes.values() if len( hashes ) > 1 ]
+                
+                for hash in random.sample( movable_hashes, 3 ):
+                    
+                    old_series_tag = hashes_to_series[ hash ]
+                    new_series_tag = random.choice( [ series_tag for series_tag in series_to_hashes.keys() if series_tag != old_series_tag ] )
+                    
+                    content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( old_series_tag, { hash } ) ) )
+                    content_updates.append( HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( new_series_tag, { hash } ) ) )
+                    
+                    hashes_to_series[ hash ] = new_series_tag
+                    
+                
+                for content_update in content_updates:
+                    
+                    for hash in content_update.GetHashes():
+                        
+                        hashes_to_media_results[ hash ].GetTagsManager().ProcessContentUpdate( service_key, content_update )
+                        
+                    
+                
+                media_list.ProcessContentUpdates( { service_key : content_updates } )
+                
+                incremental_sorted_media = list( media_list.GetSortedMedia() )
+                
+                num_files = [ media.GetNumFiles() for media in incremental_sorted_media ]
+                
+                self.assertEqual( num_files, sorted( num_files, reverse = True ) )
+                self.assertEqual( len( incremental_sorted_media ), 200 )
+                
+                # a full sort, which is stable, should not change anything
+                
+                media_list.Sort()
+                
+                self.assertEqual( list( media_list.GetSortedMedia() ), incremental_sorted_media )
+                
+            
+        finally:
+            
+            HG.test_controller.new_options.SetBoolean( 'keep_pages_collected_on_content_updates', False )
+            
+        
+    
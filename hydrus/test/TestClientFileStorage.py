@@ -9,6 +9,7 @@ from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientFilesPacked
 from hydrus.client import ClientFilesPhysical
 
 def get_good_prefixes():
@@ -218,5 +219,220 @@ class TestClientFileStorage( unittest.TestCase ):
             ClientFilesPhysical.CheckFullPrefixCoverage( 't', good_prefixes )
             
         
+    
+
+class TestThumbnailPack( unittest.TestCase ):
+    
+    def test_pack( self ):
+        
+        directory = os.path.join( HG.test_controller.db_dir, 'thumbnail_pack_test' )
+        
+        if os.path.exists( directory ):
+            
+            shutil.rmtree( directory )
+            
+        
+        hashes_to_thumbnail_bytes = { os.urandom( 32 ) : os.urandom( 100 + i ) for i in range( 20 ) }
+        
+        pack = ClientFilesPacked.ThumbnailPack( directory )
+        
+        for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+            
+            pack.Add( hash, thumbnail_bytes )
+            
+        
+        self.assertEqual( pack.GetHashes(), set( hashes_to_thumbnail_bytes.keys() ) )
+        
+        for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+            
+            self.assertTrue( pack.HasThumbnail( hash ) )
+            self.assertEqual( pack.GetThumbnailBytes( hash ), thumbnail_bytes )
+            
+        
+        missing_hash = os.urandom( 32 )
+        
+        self.assertFalse( pack.HasThumbnail( missing_hash ) )
+        self.assertEqual( pack.GetThumbnailBytes( missing_hash ), None )
+        
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) + [ missing_hash ] ), hashes_to_thumbnail_bytes )
+        
+        # delete and overwrite
+        
+        ( deletee_hash, overwritee_hash ) = list( hashes_to_thumbnail_bytes.keys() )[:2]
+        
+        pack.Delete( deletee_hash )
+        
+        del hashes_to_thumbnail_bytes[ deletee_hash ]
+        
+        hashes_to_thumbnail_bytes[ overwritee_hash ] = os.urandom( 50 )
+        
+        pack.Add( overwritee_hash, hashes_to_thumbnail_bytes[ overwritee_hash ] )
+        
+        self.assertFalse( pack.HasThumbnail( deletee_hash ) )
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) ), hashes_to_thumbnail_bytes )
+        self.assertGreater( pack.GetNumDeadBytes(), 0 )
+        
+        # reload from disk
+        
+        pack = ClientFilesPacked.ThumbnailPack( directory )
+        
+        self.assertEqual( pack.GetHashes(), set( hashes_to_thumbnail_bytes.keys() ) )
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) ), hashes_to_thumbnail_bytes )
+        
+        # index falls behind, as if we crashed mid-write
+        
+        index_path = os.path.join( directory, ClientFilesPacked.PACK_INDEX_FILENAME )
+        
+        with open( index_path, 'r+b' ) as f:
+            
+            f.truncate( ClientFilesPacked.PACK_INDEX_RECORD.size * 5 + 7 )
+            
+        
+        pack = ClientFilesPacked.ThumbnailPack( directory )
+        
+        self.assertEqual( pack.GetHashes(), set( hashes_to_thumbnail_bytes.keys() ) )
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) ), hashes_to_thumbnail_bytes )
+        
+        # pack has a torn record at the end
+        
+        pack_path = os.path.join( directory, ClientFilesPacked.PACK_FILENAME )
+        
+        good_pack_size = os.path.getsize( pack_path )
+        
+        with open( pack_path, 'ab' ) as f:
+            
+            f.write( ClientFilesPacked.PACK_RECORD_HEADER.pack( os.urandom( 32 ), 5000 ) + os.urandom( 10 ) )
+            
+        
+        pack = ClientFilesPacked.ThumbnailPack( directory )
+        
+        self.assertEqual( pack.GetHashes(), set( hashes_to_thumbnail_bytes.keys() ) )
+        self.assertEqual( os.path.getsize( pack_path ), good_pack_size )
+        
+        # compact
+        
+        self.assertGreater( pack.GetNumDeadBytes(), 0 )
+        
+        pack.Compact()
+        
+        self.assertEqual( pack.GetNumDeadBytes(), 0 )
+        self.assertLess( os.path.getsize( pack_path ), good_pack_size )
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) ), hashes_to_thumbnail_bytes )
+        
+        pack = ClientFilesPacked.ThumbnailPack( directory )
+        
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) ), hashes_to_thumbnail_bytes )
+        
+        for hash in list( hashes_to_thumbnail_bytes.keys() ):
+            
+            pack.Delete( hash )
+            
+        
+        self.assertTrue( pack.WantsCompaction() )
+        
+        pack.Compact()
+        
+        self.assertFalse( os.path.exists( pack_path ) )
+        self.assertEqual( pack.GetHashes(), set() )
+        
+        shutil.rmtree( directory )
+        
+    
+    def test_pack_mismatched_index( self ):
+        
+        directory = os.path.join( HG.test_controller.db_dir, 'thumbnail_pack_mismatch_test' )
+        
+        if os.path.exists( directory ):
+            
+            shutil.rmtree( directory )
+            
+        
+        pack_path = os.path.join( directory, ClientFilesPacked.PACK_FILENAME )
+        index_path = os.path.join( directory, ClientFilesPacked.PACK_INDEX_FILENAME )
+        
+        def make_pack_that_wants_compacting():
+            
+            if os.path.exists( directory ):
+                
+                shutil.rmtree( directory )
+                
+            
+            hashes_to_thumbnail_bytes = { os.urandom( 32 ) : os.urandom( 100 + i ) for i in range( 20 ) }
+            
+            pack = ClientFilesPacked.ThumbnailPack( directory )
+            
+            for ( hash, thumbnail_bytes ) in hashes_to_thumbnail_bytes.items():
+                
+                pack.Add( hash, thumbnail_bytes )
+                
+            
+            for hash in list( hashes_to_thumbnail_bytes.keys() )[:10]:
+                
+                pack.Delete( hash )
+                
+                del hashes_to_thumbnail_bytes[ hash ]
+                
+            
+            return ( pack, hashes_to_thumbnail_bytes )
+            
+        
+        def read_bytes( path ):
+            
+            with open( path, 'rb' ) as f:
+                
+                return f.read()
+                
+            
+        
+        def write_bytes( path, data ):
+            
+            with open( path, 'wb' ) as f:
+                
+                f.write( data )
+                
+            
+        
+        # a crash after the new pack went in, but before the new index did
+        
+        ( pack, hashes_to_thumbnail_bytes ) = make_pack_that_wants_compacting()
+        
+        old_index_bytes = read_bytes( index_path )
+        
+        pack.Compact()
+        
+        write_bytes( index_path, old_index_bytes )
+        
+        pack = ClientFilesPacked.ThumbnailPack( directory )
+        
+        self.assertEqual( pack.GetHashes(), set( hashes_to_thumbnail_bytes.keys() ) )
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) ), hashes_to_thumbnail_bytes )
+        self.assertEqual( len( read_bytes( index_path ) ), ClientFilesPacked.PACK_INDEX_RECORD.size * len( hashes_to_thumbnail_bytes ) )
+        
+        # the other way around
+        
+        ( pack, hashes_to_thumbnail_bytes ) = make_pack_that_wants_compacting()
+        
+        old_pack_bytes = read_bytes( pack_path )
+        
+        pack.Compact()
+        
+        write_bytes( pack_path, old_pack_bytes )
+        
+        pack = ClientFilesPacked.ThumbnailPack( directory )
+        
+        self.assertEqual( pack.GetHashes(), set( hashes_to_thumbnail_bytes.keys() ) )
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) ), hashes_to_thumbnail_bytes )
+        
+        # and if the files change under an index we already loaded, the read notices
+        
+        ( pack, hashes_to_thumbnail_bytes ) = make_pack_that_wants_compacting()
+        
+        self.assertEqual( pack.GetHashes(), set( hashes_to_thumbnail_bytes.keys() ) )
+        
+        ClientFilesPacked.ThumbnailPack( directory ).Compact()
+        
+        self.assertEqual( pack.GetThumbnailBytesBatch( list( hashes_to_thumbnail_bytes.keys() ) ), hashes_to_thumbnail_bytes )
+        
+        shutil.rmtree( directory )
         
     
@@ -2,8 +2,10 @@ import os
 import unittest
 
 from hydrus.core import HydrusConstants as HC
+from hydrus.core.files.images import HydrusImageHandling
 
 from hydrus.client import ClientConstants as CC
+from hydrus.client import ClientFilesMaintenanceWorkers
 from hydrus.client import ClientImageHandling
 
 class TestImageHandling( unittest.TestCase ):
@@ -22,3 +24,54 @@ class TestImageHandling( unittest.TestCase ):
         
         self.assertEqual( perceptual_hashes, set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
         
+    
+
+class TestFileMaintenanceWorkers( unittest.TestCase ):
+    
+    # these are the functions the worker processes run. we call them in-process here to check they give the same as the normal way
+    
+    def test_perceptual_hash( self ):
+        
+        for ( path, mime ) in [
+            ( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), HC.IMAGE_PNG ),
+            ( os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ), HC.IMAGE_JPEG )
+        ]:
+            
+            self.assertEqual( ClientFilesMaintenanceWorkers.GetPerceptualHashes( path, mime, False ), ClientImageHandling.GenerateShapePerceptualHashes( path, mime ) )
+            
+        
+        self.assertEqual( ClientFilesMaintenanceWorkers.GetPerceptualHashes( os.path.join( HC.STATIC_DIR, 'hydrus.png' ), HC.IMAGE_PNG, False ), set( [ b'\xb4M\xc7\xb2M\xcb8\x1c' ] ) )
+        
+    
+    def test_pixel_hash( self ):
+        
+        for ( path, mime ) in [
+            ( os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' ), HC.IMAGE_PNG ),
+            ( os.path.join( HC.STATIC_DIR, 'testing', 'muh_jpg.jpg' ), HC.IMAGE_JPEG )
+        ]:
+            
+            self.assertEqual( ClientFilesMaintenanceWorkers.GetPixelHash( path, mime ), HydrusImageHandling.GetImagePixelHash( path, mime ) )
+            
+        
+        self.assertEqual( ClientFilesMaintenanceWorkers.GetPixelHash( os.path.join( HC.STATIC_DIR, 'testing', 'muh_mp4.mp4' ), HC.IMAGE_PNG ), None )
+        
+    
+    def test_thumbnail_and_blurhash( self ):
+        
+        path = os.path.join( HC.STATIC_DIR, 'testing', 'muh_png.png' )
+        
+        target_resolution = ( 100, 60 )
+        
+        thumbnail_bytes = ClientFilesMaintenanceWorkers.GenerateThumbnailBytes( path, target_resolution, HC.IMAGE_PNG, None, None, 35 )
+        
+        self.assertIsNone( ClientFilesMaintenanceWorkers.GenerateThumbnailBytesIfWrongSize( thumbnail_bytes, path, target_resolution, HC.IMAGE_PNG, None, None, 35, False ) )
+        
+        refit_thumbnail_bytes = ClientFilesMaintenanceWorkers.GenerateThumbnailBytesIfWrongSize( thumbnail_bytes, path, ( 50, 30 ), HC.IMAGE_PNG, None, None, 35, False )
+        
+        self.assertIsNotNone( refit_thumbnail_bytes )
+        self.assertNotEqual( refit_thumbnail_bytes, thumbnail_bytes )
+        
+        self.assertIsNotNone( ClientFilesMaintenanceWorkers.GetBlurhash( thumbnail_bytes, False ) )
+        self.assertIsNone( ClientFilesMaintenanceWorkers.GetBlurhash( b'not a thumbnail', False ) )
+        
+    
@@ -98,6 +98,39 @@ class TestMergeTagsManagers( unittest.TestCase ):
         self.assertEqual( tags_manager.GetNamespaceSlice( CC.COMBINED_TAG_SERVICE_KEY, ( 'character', ), ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), frozenset( { 'character:cibo' } ) )
         
     
+class TestTagInternTable( unittest.TestCase ):
+    
+    def test_intern( self ):
+        
+        tag_intern_table = ClientTags.TagInternTable()
+        
+        self.assertEqual( tag_intern_table.GetTagId( 'samus aran' ), None )
+        
+        tag_ids = tag_intern_table.GetTagIds( [ 'samus aran', 'character:samus aran', 'samus aran' ] )
+        
+        self.assertEqual( len( tag_ids ), 2 )
+        self.assertEqual( list( tag_ids ), sorted( tag_ids ) )
+        self.assertEqual( tag_intern_table.GetTags( tag_ids ), { 'samus aran', 'character:samus aran' } )
+        self.assertEqual( tag_intern_table.GetNumTags(), 2 )
+        
+        self.assertIn( tag_intern_table.GetTagId( 'samus aran' ), tag_ids )
+        
+        more_tag_ids = tag_intern_table.GetTagIds( { 'series:metroid', 'samus aran' } )
+        
+        self.assertEqual( tag_intern_table.GetTags( more_tag_ids ), { 'series:metroid', 'samus aran' } )
+        self.assertEqual( tag_intern_table.GetNumTags(), 3 )
+        
+        self.assertEqual( tag_intern_table.GetTagIds( [] ), ClientMediaManagers.EMPTY_TAG_IDS )
+        
+        # a generator with a new tag in it has to survive the fast path failing
+        
+        generator_tag_ids = tag_intern_table.GetTagIds( ( tag for tag in ( 'samus aran', 'series:nintendo' ) ) )
+        
+        self.assertEqual( tag_intern_table.GetTags( generator_tag_ids ), { 'samus aran', 'series:nintendo' } )
+        self.assertEqual( tag_intern_table.GetNumTags(), 4 )
+        
+    
+
 class TestTagsManager( unittest.TestCase ):
     
     @classmethod
@@ -174,6 +207,30 @@ class TestTagsManager( unittest.TestCase ):
         self.assertEqual( self._other_tags_manager.GetPetitioned( self._pending_service_key, ClientTags.TAG_DISPLAY_STORAGE ), set() )
         
     
+    def test_duplicate( self ):
+        
+        hashes = { HydrusData.GenerateKey() }
+        
+        tags_manager = self._tags_manager.Duplicate()
+        
+        self.assertEqual( tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE ), self._tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_STORAGE ) )
+        self.assertEqual( tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ), self._tags_manager.GetServiceKeysToStatusesToTags( ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ) )
+        
+        # the two share their tag id arrays, so make sure an edit to one does not leak into the other
+        
+        content_update = HydrusData.ContentUpdate( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 'duplicate test', hashes ) )
+        
+        tags_manager.ProcessContentUpdate( self._first_key, content_update )
+        
+        self.assertIn( 'duplicate test', tags_manager.GetCurrent( self._first_key, ClientTags.TAG_DISPLAY_STORAGE ) )
+        self.assertIn( 'duplicate test', tags_manager.GetCurrent( self._first_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ) )
+        self.assertTrue( tags_manager.HasTag( 'duplicate test', ClientTags.TAG_DISPLAY_STORAGE ) )
+        
+        self.assertNotIn( 'duplicate test', self._tags_manager.GetCurrent( self._first_key, ClientTags.TAG_DISPLAY_STORAGE ) )
+        self.assertNotIn( 'duplicate test', self._tags_manager.GetCurrent( self._first_key, ClientTags.TAG_DISPLAY_DISPLAY_ACTUAL ) )
+        self.assertFalse( self._tags_manager.HasTag( 'duplicate test', ClientTags.TAG_DISPLAY_STORAGE ) )
+        
+    
     def test_get_current( self ):
         
         self.assertEqual( self._tags_manager.GetCurrent( self._first_key, ClientTags.TAG_DISPLAY_STORAGE ), { 'current', '\u2835', 'creator:tsutomu nihei', 'series:blame!', 'title:test title', 'volume:3', 'chapter:2', 'page:1' } )
@@ -63,6 +63,7 @@ from hydrus.test import TestClientThreading
 from hydrus.test import TestDialogs
 from hydrus.test import TestFunctions
 from hydrus.test import TestHydrusData
+from hydrus.test import TestHydrusDBBase
 from hydrus.test import TestHydrusNATPunch
 from hydrus.test import TestHydrusNetworking
 from hydrus.test import TestHydrusPaths
@@ -801,6 +802,7 @@ class Controller( object ):
             TestClientDBDuplicates,
             TestClientDBTags,
             TestHydrusData,
+            TestHydrusDBBase,
             TestHydrusPaths,
             TestHydrusTime,
             TestHydrusNATPunch,
@@ -837,6 +839,7 @@ class Controller( object ):
             TestClientThreading,
             TestFunctions,
             TestHydrusData,
+            TestHydrusDBBase,
             TestHydrusPaths,
             TestHydrusTags,
             TestHydrusTime,
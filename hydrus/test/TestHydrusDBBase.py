@@ -0,0 +1,268 @@
+import sqlite3
+import unittest
+
+from hydrus.core import HydrusData
+from hydrus.core import HydrusDBBase
+from hydrus.core import HydrusGlobals as HG
+
+class TestDBBase( unittest.TestCase ):
+    
+    def test_multi_row_insert( self ):
+        
+        self.assertEqual( HydrusDBBase.GetMultiRowInsertNumParams( 'INSERT INTO blah ( a, b ) VALUES ( ?, ? );' ), 2 )
+        self.assertEqual( HydrusDBBase.GetMultiRowInsertNumParams( 'INSERT OR IGNORE INTO mem.blah ( a ) VALUES ( ? );' ), 1 )
+        self.assertEqual( HydrusDBBase.GetMultiRowInsertNumParams( 'REPLACE INTO blah ( a, b, c ) VALUES ( ?, ?, ? );' ), 3 )
+        self.assertEqual( HydrusDBBase.GetMultiRowInsertNumParams( 'INSERT INTO blah ( a ) SELECT a FROM other WHERE b = ?;' ), 0 )
+        self.assertEqual( HydrusDBBase.GetMultiRowInsertNumParams( 'UPDATE blah SET a = ? WHERE b = ?;' ), 0 )
+        self.assertEqual( HydrusDBBase.GetMultiRowInsertNumParams( 'INSERT INTO blah ( a ) VALUES ( ? ) ON CONFLICT DO NOTHING;' ), 0 )
+        
+        self.assertEqual( HydrusDBBase.GetMultiRowInsertQuery( 'INSERT INTO blah ( a, b ) VALUES ( ?, ? );', 3 ), 'INSERT INTO blah ( a, b ) VALUES ( ?, ? ), ( ?, ? ), ( ?, ? );' )
+        
+        db = sqlite3.connect( ':memory:', isolation_level = None )
+        
+        c = db.cursor()
+        
+        c.execute( 'CREATE TABLE blah ( a INTEGER PRIMARY KEY, b INTEGER );' )
+        
+        rows = [ ( i, i * 2 ) for i in range( 2500 ) ]
+        
+        row_count = HydrusDBBase.ExecuteManyInChunks( c, 'INSERT INTO blah ( a, b ) VALUES ( ?, ? );', ( row for row in rows ) )
+        
+        self.assertEqual( row_count, 2500 )
+        self.assertEqual( sorted( c.execute( 'SELECT a, b FROM blah;' ).fetchall() ), rows )
+        
+        row_count = HydrusDBBase.ExecuteManyInChunks( c, 'INSERT OR IGNORE INTO blah ( a, b ) VALUES ( ?, ? );', [ ( i, 0 ) for i in range( 2000, 3000 ) ] )
+        
+        self.assertEqual( row_count, 500 )
+        self.assertEqual( c.execute( 'SELECT COUNT( * ) FROM blah;' ).fetchone()[0], 3000 )
+        
+        row_count = HydrusDBBase.ExecuteManyInChunks( c, 'INSERT OR IGNORE INTO blah ( a, b ) VALUES ( ?, ? );', [] )
+        
+        self.assertEqual( row_count, 0 )
+        
+        db.close()
+        
+    
+    def test_multi_row_insert_failure( self ):
+        
+        db = sqlite3.connect( ':memory:', isolation_level = None )
+        
+        db_base = HydrusDBBase.DBBase()
+        
+        db_base._SetCursor( db.cursor() )
+        
+        db_base._Execute( 'CREATE TABLE blah ( a INTEGER PRIMARY KEY, b INTEGER NOT NULL );' )
+        
+        db_base._ExecuteMany( 'INSERT INTO blah ( a, b ) VALUES ( ?, ? );', ( ( i, i ) for i in range( 10 ) ) )
+        
+        # ignored conflicts are still row by row, even in the middle of a chunk
+        
+        db_base._ExecuteMany( 'INSERT OR IGNORE INTO blah ( a, b ) VALUES ( ?, ? );', ( ( i, -1 ) for i in range( 5, 15 ) ) )
+        
+        self.assertEqual( db_base._GetRowCount(), 5 )
+        self.assertEqual( db_base._Execute( 'SELECT b FROM blah WHERE a = ?;', ( 5, ) ).fetchone(), ( 5, ) )
+        self.assertEqual( db_base._Execute( 'SELECT b FROM blah WHERE a = ?;', ( 14, ) ).fetchone(), ( -1, ) )
+        
+        # that goes for the other constraints too
+        
+        db_base._ExecuteMany( 'INSERT OR IGNORE INTO blah ( a, b ) VALUES ( ?, ? );', [ ( 100, 1 ), ( 101, None ), ( 102, 1 ) ] )
+        
+        self.assertEqual( db_base._GetRowCount(), 2 )
+        self.assertEqual( db_base._Execute( 'SELECT a FROM blah WHERE a >= ? ORDER BY a;', ( 100, ) ).fetchall(), [ ( 100, ), ( 102, ) ] )
+        
+        db_base._Execute( 'DELETE FROM blah WHERE a >= ?;', ( 100, ) )
+        
+        # a bad row fails its whole chunk, so none of these go in, not even the good row before it
+        
+        with self.assertRaises( sqlite3.IntegrityError ):
+            
+            db_base._ExecuteMany( 'INSERT INTO blah ( a, b ) VALUES ( ?, ? );', [ ( 20, 20 ), ( 0, 0 ), ( 21, 21 ) ] )
+            
+        
+        self.assertEqual( db_base._Execute( 'SELECT COUNT( * ) FROM blah WHERE a >= ?;', ( 20, ) ).fetchone(), ( 0, ) )
+        
+        # but earlier chunks stay in, as with executemany. it is up to the transaction to roll them back
+        
+        num_rows_per_chunk = HydrusDBBase.MAX_NUM_QUERY_VARIABLES // 2
+        
+        rows = [ ( i, i ) for i in range( 1000, 1000 + num_rows_per_chunk ) ] + [ ( 0, 0 ) ]
+        
+        with self.assertRaises( sqlite3.IntegrityError ):
+            
+            db_base._ExecuteMany( 'INSERT INTO blah ( a, b ) VALUES ( ?, ? );', rows )
+            
+        
+        self.assertEqual( db_base._Execute( 'SELECT COUNT( * ) FROM blah WHERE a >= ?;', ( 1000, ) ).fetchone(), ( num_rows_per_chunk, ) )
+        
+        db.close()
+        
+    
+    def test_query_stats( self ):
+        
+        db = sqlite3.connect( ':memory:', isolation_level = None )
+        
+        db_base = HydrusDBBase.DBBase()
+        
+        db_base._SetCursor( db.cursor() )
+        
+        db_base._Execute( 'CREATE TABLE blah ( a INTEGER PRIMARY KEY );' )
+        
+        HydrusDBBase.ClearQueryStats()
+        
+        # nothing is slow enough to log and explain here, we just want the numbers
+        slow_query_min_time_ms = HG.db_slow_query_min_time_ms
+        
+        HG.db_slow_query_min_time_ms = 1000000
+        HG.slow_query_mode = True
+        
+        try:
+            
+            db_base._ExecuteMany( 'INSERT INTO blah ( a ) VALUES ( ? );', ( ( i, ) for i in range( 100 ) ) )
+            
+            self.assertEqual( db_base._GetRowCount(), 100 )
+            
+            cursor = db_base._Execute( 'SELECT a FROM blah WHERE a < ? ORDER BY a;', ( 5, ) )
+            
+            self.assertEqual( cursor.fetchone(), ( 0, ) )
+            self.assertEqual( cursor.fetchmany( 2 ), [ ( 1, ), ( 2, ) ] )
+            self.assertEqual( list( cursor ), [ ( 3, ), ( 4, ) ] )
+            self.assertEqual( cursor.fetchone(), None )
+            self.assertEqual( cursor.fetchall(), [] )
+            
+            self.assertEqual( db_base._Execute( 'SELECT a FROM blah WHERE a < ? ORDER BY a;', ( 3, ) ).fetchall(), [ ( 0, ), ( 1, ), ( 2, ) ] )
+            
+            db_base._Execute( 'DELETE FROM blah WHERE a < ?;', ( 10, ) )
+            
+            self.assertEqual( db_base._GetRowCount(), 10 )
+            
+        finally:
+            
+            HG.slow_query_mode = False
+            HG.db_slow_query_min_time_ms = slow_query_min_time_ms
+            
+        
+        queries_to_stats = { stats[ 'query' ] : stats for stats in HydrusDBBase.GetQueryStats() }
+        
+        stats = queries_to_stats[ 'SELECT a FROM blah WHERE a < ? ORDER BY a;' ]
+        
+        self.assertEqual( stats[ 'module' ], 'DBBase' )
+        self.assertEqual( stats[ 'count' ], 2 )
+        self.assertEqual( stats[ 'total_rows' ], 8 )
+        self.assertEqual( queries_to_stats[ 'INSERT INTO blah ( a ) VALUES ( ? );' ][ 'total_rows' ], 100 )
+        self.assertEqual( queries_to_stats[ 'DELETE FROM blah WHERE a < ?;' ][ 'total_rows' ], 10 )
+        
+        self.assertEqual( len( HydrusDBBase.GetQueryStats( limit = 1 ) ), 1 )
+        
+        HydrusDBBase.ClearQueryStats()
+        
+        self.assertEqual( HydrusDBBase.GetQueryStats(), [] )
+        
+        db.close()
+        
+    
+    def test_query_stats_normalisation( self ):
+        
+        self.assertEqual( HydrusDBBase.NormaliseQueryForStats( 'SELECT hash_id FROM current_mappings_8 WHERE tag_id IN {};'.format( HydrusData.SplayListForDB( [ 1, 22, 333 ] ) ) ), 'SELECT hash_id FROM current_mappings_8 WHERE tag_id IN ( ? );' )
+        self.assertEqual( HydrusDBBase.NormaliseQueryForStats( 'SELECT hash_id FROM files_info WHERE size > 1024 AND mime = 7 LIMIT 50;' ), 'SELECT hash_id FROM files_info WHERE size > ? AND mime = ? LIMIT ?;' )
+        self.assertEqual( HydrusDBBase.NormaliseQueryForStats( "SELECT tag_id FROM tags WHERE tag LIKE 'blue 2%'\n  ORDER BY tag_id;" ), 'SELECT tag_id FROM tags WHERE tag LIKE ? ORDER BY tag_id;' )
+        self.assertEqual( HydrusDBBase.NormaliseQueryForStats( 'INSERT OR IGNORE INTO blah ( a, b ) VALUES ( ?, ? ), ( ?, ? ), ( ?, ? );' ), 'INSERT OR IGNORE INTO blah ( a, b ) VALUES ( ?, ? );' )
+        
+        HydrusDBBase.ClearQueryStats()
+        
+        try:
+            
+            for i in range( 10 ):
+                
+                HydrusDBBase.RecordQuery( 'ClientDBMaster', 'SELECT hash FROM hashes WHERE hash_id IN {};'.format( HydrusData.SplayListForDB( range( i + 1 ) ) ), 0.01, i + 1 )
+                
+            
+            all_stats = HydrusDBBase.GetQueryStats()
+            
+            self.assertEqual( len( all_stats ), 1 )
+            self.assertEqual( all_stats[0][ 'query' ], 'SELECT hash FROM hashes WHERE hash_id IN ( ? );' )
+            self.assertEqual( all_stats[0][ 'count' ], 10 )
+            self.assertEqual( all_stats[0][ 'total_rows' ], 55 )
+            
+            HydrusDBBase.ClearQueryStats()
+            
+            HydrusDBBase.RecordQuery( 'ClientDBMaster', 'SELECT expensive;', 100.0, 1 )
+            
+            for i in range( HydrusDBBase.MAX_NUM_QUERY_STATS * 2 ):
+                
+                HydrusDBBase.RecordQuery( 'ClientDBMaster', 'SELECT cheap_{};'.format( i ), 0.001, 1 )
+                
+            
+            all_stats = HydrusDBBase.GetQueryStats()
+            
+            self.assertEqual( len( all_stats ), HydrusDBBase.MAX_NUM_QUERY_STATS )
+            self.assertEqual( all_stats[0][ 'query' ], 'SELECT expensive;' )
+            
+        finally:
+            
+            HydrusDBBase.ClearQueryStats()
+            
+        
+    
+    
+    def test_row_count( self ):
+        
+        db = sqlite3.connect( ':memory:', isolation_level = None )
+        
+        db_base = HydrusDBBase.DBBase()
+        
+        db_base._SetCursor( db.cursor() )
+        
+        db_base._Execute( 'CREATE TABLE blah ( a INTEGER PRIMARY KEY );' )
+        
+        db_base._ExecuteMany( 'INSERT OR IGNORE INTO blah ( a ) VALUES ( ? );', ( ( i, ) for i in range( 5000 ) ) )
+        
+        self.assertEqual( db_base._GetRowCount(), 5000 )
+        
+        db_base._ExecuteMany( 'INSERT OR IGNORE INTO blah ( a ) VALUES ( ? );', ( ( i, ) for i in range( 4000, 6000 ) ) )
+        
+        self.assertEqual( db_base._GetRowCount(), 1000 )
+        
+        db_base._ExecuteMany( 'DELETE FROM blah WHERE a = ?;', ( ( i, ) for i in range( 10 ) ) )
+        
+        self.assertEqual( db_base._GetRowCount(), 10 )
+        
+        db_base._Execute( 'DELETE FROM blah WHERE a < ?;', ( 20, ) )
+        
+        self.assertEqual( db_base._GetRowCount(), 10 )
+        
+        db.close()
+        
+    
+    def test_temp_integer_table( self ):
+        
+        db = sqlite3.connect( ':memory:', isolation_level = None )
+        
+        c = db.cursor()
+        
+        c.execute( 'ATTACH ":memory:" AS mem;' )
+        
+        HydrusDBBase.TemporaryIntegerTableNameCache()
+        
+        with HydrusDBBase.TemporaryIntegerTable( c, range( 3000 ), 'hash_id' ) as temp_table_name:
+            
+            self.assertEqual( c.execute( 'SELECT COUNT( * ) FROM {};'.format( temp_table_name ) ).fetchone()[0], 3000 )
+            
+            first_temp_table_name = temp_table_name
+            
+        
+        with HydrusDBBase.TemporaryIntegerTable( c, [ 5, 6, 7 ], 'hash_id' ) as temp_table_name:
+            
+            # the emptied table goes back in the pool and is reused
+            self.assertEqual( temp_table_name, first_temp_table_name )
+            
+            self.assertEqual( sorted( c.execute( 'SELECT hash_id FROM {};'.format( temp_table_name ) ).fetchall() ), [ ( 5, ), ( 6, ), ( 7, ) ] )
+            
+            with HydrusDBBase.TemporaryIntegerTable( c, [ 1 ], 'hash_id' ) as second_temp_table_name:
+                
+                self.assertNotEqual( second_temp_table_name, temp_table_name )
+                
+            
+        
+        db.close()
+        
+    
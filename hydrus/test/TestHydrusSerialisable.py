@@ -1,10 +1,13 @@
+import random
 import unittest
 
 from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
+from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTags
 from hydrus.core import HydrusTime
+from hydrus.core.networking import HydrusNetwork
 
 from hydrus.client import ClientApplicationCommand as CAC
 from hydrus.client import ClientConstants as CC
@@ -157,6 +160,115 @@ class TestSerialisables( unittest.TestCase ):
             
         
     
+    def test_SERIALISABLE_TYPE_CONTENT_UPDATE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            # the binary format sorts hash_ids and pairs, which does not matter to anyone processing them
+            self.assertEqual( [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in obj.GetNewMappings() ], [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in dupe_obj.GetNewMappings() ] )
+            self.assertEqual( [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in obj.GetDeletedMappings() ], [ ( tag_id, sorted( hash_ids ) ) for ( tag_id, hash_ids ) in dupe_obj.GetDeletedMappings() ] )
+            self.assertEqual( sorted( ( tuple( row ) for row in obj.GetNewFiles() ) ), sorted( ( tuple( row ) for row in dupe_obj.GetNewFiles() ) ) )
+            self.assertEqual( sorted( obj.GetDeletedFiles() ), sorted( dupe_obj.GetDeletedFiles() ) )
+            self.assertEqual( sorted( ( tuple( pair ) for pair in obj.GetNewTagSiblings() ) ), sorted( ( tuple( pair ) for pair in dupe_obj.GetNewTagSiblings() ) ) )
+            self.assertEqual( sorted( ( tuple( pair ) for pair in obj.GetDeletedTagParents() ) ), sorted( ( tuple( pair ) for pair in dupe_obj.GetDeletedTagParents() ) ) )
+            self.assertEqual( obj.GetNumRows(), dupe_obj.GetNumRows() )
+            
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 50, [ 7, 3, 2 ** 40, 1 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 2, [ 5 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( 3, [] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_DELETE, ( 9, [ 100, 4 ] ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 12, 65536, HC.IMAGE_PNG, 1700000000, 640, 480, None, None, None ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 4, 1234567, HC.VIDEO_WEBM, 1700000005, 1920, 1080, 45000, 1350, None ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 20 ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_DELETE, 8 ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( 10, 3 ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_SIBLINGS, HC.CONTENT_UPDATE_ADD, ( 1, 30 ) ) )
+        content_update.AddRow( ( HC.CONTENT_TYPE_TAG_PARENTS, HC.CONTENT_UPDATE_DELETE, ( 6, 7 ) ) )
+        
+        self._dump_and_load_and_test( content_update, test )
+        
+        for compression in ( HydrusNetwork.BINARY_UPDATE_COMPRESSION_NONE, HydrusNetwork.BINARY_UPDATE_COMPRESSION_ZLIB, HydrusNetwork.BINARY_UPDATE_COMPRESSION_LZ4 ):
+            
+            network_bytes = HydrusNetwork.DumpUpdateToBinaryNetworkBytes( content_update, compression = compression )
+            
+            self.assertTrue( network_bytes.startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+            
+            dupe_content_update = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+            
+            self.assertIsInstance( dupe_content_update, HydrusNetwork.ContentUpdate )
+            
+            test( content_update, dupe_content_update )
+            
+        
+        self.assertTrue( HydrusNetwork.DumpUpdateToNetworkBytes( content_update, update_format = HydrusNetwork.UPDATE_FORMAT_BINARY ).startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+        self.assertEqual( HydrusNetwork.DumpUpdateToNetworkBytes( content_update, update_format = HydrusNetwork.UPDATE_FORMAT_JSON ), content_update.DumpToNetworkBytes() )
+        
+        # anything the binary format cannot hold falls back to json
+        
+        odd_content_update = HydrusNetwork.ContentUpdate()
+        
+        odd_content_update.AddRow( ( HC.CONTENT_TYPE_FILES, HC.CONTENT_UPDATE_ADD, ( 12, 65536, HC.IMAGE_PNG, 1700000000, 640, 480, 1.5, None, None ) ) )
+        
+        network_bytes = HydrusNetwork.DumpUpdateToNetworkBytes( odd_content_update, update_format = HydrusNetwork.UPDATE_FORMAT_BINARY )
+        
+        self.assertFalse( network_bytes.startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+        
+        test( odd_content_update, HydrusSerialisable.CreateFromNetworkBytes( network_bytes ) )
+        
+        with self.assertRaises( HydrusExceptions.SerialisationException ):
+            
+            HydrusSerialisable.CreateFromNetworkBytes( HydrusNetwork.DumpUpdateToBinaryNetworkBytes( content_update, compression = HydrusNetwork.BINARY_UPDATE_COMPRESSION_NONE )[ : -3 ] )
+            
+        
+    
+    def test_SERIALISABLE_TYPE_DEFINITIONS_UPDATE( self ):
+        
+        def test( obj, dupe_obj ):
+            
+            self.assertEqual( obj.GetHashIdsToHashes(), dupe_obj.GetHashIdsToHashes() )
+            self.assertEqual( obj.GetTagIdsToTags(), dupe_obj.GetTagIdsToTags() )
+            
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        for hash_id in ( 5, 1, 300000, 2 ** 33 ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, hash_id, HydrusData.GenerateKey() ) )
+            
+        
+        for ( tag_id, tag ) in ( ( 3, 'blue eyes' ), ( 1, 'character:samus aran' ), ( 70, '' ), ( 8, '\u30b5\u30e0\u30b9' ) ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, tag_id, tag ) )
+            
+        
+        self._dump_and_load_and_test( definitions_update, test )
+        
+        network_bytes = HydrusNetwork.DumpUpdateToNetworkBytes( definitions_update, update_format = HydrusNetwork.UPDATE_FORMAT_BINARY )
+        
+        self.assertTrue( network_bytes.startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+        
+        dupe_definitions_update = HydrusSerialisable.CreateFromNetworkBytes( network_bytes )
+        
+        self.assertIsInstance( dupe_definitions_update, HydrusNetwork.DefinitionsUpdate )
+        
+        test( definitions_update, dupe_definitions_update )
+        
+        # md5 or whatever is not what we expect in a repo, but json will hold it
+        
+        odd_definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        odd_definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, 1, b'\x00' * 16 ) )
+        
+        network_bytes = HydrusNetwork.DumpUpdateToNetworkBytes( odd_definitions_update, update_format = HydrusNetwork.UPDATE_FORMAT_BINARY )
+        
+        self.assertFalse( network_bytes.startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+        
+        test( odd_definitions_update, HydrusSerialisable.CreateFromNetworkBytes( network_bytes ) )
+        
+    
     def test_SERIALISABLE_TYPE_DUPLICATE_CONTENT_MERGE_OPTIONS( self ):
         
         def test( obj, dupe_obj ):
@@ -775,3 +887,51 @@ class TestSerialisables( unittest.TestCase ):
         self.assertEqual( tag_filter.Filter( blacklist_tags, apply_unnamespaced_rules_to_namespaced_tags = True ), { 'studio:nintendo' } )
         
     
+    def test_update_network_formats_size( self ):
+        
+        # a reproducible size comparison of the json and binary update formats, on a seeded synthetic update. parse speed varies too much by machine to test here
+        
+        r = random.Random( 558 )
+        
+        content_update = HydrusNetwork.ContentUpdate()
+        
+        for tag_id in r.sample( range( 1, 5000000 ), 2000 ):
+            
+            content_update.AddRow( ( HC.CONTENT_TYPE_MAPPINGS, HC.CONTENT_UPDATE_ADD, ( tag_id, r.sample( range( 1, 20000000 ), 50 ) ) ) )
+            
+        
+        definitions_update = HydrusNetwork.DefinitionsUpdate()
+        
+        for hash_id in r.sample( range( 1, 20000000 ), 20000 ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_HASHES, hash_id, r.randbytes( 32 ) ) )
+            
+        
+        for tag_id in r.sample( range( 1, 5000000 ), 10000 ):
+            
+            definitions_update.AddRow( ( HC.DEFINITIONS_TYPE_TAGS, tag_id, 'character:benchmark tag {}'.format( tag_id ) ) )
+            
+        
+        for update in ( content_update, definitions_update ):
+            
+            json_network_bytes = HydrusNetwork.DumpUpdateToNetworkBytes( update, update_format = HydrusNetwork.UPDATE_FORMAT_JSON )
+            binary_network_bytes = HydrusNetwork.DumpUpdateToNetworkBytes( update, update_format = HydrusNetwork.UPDATE_FORMAT_BINARY )
+            
+            self.assertTrue( binary_network_bytes.startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+            
+            self.assertLess( len( binary_network_bytes ), len( json_network_bytes ) )
+            
+            json_update = HydrusSerialisable.CreateFromNetworkBytes( json_network_bytes )
+            binary_update = HydrusSerialisable.CreateFromNetworkBytes( binary_network_bytes )
+            
+            self.assertEqual( json_update.GetNumRows(), update.GetNumRows() )
+            self.assertEqual( binary_update.GetNumRows(), update.GetNumRows() )
+            
+            if isinstance( update, HydrusNetwork.DefinitionsUpdate ):
+                
+                self.assertEqual( binary_update.GetHashIdsToHashes(), json_update.GetHashIdsToHashes() )
+                self.assertEqual( binary_update.GetTagIdsToTags(), json_update.GetTagIdsToTags() )
+                
+            
+        
+    
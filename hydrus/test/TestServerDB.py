@@ -7,11 +7,13 @@ from hydrus.core import HydrusConstants as HC
 from hydrus.core import HydrusData
 from hydrus.core import HydrusExceptions
 from hydrus.core import HydrusGlobals as HG
+from hydrus.core import HydrusSerialisable
 from hydrus.core import HydrusTime
 from hydrus.core.networking import HydrusNetwork
 from hydrus.core.networking import HydrusNetworking
 
 from hydrus.server import ServerDB
+from hydrus.server import ServerFiles
 
 from hydrus.test import TestController
 
@@ -145,6 +147,50 @@ class TestServerDB( unittest.TestCase ):
             
         
     
+    def _test_create_update_formats( self ):
+        
+        begin = 0
+        end = HydrusTime.GetNow() + 100
+        
+        ( json_update_hashes, update_hashes_to_binary_update_hashes ) = self._write( 'create_update', self._tag_service_key, begin, end, update_format = HydrusNetwork.UPDATE_FORMAT_JSON )
+        
+        self.assertGreater( len( json_update_hashes ), 0 )
+        self.assertEqual( update_hashes_to_binary_update_hashes, {} )
+        
+        ( update_hashes, update_hashes_to_binary_update_hashes ) = self._write( 'create_update', self._tag_service_key, begin, end, update_format = HydrusNetwork.UPDATE_FORMAT_BINARY )
+        
+        # the metadata always gets json, so old clients can read everything
+        self.assertEqual( set( update_hashes_to_binary_update_hashes.keys() ), set( update_hashes ) )
+        
+        for ( update_hash, binary_update_hash ) in update_hashes_to_binary_update_hashes.items():
+            
+            with open( ServerFiles.GetExpectedFilePath( update_hash ), 'rb' ) as f:
+                
+                json_update_bytes = f.read()
+                
+            
+            with open( ServerFiles.GetExpectedFilePath( binary_update_hash ), 'rb' ) as f:
+                
+                binary_update_bytes = f.read()
+                
+            
+            self.assertFalse( json_update_bytes.startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+            self.assertTrue( binary_update_bytes.startswith( HydrusNetwork.BINARY_UPDATE_MAGIC ) )
+            
+            json_update = HydrusSerialisable.CreateFromNetworkBytes( json_update_bytes )
+            binary_update = HydrusSerialisable.CreateFromNetworkBytes( binary_update_bytes )
+            
+            self.assertEqual( json_update.GetNumRows(), binary_update.GetNumRows() )
+            
+        
+        metadata = HydrusNetwork.Metadata()
+        
+        metadata.AppendUpdate( update_hashes, begin, end, end + 100 )
+        
+        self.assertEqual( metadata.GetSlice( 0 ).GetUpdateHashes( 0 ), set( update_hashes ) )
+        self.assertEqual( metadata.GetSlice( 0, update_hashes_to_alternate_update_hashes = update_hashes_to_binary_update_hashes ).GetUpdateHashes( 0 ), set( update_hashes_to_binary_update_hashes.values() ) )
+        
+    
     def _test_delete_all_content( self ):
         
         # this dude is an admin so he owns siblings and parents
@@ -1110,4 +1156,6 @@ class TestServerDB( unittest.TestCase ):
         
         self._test_delete_all_content()
         
+        self._test_create_update_formats()
+        
 
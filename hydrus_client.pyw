@@ -4,9 +4,15 @@
 # You just DO WHAT THE FUCK YOU WANT TO.
 # https://github.com/sirkris/WTFPL/blob/master/WTFPL.md
 
-from hydrus import hydrus_client_boot
-
 if __name__ == '__main__':
     
+    # file maintenance worker processes are spawned, which re-imports this script, so the boot import has to stay in here
+    
+    import multiprocessing
+    
+    multiprocessing.freeze_support()
+    
+    from hydrus import hydrus_client_boot
+    
     hydrus_client_boot.boot()
     